@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+"""
+Per-invocation latency of a short-lived producer sending one update to
+the local mock broker, either with its own SEPAClient (import, parse the
+configuration, connect) or through a sepy agent (import the lightweight
+AgentClient, one Unix socket round trip). The in-process latency of the
+two paths is also reported. The results are printed (or written) as JSON.
+
+Usage: python agentLatency.py [--invocations N] [--requests N] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import subprocess
+
+# path modification
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.Agent import SEPAAgent
+from sepy.AgentClient import AgentClient
+from mockBroker import MockBroker
+from endToEnd import percentiles, timeRequests, TEMPLATE
+
+# the producers run in fresh interpreters
+BINDINGS = {"value": "1", "topic": "bench", "broker": "mock"}
+DIRECT = """
+import sys
+sys.path.insert(0, %r)
+from sepy.SEPAClient import SEPAClient
+assert SEPAClient(%r).update("MQTT_MESSAGE", %r)[0]
+"""
+THROUGH_AGENT = """
+import sys
+sys.path.insert(0, %r)
+from sepy.AgentClient import AgentClient
+assert AgentClient(%r, %r).update("MQTT_MESSAGE", %r)[0]
+"""
+
+
+def timeInvocations(script, invocations):
+
+    """Runs a producer script in fresh interpreters, returns the wall time summary"""
+
+    samples = []
+    for i in range(invocations):
+        t0 = time.perf_counter()
+        subprocess.check_call([sys.executable, "-c", script])
+        samples.append(time.perf_counter() - t0)
+    return percentiles(samples)
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invocations", type = int, default = 20)
+    parser.add_argument("--requests", type = int, default = 1000)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # start the broker and the agent
+    broker = MockBroker().start()
+    directory = tempfile.mkdtemp()
+    jsap = broker.configuration(TEMPLATE, os.path.join(directory, "bench.jsap"))
+    agent = SEPAAgent(os.path.join(directory, "agent.sock")).start()
+    agent.client(jsap)
+
+    report = {"benchmark": "agentLatency",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+
+    # one update per process
+    report["invocationMs"] = {"direct": timeInvocations(DIRECT % (ROOT, jsap, BINDINGS), args.invocations),
+                              "agent": timeInvocations(THROUGH_AGENT % (ROOT, jsap, agent.socketPath, BINDINGS), args.invocations)}
+
+    # in-process round trips
+    kp = SEPAClient(jsap)
+    client = AgentClient(jsap, agent.socketPath)
+    report["update"] = {"direct": timeRequests(lambda i: kp.update("MQTT_MESSAGE", BINDINGS), args.requests),
+                        "agent": timeRequests(lambda i: client.update("MQTT_MESSAGE", BINDINGS), args.requests)}
+    client.close()
+    agent.stop()
+    broker.stop()
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+
+"""
+Rendering of the bulk updates of readings held in NumPy arrays: one
+forcedBindings dictionary per row rendered by getUpdate and joined as in
+SEPAClient.updateMany, against ConfigurationObject.getUpdateColumns on
+the columns. For every number of rows it reports rows/sec (best of
+several repetitions) and the peak memory traced by tracemalloc, printed
+(or written) as JSON.
+
+Usage: python columnRendering.py [--rows N [N ...]] [--repeat N] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+from sepy.ConfigurationObject import ConfigurationObject
+
+# template used by the benchmark
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+UPDATE = "UPDATE_OBSERVATION_VALUE"
+
+
+def renderDicts(configuration, observations, values):
+
+    """Renders the request body building a dictionary per row"""
+
+    prefixes = len(configuration.nsSparql)
+    bindingsList = [{"observation": o, "value": v} for o, v in zip(observations.tolist(), values.tolist())]
+    operations = [configuration.getUpdate(UPDATE, forcedBindings)[prefixes:] for forcedBindings in bindingsList]
+    return configuration.nsSparql + " ; ".join(operations)
+
+
+def renderColumns(configuration, observations, values):
+
+    """Renders the request body from the columns"""
+
+    return configuration.getUpdateColumns(UPDATE, {"observation": observations, "value": values})[0]
+
+
+def benchmark(name, render, configuration, observations, values, repeat):
+
+    """Returns rows/sec (best of repeat runs) and the peak memory of a run"""
+
+    best = float("inf")
+    for r in range(repeat):
+        start = time.perf_counter()
+        body = render(configuration, observations, values)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    render(configuration, observations, values)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"mode": name, "rows": len(values), "rowsPerSecond": len(values) / best, "peakBytes": peak, "body": body}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type = int, nargs = "+", default = [1000, 10000, 100000])
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    import numpy
+    configuration = ConfigurationObject(TEMPLATE)
+
+    # run the benchmarks
+    report = {"benchmark": "columnRendering",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+    results = []
+    for rows in args.rows:
+        observations = numpy.array(["arces-monitor:Observation%d" % (i % 100) for i in range(rows)])
+        values = numpy.round(numpy.random.default_rng(1).normal(20.0, 5.0, rows), 2)
+        dicts = benchmark("dicts", renderDicts, configuration, observations, values, args.repeat)
+        columns = benchmark("columns", renderColumns, configuration, observations, values, args.repeat)
+        if dicts.pop("body") != columns.pop("body"):
+            raise AssertionError("The request bodies differ with {} rows".format(rows))
+        columns["speedup"] = columns["rowsPerSecond"] / dicts["rowsPerSecond"]
+        results += [dicts, columns]
+    report["results"] = results
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+"""
+End-to-end benchmark of SEPAClient against the local mock broker. It
+measures update and query throughput and latency percentiles, the setup
+time of increasing numbers of subscriptions (until the broker has
+confirmed all of them: the client waits for the confirmations on an
+event, so no polling interval is included) and the delivery latency of
+their notifications. The results are printed (or written) as JSON.
+
+Usage: python endToEnd.py [--requests N] [--subscriptions 1,10,100,1000,10000] [--output FILE]
+"""
+
+# global requirements
+from threading import Condition
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# local import
+from sepy.SEPAClient import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+
+def percentiles(samples):
+
+    """Returns a summary (in milliseconds) of a list of durations in seconds"""
+
+    samples = sorted(samples)
+    summary = {"count": len(samples)}
+    if not samples:
+        return summary
+    for name, p in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("max", 1.0)):
+        summary[name] = samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+    summary["mean"] = sum(samples) / len(samples) * 1000
+    return summary
+
+
+def timeRequests(call, requests):
+
+    """Runs a request several times, returns throughput and latencies"""
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(requests):
+        t0 = time.perf_counter()
+        status, results = call(i)
+        latencies.append(time.perf_counter() - t0)
+        if not status:
+            raise RuntimeError("Request failed: {}".format(results))
+    elapsed = time.perf_counter() - start
+    return {"requestsPerSecond": requests / elapsed, "latencyMs": percentiles(latencies)}
+
+
+# handler counting the notifications of the updates
+class LatencyHandler:
+
+    def __init__(self):
+        self.condition = Condition()
+        self.arrivals = []
+
+    def handle(self, added, removed):
+        if added and "t" in added["head"]["vars"]:
+            with self.condition:
+                self.arrivals.append(time.perf_counter())
+                self.condition.notify_all()
+
+    def handleError(self, error):
+        pass
+
+    def wait(self, count, timeout):
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.arrivals) >= count, timeout)
+
+
+def benchmarkSubscriptions(kp, count, rounds):
+
+    """Measures setup time and notification latency with count subscriptions"""
+
+    handler = LatencyHandler()
+    bindings = [{"location": "arces-monitor:Location%s" % i} for i in range(count)]
+
+    # setup
+    t0 = time.perf_counter()
+    subids = kp.subscribeMany("OBSERVATIONS_BY_LOCATION", bindings, "bench", handler)
+    setup = time.perf_counter() - t0
+
+    # notifications
+    latencies = []
+    for r in range(rounds):
+        handler.arrivals = []
+        t0 = time.perf_counter()
+        kp.update("MQTT_MESSAGE", {"value": "1", "topic": "bench", "broker": "mock"})
+        if not handler.wait(count, 60):
+            raise RuntimeError("Notifications lost")
+        latencies.extend(arrival - t0 for arrival in handler.arrivals)
+
+    # teardown
+    t0 = time.perf_counter()
+    for subid in subids:
+        kp.unsubscribe(subid)
+    teardown = time.perf_counter() - t0
+
+    return {"subscriptions": count,
+            "setupSeconds": setup,
+            "setupPerSubscriptionMs": setup * 1000 / count,
+            "teardownSeconds": teardown,
+            "notificationLatencyMs": percentiles(latencies)}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type = int, default = 1000)
+    parser.add_argument("--rows", type = int, default = 100)
+    parser.add_argument("--subscriptions", default = "1,10,100,1000,10000")
+    parser.add_argument("--rounds", type = int, default = 5)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # start the broker and the client
+    broker = MockBroker(rows = args.rows).start()
+    directory = tempfile.mkdtemp()
+    kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(directory, "bench.jsap")))
+
+    # run the benchmarks
+    report = {"benchmark": "endToEnd",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+    report["update"] = timeRequests(lambda i: kp.update("MQTT_MESSAGE", {"value": str(i), "topic": "bench", "broker": "mock"}), args.requests)
+    report["query"] = timeRequests(lambda i: kp.query("OBSERVATIONS"), args.requests)
+    report["subscribe"] = [benchmarkSubscriptions(kp, int(n), args.rounds) for n in args.subscriptions.split(",")]
+    broker.stop()
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
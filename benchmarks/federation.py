@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+
+"""
+Latency of the federated queries (FederatedClient) against mock brokers
+answering after a fixed delay, one of them much slower than the others.
+The same query is sent to the brokers one after the other with
+SEPAClient.query and at once with FederatedClient.query, with and
+without a deadline for the slow broker; the time to the first binding
+and to the end of the results are reported. The results are printed
+(or written) as JSON.
+
+Usage: python federation.py [--brokers N] [--rows N] [--delay SECONDS] [--slow-delay SECONDS] [--deadline SECONDS] [--repeat N] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# local import
+from sepy.FederatedClient import *
+from mockBroker import MockBroker
+from endToEnd import TEMPLATE
+
+# query of the template used by the benchmark
+QUERY = "OBSERVATIONS_TOPICS"
+
+
+class DelayedBroker(MockBroker):
+
+    """A broker answering after delay seconds"""
+
+    def __init__(self, delay, **kwargs):
+        MockBroker.__init__(self, **kwargs)
+        self.delay = delay
+        self.httpServer.handle_error = lambda request, address: None
+
+    def beforeRequest(self):
+        time.sleep(self.delay)
+
+
+def benchmarkSequential(federation, repeat):
+
+    """Measures the queries sent to one broker after the other"""
+
+    first, total = [], []
+    for i in range(repeat):
+        start = time.perf_counter()
+        rows = 0
+        for client in federation.clients:
+            status, results = client.query(QUERY)
+            if rows == 0:
+                first.append(time.perf_counter() - start)
+            rows += len(results["results"]["bindings"])
+        total.append(time.perf_counter() - start)
+    return {"firstBindingSeconds": sum(first) / repeat, "seconds": sum(total) / repeat, "rows": rows}
+
+
+def benchmarkFederated(federation, repeat, deadline):
+
+    """Measures the queries sent to all the brokers at once"""
+
+    first, total = [], []
+    for i in range(repeat):
+        start = time.perf_counter()
+        results = federation.query(QUERY, distinct = False, deadline = deadline)
+        rows = 0
+        for binding in results:
+            if rows == 0:
+                first.append(time.perf_counter() - start)
+            rows += 1
+        total.append(time.perf_counter() - start)
+    return {"deadline": deadline,
+            "firstBindingSeconds": sum(first) / repeat,
+            "seconds": sum(total) / repeat,
+            "rows": rows,
+            "timedOut": results.timedOut}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--brokers", type = int, default = 4)
+    parser.add_argument("--rows", type = int, default = 5000)
+    parser.add_argument("--delay", type = float, default = 0.05)
+    parser.add_argument("--slow-delay", type = float, default = 1.0)
+    parser.add_argument("--deadline", type = float, default = 0.3)
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # start the brokers, the last one is slow
+    directory = tempfile.mkdtemp()
+    brokers = [DelayedBroker(args.delay, rows = args.rows).start() for i in range(args.brokers - 1)]
+    brokers.append(DelayedBroker(args.slow_delay, rows = args.rows).start())
+    files = [broker.configuration(TEMPLATE, os.path.join(directory, "broker%s.jsap" % i)) for i, broker in enumerate(brokers)]
+    federation = FederatedClient(files)
+
+    # run the benchmarks
+    report = {"benchmark": "federation",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+    report["sequential"] = benchmarkSequential(federation, args.repeat)
+    report["federated"] = benchmarkFederated(federation, args.repeat, None)
+    report["federatedDeadline"] = benchmarkFederated(federation, args.repeat, args.deadline)
+    for broker in brokers:
+        broker.stop()
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
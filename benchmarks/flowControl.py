@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+"""
+Behaviour of the adaptive flow control (AdaptiveLimiter) against a mock
+broker that serves a few requests at a time at full speed and slows down
+with every request beyond them. Producer threads send updates as fast as
+they can without a limiter, with the AIMD limiter and with the gradient
+limiter; the updates/sec, the latency percentiles seen by the producers
+(waits in the limiter included) and by the broker, and the final limit
+are reported. The results are printed (or written) as JSON.
+
+Usage: python flowControl.py [--producers N] [--updates N] [--capacity N] [--service SECONDS] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+from threading import Thread, Lock
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# local import
+from sepy.SEPAClient import *
+from mockBroker import MockBroker
+from endToEnd import TEMPLATE
+
+# update of the template used by the benchmark
+UPDATE = "UPDATE_OBSERVATION_VALUE"
+
+
+class OverloadedBroker(MockBroker):
+
+    """A broker serving capacity requests in service seconds, slower by service seconds for every request beyond them"""
+
+    def __init__(self, capacity, service, **kwargs):
+        MockBroker.__init__(self, **kwargs)
+        self.capacity = capacity
+        self.service = service
+        self.serving = 0
+        self.servingLock = Lock()
+        self.latencies = []
+
+    def beforeRequest(self):
+        start = time.perf_counter()
+        with self.servingLock:
+            self.serving += 1
+            excess = max(0, self.serving - self.capacity)
+        time.sleep(self.service * (1 + excess))
+        with self.servingLock:
+            self.serving -= 1
+            self.latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100.0 * len(values)))] if values else None
+
+
+def benchmark(broker, path, producers, updates, limiter):
+
+    """Runs the producers, returns the statistics"""
+
+    kp = SEPAClient(path, limiter = limiter)
+    latencies = []
+    errors = [0]
+    def produce(first):
+        for i in range(first, updates, producers):
+            start = time.perf_counter()
+            try:
+                status, results = kp.update(UPDATE, {"observation": "arces-monitor:Observation%s" % i, "value": str(i)})
+            except Exception:
+                status = False
+            latencies.append(time.perf_counter() - start)
+            if not status:
+                errors[0] += 1
+    broker.latencies = []
+    threads = [Thread(target = produce, args = (i,)) for i in range(producers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {"limiter": None if limiter is None else limiter.algorithm,
+            "updatesPerSecond": updates / elapsed,
+            "errors": errors[0],
+            "producerLatency": {"p50": percentile(latencies, 50), "p99": percentile(latencies, 99)},
+            "brokerLatency": {"p50": percentile(broker.latencies, 50), "p99": percentile(broker.latencies, 99)},
+            "finalLimit": None if limiter is None else limiter.limit}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--producers", type = int, default = 32)
+    parser.add_argument("--updates", type = int, default = 2000)
+    parser.add_argument("--capacity", type = int, default = 4)
+    parser.add_argument("--service", type = float, default = 0.005)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # start the broker
+    broker = OverloadedBroker(args.capacity, args.service).start()
+    broker.httpServer.handle_error = lambda request, address: None
+    path = broker.configuration(TEMPLATE, os.path.join(tempfile.mkdtemp(), "bench.jsap"))
+
+    # run the benchmarks
+    report = {"benchmark": "flowControl",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+    report["results"] = [benchmark(broker, path, args.producers, args.updates, None),
+                         benchmark(broker, path, args.producers, args.updates, AdaptiveLimiter("aimd")),
+                         benchmark(broker, path, args.producers, args.updates, AdaptiveLimiter("gradient"))]
+    broker.stop()
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
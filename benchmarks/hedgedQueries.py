@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+"""
+Tail latency of the queries against a mock broker stalling a random
+fraction of the requests: plain queries, queries with a deadline (the
+stalled ones fail at the deadline) and queries hedged by QueryHedger (a
+copy is sent after the 95th percentile of the latencies). The latency
+percentiles, the failures and the copies sent are printed (or written)
+as JSON.
+
+Usage: python hedgedQueries.py [--queries N] [--stall-probability P] [--stall SECONDS] [--deadline SECONDS] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import platform
+from threading import Lock
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.QueryHedger import *
+from mockBroker import MockBroker
+from endToEnd import TEMPLATE
+
+# query of the template used by the benchmark
+QUERY = "MQTT_TOPICS"
+
+
+class StallingBroker(MockBroker):
+
+    """A broker stalling every request for stall seconds with the given probability"""
+
+    def __init__(self, probability, stall, seed = 1, **kwargs):
+        MockBroker.__init__(self, **kwargs)
+        self.httpServer.handle_error = lambda request, address: None
+        self.probability = probability
+        self.stall = stall
+        self.random = random.Random(seed)
+        self.randomLock = Lock()
+
+    def beforeRequest(self):
+        with self.randomLock:
+            stalled = self.random.random() < self.probability
+        if stalled:
+            time.sleep(self.stall)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100.0 * len(values)))] if values else None
+
+
+def benchmark(name, query, queries):
+
+    """Sends the queries one after the other, returns the statistics"""
+
+    latencies = []
+    failures = 0
+    for i in range(queries):
+        start = time.perf_counter()
+        try:
+            status, results = query()
+        except DeadlineExceededException:
+            status = False
+        latencies.append(time.perf_counter() - start)
+        if not status:
+            failures += 1
+    return {"mode": name,
+            "failures": failures,
+            "latency": {"p50": percentile(latencies, 50), "p99": percentile(latencies, 99),
+                        "p99.9": percentile(latencies, 99.9), "max": max(latencies)}}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type = int, default = 2000)
+    parser.add_argument("--stall-probability", type = float, default = 0.02)
+    parser.add_argument("--stall", type = float, default = 0.5)
+    parser.add_argument("--deadline", type = float, default = 0.1)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # start the broker
+    broker = StallingBroker(args.stall_probability, args.stall).start()
+    path = broker.configuration(TEMPLATE, os.path.join(tempfile.mkdtemp(), "bench.jsap"))
+    client = SEPAClient(path)
+
+    # run the benchmarks
+    report = {"benchmark": "hedgedQueries",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+    results = [benchmark("plain", lambda: client.query(QUERY), args.queries),
+               benchmark("deadline", lambda: client.query(QUERY, deadline = args.deadline), args.queries)]
+    hedger = QueryHedger(client)
+    result = benchmark("hedged", lambda: hedger.query(QUERY), args.queries)
+    result["copies"] = hedger.hedged
+    result["wins"] = hedger.wins
+    results.append(result)
+    report["results"] = results
+    broker.stop()
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+"""
+Measures the cost of importing sepy, as paid by short-lived producers.
+Every measurement runs in a fresh interpreter: the import is timed with
+perf_counter and the heavy dependencies left in sys.modules are listed.
+With --compare, the same measurements are taken on another checkout
+(e.g. a worktree of an older release) and the ratios are reported.
+
+Usage: python importTime.py [--runs N] [--compare OTHER_CHECKOUT] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import statistics
+
+# directories
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+# the statements measured and the modules we look for after each of them
+STATEMENTS = {"SEPAClient": "import sepy.SEPAClient",
+              "ConfigurationObject": "import sepy.ConfigurationObject",
+              "ConnectionHandler": "import sepy.ConnectionHandler"}
+HEAVY = ("requests", "urllib3", "websocket", "yaml", "asyncio", "ssl", "base64")
+
+# the script run by the child interpreters
+CHILD = """
+import sys, time, json
+sys.path.insert(0, %r)
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def measure(path, statement, runs):
+
+    """Imports in runs fresh interpreters, returns the median time and the heavy modules loaded"""
+
+    samples = []
+    loaded = []
+    for i in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", CHILD % (os.path.abspath(path), statement, HEAVY)])
+        result = json.loads(output)
+        samples.append(result["seconds"])
+        loaded = result["loaded"]
+    return {"medianSeconds": statistics.median(samples),
+            "minSeconds": min(samples),
+            "loaded": loaded}
+
+
+def runSuite(path, runs):
+    return {name: measure(path, statement, runs) for name, statement in STATEMENTS.items()}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type = int, default = 20, help = "number of fresh interpreters per measurement")
+    parser.add_argument("--compare", default = None, help = "another checkout to compare with")
+    parser.add_argument("--sepy-path", default = os.path.join(BENCHMARKS, ".."), help = "the checkout to benchmark")
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    report = {"benchmark": "importTime",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "checkout": os.path.abspath(args.sepy_path),
+              "results": runSuite(args.sepy_path, args.runs)}
+
+    # comparison
+    if args.compare:
+        baseline = runSuite(args.compare, args.runs)
+        report["baseline"] = {"checkout": os.path.abspath(args.compare), "results": baseline}
+        report["comparison"] = {}
+        for name, result in report["results"].items():
+            report["comparison"][name] = {"speedup": baseline[name]["medianSeconds"] / result["medianSeconds"]}
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
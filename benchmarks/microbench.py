@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+
+"""
+Microbenchmarks of the CPU-bound hot paths of sepy:
+
+- render: ConfigurationObject.getSparql on every query and update of the
+  examples/*.jsap files, with all the forced bindings filled
+- notification: the on_message callback of ConnectionHandler on synthetic
+  notifications with 1 to 1000 rows, dispatched to a no-op handler
+
+For every benchmark it reports ops/sec (best of several repetitions) and
+the memory allocated per operation (peak traced by tracemalloc). With
+--compare, the same suite is also run against another checkout and the
+ratios are reported. The results are printed (or written) as JSON.
+
+Usage: python microbench.py [--compare OTHER_CHECKOUT] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+import platform
+import subprocess
+import tracemalloc
+
+# directories
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES = os.path.join(BENCHMARKS, "..", "examples")
+
+
+def measure(operation, repeat = 5, target = 0.2):
+
+    """Returns ops/sec (best of repeat runs) and peak bytes allocated per operation"""
+
+    # calibrate the number of iterations
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            operation()
+        elapsed = time.perf_counter() - start
+        if elapsed >= target / 10 or number >= 1 << 20:
+            break
+        number *= 2
+    number = max(1, int(number * target / max(elapsed, 1e-9) / 10))
+
+    # time it
+    best = float("inf")
+    for r in range(repeat):
+        start = time.perf_counter()
+        for i in range(number):
+            operation()
+        best = min(best, time.perf_counter() - start)
+
+    # memory allocated per operation
+    samples = 20
+    peaks = 0
+    tracemalloc.start()
+    for i in range(samples):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        operation()
+        peaks += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    return {"opsPerSecond": number / best, "bytesPerOp": peaks / samples}
+
+
+def loadConfigurations(directory):
+
+    """Loads the example JSAP files, completing the network section when it is missing"""
+
+    from sepy.ConfigurationObject import ConfigurationObject
+    with open(os.path.join(EXAMPLES, "mqtt.jsap")) as stream:
+        reference = json.load(stream)
+    configurations = {}
+    for path in sorted(glob.glob(os.path.join(EXAMPLES, "*.jsap"))):
+        with open(path) as stream:
+            jsap = json.load(stream)
+        for section in ("host", "sparql11protocol", "sparql11seprotocol"):
+            jsap[section] = reference[section]
+        copy = os.path.join(directory, os.path.basename(path))
+        with open(copy, "w") as stream:
+            json.dump(jsap, stream)
+        configurations[os.path.basename(path)] = ConfigurationObject(copy)
+    return configurations
+
+
+def sampleBindings(declarations):
+
+    """Returns a value for every forced binding"""
+
+    bindings = {}
+    for name, declaration in (declarations or {}).items():
+        if declaration.get("type") == "uri":
+            bindings[name] = "http://example.org/resource/" + name
+        else:
+            bindings[name] = "value of " + name
+    return bindings
+
+
+def renderBenchmarks(results):
+
+    """Benchmarks getSparql on all the example templates"""
+
+    directory = tempfile.mkdtemp()
+    for fileName, configuration in loadConfigurations(directory).items():
+        for isQuery, templates in ((True, configuration.queries), (False, configuration.updates)):
+            for name, template in templates.items():
+                bindings = sampleBindings(template.get("forcedBindings"))
+                operation = lambda: configuration.getSparql(isQuery, name, bindings)
+                key = "render/%s/%s/%s" % (fileName, "query" if isQuery else "update", name)
+                try:
+                    operation()
+                except Exception as e:
+                    results[key] = {"error": repr(e)}
+                    continue
+                results[key] = measure(operation)
+                results[key]["bindings"] = len(bindings)
+
+
+# fake websocket, used to get the on_message callback of ConnectionHandler
+class FakeWebSocketApp:
+
+    last = None
+
+    def __init__(self, url, on_message = None, on_error = None, on_close = None, on_open = None):
+        self.on_message = on_message
+        self.on_open = on_open
+        FakeWebSocketApp.last = self
+
+    def send(self, message):
+        request = json.loads(message)
+        if "subscribe" in request:
+            self.on_message(self, json.dumps({"notification": {"spuid": "spuid-bench", "alias": request.get("alias"), "sequence": 0,
+                                                               "addedResults": {"head": {"vars": []}, "results": {"bindings": []}},
+                                                               "removedResults": {"head": {"vars": []}, "results": {"bindings": []}}}}))
+
+    def run_forever(self, **kwargs):
+        self.on_open(self)
+
+
+# no-op handler
+class NullHandler:
+
+    def handle(self, added, removed):
+        pass
+
+    def handleError(self, error):
+        pass
+
+
+def notificationMessage(rows):
+
+    """Returns a synthetic notification with the given number of added rows"""
+
+    variables = ["observation", "label", "value", "unit"]
+    bindings = []
+    for i in range(rows):
+        bindings.append({"observation": {"type": "uri", "value": "http://wot.arces.unibo.it/monitor#Observation-%s" % i},
+                         "label": {"type": "literal", "value": "Temperature sensor %s" % i},
+                         "value": {"type": "literal", "datatype": "http://www.w3.org/2001/XMLSchema#decimal", "value": "%s.5" % i},
+                         "unit": {"type": "uri", "value": "http://qudt.org/1.1/vocab/unit#DegreeCelsius"}})
+    return json.dumps({"notification": {"spuid": "spuid-bench", "sequence": 1,
+                                        "addedResults": {"head": {"vars": variables}, "results": {"bindings": bindings}},
+                                        "removedResults": {"head": {"vars": variables}, "results": {"bindings": []}}}})
+
+
+def notificationBenchmarks(results):
+
+    """Benchmarks the notification handling of ConnectionHandler"""
+
+    import websocket
+    from sepy.ConnectionHandler import ConnectionHandler
+
+    # open a subscription on the fake websocket
+    original = websocket.WebSocketApp
+    websocket.WebSocketApp = FakeWebSocketApp
+    try:
+        handler = ConnectionHandler(logLevel = 40)
+        handler.openWebsocket("ws://localhost/subscribe", "SELECT * WHERE {?s ?p ?o}", alias = "bench", handler = NullHandler())
+    finally:
+        websocket.WebSocketApp = original
+    ws = FakeWebSocketApp.last
+
+    # feed the notifications
+    for rows in (1, 10, 100, 1000):
+        message = notificationMessage(rows)
+        key = "notification/%srows" % rows
+        results[key] = measure(lambda: ws.on_message(ws, message))
+        results[key]["bytes"] = len(message)
+
+
+def runSuite():
+
+    """Runs all the microbenchmarks"""
+
+    results = {}
+    renderBenchmarks(results)
+    notificationBenchmarks(results)
+    return results
+
+
+def runCheckout(path):
+
+    """Runs the suite against another checkout, in a separate process"""
+
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--sepy-path", os.path.abspath(path), "--raw"])
+    return json.loads(output)
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--compare", default = None, help = "another checkout to compare with")
+    parser.add_argument("--sepy-path", default = os.path.join(BENCHMARKS, ".."), help = "the checkout to benchmark")
+    parser.add_argument("--raw", action = "store_true", help = "only print the results of the suite")
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # path modification
+    sys.path.insert(0, os.path.abspath(args.sepy_path))
+    import logging
+    logging.getLogger("sepaLogger").setLevel(logging.ERROR)
+
+    results = runSuite()
+    if args.raw:
+        print(json.dumps(results))
+        sys.exit(0)
+
+    report = {"benchmark": "microbench",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "checkout": os.path.abspath(args.sepy_path),
+              "results": results}
+
+    # comparison
+    if args.compare:
+        baseline = runCheckout(args.compare)
+        report["baseline"] = {"checkout": os.path.abspath(args.compare), "results": baseline}
+        report["comparison"] = {}
+        for key, result in results.items():
+            if "opsPerSecond" in result and "opsPerSecond" in baseline.get(key, {}):
+                report["comparison"][key] = {"speedup": result["opsPerSecond"] / baseline[key]["opsPerSecond"],
+                                             "bytesPerOpRatio": result["bytesPerOp"] / baseline[key]["bytesPerOp"] if baseline[key]["bytesPerOp"] else None}
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
@@ -0,0 +1,291 @@
+#!/usr/bin/python3
+
+"""
+A local stand-in for a SEPA broker, used by the benchmarks. It serves the
+SPARQL 1.1 query and update endpoints over HTTP and the subscribe protocol
+over a minimal WebSocket implementation: every update produces a
+notification for every active subscription.
+
+Usage: python mockBroker.py [--http-port N] [--ws-port N] [--rows N]
+"""
+
+# global requirements
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+from threading import Thread, Lock
+import argparse
+import hashlib
+import base64
+import struct
+import json
+import time
+
+# websocket constants
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+def makeResults(variables, rows):
+
+    """Returns a SPARQL JSON result set with the given number of rows"""
+
+    bindings = []
+    for i in range(rows):
+        bindings.append({v: {"type": "literal", "value": "%s-%s" % (v, i)} for v in variables})
+    return {"head": {"vars": variables}, "results": {"bindings": bindings}}
+
+
+class WebsocketConnection(StreamRequestHandler):
+
+    """Handles a websocket connection carrying subscriptions"""
+
+    def setup(self):
+        StreamRequestHandler.setup(self)
+        self.sendLock = Lock()
+        self.spuids = set()
+
+    def handshake(self):
+        headers = {}
+        line = self.rfile.readline()
+        while line not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+            line = self.rfile.readline()
+        key = headers.get("sec-websocket-key")
+        if key is None:
+            return False
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        self.wfile.write(("HTTP/1.1 101 Switching Protocols\r\n"
+                          "Upgrade: websocket\r\n"
+                          "Connection: Upgrade\r\n"
+                          "Sec-WebSocket-Accept: %s\r\n\r\n" % accept).encode())
+        return True
+
+    def readFrame(self):
+        header = self.rfile.read(2)
+        if len(header) < 2:
+            return None, None
+        opcode = header[0] & 0x0F
+        length = header[1] & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", self.rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", self.rfile.read(8))[0]
+        mask = self.rfile.read(4) if header[1] & 0x80 else None
+        payload = self.rfile.read(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
+
+    def send(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+        with self.sendLock:
+            self.wfile.write(header + payload)
+            self.wfile.flush()
+
+    def sendJson(self, message):
+        self.send(OP_TEXT, json.dumps(message).encode("utf-8"))
+
+    def handle(self):
+        if not self.handshake():
+            return
+        broker = self.server.broker
+        try:
+            while True:
+                opcode, payload = self.readFrame()
+                if opcode is None or opcode == OP_CLOSE:
+                    break
+                if opcode == OP_PING:
+                    self.send(OP_PONG, payload)
+                    continue
+                if opcode != OP_TEXT:
+                    continue
+                message = json.loads(payload.decode("utf-8"))
+                if "subscribe" in message:
+                    alias = message.get("alias", message["subscribe"].get("alias"))
+                    spuid = broker.addSubscription(self, alias)
+                    self.spuids.add(spuid)
+                    self.sendJson({"notification": {"spuid": spuid,
+                                                    "alias": alias,
+                                                    "sequence": 0,
+                                                    "addedResults": makeResults(["s"], broker.rows),
+                                                    "removedResults": makeResults(["s"], 0)}})
+                elif "unsubscribe" in message:
+                    spuid = message["unsubscribe"]["spuid"]
+                    broker.removeSubscription(spuid)
+                    self.spuids.discard(spuid)
+                    self.sendJson({"unsubscribed": {"spuid": spuid}})
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            for spuid in list(self.spuids):
+                broker.removeSubscription(spuid)
+
+
+class HttpHandler(BaseHTTPRequestHandler):
+
+    """Handles the SPARQL 1.1 query and update requests"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        broker = self.server.broker
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        broker.beforeRequest()
+        if self.path == broker.queryPath:
+            response = broker.queryResponse
+        elif self.path == broker.updatePath:
+            broker.update(body)
+            response = b"{}"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+class HttpServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class WebsocketServer(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockBroker:
+
+    """
+    A local SEPA stand-in
+
+    Parameters
+    ----------
+    host : str
+        The address to listen on (default = "localhost")
+    httpPort : int
+        The port of the SPARQL 1.1 endpoints (default = 0, a free port)
+    wsPort : int
+        The port of the subscribe endpoint (default = 0, a free port)
+    rows : int
+        The number of rows returned by queries and initial notifications (default = 10)
+
+    """
+
+    def __init__(self, host = "localhost", httpPort = 0, wsPort = 0, rows = 10):
+
+        # configuration
+        self.host = host
+        self.rows = rows
+        self.queryPath = "/query"
+        self.updatePath = "/update"
+        self.subscribePath = "/subscribe"
+        self.queryResponse = json.dumps(makeResults(["s", "p", "o"], rows)).encode("utf-8")
+
+        # state
+        self.lock = Lock()
+        self.subscriptions = {}
+        self.counter = 0
+        self.updates = 0
+
+        # servers
+        self.httpServer = HttpServer((host, httpPort), HttpHandler)
+        self.httpServer.broker = self
+        self.wsServer = WebsocketServer((host, wsPort), WebsocketConnection)
+        self.wsServer.broker = self
+        self.httpPort = self.httpServer.server_address[1]
+        self.wsPort = self.wsServer.server_address[1]
+
+    # hook for the subclasses (e.g. to inject delays)
+    def beforeRequest(self):
+        pass
+
+    def addSubscription(self, connection, alias):
+        with self.lock:
+            self.counter += 1
+            spuid = "sepa://spuid/%s" % self.counter
+            self.subscriptions[spuid] = [connection, 0]
+        return spuid
+
+    def removeSubscription(self, spuid):
+        with self.lock:
+            self.subscriptions.pop(spuid, None)
+
+    def update(self, body):
+
+        """Notifies all the subscriptions, the added binding carries the notification time"""
+
+        with self.lock:
+            self.updates += 1
+            targets = list(self.subscriptions.items())
+        added = {"head": {"vars": ["t"]}, "results": {"bindings": [{"t": {"type": "literal", "value": repr(time.time())}}]}}
+        removed = {"head": {"vars": ["t"]}, "results": {"bindings": []}}
+        for spuid, state in targets:
+            state[1] += 1
+            try:
+                state[0].sendJson({"notification": {"spuid": spuid, "sequence": state[1], "addedResults": added, "removedResults": removed}})
+            except OSError:
+                pass
+
+    def start(self):
+        for server in (self.httpServer, self.wsServer):
+            thread = Thread(target = server.serve_forever)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        for server in (self.httpServer, self.wsServer):
+            server.shutdown()
+            server.server_close()
+
+    def configuration(self, template, path):
+
+        """Writes a JSAP file pointing to the broker, based on a template JSAP file"""
+
+        with open(template) as stream:
+            jsap = json.load(stream)
+        jsap["host"] = self.host
+        jsap["sparql11protocol"]["port"] = self.httpPort
+        jsap["sparql11protocol"]["query"]["path"] = self.queryPath
+        jsap["sparql11protocol"]["update"]["path"] = self.updatePath
+        jsap["sparql11seprotocol"]["availableProtocols"]["ws"]["port"] = self.wsPort
+        jsap["sparql11seprotocol"]["availableProtocols"]["ws"]["path"] = self.subscribePath
+        with open(path, "w") as stream:
+            json.dump(jsap, stream)
+        return path
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default = "localhost")
+    parser.add_argument("--http-port", type = int, default = 8000)
+    parser.add_argument("--ws-port", type = int, default = 9000)
+    parser.add_argument("--rows", type = int, default = 10)
+    args = parser.parse_args()
+
+    broker = MockBroker(args.host, args.http_port, args.ws_port, args.rows).start()
+    print("Mock broker listening on http://%s:%s and ws://%s:%s" % (args.host, broker.httpPort, args.host, broker.wsPort))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        broker.stop()
@@ -0,0 +1,212 @@
+#!/usr/bin/python3
+
+"""
+A local stand-in for an MQTT broker, used by the ingestion benchmark. It
+implements the part of MQTT 3.1.1 needed by a QoS 0 subscriber (connect,
+subscribe with + and # wildcards, publish, ping, disconnect) and can also
+publish messages itself, so that the benchmark measures the subscriber.
+
+Usage: python mockMqtt.py [--port N]
+"""
+
+# global requirements
+from socketserver import ThreadingTCPServer, StreamRequestHandler
+from threading import Thread, Lock
+import argparse
+import struct
+import time
+
+# packet types
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+SUBSCRIBE = 8
+SUBACK = 9
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+def encodeLength(length):
+
+    """Encodes the remaining length of a packet"""
+
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def publishPacket(topic, payload):
+
+    """Returns a QoS 0 PUBLISH packet"""
+
+    topic = topic.encode("utf-8")
+    body = struct.pack(">H", len(topic)) + topic + payload
+    return bytes([PUBLISH << 4]) + encodeLength(len(body)) + body
+
+
+def topicMatches(pattern, topic):
+
+    """Tells if a topic matches a subscription pattern"""
+
+    patternLevels = pattern.split("/")
+    topicLevels = topic.split("/")
+    for i, level in enumerate(patternLevels):
+        if level == "#":
+            return True
+        if i >= len(topicLevels) or (level != "+" and level != topicLevels[i]):
+            return False
+    return len(patternLevels) == len(topicLevels)
+
+
+class MqttConnection(StreamRequestHandler):
+
+    """Handles the connection of an MQTT client"""
+
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        StreamRequestHandler.setup(self)
+        self.sendLock = Lock()
+        self.patterns = []
+
+    def readPacket(self):
+        header = self.rfile.read(1)
+        if not header:
+            return None, None
+        length = 0
+        multiplier = 1
+        while True:
+            byte = self.rfile.read(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return header[0] >> 4, self.rfile.read(length)
+
+    def send(self, packet):
+        with self.sendLock:
+            self.wfile.write(packet)
+
+    def handle(self):
+        broker = self.server.broker
+        try:
+            while True:
+                kind, body = self.readPacket()
+                if kind is None or kind == DISCONNECT:
+                    break
+                if kind == CONNECT:
+                    self.send(bytes([CONNACK << 4, 2, 0, 0]))
+                elif kind == SUBSCRIBE:
+                    packetId = body[:2]
+                    position = 2
+                    granted = bytearray()
+                    while position < len(body):
+                        length = struct.unpack(">H", body[position:position + 2])[0]
+                        self.patterns.append(body[position + 2:position + 2 + length].decode("utf-8"))
+                        position += 3 + length
+                        granted.append(0)
+                    broker.addConnection(self)
+                    self.send(bytes([SUBACK << 4]) + encodeLength(2 + len(granted)) + packetId + bytes(granted))
+                elif kind == PUBLISH:
+                    length = struct.unpack(">H", body[:2])[0]
+                    topic = body[2:2 + length].decode("utf-8")
+                    broker.publish(topic, body[2 + length:])
+                elif kind == PINGREQ:
+                    self.send(bytes([PINGRESP << 4, 0]))
+        except (ConnectionError, OSError, IndexError):
+            pass
+        finally:
+            broker.removeConnection(self)
+
+
+class MqttServer(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockMqttBroker:
+
+    """
+    A local MQTT stand-in (QoS 0 only)
+
+    Parameters
+    ----------
+    host : str
+        The address to listen on (default = "localhost")
+    port : int
+        The port to listen on (default = 0, a free port)
+
+    """
+
+    def __init__(self, host = "localhost", port = 0):
+        self.host = host
+        self.lock = Lock()
+        self.connections = []
+        self.published = 0
+        self.server = MqttServer((host, port), MqttConnection)
+        self.server.broker = self
+        self.port = self.server.server_address[1]
+
+    def addConnection(self, connection):
+        with self.lock:
+            if connection not in self.connections:
+                self.connections.append(connection)
+
+    def removeConnection(self, connection):
+        with self.lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
+
+    def publish(self, topic, payload):
+
+        """Sends a message to all the matching subscribers"""
+
+        packet = publishPacket(topic, payload)
+        self.published += 1
+        for connection in list(self.connections):
+            if any(topicMatches(pattern, topic) for pattern in connection.patterns):
+                try:
+                    connection.send(packet)
+                except OSError:
+                    pass
+
+    def waitSubscribers(self, count = 1, timeout = 10):
+
+        """Waits until count clients subscribed"""
+
+        deadline = time.time() + timeout
+        while len(self.connections) < count and time.time() < deadline:
+            time.sleep(0.01)
+        return len(self.connections) >= count
+
+    def start(self):
+        thread = Thread(target = self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default = "localhost")
+    parser.add_argument("--port", type = int, default = 1883)
+    args = parser.parse_args()
+
+    broker = MockMqttBroker(args.host, args.port).start()
+    print("Mock MQTT broker listening on %s:%s" % (args.host, broker.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        broker.stop()
@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+
+"""
+Throughput of the MQTT ingestion pipeline (MqttIngestion) in messages per
+second, from the local MQTT stand-in to the local SEPA stand-in. Messages
+cycle over the three kinds described by examples/mqtt.jsap (regex, JSON
+and plain topics). The conversion alone is measured too, as well as the
+pipeline with different batch sizes. The results are printed (or written)
+as JSON.
+
+Usage: python mqttIngestion.py [--messages N] [--batch 1,50,200] [--transport mqtt|direct] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.MqttIngestion import *
+from mockBroker import MockBroker
+from mockMqtt import MockMqttBroker
+from endToEnd import TEMPLATE
+
+
+def sampleMessages(count):
+
+    """Returns count (topic, payload) messages cycling over the kinds of topics"""
+
+    kinds = [lambda i: ("pepoli:6lowpan:network", (" | ID: NODO%s | Temperature: %s.50 | Humidity: 45.20 | Pressure: 1013.25\n" % (i % 3 + 1, i % 40)).encode()),
+             lambda i: ("ground/lora/moisture", json.dumps({"nodeId": "device%s" % (i % 2 + 1), "moistureValue": i % 100}).encode()),
+             lambda i: ("arces/servers/ares/ercole/cpu/core-%s/temperature" % (i % 20 + 1), str(40 + i % 30).encode())]
+    return [kinds[i % len(kinds)](i) for i in range(count)]
+
+
+def benchmarkConversion(mapper, messages):
+
+    """Measures the conversion of the messages into bindings"""
+
+    start = time.perf_counter()
+    values = 0
+    for topic, payload in messages:
+        values += len(mapper.bindings(topic, payload))
+    elapsed = time.perf_counter() - start
+    return {"messagesPerSecond": len(messages) / elapsed, "values": values}
+
+
+def benchmarkPipeline(kp, messages, batchSize, transport, mqttBroker):
+
+    """Measures the ingestion of the messages, from publication to the last update"""
+
+    ingestion = MqttIngestion(kp, batchSize = batchSize).start()
+    if transport == "mqtt":
+        ingestion.connect(mqttBroker.host, mqttBroker.port, ["#"])
+        mqttBroker.waitSubscribers(1)
+        publish = mqttBroker.publish
+    else:
+        publish = ingestion.submit
+
+    start = time.perf_counter()
+    for topic, payload in messages:
+        publish(topic, payload)
+
+    # wait for the messages to be received and sent
+    while ingestion.received < len(messages):
+        time.sleep(0.001)
+    ingestion.flush()
+    elapsed = time.perf_counter() - start
+    ingestion.stop()
+    return {"batchSize": batchSize,
+            "messagesPerSecond": len(messages) / elapsed,
+            "valuesPerSecond": ingestion.sent / elapsed,
+            "values": ingestion.sent,
+            "requests": ingestion.batches,
+            "failed": ingestion.failed}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type = int, default = 10000)
+    parser.add_argument("--batch", default = "1,50,200")
+    parser.add_argument("--transport", choices = ("mqtt", "direct"), default = "mqtt", help = "mqtt requires paho-mqtt")
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # start the brokers and the client
+    broker = MockBroker().start()
+    mqttBroker = MockMqttBroker().start()
+    directory = tempfile.mkdtemp()
+    kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(directory, "bench.jsap")))
+    messages = sampleMessages(args.messages)
+
+    # run the benchmarks
+    report = {"benchmark": "mqttIngestion",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+    report["conversion"] = benchmarkConversion(MqttMapper(kp.configuration.configurationDict["extended"]), messages)
+    report["pipeline"] = [benchmarkPipeline(kp, messages, int(size), args.transport, mqttBroker) for size in args.batch.split(",")]
+    mqttBroker.stop()
+    broker.stop()
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
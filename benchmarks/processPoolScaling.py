@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+
+"""
+Benchmark of the process-pool execution mode: a CPU-heavy handler is fed
+with the notifications of several subscriptions, using an increasing number
+of worker processes. The results are printed as JSON.
+
+Usage: python processPoolScaling.py [--subscriptions N] [--notifications N] [--work N]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+from sepy.ProcessPoolDispatcher import *
+
+
+# a CPU-heavy handler
+class HeavyHandler:
+
+    def __init__(self, work):
+        self.work = work
+
+    def handle(self, added, removed):
+        total = 0.0
+        for binding in added["results"]["bindings"]:
+            value = float(binding["value"]["value"])
+            for i in range(self.work):
+                total += (value * i) % 7
+        return total
+
+
+# collects the results in the parent
+class Collector:
+
+    def __init__(self):
+        self.results = 0
+        self.errors = 0
+
+    def handleResult(self, result):
+        self.results += 1
+
+    def handleError(self, error):
+        self.errors += 1
+
+
+# run with a given number of workers
+def run(workers, subscriptions, notifications, work):
+    dispatcher = ProcessPoolDispatcher(workers)
+    collector = Collector()
+    handlers = [dispatcher.handler(HeavyHandler, (work,), collector) for i in range(subscriptions)]
+    added = {"head": {"vars": ["value"]}, "results": {"bindings": [{"value": {"type": "literal", "value": "1.5"}}]}}
+    removed = {"head": {"vars": ["value"]}, "results": {"bindings": []}}
+
+    # warm up the workers
+    for handler in handlers:
+        handler.handle(added, removed)
+    for handler in handlers:
+        handler.join()
+
+    # measure
+    start = time.perf_counter()
+    for n in range(notifications):
+        for handler in handlers:
+            handler.handle(added, removed)
+    for handler in handlers:
+        handler.join()
+    elapsed = time.perf_counter() - start
+    dispatcher.close()
+    total = notifications * subscriptions
+    return {"workers": workers, "notifications": total, "seconds": elapsed, "notificationsPerSecond": total / elapsed, "errors": collector.errors}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscriptions", type = int, default = 8)
+    parser.add_argument("--notifications", type = int, default = 200)
+    parser.add_argument("--work", type = int, default = 20000)
+    parser.add_argument("--max-workers", type = int, default = os.cpu_count())
+    args = parser.parse_args()
+
+    results = []
+    workers = 1
+    while workers <= args.max_workers:
+        results.append(run(workers, args.subscriptions, args.notifications, args.work))
+        workers *= 2
+    for result in results:
+        result["speedup"] = result["notificationsPerSecond"] / results[0]["notificationsPerSecond"]
+    print(json.dumps({"benchmark": "processPoolScaling", "cpus": os.cpu_count(), "results": results}, indent = 2))
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+"""
+Rows per second and peak traced memory (measured in a second run) of the
+export of a query to CSV (and to Parquet, when pyarrow is installed) with
+ResultExporter, compared with SEPAClient.query, which decodes the whole
+result set. The mock broker returns result sets with typed literals of
+growing size: the peak of the exports should not grow with the number of
+rows. The results are printed (or written) as JSON.
+
+Usage: python resultExport.py [--rows 10000,100000] [--batch 10000] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import tracemalloc
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# local import
+from sepy.ResultExport import *
+from mockBroker import MockBroker
+from endToEnd import TEMPLATE
+
+# query of the template used by the benchmark
+QUERY = "OBSERVATIONS_TOPICS"
+
+
+def typedResults(rows):
+
+    """Returns a result set with an IRI, an integer, a double and a dateTime per row"""
+
+    bindings = []
+    for i in range(rows):
+        bindings.append({"s": {"type": "uri", "value": "http://example.org/observation/%s" % i},
+                         "n": {"type": "literal", "datatype": XSD + "integer", "value": str(i)},
+                         "x": {"type": "literal", "datatype": XSD + "double", "value": "%s.25" % i},
+                         "t": {"type": "literal", "datatype": XSD + "dateTime", "value": "2020-01-01T00:00:%02dZ" % (i % 60)}})
+    return json.dumps({"head": {"vars": ["s", "n", "x", "t"]}, "results": {"bindings": bindings}}).encode("utf-8")
+
+
+def measure(function):
+
+    """Runs function twice, returns its elapsed seconds and its peak traced memory in bytes"""
+
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default = "10000,100000")
+    parser.add_argument("--batch", type = int, default = 10000)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    try:
+        import pyarrow
+        formats = ["csv", "parquet"]
+    except ImportError:
+        formats = ["csv"]
+
+    directory = tempfile.mkdtemp()
+    broker = MockBroker().start()
+    kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(directory, "example.jsap")))
+    exporter = ResultExporter(kp, args.batch)
+    report = {"python": platform.python_version(), "batchSize": args.batch, "results": []}
+    try:
+        for rows in [int(r) for r in args.rows.split(",")]:
+            broker.queryResponse = typedResults(rows)
+            result = {"rows": rows, "responseBytes": len(broker.queryResponse)}
+            elapsed, peak = measure(lambda: kp.query(QUERY))
+            result["query"] = {"rowsPerSecond": rows / elapsed, "peakBytes": peak}
+            for format in formats:
+                path = os.path.join(directory, "results." + format)
+                export = exporter.toCSV if format == "csv" else exporter.toParquet
+                elapsed, peak = measure(lambda: export(QUERY, path))
+                result[format] = {"rowsPerSecond": rows / elapsed, "peakBytes": peak, "fileBytes": os.path.getsize(path)}
+            report["results"].append(result)
+    finally:
+        broker.stop()
+
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
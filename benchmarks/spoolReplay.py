@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+"""
+Throughput of the durable update spool (UpdateSpool). The outage is
+simulated by appending the updates while the spool is not draining;
+then the spool is started and the replay to the mock broker is timed,
+with different numbers of entries merged in a request. The appends are
+measured too, with background syncs (durable = False) and with producer
+threads waiting for the sync of their entries while the spool drains
+(durable = True, the syncs are shared by the producers waiting at the
+same time). The results are printed (or written) as JSON.
+
+Usage: python spoolReplay.py [--updates N] [--batch 1,100,500] [--producers N] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+from threading import Thread
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.UpdateSpool import *
+from mockBroker import MockBroker
+from endToEnd import TEMPLATE
+
+# update of the template used by the benchmark
+UPDATE = "UPDATE_OBSERVATION_VALUE"
+
+
+def bindings(i):
+    return {"observation": "arces-monitor:Observation%s" % i, "value": str(i)}
+
+
+def benchmarkAppend(kp, updates):
+
+    """Measures the appends with background syncs"""
+
+    spool = UpdateSpool(kp, tempfile.mkdtemp(), durable = False)
+    start = time.perf_counter()
+    for i in range(updates):
+        spool.update(UPDATE, bindings(i))
+    elapsed = time.perf_counter() - start
+    spool.stop(flush = False)
+    return {"updatesPerSecond": updates / elapsed, "bytesPerUpdate": spool.usage / updates}
+
+
+def benchmarkDurableAppend(kp, updates, producers):
+
+    """Measures the appends of producer threads waiting for the sync of their entries, while the spool drains"""
+
+    spool = UpdateSpool(kp, tempfile.mkdtemp()).start()
+    def produce(first):
+        for i in range(first, updates, producers):
+            spool.update(UPDATE, bindings(i))
+    threads = [Thread(target = produce, args = (i,)) for i in range(producers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    spool.stop(flush = False)
+    return {"producers": producers, "updatesPerSecond": updates / elapsed}
+
+
+def benchmarkReplay(kp, broker, updates, batchEntries):
+
+    """Fills the spool during the outage, then measures its drain"""
+
+    spool = UpdateSpool(kp, tempfile.mkdtemp(), durable = False, batchEntries = batchEntries)
+    for i in range(updates):
+        spool.update(UPDATE, bindings(i))
+    requests = broker.updates
+    start = time.perf_counter()
+    spool.start()
+    spool.flush()
+    elapsed = time.perf_counter() - start
+    spool.stop()
+    return {"batchEntries": batchEntries,
+            "updatesPerSecond": spool.sent / elapsed,
+            "seconds": elapsed,
+            "requests": broker.updates - requests}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type = int, default = 20000)
+    parser.add_argument("--batch", default = "1,100,500")
+    parser.add_argument("--producers", type = int, default = 16)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # start the broker and the client
+    broker = MockBroker().start()
+    directory = tempfile.mkdtemp()
+    kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(directory, "bench.jsap")))
+
+    # run the benchmarks
+    report = {"benchmark": "spoolReplay",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+    report["append"] = benchmarkAppend(kp, args.updates)
+    report["durableAppend"] = benchmarkDurableAppend(kp, min(args.updates, 2000), args.producers)
+    report["replay"] = [benchmarkReplay(kp, broker, args.updates, int(size)) for size in args.batch.split(",")]
+    broker.stop()
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+
+"""
+Write volume of the state synchronization (StatePlanner) on mostly
+static data: a state of N observations is synchronized with a desired
+state where a fraction of the topics changed, once rewriting the whole
+state (DELETE DATA of all the current triples, INSERT DATA of all the
+desired ones) and once with the minimal plan. The triples, requests,
+bytes and time of both are reported, against the mock broker. The
+results are printed (or written) as JSON.
+
+Usage: python statePlanner.py [--observations N] [--changed 0.001,0.01,0.1] [--batch N] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.StatePlanner import *
+from mockBroker import MockBroker
+from endToEnd import TEMPLATE
+
+# query of the template used by the benchmark
+QUERY = "OBSERVATIONS_TOPICS"
+
+
+def topic(i, version = 0):
+    return {"observation": {"type": "uri", "value": "http://example.org/observation%s" % i},
+            "topic": {"type": "literal", "value": "site/sensor/%s/v%s" % (i, version)}}
+
+
+def send(kp, planner, requests):
+
+    """Sends the requests, returns their statistics"""
+
+    start = time.perf_counter()
+    for sparqlUpdate in requests:
+        kp.sendUpdate(QUERY, sparqlUpdate, False, None)
+    return {"requests": len(requests),
+            "bytes": sum(len(sparqlUpdate.encode("utf-8")) for sparqlUpdate in requests),
+            "seconds": time.perf_counter() - start}
+
+
+def benchmark(kp, observations, changed, batchSize):
+
+    """Compares the full rewrite and the minimal plan for a fraction of changed bindings"""
+
+    current = [topic(i) for i in range(observations)]
+    step = max(1, int(1 / changed))
+    desired = [topic(i, 1 if i % step == 0 else 0) for i in range(observations)]
+    planner = StatePlanner(kp, QUERY, batchSize = batchSize)
+
+    # full rewrite
+    currentTriples, desiredTriples = planner.triples(current), planner.triples(desired)
+    rewrite = send(kp, planner, planner.render(currentTriples, desiredTriples))
+    rewrite["triples"] = len(currentTriples) + len(desiredTriples)
+
+    # minimal plan
+    start = time.perf_counter()
+    deletes, inserts = planner.plan(desired, current)
+    planning = time.perf_counter() - start
+    minimal = send(kp, planner, planner.render(deletes, inserts))
+    minimal["triples"] = len(deletes) + len(inserts)
+    minimal["planningSeconds"] = planning
+    return {"changed": changed, "rewrite": rewrite, "minimal": minimal,
+            "reduction": rewrite["bytes"] / max(minimal["bytes"], 1)}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--observations", type = int, default = 20000)
+    parser.add_argument("--changed", default = "0.001,0.01,0.1")
+    parser.add_argument("--batch", type = int, default = 1000)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # start the broker and the client
+    broker = MockBroker().start()
+    directory = tempfile.mkdtemp()
+    kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(directory, "bench.jsap")))
+
+    # run the benchmarks
+    report = {"benchmark": "statePlanner",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+    report["results"] = [benchmark(kp, args.observations, float(changed), args.batch) for changed in args.changed.split(",")]
+    broker.stop()
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
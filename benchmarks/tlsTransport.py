@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+"""
+Latency of the secure requests against a mock broker served over TLS
+(with a self-signed certificate created with the openssl command): a new
+connection and a full handshake for every request, as the secure
+requests were sent before SecureTransport (requests.post, not
+verifying), SecureTransport without keep-alive (every connection resumes
+the TLS session of the previous one) and SecureTransport with keep-alive.
+The requests/sec, the latency percentiles and the number of full and
+abbreviated handshakes are printed (or written) as JSON.
+
+Usage: python tlsTransport.py [--requests N] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import ssl
+import json
+import time
+import argparse
+import platform
+import tempfile
+import warnings
+import subprocess
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# local import
+from sepy.SecureTransport import *
+from mockBroker import MockBroker
+
+# body of the requests
+QUERY = "SELECT * WHERE { ?s ?p ?o }"
+HEADERS = {"Content-Type": "application/sparql-query", "Accept": "application/json"}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100.0 * len(values)))] if values else None
+
+
+def certificate(directory):
+
+    """Creates a self-signed certificate for localhost, returns the certificate and key files"""
+
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost", "-days", "1", "-keyout", keyfile, "-out", certfile],
+                   check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    return certfile, keyfile
+
+
+def benchmark(name, send, requests, handshakes):
+
+    """Sends the requests one after the other, returns the statistics"""
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(requests):
+        begin = time.perf_counter()
+        status = send()
+        latencies.append(time.perf_counter() - begin)
+        if status != 200:
+            raise RuntimeError("Request failed with status {}".format(status))
+    elapsed = time.perf_counter() - start
+    full, resumed = handshakes()
+    return {"transport": name,
+            "requestsPerSecond": requests / elapsed,
+            "latency": {"p50": percentile(latencies, 50), "p99": percentile(latencies, 99)},
+            "fullHandshakes": full,
+            "resumedHandshakes": resumed}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type = int, default = 500)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # start the broker over TLS
+    certfile, keyfile = certificate(tempfile.mkdtemp())
+    broker = MockBroker()
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    broker.httpServer.socket = context.wrap_socket(broker.httpServer.socket, server_side = True)
+    broker.httpServer.handle_error = lambda request, address: None
+    broker.start()
+    uri = "https://localhost:%s%s" % (broker.httpPort, broker.queryPath)
+
+    # run the benchmarks
+    report = {"benchmark": "tlsTransport",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+    results = []
+    try:
+        import requests
+        warnings.filterwarnings("ignore")
+        def legacy():
+            r = requests.post(uri, headers = HEADERS, data = QUERY, verify = False)
+            r.connection.close()
+            return r.status_code
+        results.append(benchmark("requests", legacy, args.requests, lambda: (args.requests, 0)))
+    except ImportError:
+        pass
+    for keepAlive in (False, True):
+        transport = SecureTransport(cafile = certfile, keepAlive = keepAlive)
+        send = lambda: transport.post(uri, QUERY, HEADERS)[0]
+        handshakes = lambda: (transport.handshakes - transport.resumed, transport.resumed)
+        results.append(benchmark("SecureTransport(keepAlive = %s)" % keepAlive, send, args.requests, handshakes))
+        transport.close()
+    report["results"] = results
+    broker.stop()
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+"""
+Throughput of the windowed aggregation (WindowAggregator): notifications
+with a few bindings each are passed to the handler as the subscription
+would, and the time to compute the aggregates of a full window is
+measured for growing numbers of keys. The results are printed (or
+written) as JSON.
+
+Usage: python windowAggregation.py [--notifications N] [--bindings N] [--keys 10,100,1000] [--capacity N] [--output FILE]
+"""
+
+# global requirements
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+from sepy.WindowAggregator import *
+
+
+def notification(first, bindings, keys):
+    return {"head": {"vars": ["observation", "value"]},
+            "results": {"bindings": [{"observation": {"type": "uri", "value": "arces-monitor:Observation%s" % ((first + i) % keys)},
+                                      "value": {"type": "literal", "value": str((first + i) % 97 / 3)}} for i in range(bindings)]}}
+
+
+def benchmarkHandle(notifications, bindings, keys, capacity):
+
+    """Measures the notifications stored per second, windows closed on arrival"""
+
+    aggregator = WindowAggregator(window = 0.01, capacity = capacity, maxKeys = keys)
+    payloads = [notification(i * bindings, bindings, keys) for i in range(min(notifications, 1000))]
+    start = time.perf_counter()
+    for i in range(notifications):
+        aggregator.handle(payloads[i % len(payloads)], None)
+    elapsed = time.perf_counter() - start
+    return {"keys": keys,
+            "notificationsPerSecond": notifications / elapsed,
+            "valuesPerSecond": aggregator.received / elapsed,
+            "windows": aggregator.windows}
+
+
+def benchmarkAggregate(keys, capacity, repeat = 20):
+
+    """Measures the aggregation of a window with capacity values for every key"""
+
+    aggregator = WindowAggregator(window = 60.0, capacity = capacity, maxKeys = keys)
+    aggregator.handle(notification(0, keys * capacity, keys), None)
+    now = time.time()
+    start = time.perf_counter()
+    for i in range(repeat):
+        result = aggregator.aggregate(now - 60, now + 1)
+    elapsed = (time.perf_counter() - start) / repeat
+    return {"keys": keys,
+            "valuesPerWindow": int(result["count"].sum()),
+            "millisecondsPerWindow": elapsed * 1000,
+            "bytes": aggregator.values.nbytes + aggregator.times.nbytes}
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notifications", type = int, default = 20000)
+    parser.add_argument("--bindings", type = int, default = 5)
+    parser.add_argument("--keys", default = "10,100,1000")
+    parser.add_argument("--capacity", type = int, default = 512)
+    parser.add_argument("--output", default = None)
+    args = parser.parse_args()
+
+    # run the benchmarks
+    report = {"benchmark": "windowAggregation",
+              "timestamp": time.time(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "parameters": vars(args)}
+    keys = [int(k) for k in args.keys.split(",")]
+    report["handle"] = [benchmarkHandle(args.notifications, args.bindings, k, args.capacity) for k in keys]
+    report["aggregate"] = [benchmarkAggregate(k, args.capacity) for k in keys]
+
+    # output
+    output = json.dumps(report, indent = 2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(output)
+    else:
+        print(output)
@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+
+# global requirements
+from threading import Condition
+import logging
+import math
+import time
+
+
+class AdaptiveLimiter:
+
+    """
+    Limits the requests in flight to a number adapted to the response
+    times and errors of the broker, so that producers slow down (waiting
+    in acquire) instead of piling requests on an overloaded broker.
+
+    A response is a sign of overload when it fails (connection errors,
+    429 and 5xx responses) or when its latency exceeds the threshold:
+    targetLatency if given, otherwise tolerance times the lowest latency
+    observed recently. The limit then changes according to algorithm:
+
+    - "aimd": +1 for every limit responses without overload, times
+      backoff on overload (at most once per latency, so that the
+      responses of the same burst count once)
+    - "gradient": limit x gradient + sqrt(limit), smoothed, where the
+      gradient is the threshold divided by the latency, clamped to
+      [0.5, 1]; times backoff on failures
+
+    The suggested batch size (e.g. the operations of an updateMany)
+    follows the same signals: +10% without overload, times backoff on
+    overload.
+
+    Parameters
+    ----------
+    algorithm : str
+        "aimd" or "gradient" (default = "aimd")
+    initialLimit : int
+        The initial number of requests in flight (default = 4)
+    minLimit : int
+        The minimum number of requests in flight (default = 1)
+    maxLimit : int
+        The maximum number of requests in flight (default = 64)
+    targetLatency : float
+        The latency in seconds above which the broker is overloaded (default = None, tolerance x the lowest latency)
+    tolerance : float
+        The ratio to the lowest latency above which the broker is overloaded (default = 2.0)
+    backoff : float
+        The factor applied to the limit on overload (default = 0.9)
+    smoothing : float
+        The weight of a response on the limit of the gradient algorithm (default = 0.2)
+    initialBatch : int
+        The initial suggested batch size (default = 100)
+    minBatch : int
+        The minimum suggested batch size (default = 1)
+    maxBatch : int
+        The maximum suggested batch size (default = 1000)
+    metrics : MetricsRegistry
+        The registry of the sepy_concurrency_limit, sepy_inflight_requests and sepy_batch_size gauges and of the sepy_limiter_wait_seconds histogram (default = None)
+
+    Attributes
+    ----------
+    limit : float
+        The current limit (requests in flight are at most its integer part)
+    batchSize : int
+        The suggested batch size
+    inFlight : int
+        The number of requests in flight
+    minLatency : float
+        The lowest latency observed recently (slowly forgotten)
+    overloads : int
+        The number of responses signalling overload
+
+    """
+
+    # constructor
+    def __init__(self, algorithm = "aimd", initialLimit = 4, minLimit = 1, maxLimit = 64, targetLatency = None, tolerance = 2.0, backoff = 0.9,
+                 smoothing = 0.2, initialBatch = 100, minBatch = 1, maxBatch = 1000, metrics = None):
+
+        """Constructor of the AdaptiveLimiter class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== AdaptiveLimiter::__init__ invoked ===")
+
+        # configuration
+        if algorithm not in ("aimd", "gradient"):
+            raise ValueError("algorithm must be aimd or gradient")
+        self.algorithm = algorithm
+        self.minLimit = minLimit
+        self.maxLimit = maxLimit
+        self.targetLatency = targetLatency
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.minBatch = minBatch
+        self.maxBatch = maxBatch
+        self.metrics = metrics
+
+        # state
+        self.condition = Condition()
+        self.limit = float(max(minLimit, min(initialLimit, maxLimit)))
+        self.batchSize = max(minBatch, min(initialBatch, maxBatch))
+        self.inFlight = 0
+        self.minLatency = None
+        self.lastDecrease = -math.inf
+
+        # counters
+        self.overloads = 0
+
+
+    # wait for a slot
+    def acquire(self, timeout = None):
+
+        """
+        Waits until a request can be sent
+
+        Parameters
+        ----------
+        timeout : float
+            The maximum wait in seconds (default = None, no limit)
+
+        Returns
+        -------
+        float
+            The time.perf_counter() of the start of the request, to pass to release (None on timeout)
+
+        """
+
+        start = time.perf_counter()
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.inFlight < int(self.limit), timeout):
+                return None
+            self.inFlight += 1
+            inFlight = self.inFlight
+        now = time.perf_counter()
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.observe("sepy_limiter_wait_seconds", now - start)
+            metrics.set("sepy_inflight_requests", inFlight)
+        return now
+
+
+    # report a response
+    def release(self, start, failed = False):
+
+        """
+        Ends a request, adapting the limit to its latency and outcome
+
+        Parameters
+        ----------
+        start : float
+            The value returned by acquire
+        failed : bool
+            True if the request failed because of the broker or the network (default = False)
+
+        """
+
+        now = time.perf_counter()
+        latency = now - start
+        with self.condition:
+            self.inFlight -= 1
+
+            # the lowest latency is forgotten slowly, to follow changes of the broker
+            if not failed:
+                if self.minLatency is None:
+                    self.minLatency = latency
+                else:
+                    self.minLatency = min(latency, self.minLatency * 1.0001)
+            threshold = self.targetLatency if self.targetLatency is not None else self.tolerance * (self.minLatency or latency)
+            overloaded = failed or latency > threshold
+
+            # adapt the limit
+            limit = self.limit
+            if self.algorithm == "aimd":
+                if not overloaded:
+                    limit += 1.0 / limit
+                elif now - self.lastDecrease > latency:
+                    limit *= self.backoff
+                    self.lastDecrease = now
+            else:
+                if failed:
+                    target = limit * self.backoff
+                else:
+                    target = limit * max(0.5, min(1.0, threshold / max(latency, 1e-9))) + math.sqrt(limit)
+                limit = limit * (1 - self.smoothing) + target * self.smoothing
+            self.limit = max(self.minLimit, min(self.maxLimit, limit))
+
+            # adapt the batch size
+            if overloaded:
+                self.overloads += 1
+                self.batchSize = max(self.minBatch, int(self.batchSize * self.backoff))
+            else:
+                self.batchSize = min(self.maxBatch, self.batchSize + max(1, self.batchSize // 10))
+            self.condition.notify_all()
+            inFlight = self.inFlight
+
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.set("sepy_concurrency_limit", self.limit)
+            metrics.set("sepy_inflight_requests", inFlight)
+            metrics.set("sepy_batch_size", self.batchSize)
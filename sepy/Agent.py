@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+
+# global requirements
+from socketserver import ThreadingUnixStreamServer, BaseRequestHandler
+from threading import Thread, Lock, RLock
+import argparse
+import logging
+import signal
+import sys
+import os
+
+# local requirements
+from .SEPAClient import *
+from .AgentClient import defaultSocketPath, sendFrame, recvFrame
+
+
+class StreamHandler:
+
+    """
+    A handler forwarding the notifications of a subscription to an agent
+    client. The notifications received before the response to the
+    subscription (e.g. the results replayed to a late joiner) are held
+    back and sent after it by start.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = RLock()
+        self.closed = False
+        self.backlog = []
+
+    def write(self, message):
+        if self.closed:
+            return
+        try:
+            sendFrame(self.sock, message)
+        except OSError:
+            self.closed = True
+
+    def send(self, message):
+        with self.lock:
+            if self.backlog is not None:
+                self.backlog.append(message)
+            else:
+                self.write(message)
+
+    def start(self, response):
+
+        """Sends the response to the subscription, then the notifications held back"""
+
+        with self.lock:
+            self.write(response)
+            for message in self.backlog:
+                self.write(message)
+            self.backlog = None
+
+    def handle(self, added, removed):
+        self.send({"added": added, "removed": removed})
+
+    def handleError(self, error):
+        self.send({"error": str(error)})
+
+
+class AgentConnection(BaseRequestHandler):
+
+    """Serves the requests of an agent client"""
+
+    def handle(self):
+        agent = self.server.agent
+        while True:
+            try:
+                message = recvFrame(self.request)
+            except (OSError, ValueError):
+                return
+            if message is None:
+                return
+            if message.get("op") == "subscribe":
+                agent.stream(self.request, message)
+                return
+            sendFrame(self.request, agent.handleRequest(message))
+
+
+class AgentServer(ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class SEPAAgent:
+
+    """
+    A long-running process serving updates, queries and subscriptions to
+    AgentClient instances through a Unix domain socket. It keeps a
+    SEPAClient (configuration, pooled HTTP connections, tokens and
+    subscriptions) for every configuration file it is asked about, so
+    that short-lived producers skip the start-up cost. Start it with
+    python -m sepy.Agent.
+
+    Parameters
+    ----------
+    socketPath : str
+        The path of the socket (default = defaultSocketPath())
+    logLevel : int
+        The desired log level (default = 40)
+    metrics : MetricsRegistry
+        A registry passed to all the clients (default = None)
+    tracer : Tracer
+        The hooks passed to all the clients (default = None)
+
+    Attributes
+    ----------
+    clients : dict
+        Dictionary with the SEPAClient instances indexed by (configuration file, credentials file or None)
+    requests : int
+        The number of requests served
+
+    """
+
+    # constructor
+    def __init__(self, socketPath = None, logLevel = 40, metrics = None, tracer = None):
+
+        """Constructor of the SEPAAgent class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.setLevel(logLevel)
+        self.logger.debug("=== SEPAAgent::__init__ invoked ===")
+
+        # initialize
+        self.socketPath = socketPath or defaultSocketPath()
+        self.logLevel = logLevel
+        self.metrics = metrics
+        self.tracer = tracer
+        self.clients = {}
+        self.clientsLock = Lock()
+        self.requests = 0
+        self.server = None
+
+
+    # get or create the client of a configuration file
+    def client(self, File, yskFile = None):
+
+        """Returns the SEPAClient of a configuration file and of the file with its credentials, creating it on first use"""
+
+        key = (os.path.abspath(File), os.path.abspath(yskFile) if yskFile else None)
+        client = self.clients.get(key)
+        if client is None:
+            with self.clientsLock:
+                client = self.clients.get(key)
+                if client is None:
+                    import requests
+                    self.logger.info("Loading configuration {}".format(key[0]))
+                    client = SEPAClient(key[0], self.logLevel, metrics = self.metrics, tracer = self.tracer, yskFile = key[1])
+                    client.connectionManager.session = requests.Session()
+                    self.clients[key] = client
+        return client
+
+
+    # serve a request
+    def handleRequest(self, message):
+
+        """Performs a request received from a client and returns the response"""
+
+        self.requests += 1
+        try:
+            op = message["op"]
+            if op == "ping":
+                return {"ok": True}
+            secure = message.get("secure", False)
+            if secure and not message.get("yskFile"):
+                return {"error": "Secure requests need the file with the credentials (yskFile)"}
+            client = self.client(message["file"], message.get("yskFile") if secure else None)
+            if op == "update":
+                status, results = client.update(message["name"], message.get("bindings") or {}, secure)
+            elif op == "query":
+                status, results = client.query(message["name"], message.get("bindings") or {}, secure)
+            else:
+                return {"error": "Unknown operation {}".format(op)}
+            return {"status": status, "results": results}
+        except Exception as e:
+            self.logger.error("Request failed: {}".format(e))
+            return {"error": "{}: {}".format(type(e).__name__, e)}
+
+
+    # serve a subscription
+    def stream(self, sock, message):
+
+        """Streams the notifications of a subscription until the client disconnects"""
+
+        self.requests += 1
+        handler = StreamHandler(sock)
+
+        # the notifications (e.g. the results replayed to late joiners) wait for the response
+        try:
+            client = self.client(message["file"], message.get("yskFile"))
+            subid = client.subscribe(message["name"], message.get("alias"), handler, message.get("yskFile"), message.get("bindings") or {})
+        except Exception as e:
+            self.logger.error("Subscription failed: {}".format(e))
+            handler.start({"error": "{}: {}".format(type(e).__name__, e)})
+            return
+        handler.start({"ok": True})
+
+        # wait for the client to leave
+        try:
+            while sock.recv(4096):
+                pass
+        except OSError:
+            pass
+        handler.closed = True
+        client.unsubscribe(subid)
+
+
+    # start the server
+    def start(self):
+
+        """Starts serving in a background thread"""
+
+        # debug print
+        self.logger.debug("=== SEPAAgent::start invoked ===")
+
+        if os.path.exists(self.socketPath):
+            os.unlink(self.socketPath)
+        self.server = AgentServer(self.socketPath, AgentConnection)
+        self.server.agent = self
+        os.chmod(self.socketPath, 0o600)
+        thread = Thread(target = self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+    # stop the server
+    def stop(self):
+
+        """Stops serving and closes the subscriptions"""
+
+        # debug print
+        self.logger.debug("=== SEPAAgent::stop invoked ===")
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.socketPath):
+                os.unlink(self.socketPath)
+        for client in list(self.clients.values()):
+            for subid in list(client.subscriptions):
+                client.unsubscribe(subid)
+
+
+# main
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(prog = "sepy-agent", description = "Keeps sepy clients warm for the AgentClient instances")
+    parser.add_argument("--socket", default = None, help = "the socket path (default = %s)" % defaultSocketPath())
+    parser.add_argument("--preload", nargs = "*", default = [], help = "configuration files to load at start-up")
+    parser.add_argument("--log-level", type = int, default = 40)
+    args = parser.parse_args()
+
+    agent = SEPAAgent(args.socket, args.log_level)
+    for File in args.preload:
+        agent.client(File)
+    agent.start()
+    print("sepy-agent listening on {}".format(agent.socketPath))
+
+    # stop on SIGTERM as on Ctrl-C, removing the socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        signal.pause()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        agent.stop()
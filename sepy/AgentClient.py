@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+
+# global requirements
+from threading import Thread, Lock
+from uuid import uuid4
+import argparse
+import logging
+import socket
+import struct
+import json
+import sys
+import os
+
+# local requirements
+from .Exceptions import *
+
+# every frame is a JSON document preceded by its length (4 bytes, big endian)
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME = 64 * 1024 * 1024
+
+
+def defaultSocketPath():
+
+    """
+    Returns the default path of the agent socket: $SEPY_AGENT_SOCKET if set,
+    otherwise sepy-agent.sock in $XDG_RUNTIME_DIR or in the temp directory
+    (with the uid in the name)
+    """
+
+    path = os.environ.get("SEPY_AGENT_SOCKET")
+    if path:
+        return path
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "sepy-agent.sock")
+    return os.path.join("/tmp", "sepy-agent-%s.sock" % os.getuid())
+
+
+def sendFrame(sock, message):
+
+    """Sends a message on a socket"""
+
+    payload = json.dumps(message, separators = (",", ":")).encode("utf-8")
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recvFrame(sock):
+
+    """Receives a message from a socket, returns None if the peer closed the connection"""
+
+    header = recvExact(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    length = FRAME_HEADER.unpack(header)[0]
+    if length > MAX_FRAME:
+        raise AgentException("Frame too large ({} bytes)".format(length))
+    payload = recvExact(sock, length)
+    if payload is None:
+        return None
+    return json.loads(payload)
+
+
+def recvExact(sock, size):
+
+    """Receives exactly size bytes, returns None if the peer closed the connection"""
+
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            return None
+        received += n
+    return buffer
+
+
+class AgentClient:
+
+    """
+    A lightweight client forwarding updates, queries and subscriptions
+    to a sepy agent (see SEPAAgent) through a Unix domain socket. The
+    agent keeps the configuration, the HTTP connections, the tokens and
+    the subscriptions warm, so a request only costs a local round trip.
+    The methods mirror the ones of SEPAClient.
+
+    Parameters
+    ----------
+    File : str
+        JSAP or YSAP file used for configuration (as seen by the agent)
+    socketPath : str
+        The path of the agent socket (default = defaultSocketPath())
+    timeout : float
+        The timeout of the requests in seconds (default = None, no timeout)
+    yskFile : str
+        The file with the credentials of the secure updates and queries (as seen by the agent, default = None)
+
+    """
+
+    # constructor
+    def __init__(self, File, socketPath = None, timeout = None, yskFile = None):
+
+        """Constructor of the AgentClient class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== AgentClient::__init__ invoked ===")
+
+        # initialize
+        self.File = os.path.abspath(File)
+        self.socketPath = socketPath or defaultSocketPath()
+        self.timeout = timeout
+        self.yskFile = os.path.abspath(yskFile) if yskFile else None
+        self.sock = None
+        self.lock = Lock()
+        self.subscriptions = {}
+
+
+    # open a connection to the agent
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socketPath)
+        except OSError as e:
+            sock.close()
+            raise AgentException("Cannot connect to the agent on {}: {}".format(self.socketPath, e))
+        return sock
+
+
+    # check a reused connection
+    def stale(self, sock):
+
+        """Returns True if the agent closed (or reset) a connection, e.g. when it was restarted"""
+
+        import select
+        try:
+            if not select.select([sock], [], [], 0)[0]:
+                return False
+            return sock.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+
+
+    # request/response round trip
+    def request(self, message):
+
+        """
+        Sends a request to the agent and returns its response, raising
+        AgentException on errors. A reused connection found closed by the
+        agent is replaced once, before the request is sent: a request that
+        may have reached the agent (e.g. after a timeout) is never sent
+        again, updates not being idempotent.
+        """
+
+        with self.lock:
+            if self.sock is not None and self.stale(self.sock):
+                self.sock.close()
+                self.sock = None
+            for attempt in (0, 1):
+                reused = self.sock is not None
+                if not reused:
+                    self.sock = self.connect()
+                try:
+                    sendFrame(self.sock, message)
+                except socket.timeout:
+                    self.sock.close()
+                    self.sock = None
+                    raise AgentException("Timed out sending the request to the agent")
+                except OSError as e:
+                    # nothing reached the agent: retry once on a new connection
+                    self.sock.close()
+                    self.sock = None
+                    if reused:
+                        continue
+                    raise AgentException("Cannot send the request to the agent: {}".format(e))
+                try:
+                    response = recvFrame(self.sock)
+                except socket.timeout:
+                    self.sock.close()
+                    self.sock = None
+                    raise AgentException("Timed out waiting for the response of the agent")
+                except OSError:
+                    response = None
+                if response is None:
+                    self.sock.close()
+                    self.sock = None
+                    raise AgentException("The agent closed the connection")
+                break
+        if "error" in response:
+            raise AgentException(response["error"])
+        return response
+
+
+    # update
+    def update(self, updateName, forcedBindings = {}, secure = False):
+
+        """Performs a SPARQL update through the agent, returns (status, results) as SEPAClient.update"""
+
+        self.logger.debug("=== AgentClient::update invoked ===")
+        response = self.request({"op": "update", "file": self.File, "name": updateName, "bindings": forcedBindings, "secure": secure, "yskFile": self.yskFile})
+        return response["status"], response["results"]
+
+
+    # query
+    def query(self, queryName, forcedBindings = {}, secure = False):
+
+        """Performs a SPARQL query through the agent, returns (status, results) as SEPAClient.query"""
+
+        self.logger.debug("=== AgentClient::query invoked ===")
+        response = self.request({"op": "query", "file": self.File, "name": queryName, "bindings": forcedBindings, "secure": secure, "yskFile": self.yskFile})
+        return response["status"], response["results"]
+
+
+    # subscribe
+    def subscribe(self, subscriptionName, alias = None, handler = None, yskFile = None, forcedBindings = {}):
+
+        """
+        Starts a subscription through the agent: the notifications are
+        streamed on a dedicated connection and passed to the handler from
+        a background thread. The agent shares the server-side subscription
+        among all its clients.
+
+        Returns
+        -------
+        subid : str
+            The local id of the subscription, useful to call the unsubscribe method
+
+        """
+
+        self.logger.debug("=== AgentClient::subscribe invoked ===")
+
+        # open the stream
+        sock = self.connect()
+        sendFrame(sock, {"op": "subscribe", "file": self.File, "name": subscriptionName, "bindings": forcedBindings,
+                         "alias": alias, "yskFile": os.path.abspath(yskFile) if yskFile else None})
+        response = recvFrame(sock)
+        if response is None or "error" in response:
+            sock.close()
+            raise SubscriptionFailedException(response["error"] if response else "The agent closed the connection")
+        sock.settimeout(None)
+
+        # dispatch the notifications
+        subid = str(uuid4())
+        thread = Thread(target = self.dispatch, args = (sock, handler))
+        thread.daemon = True
+        self.subscriptions[subid] = sock
+        thread.start()
+        return subid
+
+
+    def dispatch(self, sock, handler):
+        while True:
+            try:
+                message = recvFrame(sock)
+            except (OSError, ValueError):
+                message = None
+            if message is None:
+                return
+            if handler is None:
+                continue
+            if "error" in message:
+                if hasattr(handler, "handleError"):
+                    handler.handleError(message["error"])
+            else:
+                handler.handle(message["added"], message["removed"])
+
+
+    # unsubscribe
+    def unsubscribe(self, subid = None, secure = False):
+
+        """Stops a subscription: closing its stream makes the agent detach the handler"""
+
+        self.logger.debug("=== AgentClient::unsubscribe invoked ===")
+        sock = self.subscriptions.pop(subid)
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+
+    # close
+    def close(self):
+
+        """Closes the connection to the agent and all the subscription streams"""
+
+        for subid in list(self.subscriptions):
+            self.unsubscribe(subid)
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+
+
+# command line client, e.g. for shell producers:
+# python -m sepy.AgentClient update mqtt.jsap ADD_OBSERVATION '{"observation": "..."}'
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Forwards an update or a query to the sepy agent")
+    parser.add_argument("op", choices = ("update", "query"))
+    parser.add_argument("file", help = "the JSAP or YSAP file")
+    parser.add_argument("name", help = "the name of the update or query")
+    parser.add_argument("bindings", nargs = "?", default = "{}", help = "the forced bindings, as a JSON object")
+    parser.add_argument("--socket", default = None, help = "the agent socket (default = %s)" % defaultSocketPath())
+    parser.add_argument("--secure", action = "store_true")
+    parser.add_argument("--ysk", default = None, help = "the file with the credentials, needed by --secure")
+    args = parser.parse_args()
+    if args.secure and args.ysk is None:
+        parser.error("--secure needs the file with the credentials (--ysk)")
+
+    client = AgentClient(args.file, args.socket, yskFile = args.ysk)
+    method = client.update if args.op == "update" else client.query
+    status, results = method(args.name, json.loads(args.bindings), args.secure)
+    print(results if isinstance(results, str) else json.dumps(results))
+    sys.exit(0 if status else 1)
@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+
+# global requirements
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, BoundedSemaphore
+import argparse
+import logging
+import time
+import sys
+import re
+
+# local requirements
+from .SEPAClient import *
+from .RDFStream import *
+
+# local names that can be written as prefixed names without escapes
+LOCAL_NAME_REGEX = re.compile(r'^[A-Za-z0-9_](?:[\w\-.]*[\w\-])?$')
+
+
+class NamespaceCompactor:
+
+    """
+    Rewrites full IRIs as prefixed names using a set of namespaces (e.g.
+    the ones of a JSAP file). The namespace of an IRI is found with a
+    dictionary lookup, splitting the IRI after its last # or /.
+
+    Parameters
+    ----------
+    namespaces : dict
+        Dictionary with the namespace IRIs indexed by prefix
+
+    """
+
+    def __init__(self, namespaces):
+        self.prefixes = {iri: prefix for prefix, iri in namespaces.items()}
+
+    def compact(self, term):
+
+        """Returns the compacted form of a term (literals are compacted in their datatype)"""
+
+        if term.startswith("<"):
+            iri = term[1:-1]
+            split = max(iri.rfind("#"), iri.rfind("/")) + 1
+            prefix = self.prefixes.get(iri[:split])
+            if prefix is not None and LOCAL_NAME_REGEX.match(iri[split:]):
+                return "%s:%s" % (prefix, iri[split:])
+            return term
+        if term.endswith(">") and "^^<" in term:
+            literal, _, datatype = term.rpartition("^^")
+            return literal + "^^" + self.compact(datatype)
+        return term
+
+
+class BulkLoader:
+
+    """
+    Loads large N-Triples or Turtle files into SEPA. The files are parsed
+    as streams and the triples are grouped into INSERT DATA requests of at
+    most maxBytes bytes (and maxTriples triples), compacted with the
+    namespaces of the JSAP file. The requests are sent by a pool of
+    workers, retrying the failed ones; at most 2 * workers requests are
+    kept in memory, so memory does not grow with the input.
+
+    Parameters
+    ----------
+    client : SEPAClient
+        The client used to send the updates
+    workers : int
+        The number of concurrent requests (default = 4)
+    maxBytes : int
+        The maximum size of a request body in bytes (default = 262144)
+    maxTriples : int
+        The maximum number of triples per request (default = 10000)
+    retries : int
+        The number of retries of a failed request (default = 3)
+    backoff : float
+        The delay before the first retry in seconds, doubled at every retry (default = 0.5)
+    graph : str
+        The IRI of the graph receiving the triples (default = None, the default graph)
+    progress : function
+        A function called with the statistics (see stats) after every request (default = None)
+    secure : bool
+        A boolean that states if the updates must be secure or not (default = False)
+
+    Attributes
+    ----------
+    stats : dict
+        The triples read, the chunks and triples sent or failed, the elapsed seconds
+    errors : list
+        The first errors of the failed requests
+
+    """
+
+    # constructor
+    def __init__(self, client, workers = 4, maxBytes = 262144, maxTriples = 10000, retries = 3, backoff = 0.5, graph = None, progress = None, secure = False):
+
+        """Constructor of the BulkLoader class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== BulkLoader::__init__ invoked ===")
+
+        # configuration
+        self.client = client
+        self.workers = workers
+        self.maxBytes = maxBytes
+        self.maxTriples = maxTriples
+        self.retries = retries
+        self.backoff = backoff
+        self.graph = graph
+        self.progress = progress
+        self.secure = secure
+        self.compactor = NamespaceCompactor(client.configuration.namespaces)
+
+        # request template
+        self.prologue = client.configuration.nsSparql + "INSERT DATA { "
+        self.epilogue = " }"
+        if graph is not None:
+            self.prologue += "GRAPH <%s> { " % graph
+            self.epilogue = " } }"
+
+        # state
+        self.lock = Lock()
+        self.stats = {"triples": 0, "chunks": 0, "sentTriples": 0, "failedChunks": 0, "failedTriples": 0, "retries": 0, "seconds": 0.0}
+        self.errors = []
+        self.start = time.perf_counter()
+
+
+    # split the triples in requests
+    def chunks(self, triples):
+
+        """Yields (sparql, count) requests from a stream of triples"""
+
+        overhead = len((self.prologue + self.epilogue).encode("utf-8"))
+        compact = self.compactor.compact
+        lines = []
+        size = overhead
+        for subject, predicate, obj in triples:
+            line = "%s %s %s ." % (compact(subject), compact(predicate), compact(obj))
+            length = len(line.encode("utf-8")) + 1
+            if lines and (size + length > self.maxBytes or len(lines) >= self.maxTriples):
+                yield self.prologue + "\n".join(lines) + self.epilogue, len(lines)
+                lines = []
+                size = overhead
+            lines.append(line)
+            size += length
+            self.stats["triples"] += 1
+        if lines:
+            yield self.prologue + "\n".join(lines) + self.epilogue, len(lines)
+
+
+    # send a request, with retries
+    def send(self, sparql, count):
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self.lock:
+                    self.stats["retries"] += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                status, results = self.client.sendUpdate("bulk", sparql, self.secure, None, makeDeadline(None, self.client.timeout))
+                if status:
+                    error = None
+                    break
+                error = results
+            except Exception as e:
+                error = e
+        with self.lock:
+            if error is None:
+                self.stats["chunks"] += 1
+                self.stats["sentTriples"] += count
+            else:
+                self.stats["failedChunks"] += 1
+                self.stats["failedTriples"] += count
+                if len(self.errors) < 10:
+                    self.errors.append(str(error))
+                self.logger.error("Chunk of {} triples failed: {}".format(count, error))
+            self.stats["seconds"] = time.perf_counter() - self.start
+            stats = dict(self.stats)
+        if self.progress is not None:
+            self.progress(stats)
+
+
+    # load
+    def load(self, paths, format = None, base = None):
+
+        """
+        Loads one or more files
+
+        Parameters
+        ----------
+        paths : str or list
+            The files to load
+        format : str
+            "nt" or "ttl" (default = None, from the file extension)
+        base : str
+            The base IRI of the Turtle files (default = None)
+
+        Returns
+        -------
+        dict
+            The statistics of the load (see stats)
+
+        """
+
+        # debug print
+        self.logger.debug("=== BulkLoader::load invoked ===")
+
+        if isinstance(paths, str):
+            paths = [paths]
+        self.start = time.perf_counter()
+
+        # at most 2 * workers requests are built and not yet sent
+        slots = BoundedSemaphore(2 * self.workers)
+
+        def task(sparql, count):
+            try:
+                self.send(sparql, count)
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            for path in paths:
+                for sparql, count in self.chunks(parseFile(path, format, base)):
+                    slots.acquire()
+                    executor.submit(task, sparql, count)
+
+        self.stats["seconds"] = time.perf_counter() - self.start
+        return dict(self.stats)
+
+
+# command line
+# python -m sepy.BulkLoader mqtt.jsap data.ttl [more.nt ...]
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Loads N-Triples or Turtle files into SEPA")
+    parser.add_argument("configuration", help = "the JSAP or YSAP file")
+    parser.add_argument("files", nargs = "+")
+    parser.add_argument("--format", choices = ("nt", "ttl"), default = None, help = "default: from the file extension")
+    parser.add_argument("--base", default = None)
+    parser.add_argument("--graph", default = None)
+    parser.add_argument("--workers", type = int, default = 4)
+    parser.add_argument("--max-bytes", type = int, default = 262144)
+    parser.add_argument("--max-triples", type = int, default = 10000)
+    parser.add_argument("--retries", type = int, default = 3)
+    parser.add_argument("--secure", action = "store_true")
+    parser.add_argument("--ysk", default = None, help = "the file with the credentials, needed by --secure")
+    args = parser.parse_args()
+    if args.secure and args.ysk is None:
+        parser.error("--secure needs the file with the credentials (--ysk)")
+
+    def report(stats):
+        sys.stderr.write("\r%(sentTriples)d triples sent in %(chunks)d requests, %(failedTriples)d failed, %(seconds).1f s" % stats)
+
+    # keep a connection alive for every worker
+    import requests
+    client = SEPAClient(args.configuration, yskFile = args.ysk)
+    client.connectionManager.session = requests.Session()
+    client.connectionManager.session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize = args.workers))
+    loader = BulkLoader(client, args.workers, args.max_bytes, args.max_triples, args.retries, graph = args.graph, progress = report, secure = args.secure)
+    stats = loader.load(args.files, args.format, args.base)
+    report(stats)
+    sys.stderr.write("\n")
+    sys.exit(1 if stats["failedChunks"] else 0)
@@ -1,14 +1,23 @@
 #!/usr/bin/python3
 
 import re
-import yaml
 import json
+import time
 import logging
+from itertools import repeat
 from os.path import splitext
 from uuid import getnode as get_mac
 
 from .Exceptions import *
 
+
+def isScalar(column):
+
+    """Returns True if a value of the columns of renderColumns is bound in all the rows (str, bytes, values without a length and 0-d arrays)"""
+
+    return isinstance(column, (str, bytes)) or not hasattr(column, "__len__") or getattr(column, "ndim", 1) == 0
+
+
 class ConfigurationObject:
 
     """
@@ -87,6 +96,10 @@ class ConfigurationObject:
         Dictionary with SPARQL query templates (values) indexed by a friendly name (key)   
     updates : dict
         Dictionary with SPARQL update templates (values) indexed by a friendly name (key)  
+    tracer : Tracer
+        The hooks called when a template is resolved (default = None)
+    templates : dict
+        The templates compiled for the bulk rendering (see compileTemplate)
     
     """
     
@@ -112,10 +125,17 @@ class ConfigurationObject:
         
         # store the file name
         self.configurationFile = configurationFile
+
+        # lifecycle hooks (see Tracer)
+        self.tracer = None
+
+        # templates compiled by compileTemplate
+        self.templates = {}
         
         # try to open configuration file
         head,tail = splitext (configurationFile)
         if tail.upper() == ".YSAP":
+            import yaml
             try:
                 with open(configurationFile) as ysapFileStream:
                     self.configurationDict = yaml.load(ysapFileStream)
@@ -296,9 +316,13 @@ class ConfigurationObject:
         # debug print
         self.logger.debug("=== configurationObject::getSparql invoked ===")
 
+        tracer = self.tracer
+        if tracer is not None:
+            start = time.perf_counter()
+
         # initialize
         configurationSparql = None
-        configurationForcedBindings = None
+        configurationForcedBindings = {}
 
         # determine if it is query or update
         if isQuery:
@@ -320,10 +344,14 @@ class ConfigurationObject:
             # read the initial update
             try:
                 configurationSparql = self.updates[sparqlName]["sparql"]
-                configurationForcedBindings = self.updates[sparqlName]["forcedBindings"]
             except KeyError as e:
                 self.logger.error("Update not found in configuration file")
                 raise ConfigurationParsingException("Update not found in configuration file")
+
+            try:
+                configurationForcedBindings = self.updates[sparqlName]["forcedBindings"]
+            except KeyError as e:
+                self.logger.debug("No forcedBindings for the update {}".format(sparqlName))
         
         # for every forced binding perform a substitution
         for v in forcedBindings.keys():
@@ -361,5 +389,243 @@ class ConfigurationObject:
                 configurationSparql = re.sub(r'(\?|\$){1}' + v + r'\.', value + " . ", configurationSparql, flags=0)
 
         # return
+        if tracer is not None:
+            tracer.onPhase("render", start, time.perf_counter() - start, {"name": sparqlName, "isQuery": isQuery, "bindings": len(forcedBindings)})
         return self.nsSparql + configurationSparql
                 
+
+
+    def compileTemplate(self, isQuery, sparqlName, variables):
+
+        """
+        Returns a SPARQL query/update split at the forced bindings of the
+        given variables, compiled once and cached. The substitutions are
+        the ones of getSparql, made with a marker instead of the values.
+
+        Parameters
+        ----------
+        isQuery : bool
+            A variable to specify if looking for a query or an update
+        sparqlName : str
+            The friendly name of the SPARQL Query or Update
+        variables : tuple
+            The names of the variables bound
+
+        Returns
+        -------
+        text : str
+            The template as a format string, with a %s in place of every value
+        slots : list
+            The indexes in variables of the values, in order of appearance
+        types : dict
+            The types of the variables declared in the forced bindings
+
+        """
+
+        key = (isQuery, sparqlName, variables)
+        compiled = self.templates.get(key)
+        if compiled is not None:
+            return compiled
+
+        # read the template
+        templates = self.queries if isQuery else self.updates
+        try:
+            template = templates[sparqlName]
+        except KeyError as e:
+            self.logger.error("{} not found in configuration file".format("Query" if isQuery else "Update"))
+            raise ConfigurationParsingException("{} not found in configuration file".format("Query" if isQuery else "Update"))
+        configurationSparql = template["sparql"]
+        configurationForcedBindings = template.get("forcedBindings", {})
+
+        # replace the variables with markers, as getSparql does with the values
+        types = {}
+        for index, v in enumerate(variables):
+            if v in configurationForcedBindings:
+                types[v] = configurationForcedBindings[v]["type"]
+                marker = "\x00{}\x00".format(index)
+                configurationSparql = re.sub(r'(\?|\$){1}' + v + r'\s+', marker + " ", configurationSparql)
+                configurationSparql = re.sub(r'(\?|\$){1}' + v + r'\}', marker + " } ", configurationSparql)
+                configurationSparql = re.sub(r'(\?|\$){1}' + v + r'\.', marker + " . ", configurationSparql)
+
+        # split at the markers
+        parts = re.split("\x00([0-9]+)\x00", configurationSparql)
+        text = "%s".join(part.replace("%", "%%") for part in parts[0::2])
+        slots = [int(index) for index in parts[1::2]]
+        compiled = (text, slots, types)
+        self.templates[key] = compiled
+        return compiled
+
+
+    def formatColumn(self, valueType, column):
+
+        """
+        Returns the values of a column as SPARQL terms of the given type,
+        typed as getSparql does: literals between quotes, full URIs
+        between <> and prefixed names as they are.
+
+        Parameters
+        ----------
+        valueType : str
+            The type declared in the forced bindings ("literal" or "uri")
+        column : list
+            The values, a sequence or an array (e.g. NumPy or pandas),
+            bytes are decoded as UTF-8
+
+        Returns
+        -------
+        list
+            The terms
+
+        """
+
+        # arrays are converted at once (but for the arrays of bytes)
+        if hasattr(column, "astype") and hasattr(column, "tolist") and getattr(column.dtype, "kind", None) != "S":
+            values = column.astype(str).tolist()
+        else:
+            if hasattr(column, "tolist"):
+                column = column.tolist()
+            values = [value.decode("utf-8") if isinstance(value, bytes) else str(value) for value in column]
+        if valueType == "literal":
+            return list(map("'{}'".format, values))
+
+        # prefixed names need a local part, as in getSparql
+        prefixes = tuple("{}:".format(ns) for ns in self.namespaces)
+        return [value if value.startswith(prefixes) and value.index(":") + 1 < len(value) else "<{}>".format(value) for value in values]
+
+
+    def renderColumns(self, isQuery, sparqlName, columns):
+
+        """
+        Returns the SPARQL queries/updates of a template bound to columns
+        of values, one per row, without the prefixes. The template is
+        compiled once (see compileTemplate) and every column is typed at
+        once, so no dictionary is built per row: the result is the one of
+        getSparql called with the bindings of every row.
+
+        Parameters
+        ----------
+        isQuery : bool
+            A variable to specify if looking for a query or an update
+        sparqlName : str
+            The friendly name of the SPARQL Query or Update
+        columns : dict
+            The values of every variable: a sequence, an array (e.g.
+            NumPy or pandas) or a scalar (anything without a length, or
+            str and bytes), bound in all the rows
+
+        Returns
+        -------
+        list
+            The SPARQL queries or updates, without the prefixes
+
+        """
+
+        # debug print
+        self.logger.debug("=== configurationObject::renderColumns invoked ===")
+
+        tracer = self.tracer
+        if tracer is not None:
+            start = time.perf_counter()
+
+        # count the rows
+        variables = tuple(sorted(columns))
+        rows = None
+        for v in variables:
+            column = columns[v]
+            if not isScalar(column):
+                if rows is None:
+                    rows = len(column)
+                elif len(column) != rows:
+                    raise ValueError("Column {} has {} values instead of {}".format(v, len(column), rows))
+        if rows is None:
+            rows = 1
+
+        # type the columns used by the template
+        text, slots, types = self.compileTemplate(isQuery, sparqlName, variables)
+        terms = {}
+        for index in slots:
+            if index not in terms:
+                v = variables[index]
+                column = columns[v]
+                if isScalar(column):
+                    terms[index] = repeat(self.formatColumn(types[v], [column])[0], rows)
+                else:
+                    terms[index] = self.formatColumn(types[v], column)
+
+        # render the rows
+        if slots:
+            sparqlList = [text % row for row in zip(*[terms[index] for index in slots])]
+        else:
+            sparqlList = [text % ()] * rows
+        if tracer is not None:
+            tracer.onPhase("render", start, time.perf_counter() - start, {"name": sparqlName, "isQuery": isQuery, "bindings": len(columns), "rows": rows})
+        return sparqlList
+
+
+    def getUpdateColumns(self, updateName, columns, batchSize = None):
+
+        """
+        Returns the bodies of the requests performing the updates of a
+        template bound to columns of values (see renderColumns), batchSize
+        operations per request separated by ";" as in SEPAClient.updateMany.
+
+        Parameters
+        ----------
+        updateName : str
+            The friendly name of the SPARQL Update
+        columns : dict
+            The values of every variable: a sequence, an array or a scalar
+        batchSize : int
+            The number of operations per request (default = None, all in one request)
+
+        Returns
+        -------
+        list
+            The SPARQL updates, declaring the prefixes once
+
+        """
+
+        # debug print
+        self.logger.debug("=== configurationObject::getUpdateColumns invoked ===")
+
+        operations = self.renderColumns(False, updateName, columns)
+        if not operations:
+            return []
+        batchSize = batchSize or len(operations)
+        return [self.nsSparql + " ; ".join(operations[i:i + batchSize]) for i in range(0, len(operations), batchSize)]
+
+
+
+    def uris(self):
+
+        """Returns the URIs of the SEPA instance, as a tuple"""
+
+        return (self.updateURI, self.queryURI, self.subscribeURI, self.secureUpdateURI, self.secureQueryURI,
+                self.secureSubscribeURI, self.tokenReqURI, self.registerURI)
+
+
+    def changes(self, other):
+
+        """
+        Compares the templates with the ones of another configuration
+        (e.g. the same file reloaded).
+
+        Parameters
+        ----------
+        other : ConfigurationObject
+            The other configuration
+
+        Returns
+        -------
+        queries : set
+            The names of the queries added, removed or rendered differently in other
+        updates : set
+            The names of the updates added, removed or rendered differently in other
+
+        """
+
+        if self.nsSparql != other.nsSparql:
+            return set(self.queries) | set(other.queries), set(self.updates) | set(other.updates)
+        queries = set(name for name in set(self.queries) | set(other.queries) if self.queries.get(name) != other.queries.get(name))
+        updates = set(name for name in set(self.updates) | set(other.updates) if self.updates.get(name) != other.updates.get(name))
+        return queries, updates
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+# global requirements
+from threading import Thread, Event
+import logging
+import os
+
+
+class ConfigurationWatcher:
+
+    """
+    Reloads the configuration of a client when its file changes, so that
+    the processes using it pick up new templates, namespaces and URIs
+    without a restart. The file is polled every interval seconds (its
+    modification time and size) by a thread, which also parses it and
+    re-establishes the changed subscriptions (see
+    SEPAClient.reloadConfiguration), off the path of the requests. A
+    file that cannot be parsed (e.g. while it is being written) is
+    logged and the current configuration is kept until the next change.
+
+    Parameters
+    ----------
+    client : SEPAClient
+        The client whose configuration is reloaded
+    interval : float
+        The time between two checks of the file in seconds (default = 1.0)
+    onReload : function
+        A function called with the changes returned by every reload (default = None)
+
+    Attributes
+    ----------
+    reloads : int
+        The number of reloads
+    failures : int
+        The number of changes of the file that could not be loaded
+
+    """
+
+    # constructor
+    def __init__(self, client, interval = 1.0, onReload = None):
+
+        """Constructor of the ConfigurationWatcher class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== ConfigurationWatcher::__init__ invoked ===")
+
+        # configuration
+        self.client = client
+        self.interval = interval
+        self.onReload = onReload
+
+        # state
+        self.path = client.configuration.configurationFile
+        self.signature = self.stat()
+        self.stopEvent = Event()
+        self.thread = None
+
+        # counters
+        self.reloads = 0
+        self.failures = 0
+
+
+    # signature of the file
+    def stat(self):
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            return None
+        return (info.st_mtime_ns, info.st_size)
+
+
+    # check
+    def check(self):
+
+        """Reloads the configuration if the file changed since the last check, returns the changes (None if not reloaded)"""
+
+        signature = self.stat()
+        if signature is None or signature == self.signature:
+            return None
+        self.signature = signature
+        try:
+            changed = self.client.reloadConfiguration()
+        except Exception as e:
+            self.failures += 1
+            self.logger.error("Reload of {} failed, keeping the current configuration: {}".format(self.path, e))
+            return None
+        self.reloads += 1
+        if self.onReload is not None:
+            self.onReload(changed)
+        return changed
+
+
+    # thread
+    def start(self):
+
+        """Starts the thread checking the file every interval seconds"""
+
+        def run():
+            while not self.stopEvent.wait(self.interval):
+                self.check()
+
+        self.stopEvent.clear()
+        self.thread = Thread(target = run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+
+        """Stops the thread started by start"""
+
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -1,21 +1,20 @@
 #!/usr/bin/python3
 
 # global requirements
-from threading import Thread
-import websocket
-import requests
-import asyncio
+from threading import Thread, Event
+from collections import OrderedDict
 import logging
-import base64
 import time
 import json
-import sys
-import ssl
-import yaml
+
+# requests, websocket, ssl, base64 and yaml are imported by the methods
+# using them, so that importing sepy does not load the whole network stack
 
 # local requirements
 from .Exceptions import *
 from .ConfigurationObject import *
+from .SecureTransport import *
+from .Deadline import *
 
 # class ConnectionHandler
 class ConnectionHandler:
@@ -37,6 +36,24 @@ class ConnectionHandler:
         # open subscriptions
         self.websockets = {}
         self.lastSpuid = None
+
+        # optional recorder of the websocket messages (see NotificationRecorder)
+        self.recorder = None
+
+        # optional metrics registry (see MetricsRegistry)
+        self.metrics = None
+
+        # optional lifecycle hooks (see Tracer)
+        self.tracer = None
+
+        # optional requests.Session keeping the HTTP connections alive (see SEPAAgent)
+        self.session = None
+
+        # TLS layer of the secure requests and subscriptions (see SecureTransport, created when first needed)
+        self.transport = None
+
+        # maximum time in seconds waiting for the confirmations of the subscriptions
+        self.subscribeTimeout = 30.0
         
         # initialize client credentials
         self.yskDict = None
@@ -49,62 +66,154 @@ class ConnectionHandler:
         
 
     # do HTTP request
-    def unsecureRequest(self, reqURI, sparql, isQuery):
+    def unsecureRequest(self, reqURI, sparql, isQuery, name = None, deadline = None):
 
-        """Method to issue a SPARQL request over HTTP"""
+        """Method to issue a SPARQL request over HTTP (name is only used by the tracer), within the Deadline deadline if given"""
 
         # debug
         self.logger.debug("=== ConnectionHandler::unsecureRequest invoked ===")
 
         # perform the request
+        import requests
         headers = {"Accept":"application/json"}
         if isQuery:
             headers["Content-Type"] = "application/sparql-query"
         else:
             headers["Content-Type"] = "application/sparql-update"
 
-        r = requests.post(reqURI, headers = headers, data = sparql.encode("utf-8"))
-        r.connection.close()
+        data = sparql.encode("utf-8")
+        timeout = None if deadline is None else deadline.timeout("send")
+        tracer = self.tracer
+        if tracer is not None:
+            start = time.perf_counter()
+        session = self.session
+        try:
+            if session is not None:
+                r = session.post(reqURI, headers = headers, data = data, timeout = timeout)
+            else:
+                r = requests.post(reqURI, headers = headers, data = data, timeout = timeout)
+                r.connection.close()
+        except requests.exceptions.Timeout as e:
+            raise DeadlineExceededException("No response from {} within the deadline".format(reqURI)) from e
+        if tracer is not None:
+            self.traceResponse(tracer, r, start, reqURI, name, len(data))
         return r.status_code, r.text
 
 
+    # do HTTP request, without reading the response
+    def streamRequest(self, reqURI, sparql, name = None, timeout = None):
+
+        """Method to issue a SPARQL query over HTTP, returning the response before its body is read (timeout in seconds, for the connection and every read)"""
+
+        # debug
+        self.logger.debug("=== ConnectionHandler::streamRequest invoked ===")
+
+        # perform the request
+        import requests
+        headers = {"Accept":"application/json", "Content-Type":"application/sparql-query"}
+        data = sparql.encode("utf-8")
+        tracer = self.tracer
+        if tracer is not None:
+            start = time.perf_counter()
+        session = self.session
+        try:
+            if session is not None:
+                r = session.post(reqURI, headers = headers, data = data, stream = True, timeout = timeout)
+            else:
+                r = requests.post(reqURI, headers = headers, data = data, stream = True, timeout = timeout)
+        except requests.exceptions.Timeout as e:
+            raise DeadlineExceededException("No response from {} within {} s".format(reqURI, timeout)) from e
+        if tracer is not None:
+            self.traceResponse(tracer, r, start, reqURI, name, len(data))
+        return r
+
+
+    # trace a response
+    def traceResponse(self, tracer, r, start, reqURI, name, size):
+
+        """Reports the send and firstByte phases of a request started at time start"""
+
+        tracer.onPhase("firstByte", start, r.elapsed.total_seconds(), {"uri": reqURI, "name": name, "status": r.status_code})
+        tracer.onPhase("send", start, time.perf_counter() - start, {"uri": reqURI, "name": name, "bytes": size})
+
+
+    # TLS layer
+    def secureTransport(self):
+
+        """Returns the SecureTransport of the secure requests, creating a verifying one if none was given"""
+
+        if self.transport is None:
+            self.transport = SecureTransport(metrics = self.metrics)
+        return self.transport
+
+
     # do HTTPS request
-    def secureRequest(self, reqURI, sparql, isQuery, tokenURI, registerURI, File):
+    def secureRequest(self, reqURI, sparql, isQuery, tokenURI, registerURI, File, name = None, deadline = None):
+
+        """Method to issue a SPARQL request over HTTPS, with the credentials stored in the YSK file File, within the Deadline deadline if given"""
 
         # debug
         self.logger.debug("=== ConnectionHandler::secureRequest invoked ===")
-        
-        yskHandler(File)
-        
-        if self.client_secret is None:
-            self.register(registerURI)
-        if self.jwt is None:
-            self.requestToken(tokenURI)
-                        
+
+        # the credentials are read once
+        if self.filename != File:
+            self.yskHandler(File)
+        self.acquireToken(registerURI, tokenURI, deadline)
+
         # perform the request
         self.logger.debug("Performing a secure SPARQL request")
+        tracer = self.tracer
+        if tracer is not None:
+            start = time.perf_counter()
         if isQuery:
-            headers = {"Content-Type":"application/sparql-query", 
-                       "Accept":"application/json",
-                       "Authorization": "Bearer " + self.jwt}
-            r = requests.post(reqURI, headers = headers, data = sparql, verify = False)        
-            r.connection.close()
+            contentType = "application/sparql-query"
         else:
-            headers = {"Content-Type":"application/sparql-update", 
-                       "Accept":"application/json",
-                       "Authorization": "Bearer " + self.jwt}
-            r = requests.post(reqURI, headers = headers, data = sparql, verify = False)        
-            r.connection.close()
-            
+            contentType = "application/sparql-update"
+        headers = {"Content-Type": contentType,
+                   "Accept": "application/json",
+                   "Authorization": "Bearer " + self.jwt}
+        data = sparql.encode("utf-8")
+        timeout = None if deadline is None else deadline.timeout("send")
+        onHeaders = None
+        if tracer is not None:
+            onHeaders = lambda status: tracer.onPhase("firstByte", start, time.perf_counter() - start, {"uri": reqURI, "name": name, "status": status})
+        import socket
+        try:
+            status, text = self.secureTransport().post(reqURI, data, headers, timeout, onHeaders)
+        except socket.timeout as e:
+            raise DeadlineExceededException("No response from {} within the deadline".format(reqURI)) from e
+        if tracer is not None:
+            tracer.onPhase("send", start, time.perf_counter() - start, {"uri": reqURI, "name": name, "bytes": len(data), "status": status})
+
         # check for errors on token validity
-        if r.status_code == 401:
+        if status == 401:
             self.jwt = None
-            self.yskDict["jwt"] = self.jwt
+            self.yskDict["security"]["jwt"] = self.jwt
             self.storeConfig()
             raise TokenExpiredException
 
         # return
-        return r.status_code, r.text
+        return status, text
+
+
+    # get credentials
+    def acquireToken(self, registerURI, tokenURI, deadline = None):
+
+        """Method to register the client and request a token, if needed (within the Deadline deadline if given)"""
+
+        tracer = self.tracer
+        if self.client_secret is None:
+            if tracer is not None:
+                start = time.perf_counter()
+            self.register(registerURI, None if deadline is None else deadline.timeout("registration"))
+            if tracer is not None:
+                tracer.onPhase("token", start, time.perf_counter() - start, {"uri": registerURI})
+        if self.jwt is None:
+            if tracer is not None:
+                start = time.perf_counter()
+            self.requestToken(tokenURI, None if deadline is None else deadline.timeout("token request"))
+            if tracer is not None:
+                tracer.onPhase("token", start, time.perf_counter() - start, {"uri": tokenURI})
 
     
     ###################################################
@@ -113,7 +222,7 @@ class ConnectionHandler:
     #
     ###################################################
 
-    def register(self, registerURI):
+    def register(self, registerURI, timeout = None):
 
         # debug print
         self.logger.debug("=== ConnectionHandler::register invoked ===")
@@ -126,17 +235,17 @@ class ConnectionHandler:
         payload = '{"client_identity":' + self.client_id + ', "grant_types":["client_credentials"]}'
         
         # perform the request
-        r = requests.post(registerURI, headers = headers, data = payload, verify = False)        
-        r.connection.close()
-        if r.status_code == 201:
+        status, text = self.secureTransport().post(registerURI, payload, headers, timeout)
+        if status == 201:
 
             # parse the response
-            jresponse = json.loads(r.text)
+            jresponse = json.loads(text)
 
             # encode with base64 client_id and client_secret
+            import base64
             cred = base64.b64encode(bytes(jresponse["client_id"] + ":" + jresponse["client_secret"], "utf-8"))
             self.client_secret = "Basic " + cred.decode("utf-8")
-            self.yskDict["client_secret"] = self.client_secret
+            self.yskDict["security"]["client_secret"] = self.client_secret
             
             # store data into the configuration file
             self.storeConfig()
@@ -151,7 +260,7 @@ class ConnectionHandler:
     ###################################################
 
     # do request token
-    def requestToken(self, tokenURI):
+    def requestToken(self, tokenURI, timeout = None):
 
         # debug print
         self.logger.debug("=== ConnectionHandler::requestToken invoked ===")
@@ -162,13 +271,12 @@ class ConnectionHandler:
                    "Authorization": self.client_secret}    
         
         # perform the request
-        r = requests.post(tokenURI, headers = headers, verify = False)        
-        r.connection.close()
+        status, text = self.secureTransport().post(tokenURI, b"", headers, timeout)
 
-        if r.status_code == 201:
-            jresponse = json.loads(r.text)
+        if status == 201:
+            jresponse = json.loads(text)
             self.jwt = jresponse["token"]["access_token"]
-            self.yskDict["jwt"] = self.jwt
+            self.yskDict["security"]["jwt"] = self.jwt
             
             # store data into the configuration file
             self.storeConfig()
@@ -185,10 +293,33 @@ class ConnectionHandler:
     # do open websocket
     def openWebsocket(self, subscribeURI, sparql, registerURI = None, tokenURI = None, alias = None, handler = None, yskFile = None):                         
 
+        """Method to open a websocket carrying a single subscription, returns its id"""
+
+        # debug
+        self.logger.debug("=== ConnectionHandler::openWebsocket invoked ===")
+
+        # open a websocket with a single subscription
+        spuids = self.openWebsockets(subscribeURI, [sparql], registerURI, tokenURI, aliases = [alias], handlers = [handler], yskFile = yskFile)
+        return spuids[0]
+
+
+    # do open websocket with several subscriptions
+    def openWebsockets(self, subscribeURI, sparqlList, registerURI = None, tokenURI = None, aliases = None, handlers = None, yskFile = None, timeout = None):
+
+        """
+        Method to open a single websocket carrying several subscriptions.
+        Notifications are routed to the handlers by subscription id, while
+        the subscription confirmations are matched to the requests by alias.
+        Returns the list of the subscription ids, in the order of sparqlList.
+        Raises SubscriptionFailedException if the websocket is closed, or
+        the confirmations do not arrive within timeout seconds (default =
+        None, the subscribeTimeout attribute).
+        """
+
     #yskFile is used for credentials storage
     
         # debug
-        self.logger.debug("=== ConnectionHandler::openWebsocket invoked ===")
+        self.logger.debug("=== ConnectionHandler::openWebsockets invoked ===")
 
         if registerURI is not None and tokenURI is not None and yskFile is not None:    # Secure request 
             secure = True
@@ -197,15 +328,23 @@ class ConnectionHandler:
                 
         if secure:
             self.yskHandler(yskFile)
-            if self.client_secret is None:
-                self.register(registerURI)
-            if self.jwt is None:
-                self.requestToken(tokenURI)
+            self.acquireToken(registerURI, tokenURI)
         
         
         # initialization
-        handler = handler
-        spuid = None
+        if aliases is None:
+            aliases = [None] * len(sparqlList)
+        if handlers is None:
+            handlers = [None] * len(sparqlList)
+        labels = list(aliases)
+        if len(sparqlList) > 1:
+            # aliases must be unique to match the confirmations to the requests
+            aliases = ["{}-{}".format(alias or "sepy", i) for i, alias in enumerate(aliases)]
+        spuids = [None] * len(sparqlList)
+        names = {}
+        pending = OrderedDict((aliases[i], i) for i in range(len(sparqlList)))
+        routes = {}
+        confirmed = Event()
 
         # on_message callback
         def on_message(ws, message):
@@ -214,75 +353,108 @@ class ConnectionHandler:
             self.logger.debug("=== ConnectionHandler::on_message invoked ===")
             self.logger.debug(message)
 
+            # record the raw message
+            if self.recorder is not None:
+                self.recorder.record(message)
+            metrics = self.metrics
+            tracer = self.tracer
+            if metrics is not None or tracer is not None:
+                received = time.perf_counter()
+
             # process message
             jmessage = json.loads(message)
                 
             
             if "notification" in jmessage:
                 
-                nonlocal spuid
                 sequence = jmessage["notification"]["sequence"]
-                spuid = jmessage["notification"]["spuid"]
+                nspuid = jmessage["notification"]["spuid"]
                 
-                if sequence == "0":     # just subscribed
-                    self.logger.log("Subscribed to spuid: " + spuid)
+                if str(sequence) == "0":     # just subscribed
+                    self.logger.info("Subscribed to spuid: " + nspuid)
+                    nalias = jmessage["notification"].get("alias")
+                    if nalias in pending:
+                        index = pending.pop(nalias)
+                    else:
+                        index = pending.popitem(last = False)[1]
+                    routes[nspuid] = handlers[index]
+                    names[nspuid] = labels[index]
                     temp = {}
                     temp["ws"] = ws
                     temp["authorization"] = self.jwt
-                    self.websockets[spuid] = temp    # save the subscription id, the thread and the jwt
+                    self.websockets[nspuid] = temp    # save the subscription id, the thread and the jwt
+                    spuids[index] = nspuid
+                    if None not in spuids:
+                        confirmed.set()
          
-                else:
-                    added = jmessage["notification"]["addedResults"]
-                    removed = jmessage["notification"]["removedResults"]
-                    self.logger.debug("Added bindings: {}".format(added))
-                    self.logger.debug("Removed bindings: {}".format(removed))
-                    
-                    if handler is not None:
-                        handler.handle(added, removed)
+                # the first notification carries the initial results
+                added = jmessage["notification"].get("addedResults")
+                removed = jmessage["notification"].get("removedResults")
+                self.logger.debug("Added bindings: {}".format(added))
+                self.logger.debug("Removed bindings: {}".format(removed))
+                
+                handler = routes.get(nspuid)
+                if handler is not None:
+                    if metrics is not None or tracer is not None:
+                        decoded = time.perf_counter()
+                    handler.handle(added, removed)
+                    if metrics is not None:
+                        self.recordNotification(names.get(nspuid), message, handler, received, decoded)
+                    if tracer is not None:
+                        tracer.onPhase("decode", received, decoded - received, {"spuid": nspuid, "bytes": len(message)})
+                        tracer.onPhase("dispatch", decoded, time.perf_counter() - decoded, {"spuid": nspuid, "alias": names.get(nspuid)})
                     
                     
             elif "error" in jmessage:                
                 
                 self.logger.error(jmessage)
                 
-                if handler is not None:
-                    handler.handleError(jmessage)
+                for handler in set(routes.values()).union(handlers):
+                    if handler is not None:
+                        handler.handleError(jmessage)
                 
             elif "unsubscribed" in jmessage:
                 
                 uspuid = jmessage["unsubscribed"]["spuid"]
-                self.logger.log("Successfully unsubscribed from spuid: " + uspuid)
+                self.logger.info("Successfully unsubscribed from spuid: " + uspuid)
                 try:
-                    ws.close()
+                    del routes[uspuid]
                     del self.websockets[uspuid]
+                    if not routes:
+                        ws.close()
                 except:
                     pass
                 
             else:
 
-                self.logger.error("Unknown message received: " + jmessage)
+                self.logger.error("Unknown message received: {}".format(jmessage))
 
 
         # on_error callback
         def on_error(ws, error):
 
             self.logger.debug("=== ConnectionHandler::on_error invoked ===")
-            self.logger.error("Error:" + error)
-            if handler is not None:
-                handler.handleError(error)
+            self.logger.error("Error: {}".format(error))
+            for handler in set(routes.values()).union(handlers):
+                if handler is not None:
+                    handler.handleError(error)
 
 
         # on_close callback
-        def on_close(ws):
+        def on_close(ws, *args):
 
             # debug
             self.logger.debug("=== ConnectionHandler::on_close invoked ===")
 
             # destroy the websocket dictionary
-            try:
-                del self.websockets[spuid]
-            except:
-                pass
+            for rspuid in list(routes.keys()):
+                try:
+                    del self.websockets[rspuid]
+                except:
+                    pass
+
+            # stop waiting for the confirmations
+            confirmed.set()
 
 
         # on_open callback
@@ -291,22 +463,25 @@ class ConnectionHandler:
             # debug
             self.logger.debug("=== ConnectionHandler::on_open invoked ===")
 
-            # composing message
-            msg = {}
-            msg1 = {}
-            msg1["sparql"] = sparql
-            if alias is not None:
-                msg["alias"] = alias
-            if secure:
-                msg1["authorization"] = self.jwt
-            
-            msg["subscribe"] = msg1
-            # send subscription request
-            self.logger.debug(msg)
-            ws.send(json.dumps(msg))
+            for sparql, alias in zip(sparqlList, aliases):
+
+                # composing message
+                msg = {}
+                msg1 = {}
+                msg1["sparql"] = sparql
+                if alias is not None:
+                    msg["alias"] = alias
+                if secure:
+                    msg1["authorization"] = self.jwt
+                
+                msg["subscribe"] = msg1
+                # send subscription request
+                self.logger.debug(msg)
+                ws.send(json.dumps(msg))
         
 
         # configuring the websocket
+        import websocket
         ws = websocket.WebSocketApp(subscribeURI,
                                     on_message = on_message,
                                     on_error = on_error,
@@ -317,37 +492,62 @@ class ConnectionHandler:
         # of the code stops working
         
         if secure:
-            wst=Thread(target=ws.run_forever,kargs=dict(sslopt={"cert_reqs": ssl.CERT_NONE}))
+            wst=Thread(target=ws.run_forever,kwargs=dict(sslopt={"context": self.secureTransport().websocketContext(subscribeURI)}))
         else:
             wst=Thread(target=ws.run_forever)
         
         wst.daemon = True
         wst.start()
+        # wait for the confirmations
+        self.logger.debug("Waiting for subscription ID")
+        if timeout is None:
+            timeout = self.subscribeTimeout
+        if not confirmed.wait(timeout):
+            ws.close()
+            raise SubscriptionFailedException("The subscriptions were not confirmed within {} seconds".format(timeout))
+        if None in spuids:
+            raise SubscriptionFailedException("The websocket was closed before the subscriptions were confirmed")
+
         # return
-        while not spuid:
-            self.logger.debug("Waiting for subscription ID")
-            time.sleep(0.1)            
-        #self.lastSpuid = spuid
-        return spuid
+        return spuids
+        
+
+    # metrics of a notification
+    def recordNotification(self, alias, message, handler, received, decoded):
+
+        """Records the metrics of a notification received at time received and decoded at time decoded"""
+
+        metrics = self.metrics
+        handled = time.perf_counter()
+        alias = alias or ""
+        metrics.inc("sepy_notifications_total", alias = alias)
+        metrics.inc("sepy_notification_bytes_total", len(message), alias = alias)
+        metrics.observe("sepy_notification_decode_seconds", decoded - received, alias = alias)
+        metrics.observe("sepy_handler_seconds", handled - decoded, alias = alias)
+        metrics.observe("sepy_notification_lag_seconds", handled - received, alias = alias)
+        pending = getattr(handler, "pending", None)
+        if pending is not None:
+            metrics.set("sepy_queue_depth", pending, alias = alias)
+
+
+    # do close websocket
+    def closeWebsocket(self, spuid, secure = False):
         
-        def close():
+        """Method to send the unsubscribe request for the given subscription id"""
         
-            # debug
-            self.logger.debug("=== ConnectionHandler::closeWebsocket invoked ===")
+        # debug
+        self.logger.debug("=== ConnectionHandler::closeWebsocket invoked ===")
 
-            nonlocal spuid
-            nonlocal ws
-            
-            # Compose unsubscription message
-            message = {}
-            temp = {}
-            temp["spuid"] = spuid     
-            if secure:
-                temp["authorization"] = self.websockets[spuid]["authorization"]
-            message["unsubscribe"] = temp
-            
-            print("ws: {}".format(ws))
-            ws.send(json.dumps(message))
+        # Compose unsubscription message
+        message = {}
+        temp = {}
+        temp["spuid"] = spuid     
+        if secure:
+            temp["authorization"] = self.websockets[spuid]["authorization"]
+        message["unsubscribe"] = temp
+        
+        # send it through the websocket of the subscription
+        self.websockets[spuid]["ws"].send(json.dumps(message))
         
         
     def getClientID(self):
@@ -355,17 +555,17 @@ class ConnectionHandler:
         """Method used to obtain unique client ID from MAC"""
         
         self.client_id = str(get_mac())
-        self.yskDict["client_id"] = self.client_id
+        self.yskDict["security"]["client_id"] = self.client_id
         
         
     def yskHandler(self, File):
         
         """Method used to handle ysk file used to store credentials"""
         
+        import yaml
         try:
             with open(File) as yskFileStream:
-                self.yskDict = yaml.load(yskFileStream)
-            print (self.yskDict)
+                self.yskDict = yaml.safe_load(yskFileStream)
             self.filename = File
             self.client_id = self.yskDict["security"].get("client_id")
             self.client_secret = self.yskDict["security"].get("client_secret")
@@ -382,6 +582,7 @@ class ConnectionHandler:
         """Method used to update the content of the configuration file"""
 
         # store data into file
+        import yaml
         with open(self.filename, "w") as yskFileStream:
             yaml.dump(self.yskDict, yskFileStream)
             yskFileStream.truncate()
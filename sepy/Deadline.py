@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+# global requirements
+from threading import Event
+import time
+
+# local requirements
+from .Exceptions import *
+
+
+class Deadline:
+
+    """
+    The time limit and the cancellation of a request. It is checked
+    before every phase of the request (rendering, token acquisition,
+    sending, decoding) and the time left bounds the waits on the
+    network: the connection and every read of the response. A request
+    whose deadline expires raises DeadlineExceededException, a cancelled
+    one RequestCancelledException.
+
+    A deadline created with a parent expires with it (at the earlier of
+    the two times) and is cancelled with it, e.g. the copies of a hedged
+    query share the deadline of the query and are cancelled one by one.
+
+    Parameters
+    ----------
+    timeout : float
+        The time left in seconds (default = None, no time limit)
+    parent : Deadline
+        The deadline of the enclosing operation (default = None)
+
+    Attributes
+    ----------
+    expires : float
+        The time.monotonic() of the expiry (None without time limit)
+
+    """
+
+    # constructor
+    def __init__(self, timeout = None, parent = None):
+
+        """Constructor of the Deadline class"""
+
+        self.expires = None if timeout is None else time.monotonic() + timeout
+        if parent is not None and parent.expires is not None:
+            self.expires = parent.expires if self.expires is None else min(self.expires, parent.expires)
+        self.parent = parent
+        self.event = Event()
+
+
+    # cancel
+    def cancel(self):
+
+        """Cancels the requests using this deadline (and its children)"""
+
+        self.event.set()
+
+
+    def isCancelled(self):
+        return self.event.is_set() or (self.parent is not None and self.parent.isCancelled())
+
+
+    def remaining(self):
+
+        """Returns the seconds left (0 if expired, None without time limit)"""
+
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+
+    # check before a phase
+    def check(self, phase):
+
+        """Raises RequestCancelledException or DeadlineExceededException if the request must stop before phase"""
+
+        if self.isCancelled():
+            raise RequestCancelledException("Request cancelled before {}".format(phase))
+        if self.expires is not None and time.monotonic() >= self.expires:
+            raise DeadlineExceededException("Deadline exceeded before {}".format(phase))
+
+
+    def timeout(self, phase):
+
+        """Checks the deadline before phase and returns the seconds left, to bound its waits"""
+
+        self.check(phase)
+        return self.remaining()
+
+
+    def wait(self, seconds = None):
+
+        """Waits up to seconds (default = None, until the expiry) or the cancellation, returns True if cancelled"""
+
+        remaining = self.remaining()
+        if seconds is None or (remaining is not None and remaining < seconds):
+            seconds = remaining
+        return self.event.wait(seconds) or self.isCancelled()
+
+
+def makeDeadline(deadline, timeout):
+
+    """Returns deadline if it is a Deadline, a new Deadline of deadline seconds if it is a number or of timeout seconds if it is None (None if both are None)"""
+
+    if isinstance(deadline, Deadline):
+        return deadline
+    if deadline is None:
+        deadline = timeout
+    if deadline is None:
+        return None
+    return Deadline(deadline)
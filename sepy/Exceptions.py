@@ -25,4 +25,31 @@ class ConfigurationParsingException(Exception):
     pass
 
 class SubscriptionFailedException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class SlowReaderException(Exception):
+    pass
+
+class AgentException(Exception):
+    pass
+
+class RDFParsingException(Exception):
+    pass
+
+class ResultParsingException(Exception):
+    pass
+
+class QueryFailedException(Exception):
+    pass
+
+class PlanningException(Exception):
+    pass
+
+class DeadlineExceededException(Exception):
+    pass
+
+class RequestCancelledException(Exception):
+    pass
+
+class BrokerUnavailableException(Exception):
+    pass
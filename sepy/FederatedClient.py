@@ -0,0 +1,390 @@
+#!/usr/bin/python3
+
+# global requirements
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+import logging
+import math
+import zlib
+import time
+
+# local requirements
+from .Exceptions import *
+from .SEPAClient import *
+
+
+def bindingKey(binding):
+
+    """Returns a hashable key of a SPARQL JSON binding, equal for equal bindings"""
+
+    return frozenset((variable, term.get("type"), term.get("value"), term.get("datatype"), term.get("xml:lang")) for variable, term in binding.items())
+
+
+class FederatedQuery:
+
+    """
+    Iterates over the merged results of a query sent to all the brokers
+    of a FederatedClient. Every broker is queried by its own thread and
+    its results are decoded while they are received (secure queries are
+    read whole), in batches yielded in the order they arrive. With
+    distinct, the bindings already yielded are skipped (their keys are
+    kept until the end of the iteration).
+
+    A broker that has not returned all its results when its deadline
+    expires (in seconds from the start of the iteration) is abandoned:
+    the results it sent in time are kept and its name is added to
+    timedOut, so that a slow broker does not hold up the others.
+
+    Parameters
+    ----------
+    federation : FederatedClient
+        The clients of the brokers
+    queryName : str
+        The friendly name of the SPARQL Query
+    forcedBindings : dict
+        The dictionary containing the bindings to fill the template (default = {})
+    distinct : bool
+        True to skip the duplicate bindings (default = True)
+    deadlines : list
+        The deadline of every broker in seconds, None for no deadline (default = None, no deadlines)
+    batchSize : int
+        The number of bindings passed at once by a broker thread (default = 1000)
+    secure : bool
+        A boolean that states if the queries must be secure or not (default = False)
+
+    Attributes
+    ----------
+    variables : list
+        The variables of the results of all the brokers
+    completed : list
+        The names of the brokers that returned all their results
+    failed : dict
+        The error messages of the brokers whose query failed, indexed by name
+    timedOut : list
+        The names of the brokers abandoned at their deadline
+    rows : int
+        The number of bindings yielded
+    duplicates : int
+        The number of duplicate bindings skipped
+
+    """
+
+    # constructor
+    def __init__(self, federation, queryName, forcedBindings = {}, distinct = True, deadlines = None, batchSize = 1000, secure = False):
+
+        """Constructor of the FederatedQuery class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== FederatedQuery::__init__ invoked ===")
+
+        # configuration
+        self.clients = federation.clients
+        self.names = federation.names
+        self.queryName = queryName
+        self.forcedBindings = forcedBindings
+        self.distinct = distinct
+        self.deadlines = deadlines or [None] * len(self.clients)
+        self.batchSize = batchSize
+        self.secure = secure
+
+        # results
+        self.variables = []
+        self.completed = []
+        self.failed = {}
+        self.timedOut = []
+        self.rows = 0
+        self.duplicates = 0
+
+
+    # pass a message to the consumer
+    def offer(self, queue, message, cancelled):
+
+        """Puts a message in the queue unless the broker is abandoned, returns False if it is"""
+
+        while not cancelled.is_set():
+            try:
+                queue.put(message, timeout = 0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+
+    # query a broker
+    def fetch(self, index, queue, cancelled):
+
+        """Performs the query on a broker, passing (index, kind, payload, time) messages to the consumer"""
+
+        client = self.clients[index]
+        try:
+            if self.secure:
+                status, results = client.query(self.queryName, self.forcedBindings, True)
+                if not status:
+                    raise QueryFailedException(results)
+                self.offer(queue, (index, "head", results.get("head", {}).get("vars", []), time.monotonic()), cancelled)
+                bindings = results["results"]["bindings"]
+                for i in range(0, len(bindings), self.batchSize):
+                    if not self.offer(queue, (index, "batch", bindings[i:i + self.batchSize], time.monotonic()), cancelled):
+                        return
+            else:
+                status, results = client.queryStream(self.queryName, self.forcedBindings, timeout = self.deadlines[index])
+                if not status:
+                    raise QueryFailedException(results)
+                with results:
+                    self.offer(queue, (index, "head", results.variables or [], time.monotonic()), cancelled)
+                    for batch in results.batches(self.batchSize):
+                        if not self.offer(queue, (index, "batch", batch, time.monotonic()), cancelled):
+                            return
+            self.offer(queue, (index, "end", None, time.monotonic()), cancelled)
+        except Exception as e:
+            self.offer(queue, (index, "error", e, time.monotonic()), cancelled)
+
+
+    # abandon a broker
+    def expire(self, index, pending, cancelled):
+        pending.discard(index)
+        cancelled[index].set()
+        self.timedOut.append(self.names[index])
+        self.logger.warning("Broker {} missed the deadline of {}".format(self.names[index], self.queryName))
+
+
+    # iterate
+    def __iter__(self):
+
+        """Yields the bindings of all the brokers"""
+
+        # debug print
+        self.logger.debug("=== FederatedQuery::__iter__ invoked ===")
+
+        # start a thread for every broker
+        count = len(self.clients)
+        queue = Queue(2 * count)
+        start = time.monotonic()
+        ends = [math.inf if deadline is None else start + deadline for deadline in self.deadlines]
+        cancelled = [Event() for i in range(count)]
+        pending = set(range(count))
+        for index in range(count):
+            thread = Thread(target = self.fetch, args = (index, queue, cancelled[index]))
+            thread.daemon = True
+            thread.start()
+
+        # merge the results
+        seen = set()
+        try:
+            while pending:
+                wait = min(ends[index] for index in pending) - time.monotonic()
+                try:
+                    index, kind, payload, produced = queue.get(timeout = None if wait == math.inf else max(wait, 0))
+                except Empty:
+                    now = time.monotonic()
+                    for index in [index for index in pending if ends[index] <= now]:
+                        self.expire(index, pending, cancelled)
+                    continue
+                if index not in pending:
+                    continue
+                if produced > ends[index]:
+                    self.expire(index, pending, cancelled)
+                elif kind == "head":
+                    self.variables.extend(variable for variable in payload if variable not in self.variables)
+                elif kind == "batch":
+                    if self.distinct:
+                        batch = []
+                        for binding in payload:
+                            key = bindingKey(binding)
+                            if key in seen:
+                                self.duplicates += 1
+                            else:
+                                seen.add(key)
+                                batch.append(binding)
+                        payload = batch
+                    self.rows += len(payload)
+                    yield from payload
+                elif kind == "end":
+                    pending.discard(index)
+                    self.completed.append(self.names[index])
+                else:
+                    pending.discard(index)
+                    self.failed[self.names[index]] = str(payload)
+                    self.logger.error("Query {} failed on broker {}: {}".format(self.queryName, self.names[index], payload))
+        finally:
+            for event in cancelled:
+                event.set()
+
+
+class FederatedClient:
+
+    """
+    A client for several SEPA brokers, e.g. partitioned by site. Queries
+    are sent to all the brokers at once and their results are merged
+    while they are received (see FederatedQuery). Updates are sent to a
+    single broker, chosen by a hash of the values of the key bindings
+    configured for their name (e.g. the observation of
+    UPDATE_OBSERVATION_VALUE), so that the same key always reaches the
+    same broker; updates without configured keys are sent to all the
+    brokers.
+
+    Parameters
+    ----------
+    clients : list
+        The SEPAClient of every broker, or the JSAP/YSAP files to create them
+    names : list
+        The names of the brokers (default = None, their query URIs)
+    keys : dict
+        The names of the bindings routing the updates, indexed by update name (default = {})
+    deadline : float
+        The default deadline of the queries on every broker in seconds (default = None, no deadline)
+    deadlines : dict
+        The deadlines of some brokers, indexed by name (default = {})
+    logLevel : int
+        The log level of the clients created from files (default = 40)
+    metrics : MetricsRegistry
+        The registry of the clients created from files (default = None)
+
+    Attributes
+    ----------
+    clients : list
+        The SEPAClient of every broker
+
+    """
+
+    # constructor
+    def __init__(self, clients, names = None, keys = None, deadline = None, deadlines = None, logLevel = 40, metrics = None):
+
+        """Constructor of the FederatedClient class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== FederatedClient::__init__ invoked ===")
+
+        # clients
+        if not clients:
+            raise ValueError("A federation needs at least one broker")
+        self.clients = [SEPAClient(client, logLevel, metrics) if isinstance(client, str) else client for client in clients]
+        self.names = list(names) if names is not None else [client.configuration.queryURI for client in self.clients]
+        if len(set(self.names)) != len(self.clients):
+            raise ValueError("The names of the brokers must be unique")
+
+        # configuration
+        self.keys = keys or {}
+        self.deadline = deadline
+        self.deadlines = deadlines or {}
+
+
+    # query
+    def query(self, queryName, forcedBindings = {}, distinct = True, deadline = None, secure = False, batchSize = 1000):
+
+        """
+        This method is used to perform a SPARQL query on all the brokers
+
+        Parameters
+        ----------
+        queryName : str
+            The friendly name of the SPARQL Query
+        forcedBindings : dict
+            The dictionary containing the bindings to fill the template
+        distinct : bool
+            True to skip the duplicate bindings (default = True)
+        deadline : float
+            The deadline of every broker in seconds (default = None, the configured deadlines)
+        secure : bool
+            A boolean that states if the connection must be secure or not (default = False)
+        batchSize : int
+            The number of bindings passed at once by a broker thread (default = 1000)
+
+        Returns
+        -------
+        FederatedQuery
+            An iterable over the merged bindings, reporting the brokers that failed or timed out
+
+        """
+
+        # debug print
+        self.logger.debug("=== FederatedClient::query invoked ===")
+
+        if deadline is None:
+            deadlines = [self.deadlines.get(name, self.deadline) for name in self.names]
+        else:
+            deadlines = [deadline] * len(self.clients)
+        return FederatedQuery(self, queryName, forcedBindings, distinct, deadlines, batchSize, secure)
+
+
+    # route an update
+    def partition(self, updateName, forcedBindings):
+
+        """Returns the index of the broker of an update, None if the update has no configured keys"""
+
+        keys = self.keys.get(updateName)
+        if keys is None:
+            return None
+        try:
+            key = "\x1f".join(str(forcedBindings[k]) for k in keys)
+        except KeyError as e:
+            raise ValueError("The update {} has no binding {} to route it".format(updateName, e))
+        return zlib.crc32(key.encode("utf-8")) % len(self.clients)
+
+
+    # update
+    def update(self, updateName, forcedBindings = {}, secure = False):
+
+        """
+        This method is used to perform a SPARQL update on the broker of its partition
+
+        Returns
+        -------
+        status : bool
+            True or False, depending on the success/failure of the request (of all the requests, if sent to all the brokers)
+        results : json
+            The results of the SPARQL update (a dictionary of results indexed by broker name, if sent to all the brokers)
+
+        """
+
+        # debug print
+        self.logger.debug("=== FederatedClient::update invoked ===")
+
+        index = self.partition(updateName, forcedBindings)
+        if index is not None:
+            return self.clients[index].update(updateName, forcedBindings, secure)
+        statuses, results = [], {}
+        for name, client in zip(self.names, self.clients):
+            status, results[name] = client.update(updateName, forcedBindings, secure)
+            statuses.append(status)
+        return all(statuses), results
+
+
+    # bulk update
+    def updateMany(self, updateName, bindingsList, secure = False):
+
+        """
+        This method is used to perform many updates from the same template
+        with a single request to every broker involved
+
+        Returns
+        -------
+        status : bool
+            True or False, depending on the success/failure of all the requests
+        results : dict
+            The results of the requests, indexed by broker name
+
+        """
+
+        # debug print
+        self.logger.debug("=== FederatedClient::updateMany invoked ===")
+
+        # group the bindings by broker
+        groups = [[] for client in self.clients]
+        for forcedBindings in bindingsList:
+            index = self.partition(updateName, forcedBindings)
+            if index is None:
+                for group in groups:
+                    group.append(forcedBindings)
+            else:
+                groups[index].append(forcedBindings)
+
+        # one request for every broker
+        statuses, results = [], {}
+        for name, client, group in zip(self.names, self.clients, groups):
+            if group:
+                status, results[name] = client.updateMany(updateName, group, secure)
+                statuses.append(status)
+        return all(statuses), results
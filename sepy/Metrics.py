@@ -0,0 +1,269 @@
+#!/usr/bin/python3
+
+# global requirements
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+from bisect import bisect_left
+import logging
+
+# default histogram buckets (seconds), from 50us to 60s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+
+    """A monotonically increasing counter"""
+
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+        self.lock = Lock()
+
+    def inc(self, amount = 1):
+        with self.lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+
+    """A value that can go up and down"""
+
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+
+    """
+    A histogram with fixed bucket bounds
+
+    Parameters
+    ----------
+    buckets : tuple
+        The sorted upper bounds of the buckets (default = DEFAULT_BUCKETS)
+
+    """
+
+    kind = "histogram"
+
+    def __init__(self, buckets = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+
+        """Returns an estimate of the q-quantile (the upper bound of its bucket)"""
+
+        with self.lock:
+            counts = list(self.counts)
+            count = self.count
+        if count == 0:
+            return None
+        rank = q * count
+        seen = 0
+        for index, n in enumerate(counts):
+            seen += n
+            if seen >= rank and n > 0:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        with self.lock:
+            return {"count": self.count,
+                    "sum": self.sum,
+                    "buckets": dict(zip(self.buckets + (float("inf"),), self.counts))}
+
+
+class MetricsRegistry:
+
+    """
+    A registry of counters, gauges and histograms labelled by query/update
+    name or subscription alias. Pass it to SEPAClient (metrics parameter)
+    to instrument the requests and the notifications; the values can be
+    read with snapshot or exported in the Prometheus text format.
+
+    Attributes
+    ----------
+    metrics : dict
+        Dictionary with the metrics indexed by name and labels
+
+    """
+
+    # constructor
+    def __init__(self):
+
+        """Constructor of the MetricsRegistry class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== MetricsRegistry::__init__ invoked ===")
+
+        # initialize
+        self.metrics = {}
+        self.lock = Lock()
+        self.server = None
+
+
+    # get or create a metric
+    def get(self, metricClass, name, labels, *args):
+
+        """Returns the metric with the given name and labels, creating it if needed"""
+
+        key = (name, labels)
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = metricClass(*args)
+                    self.metrics[key] = metric
+        return metric
+
+
+    # the metric name is positional-only, so that "name" can be used as a label
+    def inc(self, metric, amount = 1, /, **labels):
+        self.get(Counter, metric, tuple(sorted(labels.items()))).inc(amount)
+
+
+    def set(self, metric, value, /, **labels):
+        self.get(Gauge, metric, tuple(sorted(labels.items()))).set(value)
+
+
+    def observe(self, metric, value, buckets = DEFAULT_BUCKETS, /, **labels):
+        self.get(Histogram, metric, tuple(sorted(labels.items())), buckets).observe(value)
+
+
+    # read the values
+    def snapshot(self):
+
+        """
+        Returns the current values of all the metrics
+
+        Returns
+        -------
+        dict
+            Dictionary with a list of {"labels": ..., "value": ...} for each metric name
+
+        """
+
+        result = {}
+        with self.lock:
+            items = list(self.metrics.items())
+        for (name, labels), metric in items:
+            result.setdefault(name, []).append({"labels": dict(labels), "value": metric.snapshot()})
+        return result
+
+
+    # Prometheus export
+    def prometheusText(self):
+
+        """Returns all the metrics in the Prometheus text exposition format"""
+
+        lines = []
+        declared = set()
+        with self.lock:
+            items = sorted(self.metrics.items(), key = lambda item: item[0])
+        for (name, labels), metric in items:
+            if name not in declared:
+                lines.append("# TYPE %s %s" % (name, metric.kind))
+                declared.add(name)
+            if metric.kind == "histogram":
+                snapshot = metric.snapshot()
+                cumulative = 0
+                for bound, count in snapshot["buckets"].items():
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append("%s_bucket%s %s" % (name, formatLabels(labels + (("le", le),)), cumulative))
+                lines.append("%s_sum%s %s" % (name, formatLabels(labels), repr(snapshot["sum"])))
+                lines.append("%s_count%s %s" % (name, formatLabels(labels), snapshot["count"]))
+            else:
+                lines.append("%s%s %s" % (name, formatLabels(labels), metric.snapshot()))
+        return "\n".join(lines) + "\n"
+
+
+    # HTTP endpoint
+    def startHttpServer(self, port = 9100, host = "127.0.0.1"):
+
+        """
+        Serves the metrics in the Prometheus text format on http://host:port/metrics
+
+        Returns
+        -------
+        int
+            The port the server is listening on (useful when port = 0)
+
+        """
+
+        # debug print
+        self.logger.debug("=== MetricsRegistry::startHttpServer invoked ===")
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheusText().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        thread = Thread(target = self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.server.server_address[1]
+
+
+    def stopHttpServer(self):
+
+        """Stops the HTTP endpoint"""
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def formatLabels(labels):
+
+    """Formats a tuple of (name, value) labels for the Prometheus text format"""
+
+    if not labels:
+        return ""
+    escaped = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append('%s="%s"' % (name, value))
+    return "{" + ",".join(escaped) + "}"
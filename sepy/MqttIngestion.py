@@ -0,0 +1,405 @@
+#!/usr/bin/python3
+
+# global requirements
+from collections import deque
+from threading import Thread, Condition
+import logging
+import json
+import sys
+import re
+
+# Java style named groups, e.g. (?<value>\d+), used by the JSAP files
+JAVA_NAMED_GROUP = re.compile(r'\(\?<([A-Za-z]\w*)>')
+
+# counted repetitions, e.g. {2,5}
+REPETITION = re.compile(r'\{\d*(,\d*)?\}')
+
+
+def compileRegex(pattern):
+
+    """Compiles a regex of the regexTopics section, converting the Java named groups (and the possessive quantifiers and atomic groups before Python 3.11)"""
+
+    pattern = JAVA_NAMED_GROUP.sub(r'(?P<\1>', pattern)
+    if sys.version_info < (3, 11):
+        pattern = removePossessive(pattern)
+    return re.compile(pattern)
+
+
+def removePossessive(pattern):
+
+    """
+    Rewrites the possessive quantifiers (e.g. \d++) as greedy ones and the
+    atomic groups as non-capturing groups, which re supports only since
+    Python 3.11. The rewritten regex matches all the strings matched by
+    the original one (and possibly more, since it may backtrack).
+    """
+
+    result = []
+    quantified = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        token = c
+        if c == "\\":
+            token = pattern[i:i + 2]
+        elif c == "[":
+            # the class ends at the first ] that is not escaped nor its first character
+            j = i + 1
+            if pattern[j:j + 1] == "^":
+                j += 1
+            if pattern[j:j + 1] == "]":
+                j += 1
+            while j < len(pattern) and pattern[j] != "]":
+                j += 2 if pattern[j] == "\\" else 1
+            token = pattern[i:j + 1]
+        elif pattern.startswith("(?>", i):
+            result.append("(?:")
+            i += 3
+            quantified = False
+            continue
+        elif c == "(" and pattern[i + 1:i + 2] == "?":
+            token = "(?"
+        elif c in "*+?" or (c == "{" and REPETITION.match(pattern, i)):
+            if c == "{":
+                token = REPETITION.match(pattern, i).group(0)
+            elif quantified and c != "*":
+                # + after a quantifier makes it possessive, ? makes it lazy
+                quantified = False
+                i += 1
+                if c == "?":
+                    result.append(c)
+                continue
+            result.append(token)
+            quantified = True
+            i += len(token)
+            continue
+        result.append(token)
+        quantified = False
+        i += len(token)
+    return "".join(result)
+
+
+class MqttMapper:
+
+    """
+    Converts MQTT messages into the bindings of a named update, using the
+    extended section of a JSAP file:
+
+    - regexTopics: the payload of these topics is matched against the
+      regexes; the unnamed groups are appended to the topic (with ":"
+      replaced by "/") and the group named value is the value
+    - jsonTopics: the payload of these topics is a JSON object; the id
+      field is appended to the topic and the value field is the value
+    - any other topic: the payload is the value
+    - semantic-mappings: the resulting topic is looked up here to find
+      the bindings of the update (e.g. observation)
+
+    The regexes are compiled and the mappings indexed by topic once.
+
+    Parameters
+    ----------
+    extended : dict
+        The extended section of the JSAP file
+    valueBinding : str
+        The name of the binding receiving the value (default = "value")
+
+    Attributes
+    ----------
+    unmapped : int
+        The number of values discarded because their topic has no semantic mapping
+
+    """
+
+    # constructor
+    def __init__(self, extended, valueBinding = "value"):
+
+        """Constructor of the MqttMapper class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== MqttMapper::__init__ invoked ===")
+
+        # precompile the extractors
+        self.valueBinding = valueBinding
+        self.regexTopics = {}
+        for topic, patterns in extended.get("regexTopics", {}).items():
+            compiled = []
+            for pattern in patterns:
+                regex = compileRegex(pattern)
+                named = set(regex.groupindex.values())
+                compiled.append((regex, [i for i in range(1, regex.groups + 1) if i not in named]))
+            self.regexTopics[topic] = (topic.replace(":", "/"), compiled)
+        self.jsonTopics = {topic: (fields["id"], fields["value"]) for topic, fields in extended.get("jsonTopics", {}).items()}
+        self.mappings = extended.get("semantic-mappings", {})
+        self.unmapped = 0
+
+
+    # extract the values
+    def values(self, topic, payload):
+
+        """Returns the list of (topic, value) contained in a message"""
+
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode("utf-8", errors = "replace")
+
+        # regex topics
+        entry = self.regexTopics.get(topic)
+        if entry is not None:
+            prefix, compiled = entry
+            values = []
+            for regex, groups in compiled:
+                match = regex.search(payload)
+                if match is not None:
+                    values.append(("/".join([prefix] + [match.group(i) for i in groups]), match.group("value")))
+            return values
+
+        # json topics
+        fields = self.jsonTopics.get(topic)
+        if fields is not None:
+            try:
+                message = json.loads(payload)
+                return [("%s/%s" % (topic, message[fields[0]]), str(message[fields[1]]))]
+            except (ValueError, KeyError, TypeError):
+                self.logger.warning("Malformed message on topic {}".format(topic))
+                return []
+
+        # plain topics
+        return [(topic, payload.strip())]
+
+
+    # convert a message
+    def bindings(self, topic, payload):
+
+        """Returns the list of forced bindings of the update for a message"""
+
+        result = []
+        for valueTopic, value in self.values(topic, payload):
+            mapping = self.mappings.get(valueTopic)
+            if mapping is None:
+                self.unmapped += 1
+                continue
+            bindings = dict(mapping)
+            bindings[self.valueBinding] = value
+            result.append(bindings)
+        return result
+
+
+class MqttIngestion:
+
+    """
+    An ingestion pipeline from MQTT to SEPA: messages are converted by a
+    MqttMapper and the resulting bindings are queued and sent in batches,
+    each batch being a single request of SEPAClient.updateMany. The queue
+    is bounded: when it is full, submit blocks (overflow = "block") or
+    discards the bindings (overflow = "drop"). An UpdateSuppressor can
+    skip the values that did not change before they are queued.
+
+    Parameters
+    ----------
+    client : SEPAClient
+        The client used to send the updates
+    updateName : str
+        The update filled with the bindings (default = "UPDATE_OBSERVATION_VALUE")
+    mapper : MqttMapper
+        The converter of the messages (default = built from the extended section of the client configuration)
+    batchSize : int
+        The maximum number of operations per request, lowered to the batch size suggested by the AdaptiveLimiter of the client if any (default = 200)
+    maxQueue : int
+        The maximum number of queued bindings (default = 10000)
+    overflow : str
+        "block" or "drop" (default = "block")
+    secure : bool
+        A boolean that states if the updates must be secure or not (default = False)
+    suppressor : UpdateSuppressor
+        The filter of the unchanged values (default = None, all the values are sent)
+
+    Attributes
+    ----------
+    received : int
+        The number of messages submitted
+    dropped : int
+        The number of bindings discarded because the queue was full
+    sent : int
+        The number of operations sent
+    batches : int
+        The number of requests sent
+    failed : int
+        The number of operations of the failed requests
+
+    """
+
+    # constructor
+    def __init__(self, client, updateName = "UPDATE_OBSERVATION_VALUE", mapper = None, batchSize = 200, maxQueue = 10000, overflow = "block", secure = False, suppressor = None):
+
+        """Constructor of the MqttIngestion class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== MqttIngestion::__init__ invoked ===")
+
+        # configuration
+        if overflow not in ("block", "drop"):
+            raise ValueError("overflow must be block or drop")
+        self.client = client
+        self.updateName = updateName
+        self.extended = client.configuration.configurationDict.get("extended", {})
+        self.mapper = mapper or MqttMapper(self.extended)
+        self.batchSize = batchSize
+        self.maxQueue = maxQueue
+        self.overflow = overflow
+        self.secure = secure
+        self.suppressor = suppressor
+
+        # state
+        self.queue = deque()
+        self.condition = Condition()
+        self.inFlight = 0
+        self.running = False
+        self.worker = None
+        self.mqtt = None
+
+        # counters
+        self.received = 0
+        self.dropped = 0
+        self.sent = 0
+        self.batches = 0
+        self.failed = 0
+
+
+    # queue a message
+    def submit(self, topic, payload):
+
+        """Converts a message and queues its bindings"""
+
+        self.received += 1
+        bindingsList = self.mapper.bindings(topic, payload)
+        if self.suppressor is not None:
+            bindingsList = [bindings for bindings in bindingsList if self.suppressor.check(self.updateName, bindings)]
+        if not bindingsList:
+            return
+        with self.condition:
+            for bindings in bindingsList:
+                if len(self.queue) >= self.maxQueue:
+                    if self.overflow == "drop":
+                        self.dropped += 1
+                        if self.suppressor is not None:
+                            self.suppressor.forget(self.updateName, bindings)
+                        continue
+                    self.condition.wait_for(lambda: len(self.queue) < self.maxQueue or not self.running)
+                self.queue.append(bindings)
+            self.condition.notify_all()
+
+
+    # send the batches
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue or not self.running)
+                if not self.queue:
+                    return
+                limiter = getattr(self.client, "limiter", None)
+                batchSize = self.batchSize if limiter is None else min(self.batchSize, limiter.batchSize)
+                count = min(batchSize, len(self.queue))
+                batch = [self.queue.popleft() for i in range(count)]
+                self.inFlight = count
+                self.condition.notify_all()
+            try:
+                status, results = self.client.updateMany(self.updateName, batch, self.secure)
+            except Exception as e:
+                status, results = False, e
+            with self.condition:
+                self.inFlight = 0
+                self.batches += 1
+                if status:
+                    self.sent += count
+                else:
+                    self.failed += count
+                    self.logger.error("Batch of {} updates failed: {}".format(count, results))
+                    if self.suppressor is not None:
+                        for bindings in batch:
+                            self.suppressor.forget(self.updateName, bindings)
+                self.condition.notify_all()
+
+
+    # start
+    def start(self):
+
+        """Starts the thread sending the batches"""
+
+        # debug print
+        self.logger.debug("=== MqttIngestion::start invoked ===")
+
+        self.running = True
+        self.worker = Thread(target = self.run)
+        self.worker.daemon = True
+        self.worker.start()
+        return self
+
+
+    # wait for the queue to drain
+    def flush(self, timeout = None):
+
+        """Waits until all the queued bindings have been sent, returns False on timeout"""
+
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.queue and not self.inFlight, timeout)
+
+
+    # connect to the MQTT broker
+    def connect(self, host = None, port = None, topics = None):
+
+        """
+        Subscribes to the MQTT broker and submits the messages it receives.
+        The broker and the topics default to the mqtt part of the extended
+        section. Requires the paho-mqtt package.
+
+        """
+
+        # debug print
+        self.logger.debug("=== MqttIngestion::connect invoked ===")
+
+        import paho.mqtt.client as mqtt
+        settings = self.extended.get("mqtt", {})
+        host = host or settings.get("url", "localhost")
+        port = port or settings.get("port", 1883)
+        topics = topics or settings.get("topics", ["#"])
+
+        # paho-mqtt 2 asks for the version of the callbacks
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            self.mqtt = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+        else:
+            self.mqtt = mqtt.Client()
+        if settings.get("ssl"):
+            self.mqtt.tls_set()
+        self.mqtt.on_message = lambda client, userdata, message: self.submit(message.topic, message.payload)
+        self.mqtt.on_connect = lambda client, userdata, flags, rc: client.subscribe([(topic, 0) for topic in topics])
+        self.mqtt.connect(host, port)
+        self.mqtt.loop_start()
+
+
+    # stop
+    def stop(self, flush = True, timeout = None):
+
+        """Disconnects from MQTT and stops the sender, sending the queued bindings first if flush is True"""
+
+        # debug print
+        self.logger.debug("=== MqttIngestion::stop invoked ===")
+
+        if self.mqtt is not None:
+            self.mqtt.disconnect()
+            self.mqtt.loop_stop()
+            self.mqtt = None
+        if flush:
+            self.flush(timeout)
+        with self.condition:
+            self.running = False
+            if not flush:
+                self.dropped += len(self.queue)
+                if self.suppressor is not None:
+                    for bindings in self.queue:
+                        self.suppressor.forget(self.updateName, bindings)
+                self.queue.clear()
+            self.condition.notify_all()
+        if self.worker is not None:
+            self.worker.join(timeout)
+            self.worker = None
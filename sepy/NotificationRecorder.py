@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+
+# global requirements
+from threading import Lock, Timer
+import logging
+import struct
+import mmap
+import json
+import time
+import glob
+import os
+import re
+
+# segment format
+SEGMENT_MAGIC = b"SEPYLOG1"
+RECORD = struct.Struct("<dI")        # timestamp, payload length
+SEGMENT_PATTERN = "notifications-%08d.seg"
+SEGMENT_REGEX = re.compile(r"^notifications-(\d{8,})\.seg$")
+
+
+class NotificationRecorder:
+
+    """
+    A class to record the raw messages received on the websockets into an
+    append-only log, split in segments of bounded size. To start recording,
+    assign the recorder to the recorder attribute of the ConnectionHandler:
+
+        sc.connectionManager.recorder = NotificationRecorder("recordings")
+
+    Parameters
+    ----------
+    directory : str
+        The directory where the segments are written
+    segmentSize : int
+        The size in bytes after which a new segment is started (default = 64 MiB)
+    flushInterval : float
+        The maximum time in seconds a record stays buffered before being
+        written to the segment, 0 to write every record (default = 0)
+
+    Attributes
+    ----------
+    recorded : int
+        The number of recorded messages
+
+    """
+
+    # constructor
+    def __init__(self, directory, segmentSize = 64 * 1024 * 1024, flushInterval = 0.0):
+
+        """Constructor of the NotificationRecorder class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== NotificationRecorder::__init__ invoked ===")
+
+        # continue after the last existing segment
+        self.directory = directory
+        self.segmentSize = segmentSize
+        self.flushInterval = flushInterval
+        os.makedirs(directory, exist_ok = True)
+        existing = segmentFiles(directory)
+        if existing:
+            self.segmentNumber = segmentNumber(existing[-1])
+        else:
+            self.segmentNumber = 0
+        self.stream = None
+        self.timer = None
+        self.recorded = 0
+        self.lock = Lock()
+
+
+    # start a new segment
+    def roll(self):
+
+        """Closes the current segment and starts a new one"""
+
+        if self.stream is not None:
+            self.stream.close()
+        self.segmentNumber += 1
+        path = os.path.join(self.directory, SEGMENT_PATTERN % self.segmentNumber)
+        self.logger.debug("Starting segment {}".format(path))
+        self.stream = open(path, "wb")
+        self.stream.write(SEGMENT_MAGIC)
+
+
+    # record a message
+    def record(self, message, timestamp = None):
+
+        """
+        Appends a raw message to the log
+
+        Parameters
+        ----------
+        message : str
+            The message, as received from the websocket
+        timestamp : float
+            The reception time (default = None, the current time)
+
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+        if isinstance(message, str):
+            message = message.encode("utf-8")
+        with self.lock:
+            if self.stream is None or self.stream.tell() + RECORD.size + len(message) > self.segmentSize:
+                self.roll()
+            self.stream.write(RECORD.pack(timestamp, len(message)))
+            self.stream.write(message)
+            self.recorded += 1
+
+            # write the record now, or within flushInterval seconds
+            if self.flushInterval <= 0:
+                self.stream.flush()
+            elif self.timer is None:
+                self.timer = Timer(self.flushInterval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+
+    # flush
+    def flush(self):
+
+        """Writes the buffered records to the current segment"""
+
+        with self.lock:
+            self.timer = None
+            if self.stream is not None:
+                self.stream.flush()
+
+
+    # close
+    def close(self):
+
+        """Closes the current segment"""
+
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+
+def segmentFiles(directory):
+
+    """Returns the paths of the segments in a directory, in order"""
+
+    paths = glob.glob(os.path.join(directory, "notifications-*.seg"))
+    return sorted((path for path in paths if SEGMENT_REGEX.match(os.path.basename(path))), key = segmentNumber)
+
+
+def segmentNumber(path):
+
+    """Returns the number of a segment from its path"""
+
+    return int(SEGMENT_REGEX.match(os.path.basename(path)).group(1))
+
+
+class NotificationReplayer:
+
+    """
+    A class to replay the messages recorded by a NotificationRecorder,
+    reading the segments through memory mapping. Notifications are routed
+    to the handlers registered for their spuid or alias, or to the default
+    handler.
+
+    Parameters
+    ----------
+    directory : str
+        The directory containing the segments
+    handler : Handler
+        The default handler (default = None)
+
+    """
+
+    # constructor
+    def __init__(self, directory, handler = None):
+
+        """Constructor of the NotificationReplayer class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== NotificationReplayer::__init__ invoked ===")
+
+        # initialize
+        self.directory = directory
+        self.handler = handler
+        self.handlers = {}
+
+
+    # register a handler
+    def register(self, key, handler):
+
+        """
+        Registers a handler for the notifications of a subscription
+
+        Parameters
+        ----------
+        key : str
+            The spuid or the alias of the subscription
+        handler : Handler
+            A class to handle notifications
+
+        """
+
+        self.handlers[key] = handler
+
+
+    # read the records
+    def records(self):
+
+        """Yields (timestamp, raw message) tuples from all the segments, in order"""
+
+        for path in segmentFiles(self.directory):
+            with open(path, "rb") as segment:
+                if os.fstat(segment.fileno()).st_size <= len(SEGMENT_MAGIC):
+                    continue
+                with mmap.mmap(segment.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                    if data[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                        self.logger.error("Skipping invalid segment {}".format(path))
+                        continue
+                    offset = len(SEGMENT_MAGIC)
+                    end = len(data)
+                    while offset + RECORD.size <= end:
+                        timestamp, length = RECORD.unpack_from(data, offset)
+                        offset += RECORD.size
+                        if offset + length > end:
+                            self.logger.warning("Truncated record in segment {}".format(path))
+                            break
+                        yield timestamp, data[offset:offset + length]
+                        offset += length
+
+
+    # dispatch a message
+    def dispatch(self, message):
+
+        """Passes a raw message to the right handler, returns True for notifications"""
+
+        jmessage = json.loads(message)
+        if "notification" in jmessage:
+            notification = jmessage["notification"]
+            handler = self.handlers.get(notification.get("spuid"), self.handlers.get(notification.get("alias"), self.handler))
+            if handler is not None:
+                handler.handle(notification.get("addedResults"), notification.get("removedResults"))
+            return True
+        elif "error" in jmessage:
+            if self.handler is not None:
+                self.handler.handleError(jmessage)
+        return False
+
+
+    # replay
+    def replay(self, speed = None):
+
+        """
+        Replays the recorded messages
+
+        Parameters
+        ----------
+        speed : float
+            The replay speed with respect to the original one: 1 replays with
+            the original timing, 10 ten times faster; None replays at the
+            maximum speed (default = None)
+
+        Returns
+        -------
+        dict
+            The number of replayed messages and notifications, the elapsed time
+            and the throughput in messages per second
+
+        """
+
+        # debug print
+        self.logger.debug("=== NotificationReplayer::replay invoked ===")
+
+        # initialization
+        messages = 0
+        notifications = 0
+        first = None
+        start = time.perf_counter()
+
+        # replay
+        for timestamp, message in self.records():
+            if speed:
+                if first is None:
+                    first = timestamp
+                delay = (timestamp - first) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            if self.dispatch(message):
+                notifications += 1
+            messages += 1
+
+        # return the statistics
+        elapsed = time.perf_counter() - start
+        return {"messages": messages,
+                "notifications": notifications,
+                "seconds": elapsed,
+                "messagesPerSecond": messages / elapsed if elapsed > 0 else 0.0}
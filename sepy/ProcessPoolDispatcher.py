@@ -0,0 +1,312 @@
+#!/usr/bin/python3
+
+# global requirements
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from itertools import islice
+from threading import Condition, Lock
+import logging
+import pickle
+
+# handler instances living in the worker processes
+workerHandlers = {}
+
+
+def runBatch(handlerClass, handlerArgs, batch):
+
+    """
+    Runs a batch of notifications through a handler in a worker process.
+    The handler instance is created once per worker and then reused.
+
+    Parameters
+    ----------
+    handlerClass : class
+        The handler class, it must be importable by the worker processes
+    handlerArgs : tuple
+        The arguments used to build the handler
+    batch : list
+        A list of (added, removed) notifications
+
+    Returns
+    -------
+    list
+        A list of (success, value) tuples, value being either the result
+        of handle or the raised exception
+
+    """
+
+    # get the handler
+    key = (handlerClass, handlerArgs)
+    handler = workerHandlers.get(key)
+    if handler is None:
+        handler = handlerClass(*handlerArgs)
+        workerHandlers[key] = handler
+
+    # process the batch
+    outcomes = []
+    for added, removed in batch:
+        try:
+            outcomes.append((True, handler.handle(added, removed)))
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(repr(e))
+            outcomes.append((False, e))
+    return outcomes
+
+
+class ProcessPoolDispatcher:
+
+    """
+    A class to run CPU-heavy notification handlers in a pool of processes,
+    so that they are not limited by the GIL of the websocket threads.
+
+    Parameters
+    ----------
+    workers : int
+        The number of worker processes (default = None, the number of CPUs)
+    batchSize : int
+        The maximum number of notifications sent to a worker at once (default = 64)
+
+    Attributes
+    ----------
+    restarts : int
+        The number of times the pool was replaced after a worker died
+
+    """
+
+    # constructor
+    def __init__(self, workers = None, batchSize = 64):
+
+        """Constructor of the ProcessPoolDispatcher class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== ProcessPoolDispatcher::__init__ invoked ===")
+
+        # initialize the pool
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(workers)
+        self.batchSize = batchSize
+        self.lock = Lock()
+        self.closed = False
+        self.restarts = 0
+
+
+    # create a handler
+    def handler(self, handlerClass, handlerArgs = (), parent = None):
+
+        """
+        Returns a handler to be passed to SEPAClient.subscribe. The
+        notifications are processed by an instance of handlerClass living
+        in the worker processes; results and errors are given back to the
+        handleResult and handleError methods of parent.
+
+        Parameters
+        ----------
+        handlerClass : class
+            The handler class, it must be importable by the worker processes
+        handlerArgs : tuple
+            The (picklable) arguments used to build the handler (default = ())
+        parent : Handler
+            The object receiving results and errors in this process (default = None)
+
+        Returns
+        -------
+        ProcessPoolHandler
+            The handler of the subscription
+
+        """
+
+        return ProcessPoolHandler(self, handlerClass, tuple(handlerArgs), parent)
+
+
+    # submit a task
+    def submit(self, function, *args):
+
+        """
+        Submits a task to the pool. A pool broken by the death of a worker
+        (e.g. killed by the OOM killer) is replaced once; the exception of
+        the executor is raised if the dispatcher is closed.
+        """
+
+        executor = self.executor
+        try:
+            return executor.submit(function, *args)
+        except BrokenProcessPool:
+            with self.lock:
+                if self.closed:
+                    raise
+                if self.executor is executor:
+                    self.logger.error("A worker process died, restarting the process pool")
+                    self.executor = ProcessPoolExecutor(self.workers)
+                    self.restarts += 1
+                    executor.shutdown(wait = False)
+                executor = self.executor
+            return executor.submit(function, *args)
+
+
+    # close
+    def close(self, wait = True):
+
+        """Shuts down the worker processes, the notifications queued afterwards are reported as errors"""
+
+        with self.lock:
+            self.closed = True
+            executor = self.executor
+        executor.shutdown(wait = wait)
+
+
+class ProcessPoolHandler:
+
+    """
+    The handler of a single subscription in process-pool mode. Notifications
+    are queued and sent to the pool in batches, with at most one batch in
+    flight, so that the order of the notifications is preserved.
+
+    Attributes
+    ----------
+    pending : int
+        The number of queued notifications, not yet sent to the pool
+    inFlight : int
+        The number of notifications sent to the pool and not yet processed
+    processed : int
+        The number of notifications processed by the pool (failed ones included)
+    dropped : int
+        The number of notifications that could not be sent to the pool (e.g. after close)
+
+    """
+
+    # constructor
+    def __init__(self, dispatcher, handlerClass, handlerArgs, parent):
+
+        """Constructor of the ProcessPoolHandler class"""
+
+        # store the configuration
+        self.logger = dispatcher.logger
+        self.dispatcher = dispatcher
+        self.handlerClass = handlerClass
+        self.handlerArgs = handlerArgs
+        self.parent = parent
+
+        # initialize the queue
+        self.queue = deque()
+        self.inFlight = 0
+        self.processed = 0
+        self.dropped = 0
+        self.condition = Condition()
+
+
+    @property
+    def pending(self):
+        return len(self.queue)
+
+
+    # handle notifications
+    def handle(self, added, removed):
+
+        """Queues a notification for the pool"""
+
+        with self.condition:
+            self.queue.append((added, removed))
+            failure = None if self.inFlight else self.submit()
+        if failure is not None:
+            self.report(failure)
+
+
+    # handle errors
+    def handleError(self, error):
+
+        """Forwards an error of the subscription to the parent"""
+
+        if self.parent is not None:
+            self.parent.handleError(error)
+
+
+    # submit a batch
+    def submit(self):
+
+        """
+        Sends the next batch to the pool, to be called holding the
+        condition. The notifications are removed from the queue only once
+        the batch is submitted: if it cannot be (the pool is closed or
+        cannot be restarted), the queue is dropped and (error, count) is
+        returned to be reported without the condition held.
+        """
+
+        batch = list(islice(self.queue, self.dispatcher.batchSize))
+        try:
+            future = self.dispatcher.submit(runBatch, self.handlerClass, self.handlerArgs, batch)
+        except Exception as e:
+            self.logger.error("Cannot send the notifications to the process pool: {}".format(e))
+            count = len(self.queue)
+            self.queue.clear()
+            self.dropped += count
+            self.inFlight = 0
+            self.condition.notify_all()
+            return e, count
+        for notification in batch:
+            self.queue.popleft()
+        self.inFlight = len(batch)
+        future.add_done_callback(self.done)
+        return None
+
+
+    # report the notifications dropped
+    def report(self, failure):
+        error, count = failure
+        if self.parent is not None:
+            for i in range(count):
+                self.parent.handleError(error)
+
+
+    # batch completion
+    def done(self, future):
+
+        """Gives the outcomes of a batch back to the parent, then sends the next batch"""
+
+        # get the outcomes (a dead worker fails all the batch)
+        try:
+            outcomes = future.result()
+        except Exception as e:
+            self.logger.error("Process pool batch failed: {}".format(e))
+            outcomes = [(False, e)] * self.inFlight
+
+        # give them back to the parent
+        if self.parent is not None:
+            for success, value in outcomes:
+                if not success:
+                    self.parent.handleError(value)
+                elif hasattr(self.parent, "handleResult"):
+                    self.parent.handleResult(value)
+
+        # next batch
+        failure = None
+        with self.condition:
+            self.processed += self.inFlight
+            if self.queue:
+                failure = self.submit()
+            else:
+                self.inFlight = 0
+                self.condition.notify_all()
+        if failure is not None:
+            self.report(failure)
+
+
+    # wait for the queue to be empty
+    def join(self, timeout = None):
+
+        """
+        Waits until all the queued notifications have been processed
+
+        Returns
+        -------
+        bool
+            False if the timeout expired
+
+        """
+
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.inFlight and not self.queue, timeout)
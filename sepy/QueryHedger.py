@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+
+# global requirements
+from collections import deque
+from queue import Queue, Empty
+from threading import Thread, Lock
+import logging
+import time
+
+# local requirements
+from .Exceptions import *
+from .Deadline import *
+
+
+class QueryHedger:
+
+    """
+    Sends queries with hedged requests, to cut the tail latency caused
+    by a stalled connection or a slow broker thread: when the response
+    has not arrived after delay seconds, a copy of the query is sent and
+    the first response wins; the other copies are cancelled (their
+    responses are discarded). The delay is the given percentile of the
+    latencies of the last history responses, so that only the slowest
+    queries are hedged (about 100 - percentile % of them, each one
+    adding a request), and initialDelay until minSamples responses are
+    known.
+
+    Only queries are hedged: they are idempotent, so the broker may
+    answer all the copies. Every copy is sent by its own thread and is
+    bounded by the deadline of the query.
+
+    Parameters
+    ----------
+    client : SEPAClient
+        The client sending the queries
+    percentile : float
+        The percentile of the latencies after which a copy is sent (default = 95)
+    initialDelay : float
+        The delay in seconds before minSamples latencies are known (default = 0.1)
+    minDelay : float
+        The minimum delay in seconds (default = 0.001)
+    maxCopies : int
+        The maximum number of requests of a query, the first included (default = 2)
+    history : int
+        The number of latencies kept (default = 1000)
+    minSamples : int
+        The number of latencies needed to compute the delay (default = 20)
+
+    Attributes
+    ----------
+    queries : int
+        The number of queries sent
+    hedged : int
+        The number of copies sent
+    wins : int
+        The number of queries answered by a copy
+
+    """
+
+    # constructor
+    def __init__(self, client, percentile = 95, initialDelay = 0.1, minDelay = 0.001, maxCopies = 2, history = 1000, minSamples = 20):
+
+        """Constructor of the QueryHedger class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== QueryHedger::__init__ invoked ===")
+
+        # configuration
+        self.client = client
+        self.percentile = percentile
+        self.initialDelay = initialDelay
+        self.minDelay = minDelay
+        self.maxCopies = max(1, maxCopies)
+        self.minSamples = minSamples
+
+        # state
+        self.lock = Lock()
+        self.latencies = deque(maxlen = history)
+
+        # counters
+        self.queries = 0
+        self.hedged = 0
+        self.wins = 0
+
+
+    # hedging delay
+    def delay(self):
+
+        """Returns the time in seconds after which a copy of a query is sent"""
+
+        with self.lock:
+            if len(self.latencies) < self.minSamples:
+                return self.initialDelay
+            latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(self.percentile / 100.0 * len(latencies)))
+        return max(self.minDelay, latencies[index])
+
+
+    # send a copy
+    def send(self, configuration, queryName, sparqlQuery, secure, deadline, copy, responses):
+
+        """Sends a copy of a query, putting (copy, outcome) in responses, outcome being the results or an exception"""
+
+        start = time.perf_counter()
+        try:
+            outcome = self.client.sendQuery(queryName, sparqlQuery, secure, None, deadline, configuration = configuration)
+        except Exception as e:
+            outcome = e
+        # the responses of the cancelled copies count too, not to forget the slow ones
+        if not isinstance(outcome, Exception) or isinstance(outcome, RequestCancelledException):
+            with self.lock:
+                self.latencies.append(time.perf_counter() - start)
+        responses.put((copy, outcome))
+
+
+    # query
+    def query(self, queryName, forcedBindings = {}, secure = False, deadline = None):
+
+        """
+        This method is used to perform a SPARQL query with hedged requests
+
+        Parameters
+        ----------
+        queryName : str
+            The friendly name of the SPARQL Query
+        forcedBindings : dict
+            The dictionary containing the bindings to fill the template
+        secure : bool
+            A boolean that states if the connection must be secure or not (default = False)
+        deadline : float or Deadline
+            The deadline in seconds, or a Deadline that can be cancelled (default = None, the timeout of the client)
+
+        Returns
+        -------
+        status : bool
+            True or False, depending on the success/failure of the first response
+        results : json
+            The results of the SPARQL query
+
+        """
+
+        # debug print
+        self.logger.debug("=== QueryHedger::query invoked ===")
+
+        # render once for all the copies, sent to the endpoint of the same configuration
+        client = self.client
+        deadline = makeDeadline(deadline, client.timeout) or Deadline()
+        deadline.check("rendering")
+        configuration = client.configuration
+        sparqlQuery = configuration.getQuery(queryName, forcedBindings)
+
+        # send the first copy, then a new one every delay seconds
+        responses = Queue()
+        copies = []
+        pending = 0
+        delay = self.delay()
+        nextCopy = time.monotonic()
+        self.queries += 1
+        try:
+            while True:
+                now = time.monotonic()
+                if len(copies) < self.maxCopies and now >= nextCopy:
+                    copy = Deadline(parent = deadline)
+                    copies.append(copy)
+                    pending += 1
+                    nextCopy = now + delay
+                    if len(copies) > 1:
+                        self.hedged += 1
+                        if client.metrics is not None:
+                            client.metrics.inc("sepy_hedged_requests_total", name = queryName)
+                    thread = Thread(target = self.send, args = (configuration, queryName, sparqlQuery, secure, copy, len(copies) - 1, responses))
+                    thread.daemon = True
+                    thread.start()
+
+                # wait for a response, the next copy, the deadline or the cancellation (checked every 50 ms)
+                wait = 0.05
+                if len(copies) < self.maxCopies:
+                    wait = min(wait, max(0.0, nextCopy - now))
+                remaining = deadline.remaining()
+                if remaining is not None:
+                    wait = min(wait, remaining)
+                try:
+                    index, outcome = responses.get(timeout = wait)
+                except Empty:
+                    deadline.check("a response")
+                    continue
+
+                # the first response wins, a failed copy is replaced at once
+                pending -= 1
+                if isinstance(outcome, Exception):
+                    if pending == 0 and len(copies) >= self.maxCopies:
+                        raise outcome
+                    nextCopy = time.monotonic()
+                    continue
+                if index > 0:
+                    self.wins += 1
+                return outcome
+        finally:
+            for copy in copies:
+                copy.cancel()
@@ -0,0 +1,267 @@
+#!/usr/bin/python3
+
+# global requirements
+from collections import deque
+import logging
+import json
+import time
+import re
+
+# concurrent.futures is imported by QueryPager.__iter__, so that importing sepy stays fast
+
+# local requirements
+from .Exceptions import *
+from .Deadline import *
+
+# prefix and base declarations, comments and spaces before the query form
+PROLOGUE_REGEX = re.compile(r'^(?:\s+|#[^\n]*|PREFIX\s+[\w.\-]*:\s*<[^>]*>|BASE\s*<[^>]*>)*', re.IGNORECASE)
+
+# solution modifiers at the end of a query, which prevent appending new ones
+MODIFIERS_REGEX = re.compile(r'\b(?:LIMIT|OFFSET)\s+\d+\s*$', re.IGNORECASE)
+
+
+def sparqlTerm(term):
+
+    """Returns a term of a SPARQL JSON binding in SPARQL syntax"""
+
+    if term["type"] == "uri":
+        return "<%s>" % term["value"]
+    if term["type"] == "bnode":
+        raise QueryFailedException("Blank nodes cannot be used as keys")
+    literal = json.dumps(term["value"], ensure_ascii = False)
+    if "xml:lang" in term:
+        return "%s@%s" % (literal, term["xml:lang"])
+    if "datatype" in term:
+        return "%s^^<%s>" % (literal, term["datatype"])
+    return literal
+
+
+def pageQuery(sparql, limit, offset = 0, orderBy = None, keyset = False, after = None):
+
+    """
+    Rewrites a SELECT query to return a page of its results
+
+    Parameters
+    ----------
+    sparql : str
+        The rendered query
+    limit : int
+        The size of the page
+    offset : int
+        The number of results before the page (ignored by keyset pagination)
+    orderBy : str
+        The variable (without ?) ordering the results (default = None, the order of the query)
+    keyset : bool
+        Pages start after the value of orderBy in the last result instead of at an offset (default = False)
+    after : dict
+        The binding of orderBy in the last result of the previous page (keyset pagination)
+
+    Returns
+    -------
+    str
+        The query of the page
+
+    """
+
+    prologue = PROLOGUE_REGEX.match(sparql).group(0)
+    body = sparql[len(prologue):].strip()
+
+    # the query keeps its form, when it has no modifiers of its own
+    if orderBy is None and not MODIFIERS_REGEX.search(body):
+        return "%s%s LIMIT %d OFFSET %d" % (prologue, body, limit, offset)
+
+    # otherwise it becomes a subquery
+    condition = ""
+    if keyset and after is not None:
+        if after["type"] == "uri":
+            condition = " FILTER(STR(?%s) > %s)" % (orderBy, json.dumps(after["value"], ensure_ascii = False))
+        else:
+            condition = " FILTER(?%s > %s)" % (orderBy, sparqlTerm(after))
+    order = "" if orderBy is None else " ORDER BY ?%s" % orderBy
+    page = " LIMIT %d" % limit if keyset else " LIMIT %d OFFSET %d" % (limit, offset)
+    return "%sSELECT * WHERE { { %s }%s }%s%s" % (prologue, body, condition, order, page)
+
+
+class QueryPager:
+
+    """
+    Iterates over the results of a query one page at a time: the rendered
+    query is rewritten with LIMIT and OFFSET (or, with keyset pagination,
+    with a FILTER on the ordered variable, that must have unique values),
+    and the next pages are requested while the current one is consumed.
+    The page size follows the response times, to keep each request close
+    to targetSeconds, up to the limit of the broker on the results of a
+    response: a page shorter than requested is followed by a request
+    starting from its last result, and if this is not empty the page size
+    is reduced to the limit detected (pass serverLimit to skip the extra
+    request at the end).
+
+    Without orderBy, offset pagination relies on the broker returning the
+    results of the query always in the same order.
+
+    Parameters
+    ----------
+    client : SEPAClient
+        The client used to perform the queries
+    queryName : str
+        The friendly name of the SPARQL Query
+    forcedBindings : dict
+        The dictionary containing the bindings to fill the template (default = {})
+    pageSize : int
+        The size of the first page (default = 1000)
+    orderBy : str
+        The variable (without ?) ordering the results (default = None)
+    keyset : bool
+        True to use keyset pagination on orderBy instead of offsets (default = False)
+    prefetch : int
+        The number of pages requested ahead of the current one, 1 with keyset pagination (default = 1)
+    targetSeconds : float
+        The desired response time of a page (default = 0.5, None for a fixed page size)
+    minPageSize : int
+        The minimum page size (default = 100)
+    maxPageSize : int
+        The maximum page size (default = 100000)
+    secure : bool
+        A boolean that states if the queries must be secure or not (default = False)
+    serverLimit : int
+        The maximum number of results of a response of the broker (default = None, detected)
+
+    Attributes
+    ----------
+    variables : list
+        The variables of the results (None before the first page)
+    pages : int
+        The number of pages received
+    rows : int
+        The number of results received
+    pageSize : int
+        The size of the next page
+    serverLimit : int
+        The limit of the broker, given or detected (None if unknown)
+
+    """
+
+    # constructor
+    def __init__(self, client, queryName, forcedBindings = {}, pageSize = 1000, orderBy = None, keyset = False, prefetch = 1,
+                 targetSeconds = 0.5, minPageSize = 100, maxPageSize = 100000, secure = False, serverLimit = None):
+
+        """Constructor of the QueryPager class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== QueryPager::__init__ invoked ===")
+
+        # check the arguments
+        if keyset and orderBy is None:
+            raise ValueError("Keyset pagination needs an orderBy variable")
+
+        # configuration
+        self.client = client
+        self.queryName = queryName
+        self.sparql = client.configuration.getQuery(queryName, forcedBindings)
+        self.orderBy = orderBy
+        self.keyset = keyset
+        self.prefetch = 1 if keyset else max(1, prefetch)
+        self.targetSeconds = targetSeconds
+        self.minPageSize = minPageSize
+        self.maxPageSize = maxPageSize
+        self.secure = secure
+        self.serverLimit = serverLimit
+
+        # state
+        self.pageSize = min(max(minPageSize, min(pageSize, maxPageSize)), serverLimit or maxPageSize)
+        self.variables = None
+        self.guessedPageSize = None
+        self.pages = 0
+        self.rows = 0
+
+
+    # request a page
+    def fetch(self, limit, offset, after):
+
+        """Performs the query of a page, returns its limit, its offset, its response time and its bindings"""
+
+        sparql = pageQuery(self.sparql, limit, offset, self.orderBy, self.keyset, after)
+        start = time.perf_counter()
+        status, results = self.client.sendQuery(self.queryName, sparql, self.secure, None, makeDeadline(None, self.client.timeout))
+        elapsed = time.perf_counter() - start
+        if not status:
+            raise QueryFailedException("Page at {} of {} failed: {}".format(offset, self.queryName, results))
+        if self.variables is None:
+            self.variables = results.get("head", {}).get("vars")
+        return limit, offset, elapsed, results["results"]["bindings"]
+
+
+    # adapt the page size
+    def adapt(self, limit, elapsed, count):
+
+        """Scales the page size towards the target response time (at most by 2 at every page)"""
+
+        if self.targetSeconds is None or count < limit:
+            return
+        factor = max(0.5, min(2.0, self.targetSeconds / max(elapsed, 1e-6)))
+        self.pageSize = int(min(max(self.minPageSize, min(self.maxPageSize, limit * factor)), self.serverLimit or self.maxPageSize))
+
+
+    # iterate
+    def __iter__(self):
+
+        """Yields the bindings of all the pages"""
+
+        # debug print
+        self.logger.debug("=== QueryPager::__iter__ invoked ===")
+
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(self.prefetch)
+        pending = deque()
+        offset = 0
+        try:
+            pending.append(executor.submit(self.fetch, self.pageSize, offset, None))
+            offset += self.pageSize
+            while pending:
+                limit, pageOffset, elapsed, bindings = pending.popleft().result()
+                count = len(bindings)
+                self.pages += 1
+                self.rows += count
+                self.adapt(limit, elapsed, count)
+
+                # an empty page after the probe: the short page was the last one, not a limit of the broker
+                if self.guessedPageSize is not None:
+                    if count == 0:
+                        self.serverLimit = None
+                        self.pageSize = self.guessedPageSize
+                    self.guessedPageSize = None
+
+                # a short page is the last one, or the broker has a lower limit on the results:
+                # the next page starts from its last result (alone, as it may be empty),
+                # the prefetched ones skipped some
+                probing = 0 < count < limit and self.serverLimit is None
+                if probing:
+                    self.logger.debug("Short page of {} results, the broker may limit the results".format(count))
+                    self.serverLimit = count
+                    self.guessedPageSize = self.pageSize
+                    self.pageSize = min(self.pageSize, count)
+                    for future in pending:
+                        future.cancel()
+                    pending.clear()
+                    offset = pageOffset + count
+                    limit = count
+
+                # request the next pages before yielding the current one
+                if count >= limit:
+                    if self.keyset:
+                        after = bindings[-1].get(self.orderBy)
+                        if after is None:
+                            raise QueryFailedException("The last result of a page has no {}".format(self.orderBy))
+                        pending.append(executor.submit(self.fetch, self.pageSize, 0, after))
+                    else:
+                        while len(pending) < (1 if probing else self.prefetch):
+                            pending.append(executor.submit(self.fetch, self.pageSize, offset, None))
+                            offset += self.pageSize
+                else:
+                    for future in pending:
+                        future.cancel()
+                    pending.clear()
+                yield from bindings
+        finally:
+            executor.shutdown(wait = False, cancel_futures = True)
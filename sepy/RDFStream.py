@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+
+# global requirements
+from urllib.parse import urljoin
+from uuid import uuid4
+import logging
+import re
+
+# local requirements
+from .Exceptions import *
+
+# size of the blocks read from the files
+BLOCK_SIZE = 1 << 16
+
+# characters needed after a token to be sure it is complete (e.g. 1 and 1.5)
+LOOKAHEAD = 8
+
+# well known IRIs
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+RDF_TYPE = "<%stype>" % RDF
+RDF_FIRST = "<%sfirst>" % RDF
+RDF_REST = "<%srest>" % RDF
+RDF_NIL = "<%snil>" % RDF
+
+# turtle tokens (the order matters)
+TOKEN_REGEX = re.compile(r'''
+    (?P<space>(?:\s+|\#[^\n]*)+)
+  | (?P<iri><[^<>"{}|^`\\\x00-\x20]*>)
+  | (?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'|"(?:[^"\\\n\r]|\\.)*"|'(?:[^'\\\n\r]|\\.)*')
+  | (?P<directive>@prefix|@base)\b
+  | (?P<langtag>@[a-zA-Z]+(?:-[a-zA-Z0-9]+)*)
+  | (?P<datatype>\^\^)
+  | (?P<number>[+-]?(?:\d+\.\d*[eE][+-]?\d+|\.\d+[eE][+-]?\d+|\d+[eE][+-]?\d+|\d*\.\d+|\d+))
+  | (?P<bnode>_:[\w](?:[\w\-.]*[\w\-])?)
+  | (?P<pname>(?:[A-Za-z](?:[\w\-.]*[\w\-])?)?:(?:(?:[\w:%]|\\.)(?:(?:[\w\-.:%]|\\.)*(?:[\w\-:%]|\\.))?)?)
+  | (?P<keyword>(?:a|true|false|PREFIX|BASE|prefix|base)\b)
+  | (?P<punctuation>[.;,\[\]()])
+''', re.VERBOSE)
+
+# n-triples lines
+NT_REGEX = re.compile(r'''^\s*(<[^>]*>|_:[^\s.]+(?:\.[^\s.]+)*)\s*(<[^>]*>)\s*
+    (<[^>]*>|_:[^\s.]+(?:\.[^\s.]+)*|"(?:[^"\\\n\r]|\\.)*"(?:@[a-zA-Z]+(?:-[a-zA-Z0-9]+)*|\^\^<[^>]*>)?)
+    \s*\.\s*(?:\#.*)?$''', re.VERBOSE)
+LOCAL_ESCAPE_REGEX = re.compile(r'\\(.)')
+
+
+def tokens(stream):
+
+    """Yields the (kind, text) turtle tokens of a text stream, reading it in blocks"""
+
+    buffer = ""
+    position = 0
+    eof = False
+    while True:
+        if position >= len(buffer):
+            if eof:
+                return
+            buffer = stream.read(BLOCK_SIZE)
+            position = 0
+            eof = not buffer
+            continue
+        match = TOKEN_REGEX.match(buffer, position)
+
+        # a token close to the end of the buffer may continue in the next block
+        # (as well as a long string, partially matched as an empty string)
+        if not eof and (match is None or len(buffer) - match.end() < LOOKAHEAD or
+                        (buffer.startswith(('"""', "'''"), position) and match.end() - position < 6)):
+            block = stream.read(BLOCK_SIZE)
+            if block:
+                buffer = buffer[position:] + block
+                position = 0
+                continue
+            eof = True
+            continue
+        if match is None:
+            raise RDFParsingException("Unexpected text: {}".format(buffer[position:position + 40]))
+        position = match.end()
+        kind = match.lastgroup
+        if kind != "space":
+            yield kind, match.group(kind)
+
+
+class TurtleParser:
+
+    """
+    A streaming parser of Turtle (and N-Triples) documents: triples are
+    yielded as soon as their statement ends, so that memory does not grow
+    with the size of the document. Terms are returned in SPARQL syntax
+    with full IRIs (<...>) and literals as written in the document; blank
+    nodes are replaced by skolem IRIs unique to the parser, since blank
+    node labels cannot span several SPARQL requests.
+
+    Parameters
+    ----------
+    stream : file
+        A text stream with the document
+    base : str
+        The base IRI (default = None)
+
+    """
+
+    # constructor
+    def __init__(self, stream, base = None):
+
+        """Constructor of the TurtleParser class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== TurtleParser::__init__ invoked ===")
+
+        # initialize
+        self.tokens = tokens(stream)
+        self.base = base
+        self.prefixes = {}
+        self.genid = "urn:sepy:genid:%s:" % uuid4().hex
+        self.anonymous = 0
+        self.pending = []
+        self.lookahead = None
+
+
+    # token helpers
+    def peek(self):
+        if self.lookahead is None:
+            self.lookahead = next(self.tokens, (None, None))
+        return self.lookahead
+
+    def take(self):
+        token = self.peek()
+        self.lookahead = None
+        return token
+
+    def expect(self, text):
+        kind, value = self.take()
+        if value != text:
+            raise RDFParsingException("Expected {} but found {}".format(text, value))
+
+
+    # terms
+    def iri(self, text):
+        iri = text[1:-1]
+        if self.base is not None and ":" not in iri:
+            iri = urljoin(self.base, iri)
+        return "<%s>" % iri
+
+    def pname(self, text):
+        prefix, _, local = text.partition(":")
+        if prefix not in self.prefixes:
+            raise RDFParsingException("Undefined prefix {}".format(prefix))
+        return "<%s%s>" % (self.prefixes[prefix], LOCAL_ESCAPE_REGEX.sub(r'\1', local))
+
+    def bnode(self, label = None):
+        if label is None:
+            self.anonymous += 1
+            label = "anon%s" % self.anonymous
+        return "<%s%s>" % (self.genid, label)
+
+    def term(self, kind, value):
+        if kind == "iri":
+            return self.iri(value)
+        if kind == "pname":
+            return self.pname(value)
+        if kind == "bnode":
+            return self.bnode(value[2:])
+        if kind == "keyword" and value == "a":
+            return RDF_TYPE
+        raise RDFParsingException("Unexpected {}".format(value))
+
+
+    # grammar
+    def directive(self, kind, value):
+        if value.lower() in ("@prefix", "prefix"):
+            prefix = self.take()[1]
+            self.prefixes[prefix[:-1]] = self.iri(self.take()[1])[1:-1]
+        else:
+            self.base = self.iri(self.take()[1])[1:-1]
+        if value.startswith("@"):
+            self.expect(".")
+
+    def object(self):
+        kind, value = self.take()
+        if kind == "string":
+            nextKind, nextValue = self.peek()
+            if nextKind == "langtag":
+                self.take()
+                return value + nextValue
+            if nextKind == "datatype":
+                self.take()
+                return value + "^^" + self.term(*self.take())
+            return value
+        if kind == "number" or (kind == "keyword" and value in ("true", "false")):
+            return value
+        if value == "[":
+            return self.blankNodePropertyList()
+        if value == "(":
+            return self.collection()
+        return self.term(kind, value)
+
+    def blankNodePropertyList(self):
+        node = self.bnode()
+        if self.peek()[1] != "]":
+            self.predicateObjectList(node)
+        self.expect("]")
+        return node
+
+    def collection(self):
+        head = RDF_NIL
+        previous = None
+        while self.peek()[1] != ")":
+            if self.peek()[0] is None:
+                raise RDFParsingException("Unterminated collection")
+            node = self.bnode()
+            if previous is None:
+                head = node
+            else:
+                self.pending.append((previous, RDF_REST, node))
+            self.pending.append((node, RDF_FIRST, self.object()))
+            previous = node
+        self.take()
+        if previous is not None:
+            self.pending.append((previous, RDF_REST, RDF_NIL))
+        return head
+
+    def predicateObjectList(self, subject):
+        while True:
+            predicate = self.term(*self.take())
+            while True:
+                self.pending.append((subject, predicate, self.object()))
+                if self.peek()[1] != ",":
+                    break
+                self.take()
+            if self.peek()[1] != ";":
+                return
+            while self.peek()[1] == ";":
+                self.take()
+            if self.peek()[1] in (".", "]", None):
+                return
+
+
+    # iterate
+    def __iter__(self):
+
+        """Yields the (subject, predicate, object) triples of the document"""
+
+        while True:
+            kind, value = self.take()
+            if kind is None:
+                return
+            if kind == "directive" or (kind == "keyword" and value.lower() in ("prefix", "base")):
+                self.directive(kind, value)
+                continue
+            if value == "[":
+                subject = self.blankNodePropertyList()
+                if self.peek()[1] != ".":
+                    self.predicateObjectList(subject)
+            elif value == "(":
+                subject = self.collection()
+                self.predicateObjectList(subject)
+            else:
+                subject = self.term(kind, value)
+                self.predicateObjectList(subject)
+            self.expect(".")
+            yield from self.pending
+            self.pending = []
+
+
+def parseNTriples(stream, genid = None):
+
+    """
+    Yields the (subject, predicate, object) triples of an N-Triples stream,
+    with the same conventions of TurtleParser (one line at a time)
+    """
+
+    genid = genid or "urn:sepy:genid:%s:" % uuid4().hex
+    for number, line in enumerate(stream, 1):
+        match = NT_REGEX.match(line)
+        if match is None:
+            if line.strip() and not line.lstrip().startswith("#"):
+                raise RDFParsingException("Malformed N-Triples line {}".format(number))
+            continue
+        subject, predicate, obj = match.groups()
+        if subject.startswith("_:"):
+            subject = "<%s%s>" % (genid, subject[2:])
+        if obj.startswith("_:"):
+            obj = "<%s%s>" % (genid, obj[2:])
+        yield subject, predicate, obj
+
+
+def parseFile(path, format = None, base = None):
+
+    """
+    Yields the triples of a file, streaming it. The format ("nt" or "ttl")
+    defaults to the file extension.
+    """
+
+    if format is None:
+        format = "nt" if path.lower().endswith(".nt") else "ttl"
+    with open(path, encoding = "utf-8") as stream:
+        if format == "nt":
+            yield from parseNTriples(stream)
+        else:
+            yield from TurtleParser(stream, base)
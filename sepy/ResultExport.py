@@ -0,0 +1,306 @@
+#!/usr/bin/python3
+
+# global requirements
+from datetime import datetime, timezone
+import argparse
+import logging
+import json
+import time
+import csv
+import sys
+
+# pyarrow is optional and only imported by the Arrow and Parquet exports
+
+# local requirements
+from .SEPAClient import *
+
+# column types of the literal datatypes (the other terms are strings)
+XSD = "http://www.w3.org/2001/XMLSchema#"
+INTEGER_TYPES = ("integer", "int", "long", "short", "byte", "nonNegativeInteger", "positiveInteger",
+                 "nonPositiveInteger", "negativeInteger", "unsignedLong", "unsignedInt",
+                 "unsignedShort", "unsignedByte")
+COLUMN_TYPES = {XSD + "decimal": "float64",
+                XSD + "double": "float64",
+                XSD + "float": "float64",
+                XSD + "boolean": "bool",
+                XSD + "dateTime": "timestamp"}
+COLUMN_TYPES.update((XSD + datatype, "int64") for datatype in INTEGER_TYPES)
+
+
+def termValue(term):
+
+    """Returns the text of a term as written in SPARQL CSV results (blank nodes as _:label)"""
+
+    if term is None:
+        return ""
+    if term.get("type") == "bnode":
+        return "_:" + term["value"]
+    return term["value"]
+
+
+def termType(term):
+
+    """Returns the column type of a term ("string" unless it is a typed literal)"""
+
+    if term.get("type") in ("literal", "typed-literal"):
+        return COLUMN_TYPES.get(term.get("datatype"), "string")
+    return "string"
+
+
+def columnType(terms):
+
+    """Returns the type of a column from some of its terms (integers and decimals give float64)"""
+
+    kinds = set(termType(term) for term in terms if term is not None)
+    if kinds == {"int64", "float64"}:
+        return "float64"
+    if len(kinds) == 1:
+        return kinds.pop()
+    return "string"
+
+
+def parseBoolean(value):
+    if value in ("true", "1"):
+        return True
+    if value in ("false", "0"):
+        return False
+    raise ValueError(value)
+
+
+def parseInteger(value):
+    number = int(value)
+    if not -2 ** 63 <= number < 2 ** 63:
+        raise OverflowError(value)
+    return number
+
+
+def parseTimestamp(value):
+
+    """Parses an xsd:dateTime, values without a time zone are taken as UTC"""
+
+    timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo = timezone.utc)
+    return timestamp
+
+
+# parsers of the column types
+CONVERTERS = {"string": termValue,
+              "int64": lambda term: parseInteger(term["value"]),
+              "float64": lambda term: float(term["value"]),
+              "bool": lambda term: parseBoolean(term["value"]),
+              "timestamp": lambda term: parseTimestamp(term["value"])}
+
+
+class CSVWriter:
+
+    """Writes batches of bindings as SPARQL 1.1 CSV results"""
+
+    def __init__(self, path, variables, types):
+        self.variables = variables
+        self.invalid = 0
+        self.stream = open(path, "w", newline = "", encoding = "utf-8")
+        self.writer = csv.writer(self.stream)
+        self.writer.writerow(variables)
+
+    def write(self, batch):
+        variables = self.variables
+        self.writer.writerows([[termValue(binding.get(v)) for v in variables] for binding in batch])
+
+    def close(self):
+        self.stream.close()
+
+
+class ArrowWriter:
+
+    """
+    Writes batches of bindings as the record batches of an Arrow IPC file
+    or as the row groups of a Parquet file, with one typed column for
+    every variable. Values that do not match the type of their column
+    are written as nulls and counted in invalid.
+    """
+
+    def __init__(self, path, variables, types, parquet = False, compression = "snappy"):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("pyarrow is needed to export Arrow and Parquet files")
+        self.pyarrow = pyarrow
+        self.variables = variables
+        self.types = types
+        self.invalid = 0
+        arrowTypes = {"string": pyarrow.string(),
+                      "int64": pyarrow.int64(),
+                      "float64": pyarrow.float64(),
+                      "bool": pyarrow.bool_(),
+                      "timestamp": pyarrow.timestamp("us", tz = "UTC")}
+        self.schema = pyarrow.schema([(v, arrowTypes[types[v]]) for v in variables])
+        if parquet:
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression = compression)
+        else:
+            import pyarrow.ipc
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def column(self, variable, batch):
+        convert = CONVERTERS[self.types[variable]]
+        values = []
+        for binding in batch:
+            term = binding.get(variable)
+            if term is None:
+                values.append(None)
+                continue
+            try:
+                values.append(convert(term))
+            except (ValueError, OverflowError):
+                self.invalid += 1
+                values.append(None)
+        return values
+
+    def write(self, batch):
+        arrays = [self.pyarrow.array(self.column(v, batch), type = field.type)
+                  for v, field in zip(self.variables, self.schema)]
+        self.writer.write_batch(self.pyarrow.RecordBatch.from_arrays(arrays, schema = self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ResultExporter:
+
+    """
+    Exports the results of the queries of a JSAP file to CSV, Arrow or
+    Parquet files. The bindings are decoded while the response is received
+    (see SEPAClient.queryStream) and written in batches of batchSize rows,
+    so that memory is bounded by the batch size and not by the number of
+    results. The type of the Arrow and Parquet columns comes from the
+    datatypes of the literals in the first batch, unless it is given.
+
+    Parameters
+    ----------
+    client : SEPAClient
+        The client used to perform the queries
+    batchSize : int
+        The number of rows of each batch (default = 10000)
+    types : dict
+        The column types ("string", "int64", "float64", "bool" or "timestamp") indexed by variable (default = None, from the data)
+    chunkSize : int
+        The size of the blocks read from the response (default = 65536)
+
+    """
+
+    # constructor
+    def __init__(self, client, batchSize = 10000, types = None, chunkSize = 65536):
+
+        """Constructor of the ResultExporter class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== ResultExporter::__init__ invoked ===")
+
+        # configuration
+        self.client = client
+        self.batchSize = batchSize
+        self.types = types or {}
+        self.chunkSize = chunkSize
+
+
+    # export
+    def export(self, queryName, writerClass, path, forcedBindings = {}, **options):
+
+        """
+        Streams the results of a query to a writer
+
+        Returns
+        -------
+        status : bool
+            True or False, depending on the success/failure of the query
+        results : dict
+            The number of rows, batches and invalid values and the elapsed seconds (the error message if status is False)
+
+        """
+
+        # debug print
+        self.logger.debug("=== ResultExporter::export invoked ===")
+
+        start = time.perf_counter()
+        status, stream = self.client.queryStream(queryName, forcedBindings, self.chunkSize)
+        if not status:
+            return False, stream
+        stats = {"rows": 0, "batches": 0, "invalid": 0, "seconds": 0.0}
+        writer = None
+        try:
+            with stream:
+                for batch in stream.batches(self.batchSize):
+                    if writer is None:
+                        writer = self.openWriter(writerClass, path, stream.variables, batch, options)
+                    writer.write(batch)
+                    stats["rows"] += len(batch)
+                    stats["batches"] += 1
+
+                    # release the batch before the next one is decoded
+                    del batch
+                if writer is None:
+                    writer = self.openWriter(writerClass, path, stream.variables, [], options)
+        finally:
+            if writer is not None:
+                writer.close()
+        stats["invalid"] = writer.invalid
+        stats["seconds"] = time.perf_counter() - start
+        return True, stats
+
+
+    # create the writer
+    def openWriter(self, writerClass, path, variables, batch, options):
+        if variables is None:
+            variables = []
+            for binding in batch:
+                variables.extend(v for v in binding if v not in variables)
+        types = {v: self.types.get(v) or columnType(binding.get(v) for binding in batch) for v in variables}
+        return writerClass(path, variables, types, **options)
+
+
+    # formats
+    def toCSV(self, queryName, path, forcedBindings = {}):
+
+        """Exports the results of a query to a CSV file (see export)"""
+
+        return self.export(queryName, CSVWriter, path, forcedBindings)
+
+    def toArrow(self, queryName, path, forcedBindings = {}):
+
+        """Exports the results of a query to an Arrow IPC file (see export)"""
+
+        return self.export(queryName, ArrowWriter, path, forcedBindings)
+
+    def toParquet(self, queryName, path, forcedBindings = {}, compression = "snappy"):
+
+        """Exports the results of a query to a Parquet file (see export)"""
+
+        return self.export(queryName, ArrowWriter, path, forcedBindings, parquet = True, compression = compression)
+
+
+# command line
+# python -m sepy.ResultExport example.jsap QUERY_NAME results.parquet [--bindings '{"var": "value"}']
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description = "Exports the results of a query to a CSV, Arrow or Parquet file")
+    parser.add_argument("configuration", help = "the JSAP or YSAP file")
+    parser.add_argument("query", help = "the name of the query")
+    parser.add_argument("output", help = "the output file (.csv, .arrow or .parquet)")
+    parser.add_argument("--bindings", default = "{}", help = "the forced bindings, as a JSON object")
+    parser.add_argument("--batch-size", type = int, default = 10000)
+    args = parser.parse_args()
+
+    exporter = ResultExporter(SEPAClient(args.configuration), args.batch_size)
+    output = args.output.lower()
+    if output.endswith(".parquet"):
+        status, results = exporter.toParquet(args.query, args.output, json.loads(args.bindings))
+    elif output.endswith((".arrow", ".feather", ".ipc")):
+        status, results = exporter.toArrow(args.query, args.output, json.loads(args.bindings))
+    else:
+        status, results = exporter.toCSV(args.query, args.output, json.loads(args.bindings))
+    if not status:
+        sys.stderr.write("Query failed: %s\n" % results)
+        sys.exit(1)
+    sys.stderr.write("%(rows)d rows in %(batches)d batches, %(invalid)d invalid values, %(seconds).1f s\n" % results)
@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+
+# global requirements
+import logging
+import codecs
+import json
+import re
+
+# local requirements
+from .Exceptions import *
+
+# start of the bindings array and projected variables
+BINDINGS_REGEX = re.compile(r'"bindings"\s*:\s*\[')
+VARS_REGEX = re.compile(r'"vars"\s*:\s*(\[[^\]]*\])')
+
+# characters between two bindings
+SEPARATOR_REGEX = re.compile(r'[\s,]*')
+
+
+class ResultStream:
+
+    """
+    Iterates over the bindings of a SPARQL JSON result set while the
+    response is being received: only the binding being decoded and one
+    block of the response are kept in memory, whatever the number of
+    results. The head of the result set is read when the stream is
+    created.
+
+    Parameters
+    ----------
+    chunks : iterable
+        The blocks (bytes) of the response body
+    close : function
+        A function called when the stream is closed, e.g. to release the connection (default = None)
+
+    Attributes
+    ----------
+    variables : list
+        The projected variables (None if the head follows the results)
+    boolean : bool
+        The result of an ASK query (None for the other queries)
+    error : str
+        The error message returned by the broker (None if there is no error)
+    received : int
+        The number of bytes read from the response so far
+
+    """
+
+    # constructor
+    def __init__(self, chunks, close = None):
+
+        """Constructor of the ResultStream class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== ResultStream::__init__ invoked ===")
+
+        # input
+        self.chunks = iter(chunks)
+        self.closeFunction = close
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.jsonDecoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.done = False
+        self.received = 0
+
+        # head
+        self.variables = None
+        self.boolean = None
+        self.error = None
+        self.readHead()
+
+
+    # read a block
+    def read(self):
+
+        """Appends a block of the response to the buffer, returns False at the end of the response"""
+
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            self.buffer = self.buffer[self.position:] + self.decoder.decode(b"", True)
+            self.position = 0
+            return False
+        self.received += len(chunk)
+        self.buffer = self.buffer[self.position:] + self.decoder.decode(chunk)
+        self.position = 0
+        return True
+
+
+    # read up to the first binding
+    def readHead(self):
+        while True:
+            if self.variables is None:
+                match = VARS_REGEX.search(self.buffer)
+                if match is not None:
+                    self.variables = json.loads(match.group(1))
+            match = BINDINGS_REGEX.search(self.buffer)
+            if match is not None:
+                self.position = match.end()
+                return
+            if not self.read():
+                break
+
+        # no bindings: ASK queries and errors are small documents
+        self.done = True
+        try:
+            document = json.loads(self.buffer)
+        except ValueError:
+            raise ResultParsingException("Malformed result set: {}".format(self.buffer[:80]))
+        if "error" in document:
+            error = document["error"]
+            self.error = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+        self.boolean = document.get("boolean")
+        self.close()
+
+
+    # iterate
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self.done:
+            position = SEPARATOR_REGEX.match(self.buffer, self.position).end()
+            if position < len(self.buffer):
+                if self.buffer[position] == "]":
+                    self.position = position + 1
+                    self.done = True
+                    self.close()
+                    break
+                try:
+                    binding, end = self.jsonDecoder.raw_decode(self.buffer, position)
+                    self.position = end
+                    return binding
+                except ValueError:
+                    # the binding continues in the next block
+                    if self.eof:
+                        raise ResultParsingException("Malformed binding: {}".format(self.buffer[position:position + 80]))
+            if not self.read() and position >= len(self.buffer):
+                raise ResultParsingException("Truncated result set")
+        raise StopIteration
+
+
+    # group the bindings
+    def batches(self, size):
+
+        """Yields lists of at most size bindings"""
+
+        batch = []
+        for binding in self:
+            batch.append(binding)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+    # close
+    def close(self):
+
+        """Releases the response (the remaining bindings are discarded)"""
+
+        self.done = True
+        if self.closeFunction is not None:
+            closeFunction = self.closeFunction
+            self.closeFunction = None
+            closeFunction()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
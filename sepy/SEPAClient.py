@@ -1,11 +1,20 @@
 #!/usr/bin/python3
 
 from os.path import splitext
+from threading import Lock
+from uuid import uuid4
 import json
+import time
 import logging
 from .ConfigurationObject import *
 from .Exceptions import *
 from .ConnectionHandler import *
+from .SharedSubscription import *
+from .ResultStream import *
+from .QueryPager import *
+from .AdaptiveLimiter import *
+from .SecureTransport import *
+from .Deadline import *
 
 # class KP
 class SEPAClient:
@@ -24,13 +33,27 @@ class SEPAClient:
     ----------
     subscriptions : dict
         Dictionary to keep track of the active subscriptions
+    sharedSubscriptions : dict
+        Dictionary with the server-side subscriptions indexed by subscribe URI and normalized SPARQL
     connectionManager : ConnectionManager
         The underlying responsible for network connections
+    metrics : MetricsRegistry
+        The registry collecting the metrics of requests and notifications (None if disabled)
+    tracer : Tracer
+        The hooks called at the end of every phase of requests and notifications (None if disabled)
+    limiter : AdaptiveLimiter
+        The limiter of the updates in flight (None if disabled)
+    yskFile : str
+        The file with the credentials of the secure updates and queries
+    timeout : float
+        The default deadline of the updates and queries in seconds (None for no deadline)
+    reloadListeners : list
+        The functions called after a reload of the configuration, with the previous and the new ConfigurationObject and the names of the changed templates
 
     """
 
     # constructor
-    def __init__(self, File, logLevel = 40):
+    def __init__(self, File, logLevel = 40, metrics = None, tracer = None, limiter = None, yskFile = None, transport = None, timeout = None):
         
         """
         Constructor for the Low-level KP class
@@ -41,25 +64,60 @@ class SEPAClient:
             JSAP or YSAP file used for configuration
         logLevel : int
             The desired log level. Default = 40
+        metrics : MetricsRegistry
+            A registry to collect metrics about requests and notifications (default = None)
+        tracer : Tracer
+            The hooks to call at the end of every phase of requests and notifications (default = None)
+        limiter : AdaptiveLimiter
+            A limiter of the updates in flight, adapted to the response times of the broker (default = None)
+        yskFile : str
+            The file with the credentials of the secure updates and queries (default = None)
+        transport : SecureTransport
+            The TLS layer of the secure requests and subscriptions (default = None, verifying with the system CAs)
+        timeout : float
+            The default deadline of the updates and queries in seconds (default = None, no deadline)
 
         """
 
         # logger configuration
+        # (the handlers are configured once, by ConfigurationObject)
         self.logger = logging.getLogger("sepaLogger")
         self.logger.setLevel(logLevel)
-        logging.basicConfig(format='%(levelname)s:%(message)s', level=logLevel)
         self.logger.debug("=== KP::__init__ invoked ===")
+        self.logLevel = logLevel
 
         # initialize data structures
         self.subscriptions = {}
+        self.sharedSubscriptions = {}
+        self.subscriptionRequests = {}
+        self.subscriptionsLock = Lock()
+        self.reloadListeners = []
 
         # initialize handler
-        self.configuration = ConfigurationObject(File)
-        self.connectionManager = ConnectionHandler()        
+        self.configuration = ConfigurationObject(File, logLevel)
+        self.connectionManager = ConnectionHandler(logLevel)
+
+        # initialize instrumentation
+        self.metrics = metrics
+        self.connectionManager.metrics = metrics
+        self.tracer = tracer
+        self.configuration.tracer = tracer
+        self.connectionManager.tracer = tracer
+        self.limiter = limiter
+        if limiter is not None and limiter.metrics is None:
+            limiter.metrics = metrics
+
+        # initialize security
+        self.yskFile = yskFile
+        if transport is not None:
+            self.connectionManager.transport = transport
+
+        # initialize deadlines
+        self.timeout = timeout
         
 
     # update
-    def update(self, updateName, forcedBindings = {}, secure = False):
+    def update(self, updateName, forcedBindings = {}, secure = False, deadline = None):
 
         """
         This method is used to perform a SPARQL update
@@ -72,6 +130,8 @@ class SEPAClient:
             The dictionary containing the bindings to fill the template
         secure : bool
             A boolean that states if the connection must be secure or not (default = False)
+        deadline : float or Deadline
+            The deadline in seconds, or a Deadline that can be cancelled (default = None, the timeout of the client)
 
         Returns
         -------
@@ -86,25 +146,175 @@ class SEPAClient:
         self.logger.debug("=== KP::update invoked ===")
 
         # perform the update request
-        updateURI = self.configuration.updateURI
-        sparqlUpdate = self.configuration.getUpdate(updateName, forcedBindings)
-        
-        if secure:
-            tokenURI = self.configuration.tokenReqURI
-            registerURI = self.configuration.registerURI
-            status, results = self.connectionManager.secureRequest(updateURI, sparqlUpdate, False, tokenURI, registerURI)
-        else:
-            status, results = self.connectionManager.unsecureRequest(updateURI, sparqlUpdate, False)
+        deadline = makeDeadline(deadline, self.timeout)
+        if deadline is not None:
+            deadline.check("rendering")
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        configuration = self.configuration
+        sparqlUpdate = configuration.getUpdate(updateName, forcedBindings)
+        sent = None
+        if metrics is not None:
+            sent = time.perf_counter()
+            metrics.observe("sepy_render_seconds", sent - start, kind = "update", name = updateName)
+        return self.sendUpdate(updateName, sparqlUpdate, secure, sent, deadline, configuration = configuration)
+
+
+    # bulk update
+    def updateMany(self, updateName, bindingsList, secure = False, deadline = None):
+
+        """
+        This method is used to perform many updates from the same template
+        in a single request (the operations are separated by ";")
+
+        Parameters
+        ----------
+        updateName : str
+            The friendly name of the SPARQL Update
+        bindingsList : list
+            A list of dictionaries, each one containing the bindings to fill the template
+        secure : bool
+            A boolean that states if the connection must be secure or not (default = False)
+        deadline : float or Deadline
+            The deadline in seconds, or a Deadline that can be cancelled (default = None, the timeout of the client)
+
+        Returns
+        -------
+        status : bool
+            True or False, depending on the success/failure of the request
+        results : json
+            The results of the SPARQL update
+
+        """
+
+        # debug print
+        self.logger.debug("=== KP::updateMany invoked ===")
+
+        # render the operations, declaring the prefixes once
+        deadline = makeDeadline(deadline, self.timeout)
+        if deadline is not None:
+            deadline.check("rendering")
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        configuration = self.configuration
+        prefixes = len(configuration.nsSparql)
+        operations = [configuration.getUpdate(updateName, forcedBindings)[prefixes:] for forcedBindings in bindingsList]
+        sparqlUpdate = configuration.nsSparql + " ; ".join(operations)
+        sent = None
+        if metrics is not None:
+            sent = time.perf_counter()
+            metrics.observe("sepy_render_seconds", sent - start, kind = "update", name = updateName)
+        return self.sendUpdate(updateName, sparqlUpdate, secure, sent, deadline, configuration = configuration)
+
+
+    # bulk update from columns
+    def updateColumns(self, updateName, columns, secure = False, batchSize = None, deadline = None):
+
+        """
+        This method is used to perform the updates of a template bound to
+        columns of values (e.g. NumPy arrays or DataFrame columns), without
+        a dictionary per row (see ConfigurationObject.renderColumns)
+
+        Parameters
+        ----------
+        updateName : str
+            The friendly name of the SPARQL Update
+        columns : dict
+            The values of every variable: a sequence, an array or a scalar bound in all the rows
+        secure : bool
+            A boolean that states if the connection must be secure or not (default = False)
+        batchSize : int
+            The number of operations per request (default = None, all in one request)
+        deadline : float or Deadline
+            The deadline in seconds, or a Deadline that can be cancelled (default = None, the timeout of the client)
+
+        Returns
+        -------
+        status : bool
+            True if all the requests succeeded, False at the first failure
+        results : list
+            The results of the requests sent
+
+        """
+
+        # debug print
+        self.logger.debug("=== KP::updateColumns invoked ===")
+
+        # render all the requests
+        deadline = makeDeadline(deadline, self.timeout)
+        if deadline is not None:
+            deadline.check("rendering")
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        configuration = self.configuration
+        sparqlUpdates = configuration.getUpdateColumns(updateName, columns, batchSize)
+        sent = None
+        if metrics is not None:
+            sent = time.perf_counter()
+            metrics.observe("sepy_render_seconds", sent - start, kind = "update", name = updateName)
+
+        # send them in order, stopping at the first failure
+        resultsList = []
+        for sparqlUpdate in sparqlUpdates:
+            status, results = self.sendUpdate(updateName, sparqlUpdate, secure, sent, deadline, configuration = configuration)
+            sent = None
+            resultsList.append(results)
+            if not status:
+                return False, resultsList
+        return True, resultsList
+
+
+    # send a rendered update
+    def sendUpdate(self, updateName, sparqlUpdate, secure, sent, deadline = None, raiseUnavailable = False, configuration = None):
+
+        """Sends a rendered update, sent is the time the rendering ended (only used by the metrics), within the Deadline deadline if given (raising BrokerUnavailableException on 429 and 5xx responses if raiseUnavailable is True), to the URIs of the configuration it was rendered with (default = None, the current one)"""
+
+        metrics = self.metrics
+        if metrics is not None and sent is None:
+            sent = time.perf_counter()
+        limiter = self.limiter
+        if limiter is not None:
+            start = limiter.acquire(None if deadline is None else deadline.timeout("waiting for the limiter"))
+            if start is None:
+                raise DeadlineExceededException("Deadline exceeded waiting for the limiter")
+        if configuration is None:
+            configuration = self.configuration
+        try:
+            if secure:
+                updateURI = configuration.secureUpdateURI
+                tokenURI = configuration.tokenReqURI
+                registerURI = configuration.registerURI
+                status, results = self.connectionManager.secureRequest(updateURI, sparqlUpdate, False, tokenURI, registerURI, self.yskFile, name = updateName, deadline = deadline)
+            else:
+                updateURI = configuration.updateURI
+                status, results = self.connectionManager.unsecureRequest(updateURI, sparqlUpdate, False, name = updateName, deadline = deadline)
+        except Exception as e:
+            if limiter is not None:
+                # a cancellation says nothing about the broker
+                limiter.release(start, not isinstance(e, RequestCancelledException))
+            if metrics is not None:
+                metrics.inc("sepy_errors_total", kind = "update", name = updateName)
+            raise
+        unavailable = int(status) == 429 or int(status) >= 500
+        if limiter is not None:
+            limiter.release(start, unavailable)
+        if metrics is not None:
+            self.recordRequest("update", updateName, sparqlUpdate, status, results, sent)
 
         # return
         if int(status) == 200:
             return True, results
+        elif unavailable and raiseUnavailable:
+            raise BrokerUnavailableException("Update {} failed with status {}: {}".format(updateName, status, results))
         else:
             return False, results
 
 
     # query
-    def query(self, queryName, forcedBindings = {}, secure = False):
+    def query(self, queryName, forcedBindings = {}, secure = False, deadline = None):
     
         """
         This method is used to perform a SPARQL query
@@ -117,6 +327,8 @@ class SEPAClient:
             The dictionary containing the bindings to fill the template
         secure : bool
             A boolean that states if the connection must be secure or not (default = False)
+        deadline : float or Deadline
+            The deadline in seconds, or a Deadline that can be cancelled (default = None, the timeout of the client)
 
         Returns
         -------
@@ -131,21 +343,61 @@ class SEPAClient:
         self.logger.debug("=== KP::query invoked ===")
         
         # perform the query request
-        queryURI = self.configuration.queryURI
-        sparqlQuery = self.configuration.getQuery(queryName, forcedBindings)
-
-        if secure:
-            # take register URI from configuration file
-            registerURI = self.configuration.registerURI
-            # take token request URI from configuration file
-            tokenURI = self.configuration.tokenReqURI
-            status, results = self.connectionManager.secureRequest(queryURI, sparqlQuery, True, tokenURI, registerURI)
-        else:
-            status, results = self.connectionManager.unsecureRequest(queryURI, sparqlQuery, True)
+        deadline = makeDeadline(deadline, self.timeout)
+        if deadline is not None:
+            deadline.check("rendering")
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        configuration = self.configuration
+        sparqlQuery = configuration.getQuery(queryName, forcedBindings)
+        sent = None
+        if metrics is not None:
+            sent = time.perf_counter()
+            metrics.observe("sepy_render_seconds", sent - start, kind = "query", name = queryName)
+        return self.sendQuery(queryName, sparqlQuery, secure, sent, deadline, configuration = configuration)
+
+
+    # send a rendered query
+    def sendQuery(self, queryName, sparqlQuery, secure, sent, deadline = None, configuration = None):
+
+        """Sends a rendered query, sent is the time the rendering ended (only used by the metrics), within the Deadline deadline if given, to the URIs of the configuration it was rendered with (default = None, the current one)"""
+
+        metrics = self.metrics
+        if metrics is not None and sent is None:
+            sent = time.perf_counter()
+        if configuration is None:
+            configuration = self.configuration
+        try:
+            if secure:
+                queryURI = configuration.secureQueryURI
+                # take register URI from configuration file
+                registerURI = configuration.registerURI
+                # take token request URI from configuration file
+                tokenURI = configuration.tokenReqURI
+                status, results = self.connectionManager.secureRequest(queryURI, sparqlQuery, True, tokenURI, registerURI, self.yskFile, name = queryName, deadline = deadline)
+            else:
+                queryURI = configuration.queryURI
+                status, results = self.connectionManager.unsecureRequest(queryURI, sparqlQuery, True, name = queryName, deadline = deadline)
+        except Exception:
+            if metrics is not None:
+                metrics.inc("sepy_errors_total", kind = "query", name = queryName)
+            raise
+        if metrics is not None:
+            self.recordRequest("query", queryName, sparqlQuery, status, results, sent)
             
         # return 
         if int(status) == 200:
+            if deadline is not None:
+                deadline.check("decoding")
+            tracer = self.tracer
+            if metrics is not None or tracer is not None:
+                start = time.perf_counter()
             jresults = json.loads(results)
+            if metrics is not None:
+                metrics.observe("sepy_decode_seconds", time.perf_counter() - start, kind = "query", name = queryName)
+            if tracer is not None:
+                tracer.onPhase("decode", start, time.perf_counter() - start, {"name": queryName, "bytes": len(results)})
             if "error" in jresults:
                 return False, jresults["error"]["message"]
             else:
@@ -154,11 +406,132 @@ class SEPAClient:
             return False, results
         
 
+    # paged query
+    def queryPaged(self, queryName, forcedBindings = {}, pageSize = 1000, orderBy = None, keyset = False, prefetch = 1, secure = False, **options):
+
+        """
+        This method is used to perform a SPARQL query one page at a time
+
+        Parameters
+        ----------
+        queryName : str
+            The friendly name of the SPARQL Query
+        forcedBindings : dict
+            The dictionary containing the bindings to fill the template
+        pageSize : int
+            The size of the first page, then adapted to the response times (default = 1000)
+        orderBy : str
+            The variable (without ?) ordering the results (default = None)
+        keyset : bool
+            True to page on the values of orderBy instead of offsets (default = False)
+        prefetch : int
+            The number of pages requested ahead of the one being consumed (default = 1)
+        secure : bool
+            A boolean that states if the connection must be secure or not (default = False)
+        options : dict
+            The other parameters of QueryPager (targetSeconds, minPageSize, maxPageSize)
+
+        Returns
+        -------
+        QueryPager
+            An iterable over the bindings of all the pages (raises QueryFailedException if a page fails)
+
+        """
+
+        # debug print
+        self.logger.debug("=== KP::queryPaged invoked ===")
+
+        return QueryPager(self, queryName, forcedBindings, pageSize, orderBy, keyset, prefetch, secure = secure, **options)
+
+
+    # streamed query
+    def queryStream(self, queryName, forcedBindings = {}, chunkSize = 65536, timeout = None):
+
+        """
+        This method is used to perform a SPARQL query whose results are
+        decoded while they are received (only unsecure queries)
+
+        Parameters
+        ----------
+        queryName : str
+            The friendly name of the SPARQL Query
+        forcedBindings : dict
+            The dictionary containing the bindings to fill the template
+        chunkSize : int
+            The size of the blocks read from the response (default = 65536)
+        timeout : float
+            The maximum time in seconds to connect and to wait for every block (default = None, the timeout of the client)
+
+        Returns
+        -------
+        status : bool
+            True or False, depending on the success/failure of the request
+        results : ResultStream
+            The bindings of the results, to be closed after use (the error message if status is False)
+
+        """
+
+        # debug print
+        self.logger.debug("=== KP::queryStream invoked ===")
+
+        # perform the query request
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        configuration = self.configuration
+        queryURI = configuration.queryURI
+        sparqlQuery = configuration.getQuery(queryName, forcedBindings)
+        if timeout is None:
+            timeout = self.timeout
+        if metrics is not None:
+            sent = time.perf_counter()
+            metrics.observe("sepy_render_seconds", sent - start, kind = "query", name = queryName)
+        try:
+            r = self.connectionManager.streamRequest(queryURI, sparqlQuery, name = queryName, timeout = timeout)
+        except Exception:
+            if metrics is not None:
+                metrics.inc("sepy_errors_total", kind = "query", name = queryName)
+            raise
+        if metrics is not None:
+            metrics.observe("sepy_request_seconds", time.perf_counter() - sent, kind = "query", name = queryName)
+            metrics.inc("sepy_requests_total", kind = "query", name = queryName)
+            metrics.inc("sepy_bytes_sent_total", len(sparqlQuery.encode("utf-8")), kind = "query", name = queryName)
+
+        # return
+        if r.status_code != 200:
+            if metrics is not None:
+                metrics.inc("sepy_errors_total", kind = "query", name = queryName)
+            results = r.text
+            r.close()
+            return False, results
+        results = ResultStream(r.iter_content(chunkSize), r.close)
+        if results.error is not None:
+            return False, results.error
+        return True, results
+
+
+    # metrics of a request
+    def recordRequest(self, kind, name, sparql, status, results, sent):
+
+        """Records the metrics of a completed request, sent at time sent"""
+
+        metrics = self.metrics
+        metrics.observe("sepy_request_seconds", time.perf_counter() - sent, kind = kind, name = name)
+        metrics.inc("sepy_requests_total", kind = kind, name = name)
+        metrics.inc("sepy_bytes_sent_total", len(sparql.encode("utf-8")), kind = kind, name = name)
+        metrics.inc("sepy_bytes_received_total", len(results.encode("utf-8")), kind = kind, name = name)
+        if int(status) != 200:
+            metrics.inc("sepy_errors_total", kind = kind, name = name)
+
+
     # susbscribe
-    def subscribe(self, subscriptionName, alias = None, handler = None, yskFile = None):
+    def subscribe(self, subscriptionName, alias = None, handler = None, yskFile = None, forcedBindings = {}):
 
         """
-        This method is used to start a SPARQL subscription
+        This method is used to start a SPARQL subscription. Subscriptions
+        resulting in the same SPARQL share a single server-side subscription:
+        notifications are forwarded to all the local handlers and the current
+        results are replayed to the late joiners.
 
         Parameters
         ----------
@@ -168,15 +541,15 @@ class SEPAClient:
             A friendly name for the subscription
         handler : Handler
             A class to handle notifications
-        secure : bool
-            A boolean that states if the connection must be secure or not (default = False)
         yskFile : str
             The file that contains secure websocket credentials (default = None)
+        forcedBindings : dict
+            The dictionary containing the bindings to fill the template (default = {})
         
         Returns
         -------
         subid : str
-            The id of the subscription, useful to call the unsubscribe method
+            The local id of the subscription, useful to call the unsubscribe method
 
         """
         
@@ -184,25 +557,184 @@ class SEPAClient:
         self.logger.debug("=== KP::subscribe invoked ===")
       
         # start the subscription and return the ID
-        sparqlQuery = self.configuration.getQuery(subscriptionName, forcedBindings = {})
-  
-        subid = None
-        if yskFile:
-            subscribeURI = self.configuration.secureSubscribeURI
-            registerURI = self.configuration.registerURI
-            tokenURI = self.configuration.tokenReqURI
-            subid = self.connectionManager.openWebsocket(subscribeURI, sparqlQuery, registerURI, tokenURI, alias = alias, handler = handler, yskFile = yskFile)
+        return self.subscribeMany(subscriptionName, [forcedBindings], alias, [handler], yskFile)[0]
+
+
+    # subscribe many
+    def subscribeMany(self, subscriptionName, bindingsList, alias = None, handler = None, yskFile = None):
+
+        """
+        This method is used to start many parameterized subscriptions from
+        the same template. All the new server-side subscriptions share a
+        single websocket connection.
+
+        Parameters
+        ----------
+        subscriptionName : str
+            The SPARQL subscription to request
+        bindingsList : list
+            A list of dictionaries, each one containing the bindings to fill the template
+        alias : str
+            A friendly name for the subscriptions
+        handler : Handler or list
+            A class to handle notifications, or a list with a handler for each subscription
+        yskFile : str
+            The file that contains secure websocket credentials (default = None)
+
+        Returns
+        -------
+        subids : list
+            The local ids of the subscriptions, in the order of bindingsList
+
+        """
+
+        # debug print
+        self.logger.debug("=== KP::subscribeMany invoked ===")
+
+        # initialization
+        if isinstance(handler, (list, tuple)):
+            handlers = handler
+        else:
+            handlers = [handler] * len(bindingsList)
+        configuration = self.configuration
+        subids = []
+        toOpen = []
+
+        # attach every request to a new or existing server-side subscription
+        with self.subscriptionsLock:
+            for forcedBindings, shandler in zip(bindingsList, handlers):
+                subid = str(uuid4())
+                request = (subscriptionName, forcedBindings, alias, yskFile)
+                self.attach(configuration, subid, request, shandler, toOpen)
+                subids.append(subid)
+
+        # open the new subscriptions through a single websocket, without the lock
+        # held: the handlers of the first notifications may subscribe or unsubscribe
+        if toOpen:
+            sharedList = [shared for shared, sparqlQuery in toOpen]
+            try:
+                self.openShared(configuration, toOpen, alias, yskFile)
+            except Exception as e:
+                toClose = []
+                with self.subscriptionsLock:
+                    for subid in subids:
+                        if subid in self.subscriptions:
+                            closing = self.detach(subid)
+                            if closing is not None:
+                                toClose.append(closing)
+                self.abandon(sharedList, str(e))
+                for shared in toClose:
+                    self.connectionManager.closeWebsocket(spuid = shared.spuid, secure = shared.secure)
+                raise
+
+        # replay the current results to the subscriptions joining existing ones
+        for subid in subids:
+            shared = self.subscriptions.get(subid)
+            if shared is not None:
+                shared.replay(subid)
+
+        # return the local ids
+        return subids
+
+
+    # attach a local subscription
+    def attach(self, configuration, subid, request, handler, toOpen):
+
+        """
+        Attaches a local subscription to a new or existing server-side one,
+        adding the new ones to toOpen (with the subscriptions lock held).
+        The current results of an existing one are replayed to the handler
+        by SharedSubscription.replay, to be called once the lock is released.
+        """
+
+        subscriptionName, forcedBindings, alias, yskFile = request
+        if yskFile is not None:
+            subscribeURI = configuration.secureSubscribeURI
         else:
-            subscribeURI = self.configuration.subscribeURI
-            subid = self.connectionManager.openWebsocket(subscribeURI, sparqlQuery, alias = alias, handler = handler)
-        return subid
+            subscribeURI = configuration.subscribeURI
+        sparqlQuery = configuration.getQuery(subscriptionName, forcedBindings)
+        key = (subscribeURI, normalizeSparql(sparqlQuery))
+        shared = self.sharedSubscriptions.get(key)
+        if shared is None:
+            shared = SharedSubscription(key, secure = yskFile is not None)
+            self.sharedSubscriptions[key] = shared
+            toOpen.append((shared, sparqlQuery))
+        else:
+            self.logger.debug("Sharing subscription {}".format(shared.spuid))
+        shared.addHandler(subid, handler, deferred = True)
+        self.subscriptions[subid] = shared
+        self.subscriptionRequests[subid] = request
+
+
+    # open server-side subscriptions
+    def openShared(self, configuration, toOpen, alias, yskFile):
+
+        """
+        Opens the server-side subscriptions of toOpen, a list of
+        (SharedSubscription, sparql), through a single websocket (without
+        the subscriptions lock held). The ones left by all their local
+        subscribers in the meantime are closed at once.
+        """
+
+        subscribeURI = toOpen[0][0].key[0]
+        sparqlList = [sparqlQuery for shared, sparqlQuery in toOpen]
+        sharedList = [shared for shared, sparqlQuery in toOpen]
+        aliases = alias if isinstance(alias, list) else [alias] * len(toOpen)
+        if yskFile is not None:
+            registerURI = configuration.registerURI
+            tokenURI = configuration.tokenReqURI
+            spuids = self.connectionManager.openWebsockets(subscribeURI, sparqlList, registerURI, tokenURI, aliases = aliases, handlers = sharedList, yskFile = yskFile)
+        else:
+            spuids = self.connectionManager.openWebsockets(subscribeURI, sparqlList, aliases = aliases, handlers = sharedList)
+        toClose = []
+        with self.subscriptionsLock:
+            for shared, spuid in zip(sharedList, spuids):
+                shared.spuid = spuid
+                if self.sharedSubscriptions.get(shared.key) is not shared:
+                    toClose.append(shared)
+        for shared in toClose:
+            self.connectionManager.closeWebsocket(spuid = shared.spuid, secure = shared.secure)
+
+
+    # detach a local subscription
+    def detach(self, subid):
+
+        """Detaches a local subscription (with the subscriptions lock held), returns its server-side subscription if it has to be closed"""
+
+        shared = self.subscriptions.pop(subid)
+        self.subscriptionRequests.pop(subid, None)
+        if shared.removeHandler(subid) > 0:
+            return None
+        if self.sharedSubscriptions.get(shared.key) is shared:
+            del self.sharedSubscriptions[shared.key]
+
+        # a subscription still opening is closed by openShared
+        return shared if shared.spuid is not None else None
+
+
+    # forget server-side subscriptions
+    def abandon(self, sharedList, error):
+
+        """Detaches the local subscriptions of server-side ones that could not be opened, passing the error to their handlers"""
+
+        with self.subscriptionsLock:
+            for shared in sharedList:
+                if self.sharedSubscriptions.get(shared.key) is shared:
+                    del self.sharedSubscriptions[shared.key]
+            for subid, shared in list(self.subscriptions.items()):
+                if any(shared is failed for failed in sharedList):
+                    del self.subscriptions[subid]
+                    self.subscriptionRequests.pop(subid, None)
+        for shared in sharedList:
+            shared.handleError(error)
         
     
-    # Please unsubscribe with close method in ConnectionHandler. Here it is not implemented.
+    # unsubscribe
     def unsubscribe(self, subid = None, secure = False):
 
         """
-        This method is used to start a SPARQL subscription
+        This method is used to stop a SPARQL subscription. The server-side
+        subscription is closed only when its last local subscriber leaves.
 
         Parameters
         ----------
@@ -216,6 +748,158 @@ class SEPAClient:
         # debug print
         self.logger.debug("=== KP::unsubscribe invoked ===")
 
+        # detach the local subscriber
+        with self.subscriptionsLock:
+            shared = self.detach(subid)
+
         # close the subscription, given the id
-        self.connectionManager.closeWebsocket(spuid = subid, secure = secure)
+        if shared is not None:
+            self.connectionManager.closeWebsocket(spuid = shared.spuid, secure = secure or shared.secure)
+
+
+    # reload the configuration
+    def reloadConfiguration(self, File = None):
 
+        """
+        This method is used to reload the configuration file, or to load
+        another one, without rebuilding the client. The file is parsed
+        into a new ConfigurationObject, which replaces the current one
+        at once: requests in flight complete with the configuration they
+        started with. The subscriptions whose SPARQL or subscribe URI
+        changed are moved to new server-side subscriptions (their
+        handlers first receive the removal of the current results), the
+        others are left untouched. The reload listeners are called last.
+        A configuration missing a subscribed query is rejected with
+        ConfigurationParsingException, keeping the current one.
+
+        Parameters
+        ----------
+        File : str
+            JSAP or YSAP file used for configuration (default = None, the current file)
+
+        Returns
+        -------
+        dict
+            The names of the changed queries and updates, whether the URIs changed and the number of subscriptions moved
+
+        """
+
+        # debug print
+        self.logger.debug("=== KP::reloadConfiguration invoked ===")
+
+        # parse the new configuration (a failure leaves the current one in place)
+        previous = self.configuration
+        configuration = ConfigurationObject(File or previous.configurationFile, self.logLevel)
+        configuration.tracer = self.tracer
+        queries, updates = previous.changes(configuration)
+        uris = previous.uris() != configuration.uris()
+
+        # swap, unless a subscribed query is missing
+        with self.subscriptionsLock:
+            keys, missing = self.subscriptionKeys(configuration)
+            if missing:
+                raise ConfigurationParsingException("Subscribed queries missing from the new configuration: {}".format(", ".join(sorted(set(missing.values())))))
+            self.configuration = configuration
+        moved = self.resubscribe(configuration)
+        changed = {"queries": sorted(queries), "updates": sorted(updates), "uris": uris, "resubscribed": moved}
+        self.logger.info("Configuration reloaded: {}".format(changed))
+        for listener in list(self.reloadListeners):
+            try:
+                listener(previous, configuration, changed)
+            except Exception as e:
+                self.logger.error("Reload listener {} failed: {}".format(listener, e))
+        return changed
+
+
+    # server-side subscriptions of a configuration
+    def subscriptionKeys(self, configuration):
+
+        """Returns the keys of the local subscriptions with configuration and the names of the queries it lacks, by subid (with the subscriptions lock held)"""
+
+        keys = {}
+        missing = {}
+        for subid, (subscriptionName, forcedBindings, alias, yskFile) in self.subscriptionRequests.items():
+            subscribeURI = configuration.secureSubscribeURI if yskFile is not None else configuration.subscribeURI
+            try:
+                keys[subid] = (subscribeURI, normalizeSparql(configuration.getQuery(subscriptionName, forcedBindings)))
+            except ConfigurationParsingException:
+                missing[subid] = subscriptionName
+        return keys, missing
+
+
+    # move the changed subscriptions
+    def resubscribe(self, configuration):
+
+        """Moves the local subscriptions whose server-side subscription changed with configuration, returns their number"""
+
+        toClose = []
+        groups = {}
+        retracted = []
+        removed = []
+        with self.subscriptionsLock:
+
+            # all the keys first: the subscriptions started with the previous
+            # configuration while it was being replaced may use removed queries
+            keys, missing = self.subscriptionKeys(configuration)
+            for subid, subscriptionName in missing.items():
+                shared = self.subscriptions[subid]
+                handler = shared.handlers.get(subid)
+                if handler is not None:
+                    removed.append((handler, subscriptionName))
+                closing = self.detach(subid)
+                if closing is not None:
+                    toClose.append(closing)
+
+            # detach the subscriptions whose key changed, attach them again
+            for subid, request in list(self.subscriptionRequests.items()):
+                shared = self.subscriptions[subid]
+                subscriptionName, forcedBindings, alias, yskFile = request
+                key = keys[subid]
+                subscribeURI = key[0]
+                if key == shared.key:
+                    continue
+                handler = shared.handlers.get(subid)
+                current = shared.snapshot()
+                if handler is not None and current is not None:
+                    retracted.append((handler, current))
+                closing = self.detach(subid)
+                if closing is not None:
+                    toClose.append(closing)
+                group = groups.setdefault((subscribeURI, yskFile), ([], [], []))
+                toOpen = group[0]
+                opened = len(toOpen)
+                self.attach(configuration, subid, request, handler, toOpen)
+                group[1].extend([alias] * (len(toOpen) - opened))
+                group[2].append(subid)
+
+        # the subscriptions of removed queries are ended
+        for handler, subscriptionName in removed:
+            self.logger.error("Subscription to {} ended: the query was removed from the configuration".format(subscriptionName))
+            if hasattr(handler, "handleError"):
+                handler.handleError("Query {} removed from the configuration".format(subscriptionName))
+
+        # the handlers moved receive the removal of the current results first
+        for handler, current in retracted:
+            handler.handle({"head": current["head"], "results": {"bindings": []}}, current)
+
+        # open the new server-side subscriptions, one websocket per subscribe URI
+        for (subscribeURI, yskFile), (toOpen, aliases, subids) in groups.items():
+            if not toOpen:
+                continue
+            try:
+                self.openShared(configuration, toOpen, aliases, yskFile)
+            except Exception as e:
+                self.logger.error("Resubscription failed: {}".format(e))
+                self.abandon([shared for shared, sparqlQuery in toOpen], str(e))
+
+        # close the server-side subscriptions left without subscribers
+        for shared in toClose:
+            self.connectionManager.closeWebsocket(spuid = shared.spuid, secure = shared.secure)
+
+        # replay the current results to the subscriptions moved to existing ones
+        for toOpen, aliases, subids in groups.values():
+            for subid in subids:
+                shared = self.subscriptions.get(subid)
+                if shared is not None:
+                    shared.replay(subid)
+        return sum(len(subids) for toOpen, aliases, subids in groups.values())
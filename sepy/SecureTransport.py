@@ -0,0 +1,264 @@
+#!/usr/bin/python3
+
+# global requirements
+from urllib.parse import urlsplit
+from collections import deque
+from threading import Lock
+import logging
+
+# ssl, socket and http.client are imported by the methods using them,
+# so that importing sepy does not load the TLS stack
+
+
+class ResumingContext:
+
+    """
+    The SSL context of an endpoint as seen by websocket-client (sslopt
+    "context"): the sockets are wrapped by SecureTransport.wrap, so that
+    the websockets resume the TLS sessions too
+    """
+
+    def __init__(self, transport, host, port):
+        self.transport = transport
+        self.host = host
+        self.port = port
+
+    def wrap_socket(self, sock, server_hostname = None, **kwargs):
+        return self.transport.wrap(sock, self.host, self.port, **kwargs)
+
+
+class SecureTransport:
+
+    """
+    The TLS layer of the secure requests and subscriptions. The SSL
+    context of every endpoint (host, port) is built once, verifying the
+    certificate of the broker and its host name against the system CAs
+    or cafile/capath. The TLS session of the last connection to an
+    endpoint is offered by the next one, which then resumes it with an
+    abbreviated handshake, and the HTTPS connections are kept alive and
+    reused (at most maxConnections idle connections per endpoint).
+
+    Parameters
+    ----------
+    cafile : str
+        The PEM file of the certificates trusted besides the system ones, e.g. a self-signed broker (default = None)
+    capath : str
+        A directory of trusted certificates (default = None)
+    verify : bool
+        False to accept any certificate (default = True, only for tests)
+    certfile : str
+        The PEM file of a client certificate (default = None)
+    keyfile : str
+        The key of the client certificate (default = None, in certfile)
+    timeout : float
+        The timeout of the connections in seconds (default = 30)
+    keepAlive : bool
+        False to close the connections after every request (default = True)
+    maxConnections : int
+        The maximum number of idle connections kept per endpoint (default = 4)
+    metrics : MetricsRegistry
+        The registry of the sepy_tls_handshakes_total counter (default = None)
+
+    Attributes
+    ----------
+    handshakes : int
+        The number of TLS handshakes
+    resumed : int
+        The number of handshakes resuming a session
+    requests : int
+        The number of HTTPS requests
+    reused : int
+        The number of HTTPS requests sent over a kept-alive connection
+
+    """
+
+    # constructor
+    def __init__(self, cafile = None, capath = None, verify = True, certfile = None, keyfile = None, timeout = 30.0, keepAlive = True, maxConnections = 4, metrics = None):
+
+        """Constructor of the SecureTransport class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== SecureTransport::__init__ invoked ===")
+
+        # configuration
+        self.cafile = cafile
+        self.capath = capath
+        self.verify = verify
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.timeout = timeout
+        self.keepAlive = keepAlive
+        self.maxConnections = maxConnections
+        self.metrics = metrics
+        if not verify:
+            self.logger.warning("TLS certificates are not verified")
+
+        # state, indexed by endpoint
+        self.lock = Lock()
+        self.contexts = {}
+        self.sessions = {}
+        self.idle = {}
+
+        # counters
+        self.handshakes = 0
+        self.resumed = 0
+        self.requests = 0
+        self.reused = 0
+
+
+    # context of an endpoint
+    def context(self, host, port):
+
+        """Returns the SSL context of an endpoint, built the first time"""
+
+        key = (host, port)
+        context = self.contexts.get(key)
+        if context is None:
+            import ssl
+            context = ssl.create_default_context(cafile = self.cafile, capath = self.capath)
+            if not self.verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            if self.certfile is not None:
+                context.load_cert_chain(self.certfile, self.keyfile)
+            with self.lock:
+                context = self.contexts.setdefault(key, context)
+        return context
+
+
+    # TLS handshake
+    def wrap(self, sock, host, port, **kwargs):
+
+        """Wraps a connected socket, offering the last session of the endpoint"""
+
+        key = (host, port)
+        session = self.sessions.get(key)
+        tls = self.context(host, port).wrap_socket(sock, server_hostname = host, session = session, **kwargs)
+        resumed = tls.session_reused
+        with self.lock:
+            self.handshakes += 1
+            if resumed:
+                self.resumed += 1
+        if tls.session is not None:
+            self.sessions[key] = tls.session
+        if self.metrics is not None:
+            self.metrics.inc("sepy_tls_handshakes_total", resumed = str(bool(resumed)).lower())
+        return tls
+
+
+    # context for websocket-client
+    def websocketContext(self, uri):
+
+        """Returns the sslopt context of a wss URI, resuming the TLS sessions of the endpoint"""
+
+        parts = urlsplit(uri)
+        return ResumingContext(self, parts.hostname, parts.port or 443)
+
+
+    # open a connection
+    def connect(self, host, port, timeout = None):
+
+        """Returns an HTTPConnection over a new TLS connection to an endpoint"""
+
+        import socket
+        import http.client
+        if timeout is None:
+            timeout = self.timeout
+        connection = http.client.HTTPConnection(host, port, timeout = timeout)
+        sock = socket.create_connection((host, port), timeout)
+        # as HTTPConnection.connect: no Nagle delay between a request and the next one
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection.sock = self.wrap(sock, host, port)
+        return connection
+
+
+    # HTTPS request
+    def post(self, uri, data, headers, timeout = None, onHeaders = None):
+
+        """
+        Sends a POST request over a kept-alive connection
+
+        Parameters
+        ----------
+        uri : str
+            The https URI of the request
+        data : bytes or str
+            The body of the request
+        headers : dict
+            The headers of the request
+        timeout : float
+            The timeout of the connection and of every read in seconds (default = None, the timeout of the transport)
+        onHeaders : callable
+            Called with the status code when the headers of the response are received (default = None)
+
+        Returns
+        -------
+        status : int
+            The status code of the response
+        text : str
+            The body of the response
+
+        """
+
+        import http.client
+        parts = urlsplit(uri)
+        key = (parts.hostname, parts.port or 443)
+        path = parts.path + ("?" + parts.query if parts.query else "")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        for attempt in range(2):
+
+            # a kept-alive connection, or a new one
+            with self.lock:
+                idle = self.idle.get(key)
+                connection = idle.pop() if idle else None
+            reused = connection is not None
+            if connection is None:
+                connection = self.connect(key[0], key[1], timeout)
+            else:
+                connection.sock.settimeout(self.timeout if timeout is None else timeout)
+
+            # a kept-alive connection may have been closed by the broker
+            try:
+                connection.request("POST", path, body = data, headers = headers)
+                response = connection.getresponse()
+                if onHeaders is not None:
+                    onHeaders(response.status)
+                text = response.read().decode("utf-8")
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.BadStatusLine):
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            break
+
+        # keep the connection and its session (TLS 1.3 tickets arrive after the handshake)
+        with self.lock:
+            self.requests += 1
+            if reused:
+                self.reused += 1
+            if connection.sock is not None and connection.sock.session is not None:
+                self.sessions[key] = connection.sock.session
+            idle = self.idle.setdefault(key, deque())
+            if self.keepAlive and not response.will_close and connection.sock is not None and len(idle) < self.maxConnections:
+                idle.append(connection)
+                connection = None
+        if connection is not None:
+            connection.close()
+        return response.status, text
+
+
+    # close
+    def close(self):
+
+        """Closes the idle connections (the contexts and sessions are kept)"""
+
+        with self.lock:
+            connections = [connection for idle in self.idle.values() for connection in idle]
+            self.idle.clear()
+        for connection in connections:
+            connection.close()
@@ -0,0 +1,427 @@
+#!/usr/bin/python3
+
+# global requirements
+from multiprocessing import shared_memory
+from threading import Lock
+import tempfile
+import logging
+import struct
+import json
+import time
+import os
+
+# local requirements
+from .Exceptions import *
+
+# layout of the shared memory segment
+MAGIC = b"SEPY"
+HEADER = struct.Struct("<4sIQq")       # magic, max readers, capacity, publisher pid
+POSITIONS = struct.Struct("<QQ")       # committed head, reserved head
+SLOT = struct.Struct("<Qq")            # reader cursor, reader pid (0 = free)
+LENGTH = struct.Struct("<I")
+WRAP = 0xFFFFFFFF
+POSITIONS_OFFSET = HEADER.size
+SLOTS_OFFSET = POSITIONS_OFFSET + POSITIONS.size
+
+
+def dataOffset(maxReaders):
+
+    """Returns the offset of the ring buffer inside the segment (64 bytes aligned)"""
+
+    end = SLOTS_OFFSET + maxReaders * SLOT.size
+    return (end + 63) // 64 * 64
+
+
+def lockPath(name):
+
+    """Returns the path of the file serializing the claims of the reader slots of a segment"""
+
+    return os.path.join(tempfile.gettempdir(), "sepy-%s.lock" % name.lstrip("/"))
+
+
+def processAlive(pid):
+
+    """Returns False if the process of a reader slot has exited without releasing it"""
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class NotificationPublisher:
+
+    """
+    A handler class that publishes the notifications of a subscription into
+    a shared memory ring buffer, so that other local processes can read them
+    through a NotificationReader without opening their own subscription.
+    The publisher never blocks: readers that fall behind by more than the
+    buffer capacity lose messages and are reported as slow readers.
+
+    Parameters
+    ----------
+    name : str
+        The name of the shared memory segment (default = None, a random name is chosen)
+    capacity : int
+        The size in bytes of the ring buffer (default = 16 MiB)
+    maxReaders : int
+        The maximum number of readers attached at the same time (default = 16)
+
+    Attributes
+    ----------
+    name : str
+        The name of the shared memory segment, to be passed to the readers
+    published : int
+        The number of published notifications
+
+    """
+
+    # constructor
+    def __init__(self, name = None, capacity = 16 * 1024 * 1024, maxReaders = 16):
+
+        """Constructor of the NotificationPublisher class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== NotificationPublisher::__init__ invoked ===")
+
+        # create and initialize the segment
+        self.capacity = capacity
+        self.maxReaders = maxReaders
+        self.offset = dataOffset(maxReaders)
+        self.shm = shared_memory.SharedMemory(name = name, create = True, size = self.offset + capacity)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        HEADER.pack_into(self.buf, 0, MAGIC, maxReaders, capacity, os.getpid())
+        POSITIONS.pack_into(self.buf, POSITIONS_OFFSET, 0, 0)
+        for slot in range(maxReaders):
+            SLOT.pack_into(self.buf, SLOTS_OFFSET + slot * SLOT.size, 0, 0)
+        self.head = 0
+        self.published = 0
+
+        # handle and handleError may be called by several threads
+        self.lock = Lock()
+
+
+    # handle notifications
+    def handle(self, added, removed):
+
+        """Publishes a notification into the ring buffer"""
+
+        self.publish(json.dumps({"addedResults": added, "removedResults": removed}, separators = (",", ":")).encode("utf-8"))
+
+
+    # handle errors
+    def handleError(self, error):
+
+        """Publishes an error into the ring buffer"""
+
+        self.publish(json.dumps({"error": str(error)}, separators = (",", ":")).encode("utf-8"))
+
+
+    # write a record
+    def publish(self, payload):
+
+        """
+        Appends a raw record to the ring buffer
+
+        Parameters
+        ----------
+        payload : bytes
+            The content of the record
+
+        """
+
+        # check the size
+        size = LENGTH.size + len(payload)
+        if size > self.capacity:
+            raise ValueError("Record larger than the ring buffer capacity")
+
+        with self.lock:
+
+            # skip the tail of the buffer if the record does not fit
+            head = self.head
+            pos = head % self.capacity
+            if pos + size > self.capacity:
+                if self.capacity - pos >= LENGTH.size:
+                    POSITIONS.pack_into(self.buf, POSITIONS_OFFSET, head, head + self.capacity - pos)
+                    LENGTH.pack_into(self.buf, self.offset + pos, WRAP)
+                head += self.capacity - pos
+                pos = 0
+
+            # reserve the space, write the record and commit it
+            POSITIONS.pack_into(self.buf, POSITIONS_OFFSET, self.head, head + size)
+            start = self.offset + pos
+            self.buf[start + LENGTH.size:start + size] = payload
+            LENGTH.pack_into(self.buf, start, len(payload))
+            self.head = head + size
+            POSITIONS.pack_into(self.buf, POSITIONS_OFFSET, self.head, self.head)
+            self.published += 1
+
+
+    # slow readers detection
+    def slowReaders(self, threshold = 0.5):
+
+        """
+        Returns the readers lagging behind by more than a fraction of the capacity
+        (the slots of the exited readers are skipped)
+
+        Parameters
+        ----------
+        threshold : float
+            The fraction of the capacity over which a reader is considered slow (default = 0.5)
+
+        Returns
+        -------
+        list
+            A list of tuples (slot, pid, lag in bytes)
+
+        """
+
+        slow = []
+        for slot in range(self.maxReaders):
+            cursor, pid = SLOT.unpack_from(self.buf, SLOTS_OFFSET + slot * SLOT.size)
+            if pid != 0 and self.head - cursor > threshold * self.capacity and processAlive(pid):
+                slow.append((slot, pid, self.head - cursor))
+        return slow
+
+
+    # close
+    def close(self, unlink = True):
+
+        """Releases the shared memory segment, destroying it if unlink is True"""
+
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+            try:
+                os.remove(lockPath(self.name))
+            except FileNotFoundError:
+                pass
+
+
+class NotificationReader:
+
+    """
+    A class to read the notifications published by a NotificationPublisher
+    in another local process. Every reader has its own cursor, stored in a
+    slot of the segment so that the publisher can detect slow readers.
+
+    Parameters
+    ----------
+    name : str
+        The name of the shared memory segment
+    slot : int
+        The reader slot to use, assigned by the caller (default = None, the
+        first free slot is taken while holding a file lock, so that readers
+        attaching at the same time get different slots)
+    raiseOnOverrun : bool
+        If True a SlowReaderException is raised when messages are lost,
+        otherwise the reader resumes from the next published message (default = False)
+
+    Attributes
+    ----------
+    lost : int
+        The number of times the reader has been overrun by the publisher
+    lostBytes : int
+        The amount of data lost because of the overruns
+
+    """
+
+    # constructor
+    def __init__(self, name, slot = None, raiseOnOverrun = False):
+
+        """Constructor of the NotificationReader class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== NotificationReader::__init__ invoked ===")
+
+        # attach to the segment
+        self.shm = shared_memory.SharedMemory(name = name)
+        self.buf = self.shm.buf
+        magic, self.maxReaders, self.capacity, owner = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a notification ring buffer")
+        if owner != os.getpid():
+            # the segment is owned by the publisher, it must survive this process
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.offset = dataOffset(self.maxReaders)
+        self.raiseOnOverrun = raiseOnOverrun
+        self.lost = 0
+        self.lostBytes = 0
+        self.pending = None
+
+        # take a slot, starting from the newest message
+        if slot is None:
+            import fcntl
+            with open(lockPath(name), "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self.claim(self.freeSlot())
+        else:
+            self.claim(slot)
+
+
+    # slots
+    def freeSlot(self):
+
+        """Returns the first free reader slot, or the first one of an exited reader"""
+
+        for slot in range(self.maxReaders):
+            pid = SLOT.unpack_from(self.buf, SLOTS_OFFSET + slot * SLOT.size)[1]
+            if pid == 0 or not processAlive(pid):
+                return slot
+        raise SlowReaderException("No free reader slot")
+
+    def claim(self, slot):
+
+        """Takes a reader slot, from the newest message"""
+
+        self.slot = slot
+        self.slotOffset = SLOTS_OFFSET + slot * SLOT.size
+        self.cursor = POSITIONS.unpack_from(self.buf, POSITIONS_OFFSET)[0]
+        SLOT.pack_into(self.buf, self.slotOffset, self.cursor, os.getpid())
+
+
+    # handle overruns
+    def overrun(self, head):
+
+        """Skips the lost messages after an overrun"""
+
+        self.lost += 1
+        self.lostBytes += head - self.cursor
+        self.cursor = head
+        SLOT.pack_into(self.buf, self.slotOffset, self.cursor, os.getpid())
+        self.logger.warning("Reader {} overrun, {} bytes lost".format(self.slot, self.lostBytes))
+        if self.raiseOnOverrun:
+            raise SlowReaderException("Reader overrun by the publisher")
+
+
+    # zero-copy read
+    def readView(self):
+
+        """
+        Returns a memoryview on the next record without copying it, or None
+        if no record is available. The view must be released by calling
+        commit before reading the next record.
+
+        Returns
+        -------
+        memoryview
+            The content of the record
+
+        """
+
+        while True:
+
+            # check for new records
+            head, reserved = POSITIONS.unpack_from(self.buf, POSITIONS_OFFSET)
+            if self.cursor == head:
+                return None
+            if reserved - self.cursor > self.capacity:
+                self.overrun(head)
+                continue
+
+            # skip the tail of the buffer
+            pos = self.cursor % self.capacity
+            if self.capacity - pos < LENGTH.size:
+                self.cursor += self.capacity - pos
+                continue
+            length = LENGTH.unpack_from(self.buf, self.offset + pos)[0]
+            if length == WRAP:
+                self.cursor += self.capacity - pos
+                continue
+            if pos + LENGTH.size + length > self.capacity:
+                # the length has been overwritten in the meanwhile
+                self.overrun(head)
+                continue
+
+            # return the view
+            start = self.offset + pos + LENGTH.size
+            self.pending = self.cursor + LENGTH.size + length
+            return self.buf[start:start + length]
+
+
+    # release the last view
+    def commit(self):
+
+        """
+        Advances the cursor past the record returned by readView
+
+        Returns
+        -------
+        bool
+            False if the record was overwritten while it was being read
+
+        """
+
+        # check that the record has not been overwritten
+        reserved = POSITIONS.unpack_from(self.buf, POSITIONS_OFFSET + 8)[0]
+        if reserved - self.cursor > self.capacity:
+            self.pending = None
+            self.overrun(POSITIONS.unpack_from(self.buf, POSITIONS_OFFSET)[0])
+            return False
+
+        # advance
+        self.cursor = self.pending
+        self.pending = None
+        SLOT.pack_into(self.buf, self.slotOffset, self.cursor, os.getpid())
+        return True
+
+
+    # decoded read
+    def read(self, timeout = 0):
+
+        """
+        Returns the next decoded notification, or None if nothing arrives
+        within the timeout (in seconds)
+
+        Returns
+        -------
+        dict
+            A dictionary with addedResults and removedResults (or error)
+
+        """
+
+        deadline = time.monotonic() + timeout
+        while True:
+            view = self.readView()
+            if view is not None:
+                data = bytes(view)
+                view.release()
+                if self.commit():
+                    return json.loads(data)
+            elif time.monotonic() >= deadline:
+                return None
+            else:
+                time.sleep(0.001)
+
+
+    # dispatch to a handler
+    def run(self, handler, timeout = 0.1):
+
+        """Reads notifications forever, passing them to the handle/handleError methods of handler"""
+
+        while self.buf is not None:
+            notification = self.read(timeout)
+            if notification is None:
+                continue
+            if "error" in notification:
+                handler.handleError(notification["error"])
+            else:
+                handler.handle(notification["addedResults"], notification["removedResults"])
+
+
+    # close
+    def close(self):
+
+        """Frees the reader slot and detaches from the segment"""
+
+        SLOT.pack_into(self.buf, self.slotOffset, 0, 0)
+        self.buf = None
+        self.shm.close()
@@ -0,0 +1,268 @@
+#!/usr/bin/python3
+
+# global requirements
+from threading import RLock
+import logging
+import json
+import re
+
+# regular expressions used to normalize the SPARQL text
+PREFIX_REGEX = re.compile(r'PREFIX\s+([\w\-\.]*):\s*<([^>]*)>\s*', re.IGNORECASE)
+LITERAL_REGEX = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')')
+SPACES_REGEX = re.compile(r'\s+')
+
+
+def normalizeSparql(sparql):
+
+    """
+    Returns a canonical form of a rendered SPARQL query, used to detect
+    identical subscriptions. Prefix declarations are deduplicated and
+    sorted, while whitespace outside string literals is collapsed.
+
+    Parameters
+    ----------
+    sparql : str
+        The rendered SPARQL query (prefixes included)
+
+    Returns
+    -------
+    str
+        The normalized SPARQL query
+
+    """
+
+    # collect and remove prefix declarations
+    prefixes = sorted(set(PREFIX_REGEX.findall(sparql)))
+    body = PREFIX_REGEX.sub(" ", sparql)
+
+    # collapse whitespace, leaving string literals untouched
+    chunks = LITERAL_REGEX.split(body)
+    for i in range(0, len(chunks), 2):
+        chunks[i] = SPACES_REGEX.sub(" ", chunks[i])
+    body = "".join(chunks).strip()
+
+    # return
+    prologue = " ".join("PREFIX %s: <%s>" % (ns, iri) for ns, iri in prefixes)
+    return (prologue + " " + body).strip()
+
+
+class SharedSubscription:
+
+    """
+    A handler class that multiplexes a single server-side subscription
+    towards several local handlers, keeping track of the current result set
+    so that late joiners can receive it.
+
+    Parameters
+    ----------
+    key : tuple
+        The key (subscribe URI, normalized SPARQL) identifying the subscription
+    secure : bool
+        A boolean that states if the subscription is secure (default = False)
+
+    Attributes
+    ----------
+    spuid : str
+        The id of the server-side subscription
+    handlers : dict
+        Dictionary with the local handlers indexed by local subscription id
+    initialized : bool
+        True once the first notification (with the initial results) arrived
+    joining : dict
+        The notifications held back for the handlers waiting for the replay of the current results, indexed by local subscription id
+
+    """
+
+    # constructor
+    def __init__(self, key, secure = False):
+
+        """Constructor of the SharedSubscription class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== SharedSubscription::__init__ invoked ===")
+
+        # initialize data structures
+        self.key = key
+        self.secure = secure
+        self.spuid = None
+        self.handlers = {}
+        self.initialized = False
+        self.joining = {}
+        self.lock = RLock()
+
+        # current result set
+        self.head = {"vars": []}
+        self.results = {}
+
+
+    @property
+    def pending(self):
+
+        """The number of notifications queued by the local handlers (None if they don't queue)"""
+
+        depths = [handler.pending for handler in list(self.handlers.values()) if hasattr(handler, "pending")]
+        return sum(depths) if depths else None
+
+
+    # current results
+    def snapshot(self):
+
+        """Returns the current results, in the form of the added results of a notification (None before the first notification)"""
+
+        with self.lock:
+            if not self.initialized:
+                return None
+            bindings = []
+            for binding, count in self.results.values():
+                bindings.extend([binding] * count)
+            return {"head": self.head, "results": {"bindings": bindings}}
+
+
+    # register a new local handler
+    def addHandler(self, localId, handler, deferred = False):
+
+        """
+        Registers a local handler. If the initial results have already
+        been received, they are replayed to the new handler: the
+        notifications received meanwhile are held back and delivered
+        after them. The handlers are always called without the lock held,
+        so that they can subscribe and unsubscribe.
+
+        Parameters
+        ----------
+        localId : str
+            The local subscription id
+        handler : Handler
+            A class to handle notifications (it can be None)
+        deferred : bool
+            True to leave the replay to a later call of replay, e.g. once the caller released its own locks (default = False)
+
+        """
+
+        # debug print
+        self.logger.debug("=== SharedSubscription::addHandler invoked ===")
+
+        with self.lock:
+            self.handlers[localId] = handler
+            if self.initialized and handler is not None:
+                self.joining[localId] = []
+        if not deferred:
+            self.replay(localId)
+
+
+    # replay the current results to a new local handler
+    def replay(self, localId):
+
+        """Replays the current results to a handler registered by addHandler, then the notifications held back (to be called without locks held)"""
+
+        with self.lock:
+            if localId not in self.joining:
+                return
+            handler = self.handlers.get(localId)
+            added = self.snapshot()
+            self.joining[localId] = []
+        handler.handle(added, {"head": added["head"], "results": {"bindings": []}})
+
+        # deliver the notifications received meanwhile, until there are none
+        while True:
+            with self.lock:
+                backlog = self.joining.get(localId)
+                if not backlog:
+                    self.joining.pop(localId, None)
+                    return
+                self.joining[localId] = []
+            for method, args in backlog:
+                getattr(handler, method)(*args)
+
+
+    # unregister a local handler
+    def removeHandler(self, localId, retract = False):
+
+        """
+        Unregisters a local handler and returns the number of handlers
+        still attached to the subscription.
+
+        Parameters
+        ----------
+        localId : str
+            The local subscription id
+        retract : bool
+            True to notify the handler of the removal of the current results, e.g. before moving it to another subscription (default = False)
+
+        Returns
+        -------
+        int
+            The number of remaining local handlers
+
+        """
+
+        # debug print
+        self.logger.debug("=== SharedSubscription::removeHandler invoked ===")
+
+        with self.lock:
+            handler = self.handlers.pop(localId, None)
+            self.joining.pop(localId, None)
+            remaining = len(self.handlers)
+            current = self.snapshot() if retract and handler is not None else None
+        if current is not None:
+            handler.handle({"head": current["head"], "results": {"bindings": []}}, current)
+        return remaining
+
+
+    # select the handlers of a notification
+    def targets(self, method, args):
+
+        """Returns the handlers of a notification, holding it back for the handlers waiting for their replay (with the lock held)"""
+
+        targets = []
+        for localId, handler in self.handlers.items():
+            if handler is None or not hasattr(handler, method):
+                continue
+            if localId in self.joining:
+                self.joining[localId].append((method, args))
+            else:
+                targets.append(handler)
+        return targets
+
+
+    # handle notifications
+    def handle(self, added, removed):
+
+        """Updates the current result set and forwards the notification to all the local handlers"""
+
+        with self.lock:
+
+            # update the result set
+            if added:
+                self.head = added.get("head", self.head)
+                for binding in added.get("results", {}).get("bindings", []):
+                    frozen = json.dumps(binding, sort_keys = True)
+                    count = self.results.get(frozen, (binding, 0))[1]
+                    self.results[frozen] = (binding, count + 1)
+            if removed:
+                for binding in removed.get("results", {}).get("bindings", []):
+                    frozen = json.dumps(binding, sort_keys = True)
+                    if frozen in self.results:
+                        binding, count = self.results[frozen]
+                        if count > 1:
+                            self.results[frozen] = (binding, count - 1)
+                        else:
+                            del self.results[frozen]
+            self.initialized = True
+            targets = self.targets("handle", (added, removed))
+
+        # fan out
+        for handler in targets:
+            handler.handle(added, removed)
+
+
+    # handle errors
+    def handleError(self, error):
+
+        """Forwards an error to all the local handlers"""
+
+        with self.lock:
+            targets = self.targets("handleError", (error,))
+        for handler in targets:
+            handler.handleError(error)
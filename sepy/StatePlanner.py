@@ -0,0 +1,352 @@
+#!/usr/bin/python3
+
+# global requirements
+import logging
+import json
+import re
+
+# local requirements
+from .Exceptions import *
+from .Deadline import *
+from .QueryPager import PROLOGUE_REGEX
+
+# terms and punctuation of a graph pattern
+TOKEN_REGEX = re.compile(r'''\s*(<[^>]*>|[?$]\w+|"(?:[^"\\]|\\.)*"(?:@[\w\-]+|\^\^(?:<[^>]*>|[\w\-]*:[\w\-]*))?|'(?:[^'\\]|\\.)*'(?:@[\w\-]+|\^\^(?:<[^>]*>|[\w\-]*:[\w\-]*))?|[\w\-]*:(?:[\w\-.]*[\w\-])?|[+\-]?\d+(?:\.\d+)?(?:[eE][+\-]?\d+)?|[;,.{}()\[\]]|\w+|\S)''')
+
+# start of the WHERE clause of a query and of the INSERT template of an update
+WHERE_REGEX = re.compile(r'\bWHERE\s*\{|^\s*SELECT\b[^{]*\{', re.IGNORECASE)
+INSERT_REGEX = re.compile(r'\bINSERT\s*\{', re.IGNORECASE)
+
+# the datatype of plain literals
+XSD_STRING = "http://www.w3.org/2001/XMLSchema#string"
+RDF_TYPE = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+
+
+def rdfTerm(term):
+
+    """Returns a term of a SPARQL JSON binding in SPARQL syntax, plain literals without datatype"""
+
+    if term["type"] == "uri":
+        return "<%s>" % term["value"]
+    if term["type"] == "bnode":
+        raise PlanningException("Blank nodes cannot be compared across requests")
+    literal = json.dumps(term["value"], ensure_ascii = False)
+    if "xml:lang" in term:
+        return "%s@%s" % (literal, term["xml:lang"].lower())
+    if term.get("datatype", XSD_STRING) != XSD_STRING:
+        return "%s^^<%s>" % (literal, term["datatype"])
+    return literal
+
+
+def block(sparql, regex):
+
+    """Returns the text between the braces opened by the first match of regex"""
+
+    match = regex.search(sparql)
+    if match is None:
+        raise PlanningException("No graph pattern found in: {}".format(sparql[:80]))
+    depth = 1
+    for i in range(match.end(), len(sparql)):
+        if sparql[i] == "{":
+            depth += 1
+        elif sparql[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return sparql[match.end():i]
+    raise PlanningException("Unbalanced braces in: {}".format(sparql[:80]))
+
+
+def parsePattern(pattern):
+
+    """
+    Returns the triple patterns of a basic graph pattern
+
+    Parameters
+    ----------
+    pattern : str
+        The triples, with the ; and , abbreviations
+
+    Returns
+    -------
+    list
+        A list of (subject, predicate, object) tuples of SPARQL terms and variables
+
+    """
+
+    tokens = [token for token in TOKEN_REGEX.findall(pattern) if token]
+    triples = []
+    subject = predicate = None
+    expected = "subject"
+    previous = None
+    for token in tokens:
+        if token in "{}()[]" or (token[0].isalpha() and ":" not in token and token != "a"):
+            raise PlanningException("Only basic graph patterns can be planned, found {}".format(token))
+        complete = expected in ("subject", "separator") or previous == ";"
+        if token == ".":
+            if not complete:
+                raise PlanningException("Unexpected . in: {}".format(pattern))
+            expected = "subject"
+        elif token == ";":
+            if expected != "separator" and previous != ";":
+                raise PlanningException("Unexpected ; in: {}".format(pattern))
+            expected = "predicate"
+        elif token == ",":
+            if expected != "separator":
+                raise PlanningException("Unexpected , in: {}".format(pattern))
+            expected = "object"
+        elif expected == "subject":
+            subject = token
+            expected = "predicate"
+        elif expected == "predicate":
+            predicate = RDF_TYPE if token == "a" else token
+            expected = "object"
+        elif expected == "object":
+            triples.append((subject, predicate, token))
+            expected = "separator"
+        else:
+            raise PlanningException("Missing separator before {} in: {}".format(token, pattern))
+        previous = token
+    if not (expected in ("subject", "separator") or previous == ";"):
+        raise PlanningException("Incomplete triple in: {}".format(pattern))
+    return triples
+
+
+class StatePlanner:
+
+    """
+    Synchronizes a part of the knowledge base with a desired state,
+    sending only the triples that changed. The triples are generated
+    from bindings with a template: the INSERT template of updateName or,
+    without it, the WHERE clause of queryName (a basic graph pattern).
+    The desired bindings are compared to the current ones (the results
+    of queryName, or the state known after the last apply) and the
+    difference is sent as DELETE DATA and INSERT DATA operations of at
+    most batchSize triples per request.
+
+    Triples shared by several bindings (e.g. the type of an observation)
+    are kept as long as one binding needs them. Bindings are in the
+    SPARQL JSON format, as the results of SEPAClient.query, and must
+    bind all the variables of the template; blank nodes are not
+    supported.
+
+    Parameters
+    ----------
+    client : SEPAClient
+        The client used to query the current state and send the updates
+    queryName : str
+        The friendly name of the SPARQL Query returning the current state
+    updateName : str
+        The friendly name of the SPARQL Update whose INSERT template generates the triples (default = None, the query pattern)
+    forcedBindings : dict
+        The dictionary containing the bindings to fill the templates (default = {})
+    batchSize : int
+        The maximum number of triples per request (default = 1000)
+    secure : bool
+        A boolean that states if the requests must be secure or not (default = False)
+
+    Attributes
+    ----------
+    template : list
+        The (subject, predicate, object) patterns generating the triples
+    state : set
+        The triples known to be in the knowledge base after the last apply (None before)
+    deleted : int
+        The number of triples deleted
+    inserted : int
+        The number of triples inserted
+    unchanged : int
+        The number of desired triples that were already there
+    requests : int
+        The number of update requests sent
+
+    """
+
+    # constructor
+    def __init__(self, client, queryName, updateName = None, forcedBindings = {}, batchSize = 1000, secure = False):
+
+        """Constructor of the StatePlanner class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== StatePlanner::__init__ invoked ===")
+
+        # configuration
+        self.client = client
+        self.queryName = queryName
+        self.updateName = updateName
+        self.forcedBindings = forcedBindings
+        self.batchSize = batchSize
+        self.secure = secure
+
+        # template
+        self.parseTemplate(client.configuration)
+
+        # state
+        self.state = None
+        listeners = getattr(client, "reloadListeners", None)
+        if listeners is not None:
+            listeners.append(self.onReload)
+
+        # counters
+        self.deleted = 0
+        self.inserted = 0
+        self.unchanged = 0
+        self.requests = 0
+
+
+    # parse the template
+    def parseTemplate(self, configuration):
+
+        """Reads the triple patterns of the template from a configuration"""
+
+        if self.updateName is None:
+            sparql = configuration.getQuery(self.queryName, self.forcedBindings)
+            self.template = parsePattern(block(sparql[len(PROLOGUE_REGEX.match(sparql).group(0)):], WHERE_REGEX))
+        else:
+            self.template = parsePattern(block(configuration.getUpdate(self.updateName, self.forcedBindings), INSERT_REGEX))
+        self.variables = sorted(set(term[1:] for triple in self.template for term in triple if term[0] in "?$"))
+
+
+    # configuration reloaded
+    def onReload(self, previous, configuration, changed):
+
+        """Reads the template again if a reload of the configuration changed it, forgetting the state (see SEPAClient.reloadConfiguration)"""
+
+        if self.queryName in changed["queries"] or self.updateName in changed["updates"]:
+            self.parseTemplate(configuration)
+            self.state = None
+
+
+    # generate the triples
+    def triples(self, bindingsList):
+
+        """Returns the set of the triples generated by the template for all the bindings"""
+
+        triples = set()
+        template = self.template
+        for binding in bindingsList:
+            try:
+                terms = {variable: rdfTerm(binding[variable]) for variable in self.variables}
+            except KeyError as e:
+                raise PlanningException("The binding {} misses the variable {}".format(binding, e))
+            for triple in template:
+                triples.add(tuple(terms[term[1:]] if term[0] in "?$" else term for term in triple))
+        return triples
+
+
+    # read the current state
+    def refresh(self):
+
+        """Reads the current state from the results of the query, returns its triples"""
+
+        status, results = self.client.query(self.queryName, self.forcedBindings, self.secure)
+        if not status:
+            raise QueryFailedException("Query {} failed: {}".format(self.queryName, results))
+        self.state = self.triples(results["results"]["bindings"])
+        return self.state
+
+
+    # current triples
+    def current(self, current):
+
+        """Returns the triples of the current bindings, of the state after the last apply or of the results of the query"""
+
+        if current is not None:
+            return self.triples(current)
+        if self.state is not None:
+            return self.state
+        return self.refresh()
+
+
+    # plan
+    def plan(self, desired, current = None):
+
+        """
+        Computes the triples to delete and insert to reach the desired state
+
+        Parameters
+        ----------
+        desired : list
+            The desired bindings
+        current : list
+            The current bindings (default = None, the state after the last apply or the results of the query)
+
+        Returns
+        -------
+        deletes : set
+            The triples to delete, as (subject, predicate, object) tuples
+        inserts : set
+            The triples to insert
+
+        """
+
+        currentTriples = self.current(current)
+        desiredTriples = self.triples(desired)
+        return currentTriples - desiredTriples, desiredTriples - currentTriples
+
+
+    # render the requests
+    def render(self, deletes, inserts):
+
+        """Returns the SPARQL updates of a plan, deletions first, with at most batchSize triples each"""
+
+        operations = [("DELETE", triple) for triple in sorted(deletes)] + [("INSERT", triple) for triple in sorted(inserts)]
+        prefixes = self.client.configuration.nsSparql
+        requests = []
+        for start in range(0, len(operations), self.batchSize):
+            batch = operations[start:start + self.batchSize]
+            parts = []
+            for kind in ("DELETE", "INSERT"):
+                triples = [" ".join(triple) for operation, triple in batch if operation == kind]
+                if triples:
+                    parts.append("%s DATA { %s }" % (kind, " . ".join(triples)))
+            requests.append(prefixes + " ; ".join(parts))
+        return requests
+
+
+    # synchronize
+    def apply(self, desired, current = None):
+
+        """
+        Sends the minimal updates to reach the desired state
+
+        Parameters
+        ----------
+        desired : list
+            The desired bindings
+        current : list
+            The current bindings (default = None, the state after the last apply or the results of the query)
+
+        Returns
+        -------
+        status : bool
+            True or False, depending on the success/failure of the requests (the first failure stops them)
+        results : dict
+            The number of triples deleted, inserted and unchanged and of requests sent, or the error of the failed request
+
+        """
+
+        # debug print
+        self.logger.debug("=== StatePlanner::apply invoked ===")
+
+        # plan
+        desiredTriples = self.triples(desired)
+        currentTriples = self.current(current)
+        deletes = currentTriples - desiredTriples
+        inserts = desiredTriples - currentTriples
+
+        # send
+        name = self.updateName or self.queryName
+        requests = self.render(deletes, inserts)
+        for sparqlUpdate in requests:
+            status, results = self.client.sendUpdate(name, sparqlUpdate, self.secure, None, makeDeadline(None, self.client.timeout))
+            self.requests += 1
+            if not status:
+                # the state is unknown until the next refresh
+                self.state = None
+                return False, results
+        self.state = desiredTriples
+        self.deleted += len(deletes)
+        self.inserted += len(inserts)
+        self.unchanged += len(desiredTriples) - len(inserts)
+        return True, {"deleted": len(deletes), "inserted": len(inserts), "unchanged": len(desiredTriples) - len(inserts), "requests": len(requests)}
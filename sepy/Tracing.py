@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+# global requirements
+from collections import deque
+from threading import Lock
+import logging
+
+# phases reported to the tracers
+PHASES = ("render", "token", "send", "firstByte", "decode", "dispatch")
+
+
+class Tracer:
+
+    """
+    Base class of the request lifecycle hooks. Assign a tracer to a
+    SEPAClient (tracer parameter) to be called at the end of every phase:
+
+    - render: template resolution in ConfigurationObject.getSparql
+      (context: name, isQuery, bindings)
+    - token: client registration or token request (context: uri)
+    - send: HTTP request, from the call to the complete response (context: uri, name, bytes)
+    - firstByte: HTTP request, from the call to the response headers (context: uri, name, status)
+    - decode: JSON decode of query results or notifications (context: name or spuid, bytes)
+    - dispatch: notification handler call (context: spuid, alias)
+
+    Tracers are disabled by default: when no tracer is set, the context
+    dictionaries are not even built.
+
+    """
+
+    def onPhase(self, phase, start, duration, context):
+
+        """
+        Called at the end of every phase
+
+        Parameters
+        ----------
+        phase : str
+            The name of the phase
+        start : float
+            The start of the phase, as returned by time.perf_counter
+        duration : float
+            The duration of the phase in seconds
+        context : dict
+            Information about the request or notification
+
+        """
+
+        pass
+
+
+class RecordingTracer(Tracer):
+
+    """
+    A tracer keeping the most recent phases in memory, useful to find the
+    sources of tail latency
+
+    Parameters
+    ----------
+    maxSpans : int
+        The number of phases kept (default = 10000)
+
+    """
+
+    def __init__(self, maxSpans = 10000):
+        self.spans = deque(maxlen = maxSpans)
+        self.lock = Lock()
+
+    def onPhase(self, phase, start, duration, context):
+        with self.lock:
+            self.spans.append((phase, start, duration, context))
+
+    def slowest(self, count = 10, phase = None):
+
+        """Returns the slowest recorded phases (optionally only of the given kind)"""
+
+        with self.lock:
+            spans = [span for span in self.spans if phase is None or span[0] == phase]
+        return sorted(spans, key = lambda span: span[2], reverse = True)[:count]
+
+
+class LoggingTracer(Tracer):
+
+    """
+    A tracer logging the phases slower than a threshold
+
+    Parameters
+    ----------
+    threshold : float
+        The minimum duration in seconds of the logged phases (default = 0.1)
+
+    """
+
+    def __init__(self, threshold = 0.1):
+        self.logger = logging.getLogger("sepaLogger")
+        self.threshold = threshold
+
+    def onPhase(self, phase, start, duration, context):
+        if duration >= self.threshold:
+            self.logger.warning("Slow {} phase ({:.3f} s): {}".format(phase, duration, context))
@@ -0,0 +1,537 @@
+#!/usr/bin/python3
+
+# global requirements
+from threading import Thread, Condition
+import logging
+import struct
+import time
+import zlib
+import os
+
+# local requirements
+from .Exceptions import *
+from .Deadline import *
+
+# header of the entries: payload length and crc32
+ENTRY_HEADER = struct.Struct(">II")
+
+# extension of the segment files
+SEGMENT_EXTENSION = ".spool"
+
+
+def scanSegment(path, start = 0):
+
+    """Returns the offset after the last valid entry of a segment and the number of valid entries after start"""
+
+    entries = 0
+    offset = start
+    with open(path, "rb") as stream:
+        stream.seek(start)
+        while True:
+            header = stream.read(ENTRY_HEADER.size)
+            if len(header) < ENTRY_HEADER.size:
+                break
+            length, crc = ENTRY_HEADER.unpack(header)
+            payload = stream.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            offset += ENTRY_HEADER.size + length
+            entries += 1
+    return offset, entries
+
+
+class UpdateSpool:
+
+    """
+    A durable spool of updates, to keep producing while the broker is
+    unreachable. The rendered updates are appended to a log of segment
+    files in directory and sent in order by a background thread, merging
+    consecutive entries into single requests (as SEPAClient.updateMany).
+    The position of the first entry not yet sent is saved after every
+    request, so that the spool survives restarts: an entry is sent at
+    least once.
+
+    The appends are made durable in groups: the log is synced at most
+    every syncInterval seconds and, if durable is True, update returns
+    after the sync of its entry. Requests failing because the broker is
+    unreachable or overloaded (status 429 or 5xx) are retried with an
+    exponential backoff, without skipping entries; requests rejected by
+    the broker are retried entry by entry, with the same backoff, and the
+    entries still rejected after retries attempts are skipped.
+
+    The disk usage is bounded by maxBytes: when it is reached, update
+    waits for the spool to drain (overflow = "block"), discards the new
+    entry (overflow = "drop-newest") or deletes the oldest segment
+    (overflow = "drop-oldest").
+
+    Parameters
+    ----------
+    client : SEPAClient
+        The client used to render and send the updates
+    directory : str
+        The directory of the segment files, created if needed
+    segmentBytes : int
+        The size of a segment file (default = 4 MiB)
+    maxBytes : int
+        The maximum size of the segment files, at least 2 * segmentBytes (default = 256 MiB)
+    overflow : str
+        "block", "drop-newest" or "drop-oldest" (default = "block")
+    durable : bool
+        True if update returns after its entry is synced to disk (default = True)
+    syncInterval : float
+        The maximum delay of the sync of an entry in seconds (default = 0.05)
+    batchEntries : int
+        The maximum number of entries in a request (default = 500)
+    batchBytes : int
+        The maximum size of a request in bytes (default = 262144)
+    retryInterval : float
+        The delay before the first retry in seconds, doubled at every retry (default = 0.5)
+    maxRetryInterval : float
+        The maximum delay between retries in seconds (default = 30)
+    retries : int
+        The number of retries of an entry rejected by the broker (default = 3)
+    secure : bool
+        A boolean that states if the updates must be secure or not (default = False)
+
+    Attributes
+    ----------
+    pending : int
+        The number of entries not yet sent
+    appended : int
+        The number of entries appended
+    dropped : int
+        The number of entries discarded by the overflow policy
+    sent : int
+        The number of entries sent
+    batches : int
+        The number of requests sent
+    rejected : int
+        The number of entries skipped because the broker rejected them
+    retried : int
+        The number of retried requests
+    usage : int
+        The size of the segment files in bytes
+
+    """
+
+    # constructor
+    def __init__(self, client, directory, segmentBytes = 4194304, maxBytes = 268435456, overflow = "block", durable = True,
+                 syncInterval = 0.05, batchEntries = 500, batchBytes = 262144, retryInterval = 0.5, maxRetryInterval = 30.0,
+                 retries = 3, secure = False):
+
+        """Constructor of the UpdateSpool class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== UpdateSpool::__init__ invoked ===")
+
+        # configuration
+        if overflow not in ("block", "drop-newest", "drop-oldest"):
+            raise ValueError("overflow must be block, drop-newest or drop-oldest")
+        if maxBytes < 2 * segmentBytes:
+            raise ValueError("maxBytes must be at least 2 * segmentBytes")
+        self.client = client
+        self.directory = directory
+        self.segmentBytes = segmentBytes
+        self.maxBytes = maxBytes
+        self.overflow = overflow
+        self.durable = durable
+        self.syncInterval = syncInterval
+        self.batchEntries = batchEntries
+        self.batchBytes = batchBytes
+        self.retryInterval = retryInterval
+        self.maxRetryInterval = maxRetryInterval
+        self.retries = retries
+        self.secure = secure
+
+        # state
+        self.condition = Condition()
+        self.running = False
+        self.workers = []
+        self.written = 0
+        self.synced = 0
+        self.inFlight = None
+
+        # counters
+        self.appended = 0
+        self.dropped = 0
+        self.sent = 0
+        self.batches = 0
+        self.rejected = 0
+        self.retried = 0
+
+        # open the log
+        self.recover()
+
+
+    # paths
+    def segmentPath(self, index):
+        return os.path.join(self.directory, "%020d%s" % (index, SEGMENT_EXTENSION))
+
+    def cursorPath(self):
+        return os.path.join(self.directory, "cursor")
+
+
+    # read the log left by a previous run
+    def recover(self):
+
+        """Reads the segments and the cursor, truncating a partially written entry at the end of the log"""
+
+        # debug print
+        self.logger.debug("=== UpdateSpool::recover invoked ===")
+
+        os.makedirs(self.directory, exist_ok = True)
+        indexes = sorted(int(name[:-len(SEGMENT_EXTENSION)]) for name in os.listdir(self.directory) if name.endswith(SEGMENT_EXTENSION))
+        cursor = (indexes[0] if indexes else 0, 0)
+        try:
+            with open(self.cursorPath()) as stream:
+                segment, offset = stream.read().split()
+                cursor = (int(segment), int(offset))
+        except (OSError, ValueError):
+            pass
+
+        # segments: index -> [size, entries not yet sent]
+        self.segments = {}
+        for index in indexes:
+            path = self.segmentPath(index)
+            if index < cursor[0]:
+                os.remove(path)
+                continue
+            start = min(cursor[1], os.path.getsize(path)) if index == cursor[0] else 0
+            valid, entries = scanSegment(path, start)
+            if valid < os.path.getsize(path):
+                self.logger.warning("Truncating the spool segment {} at {} bytes".format(path, valid))
+                os.truncate(path, valid)
+            self.segments[index] = [valid, entries]
+        if cursor[0] not in self.segments:
+            cursor = (min(self.segments), 0) if self.segments else (cursor[0], 0)
+        self.cursor = cursor
+
+        # append to the last segment
+        self.active = max(self.segments) if self.segments else cursor[0]
+        self.segments.setdefault(self.active, [0, 0])
+        self.fd = os.open(self.segmentPath(self.active), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self.syncDirectory()
+        self.usage = sum(size for size, entries in self.segments.values())
+        self.pending = sum(entries for size, entries in self.segments.values())
+
+
+    def syncDirectory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+    # append an update
+    def update(self, updateName, forcedBindings = {}):
+
+        """
+        Renders an update and appends it to the spool
+
+        Returns
+        -------
+        status : bool
+            True if the update was spooled, False if it was discarded by the overflow policy
+        results : str
+            "spooled" or "dropped"
+
+        """
+
+        sparqlUpdate = self.client.configuration.getUpdate(updateName, forcedBindings)
+        return self.append(updateName, sparqlUpdate)
+
+
+    def append(self, updateName, sparqlUpdate):
+
+        """Appends a rendered update to the spool (see update)"""
+
+        payload = (updateName + "\n" + sparqlUpdate).encode("utf-8")
+        entry = ENTRY_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self.condition:
+            if not self.reserve(len(entry)):
+                self.dropped += 1
+                return False, "dropped"
+            os.write(self.fd, entry)
+            segment = self.segments[self.active]
+            segment[0] += len(entry)
+            segment[1] += 1
+            self.usage += len(entry)
+            self.pending += 1
+            self.appended += 1
+            self.written += 1
+            sequence = self.written
+            if segment[0] >= self.segmentBytes:
+                self.rotate()
+            self.condition.notify_all()
+            if self.durable:
+                self.condition.wait_for(lambda: self.synced >= sequence or not self.running)
+        return True, "spooled"
+
+
+    # make room for an entry (called with the lock held)
+    def reserve(self, size):
+        while self.usage + size > self.maxBytes:
+            if self.overflow == "drop-newest":
+                return False
+            if self.overflow == "block":
+                if not self.running:
+                    return False
+                self.condition.wait()
+                continue
+            oldest = min(self.segments)
+            if oldest == self.active:
+                return False
+            self.dropSegment(oldest)
+        return True
+
+
+    # discard a segment (called with the lock held)
+    def dropSegment(self, index):
+        size, entries = self.segments.pop(index)
+        if self.inFlight is not None and self.inFlight[0] == index:
+            entries -= self.inFlight[1]
+        self.usage -= size
+        self.pending -= entries
+        self.dropped += entries
+        os.remove(self.segmentPath(index))
+        if self.cursor[0] == index:
+            self.cursor = (min(self.segments), 0)
+        self.logger.warning("Spool full, {} entries discarded".format(entries))
+
+
+    # start a new segment (called with the lock held)
+    def rotate(self):
+        os.fsync(self.fd)
+        os.close(self.fd)
+        self.synced = self.written
+        self.active += 1
+        self.segments[self.active] = [0, 0]
+        self.fd = os.open(self.segmentPath(self.active), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self.syncDirectory()
+
+
+    # sync the log in groups
+    def syncLoop(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.written > self.synced or not self.running)
+                if not self.running and self.written == self.synced:
+                    return
+            time.sleep(self.syncInterval)
+            with self.condition:
+                if self.written > self.synced:
+                    os.fsync(self.fd)
+                    self.synced = self.written
+                    self.condition.notify_all()
+
+
+    # read the next entries
+    def readBatch(self, segment, offset, end):
+
+        """Returns the (updateName, sparqlUpdate, endOffset) entries of a segment from offset, up to a batch"""
+
+        entries = []
+        size = 0
+        with open(self.segmentPath(segment), "rb") as stream:
+            stream.seek(offset)
+            while offset < end and len(entries) < self.batchEntries and size < self.batchBytes:
+                length, crc = ENTRY_HEADER.unpack(stream.read(ENTRY_HEADER.size))
+                name, _, sparql = stream.read(length).decode("utf-8").partition("\n")
+                offset += ENTRY_HEADER.size + length
+                size += length
+                entries.append((name, sparql, offset))
+        return entries
+
+
+    # group the entries in requests
+    def requests(self, entries):
+
+        """Yields (sparqlUpdate, entries) requests, merging the consecutive entries declaring the prefixes of the configuration"""
+
+        prefixes = self.client.configuration.nsSparql
+        group = []
+        for entry in entries:
+            if entry[1].startswith(prefixes):
+                group.append(entry)
+                continue
+            if group:
+                yield prefixes + " ; ".join(e[1][len(prefixes):] for e in group), group
+                group = []
+            yield entry[1], [entry]
+        if group:
+            yield prefixes + " ; ".join(e[1][len(prefixes):] for e in group), group
+
+
+    # send a request until the broker is reachable
+    def send(self, sparqlUpdate, count):
+
+        """Returns (status, results) of a request, retrying while the broker is unreachable (None when stopped)"""
+
+        delay = self.retryInterval
+        while True:
+            try:
+                return self.client.sendUpdate("spool", sparqlUpdate, self.secure, None, makeDeadline(None, self.client.timeout), raiseUnavailable = True)
+            except Exception as e:
+                self.logger.warning("Spool request of {} entries failed, retrying in {} s: {}".format(count, delay, e))
+            if not self.backoff(delay):
+                return None
+            delay = min(delay * 2, self.maxRetryInterval)
+
+
+    # wait before a retry
+    def backoff(self, delay):
+
+        """Waits delay seconds, returns False if the spool was stopped meanwhile"""
+
+        with self.condition:
+            self.retried += 1
+            return not self.condition.wait_for(lambda: not self.running, delay)
+
+
+    # mark entries as in flight
+    def claim(self, segment, count):
+
+        """Marks the next count entries of segment as in flight, returns False if the segment was discarded"""
+
+        with self.condition:
+            if segment not in self.segments:
+                return False
+            self.inFlight = (segment, count)
+            return True
+
+
+    # mark entries as sent
+    def advance(self, segment, entries, sent):
+        with self.condition:
+            self.inFlight = None
+            self.pending -= len(entries)
+            if sent:
+                self.sent += len(entries)
+            else:
+                self.rejected += len(entries)
+
+            # the segment may have been discarded in the meantime
+            if segment in self.segments:
+                self.segments[segment][1] -= len(entries)
+                if self.cursor[0] == segment:
+                    self.cursor = (segment, entries[-1][2])
+                    self.saveCursor()
+            self.condition.notify_all()
+
+    def saveCursor(self):
+        path = self.cursorPath()
+        with open(path + ".tmp", "w") as stream:
+            stream.write("%d %d\n" % self.cursor)
+        os.replace(path + ".tmp", path)
+
+
+    # drain the spool
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending > 0 or not self.running)
+                if not self.running:
+                    return
+                segment, offset = self.cursor
+                end = self.segments[segment][0]
+
+                # delete the segments already sent
+                if offset >= end:
+                    if segment != self.active:
+                        self.usage -= end
+                        del self.segments[segment]
+                        os.remove(self.segmentPath(segment))
+                        self.cursor = (min(self.segments), 0)
+                        self.saveCursor()
+                        self.condition.notify_all()
+                    else:
+                        self.condition.wait(self.syncInterval)
+                    continue
+            try:
+                entries = self.readBatch(segment, offset, end)
+            except FileNotFoundError:
+                continue
+            # the entries of a segment discarded meanwhile are not sent
+            for sparqlUpdate, group in self.requests(entries):
+                if not self.claim(segment, len(group)):
+                    break
+                result = self.send(sparqlUpdate, len(group))
+                if result is None:
+                    return
+                if result[0]:
+                    with self.condition:
+                        self.batches += 1
+                    self.advance(segment, group, True)
+                    continue
+
+                # rejected: retry the entries one by one
+                self.logger.error("Spool request of {} entries rejected: {}".format(len(group), result[1]))
+                for entry in group:
+                    if not self.claim(segment, 1):
+                        break
+                    delay = self.retryInterval
+                    for attempt in range(self.retries + 1):
+                        if attempt:
+                            if not self.backoff(delay):
+                                return
+                            delay = min(delay * 2, self.maxRetryInterval)
+                        result = self.send(entry[1], 1)
+                        if result is None:
+                            return
+                        if result[0]:
+                            break
+                    with self.condition:
+                        self.batches += 1
+                    if not result[0]:
+                        self.logger.error("Spool entry {} skipped: {}".format(entry[0], result[1]))
+                    self.advance(segment, [entry], result[0])
+
+
+    # start
+    def start(self):
+
+        """Starts the threads syncing and draining the spool"""
+
+        # debug print
+        self.logger.debug("=== UpdateSpool::start invoked ===")
+
+        self.running = True
+        self.workers = [Thread(target = self.run), Thread(target = self.syncLoop)]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+        return self
+
+
+    # wait for the spool to drain
+    def flush(self, timeout = None):
+
+        """Waits until all the entries have been sent, returns False on timeout"""
+
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending == 0, timeout)
+
+
+    # stop
+    def stop(self, flush = True, timeout = None):
+
+        """Stops the threads, sending the pending entries first if flush is True (the others stay on disk)"""
+
+        # debug print
+        self.logger.debug("=== UpdateSpool::stop invoked ===")
+
+        if flush and self.running:
+            self.flush(timeout)
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = []
+        with self.condition:
+            os.fsync(self.fd)
+            self.synced = self.written
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+
+# global requirements
+from collections import OrderedDict
+from threading import Lock
+import logging
+import time
+
+
+def parseValue(value):
+
+    """Returns a value as a float when it is a number (so that 21.5 and 21.50 are equal), as it is otherwise"""
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class UpdateSuppressor:
+
+    """
+    Skips the updates that would not change what the broker knows: the
+    last value sent is remembered for every update name and combination
+    of key bindings (e.g. the observation of UPDATE_OBSERVATION_VALUE),
+    and an update is sent only if its value changed by more than the
+    deadband, or if nothing was sent for that key for maxSilence seconds
+    (the heartbeat). Updates without configured keys are always sent.
+
+    The last values are kept in a LRU dictionary of at most maxEntries
+    keys, with the value parsed as a float when possible: an evicted key
+    is simply sent again.
+
+    Parameters
+    ----------
+    client : SEPAClient
+        The client used to send the updates
+    keys : dict
+        The names of the key bindings, indexed by update name (default = {"UPDATE_OBSERVATION_VALUE": ["observation"]})
+    valueBinding : str
+        The binding carrying the value (default = "value")
+    deadband : float or dict
+        The largest change of a numeric value that is suppressed, or a dictionary of deadbands indexed by update name (default = 0, only equal values)
+    maxSilence : float
+        The maximum time between two updates of a key in seconds (default = 300, None for no heartbeat)
+    maxEntries : int
+        The maximum number of remembered keys (default = 100000)
+
+    Attributes
+    ----------
+    suppressed : int
+        The number of updates skipped
+    passed : int
+        The number of updates let through
+    evicted : int
+        The number of keys forgotten to respect maxEntries
+
+    """
+
+    # constructor
+    def __init__(self, client, keys = None, valueBinding = "value", deadband = 0.0, maxSilence = 300.0, maxEntries = 100000):
+
+        """Constructor of the UpdateSuppressor class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== UpdateSuppressor::__init__ invoked ===")
+
+        # configuration
+        self.client = client
+        self.keys = keys if keys is not None else {"UPDATE_OBSERVATION_VALUE": ["observation"]}
+        self.valueBinding = valueBinding
+        self.deadband = deadband
+        self.maxSilence = maxSilence
+        self.maxEntries = maxEntries
+
+        # state: (updateName, key values) -> (value, time of the last update sent)
+        self.last = OrderedDict()
+        self.lock = Lock()
+
+        # the values sent with a template are forgotten when the template changes
+        listeners = getattr(client, "reloadListeners", None)
+        if listeners is not None:
+            listeners.append(self.onReload)
+
+        # counters
+        self.suppressed = 0
+        self.passed = 0
+        self.evicted = 0
+
+
+    # key of an update
+    def key(self, updateName, forcedBindings):
+        keys = self.keys.get(updateName)
+        if keys is None or self.valueBinding not in forcedBindings:
+            return None
+        return (updateName,) + tuple(forcedBindings.get(k) for k in keys)
+
+
+    # decide
+    def check(self, updateName, forcedBindings, now = None):
+
+        """
+        Tells if an update must be sent, remembering its value if so
+
+        Parameters
+        ----------
+        updateName : str
+            The friendly name of the SPARQL Update
+        forcedBindings : dict
+            The bindings of the update
+        now : float
+            The current time.monotonic() (default = None, read from the clock)
+
+        Returns
+        -------
+        bool
+            True if the update must be sent, False if it is suppressed
+
+        """
+
+        key = self.key(updateName, forcedBindings)
+        if key is None:
+            self.passed += 1
+            return True
+        if now is None:
+            now = time.monotonic()
+        value = parseValue(forcedBindings[self.valueBinding])
+        deadband = self.deadband.get(updateName, 0.0) if isinstance(self.deadband, dict) else self.deadband
+        with self.lock:
+            last = self.last.get(key)
+            if last is not None:
+                lastValue, lastTime = last
+                if self.maxSilence is None or now - lastTime < self.maxSilence:
+                    if lastValue == value or (isinstance(value, float) and isinstance(lastValue, float) and abs(value - lastValue) <= deadband):
+                        self.last.move_to_end(key)
+                        self.suppressed += 1
+                        metrics = getattr(self.client, "metrics", None)
+                        if metrics is not None:
+                            metrics.inc("sepy_suppressed_total", kind = "update", name = updateName)
+                        return False
+            self.last[key] = (value, now)
+            self.last.move_to_end(key)
+            if len(self.last) > self.maxEntries:
+                self.last.popitem(last = False)
+                self.evicted += 1
+            self.passed += 1
+        return True
+
+
+    # forget a value that was not sent
+    def forget(self, updateName, forcedBindings):
+
+        """Forgets the value of an update that failed, so that the next one is sent"""
+
+        key = self.key(updateName, forcedBindings)
+        if key is not None:
+            with self.lock:
+                self.last.pop(key, None)
+
+
+    # configuration reloaded
+    def onReload(self, previous, configuration, changed):
+
+        """Forgets the values of the updates changed by a reload of the configuration (see SEPAClient.reloadConfiguration)"""
+
+        updates = set(changed["updates"])
+        with self.lock:
+            for key in [key for key in self.last if key[0] in updates]:
+                del self.last[key]
+
+
+    # update
+    def update(self, updateName, forcedBindings = {}, secure = False):
+
+        """
+        Performs an update with SEPAClient.update, unless it is suppressed
+
+        Returns
+        -------
+        status : bool
+            True or False, depending on the success/failure of the request (True if suppressed)
+        results : json
+            The results of the SPARQL update ("suppressed" if suppressed)
+
+        """
+
+        if not self.check(updateName, forcedBindings):
+            return True, "suppressed"
+        try:
+            status, results = self.client.update(updateName, forcedBindings, secure)
+        except Exception:
+            self.forget(updateName, forcedBindings)
+            raise
+        if not status:
+            self.forget(updateName, forcedBindings)
+        return status, results
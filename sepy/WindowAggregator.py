@@ -0,0 +1,347 @@
+#!/usr/bin/python3
+
+# global requirements
+from threading import Thread, Event, Lock, Condition
+from collections import deque
+from datetime import datetime
+import logging
+import math
+import time
+
+# numpy is only imported by WindowAggregator, so that importing sepy does not need it
+
+
+def parseTime(value):
+
+    """Returns the epoch seconds of a number or of an xsd:dateTime"""
+
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class WindowAggregator:
+
+    """
+    A subscription handler computing windowed aggregates of numeric
+    values: the values of the added bindings are stored, for every key,
+    in a ring buffer of the last capacity values, and every slide seconds
+    the mean, minimum, maximum, percentiles and count of the values of the
+    last window seconds are computed for all the keys at once. With slide
+    equal to window (the default) the windows are tumbling, otherwise they
+    are sliding. Windows are aligned to multiples of slide.
+
+    Memory is allocated once (maxKeys x capacity values and times): when
+    a window holds more than capacity values of a key, the oldest ones
+    are overwritten, and values of keys beyond maxKeys are discarded.
+
+    The windows are closed when a notification arrives after their end,
+    or by tick (called every slide seconds by a thread after start). The
+    aggregates are passed to onWindow and, if updateName is given, written
+    back with a single SEPAClient.updateMany request per window, with the
+    bindings keyBinding, count, mean, min, max, p<q> for every percentile,
+    windowStart and windowEnd (epoch seconds). The write-backs are sent in
+    order by a writer thread, so that the notifications are not delayed by
+    the requests (see flush). Requires numpy.
+
+    Parameters
+    ----------
+    client : SEPAClient
+        The client used to write back the aggregates (default = None)
+    window : float
+        The length of the windows in seconds (default = 60)
+    slide : float
+        The time between the ends of two windows in seconds (default = None, equal to window)
+    keyBinding : str
+        The binding identifying the series (default = "observation")
+    valueBinding : str
+        The binding with the numeric value (default = "value")
+    timeBinding : str
+        The binding with the time of the value, epoch seconds or xsd:dateTime (default = None, the arrival time)
+    percentiles : tuple
+        The percentiles to compute (default = (50, 95))
+    capacity : int
+        The number of values kept for every key (default = 512)
+    maxKeys : int
+        The maximum number of keys (default = 1000)
+    updateName : str
+        The update used to write back the aggregates (default = None, no write back)
+    onWindow : function
+        A function called with the aggregates of every window (default = None)
+
+    Attributes
+    ----------
+    received : int
+        The number of values stored
+    invalid : int
+        The number of bindings without a key or a numeric value
+    discarded : int
+        The number of values of keys beyond maxKeys
+    overwritten : int
+        The number of values overwritten before leaving their windows
+    windows : int
+        The number of windows closed
+    unwritten : int
+        The number of windows whose aggregates are being written back
+
+    """
+
+    # constructor
+    def __init__(self, client = None, window = 60.0, slide = None, keyBinding = "observation", valueBinding = "value", timeBinding = None,
+                 percentiles = (50, 95), capacity = 512, maxKeys = 1000, updateName = None, onWindow = None):
+
+        """Constructor of the WindowAggregator class"""
+
+        # logger
+        self.logger = logging.getLogger("sepaLogger")
+        self.logger.debug("=== WindowAggregator::__init__ invoked ===")
+
+        # configuration
+        import numpy
+        self.numpy = numpy
+        self.client = client
+        self.window = float(window)
+        self.slide = float(slide or window)
+        self.keyBinding = keyBinding
+        self.valueBinding = valueBinding
+        self.timeBinding = timeBinding
+        self.percentiles = tuple(percentiles)
+        self.capacity = capacity
+        self.maxKeys = maxKeys
+        self.updateName = updateName
+        self.onWindow = onWindow
+
+        # ring buffers: one row per key
+        self.values = numpy.zeros((maxKeys, capacity))
+        self.times = numpy.full((maxKeys, capacity), -numpy.inf)
+        self.heads = [0] * maxKeys
+        self.rows = {}
+        self.keys = []
+        self.lock = Lock()
+        self.windowLock = Lock()
+        self.nextEnd = None
+
+        # timer
+        self.stopEvent = Event()
+        self.timer = None
+
+        # write-backs, sent by the writer thread
+        self.writes = deque()
+        self.writeCondition = Condition()
+        self.writer = None
+        self.unwritten = 0
+
+        # counters
+        self.received = 0
+        self.invalid = 0
+        self.discarded = 0
+        self.overwritten = 0
+        self.windows = 0
+
+
+    # store the values of a notification
+    def handle(self, added, removed):
+
+        """Stores the values of the added bindings (the removed ones are ignored) and closes the elapsed windows"""
+
+        now = time.time()
+        keyBinding = self.keyBinding
+        valueBinding = self.valueBinding
+        timeBinding = self.timeBinding
+        capacity = self.capacity
+        values = self.values
+        times = self.times
+        heads = self.heads
+        rows = self.rows
+        latest = now if timeBinding is None else None
+        with self.lock:
+            for binding in (added or {}).get("results", {}).get("bindings", []):
+                try:
+                    key = binding[keyBinding]["value"]
+                    value = float(binding[valueBinding]["value"])
+                    sample = now if timeBinding is None else parseTime(binding[timeBinding]["value"])
+                except (KeyError, ValueError):
+                    self.invalid += 1
+                    continue
+                row = rows.get(key)
+                if row is None:
+                    if len(self.keys) >= self.maxKeys:
+                        self.discarded += 1
+                        continue
+                    row = rows[key] = len(self.keys)
+                    self.keys.append(key)
+                if self.nextEnd is None:
+                    self.nextEnd = (math.floor(sample / self.slide) + 1) * self.slide
+                head = heads[row]
+                if times[row, head] > self.nextEnd - self.window:
+                    self.overwritten += 1
+                values[row, head] = value
+                times[row, head] = sample
+                heads[row] = (head + 1) % capacity
+                self.received += 1
+                if timeBinding is not None and (latest is None or sample > latest):
+                    latest = sample
+        if latest is not None:
+            self.tick(latest)
+
+    def handleError(self, message):
+        self.logger.error("WindowAggregator received an error: {}".format(message))
+
+
+    # aggregate a window
+    def aggregate(self, start, end):
+
+        """
+        Computes the aggregates of the values in (start, end] for all the keys
+
+        Returns
+        -------
+        dict
+            The window start and end, the keys with at least one value and
+            the numpy arrays count, mean, min, max and p<q> for every percentile
+
+        """
+
+        numpy = self.numpy
+        with self.lock:
+            used = len(self.keys)
+            times = self.times[:used]
+            mask = (times > start) & (times <= end)
+            counts = mask.sum(axis = 1)
+            present = numpy.nonzero(counts)[0]
+            values = numpy.where(mask[present], self.values[present], numpy.nan)
+            keys = [self.keys[row] for row in present]
+        counts = counts[present]
+        result = {"start": start, "end": end, "keys": keys, "count": counts}
+
+        # the values of every key sorted, followed by the NaNs of the other times
+        ordered = numpy.sort(values, axis = 1)
+        last = numpy.maximum(counts - 1, 0)
+        result["mean"] = numpy.where(numpy.isnan(values), 0.0, values).sum(axis = 1) / numpy.maximum(counts, 1)
+        result["min"] = ordered[:, 0] if len(keys) else numpy.empty(0)
+        result["max"] = numpy.take_along_axis(ordered, last[:, None], axis = 1)[:, 0]
+
+        # percentiles with linear interpolation, as numpy.percentile
+        for q in self.percentiles:
+            position = last * (q / 100.0)
+            low = numpy.floor(position).astype(int)
+            high = numpy.minimum(low + 1, last)
+            fraction = position - low
+            lowValues = numpy.take_along_axis(ordered, low[:, None], axis = 1)[:, 0]
+            highValues = numpy.take_along_axis(ordered, high[:, None], axis = 1)[:, 0]
+            result["p%g" % q] = lowValues + (highValues - lowValues) * fraction
+        return result
+
+
+    # close the elapsed windows
+    def tick(self, now = None):
+
+        """Closes the windows ended before now (default = the current time), returns their aggregates"""
+
+        if now is None:
+            now = time.time()
+        results = []
+        with self.windowLock:
+            while self.nextEnd is not None and self.nextEnd <= now:
+                end = self.nextEnd
+                self.nextEnd = end + self.slide
+                result = self.aggregate(end - self.window, end)
+                self.windows += 1
+                results.append(result)
+                if self.onWindow is not None:
+                    self.onWindow(result)
+                if self.updateName is not None and result["keys"]:
+                    self.enqueue(result)
+        return results
+
+
+    # hand the aggregates to the writer thread
+    def enqueue(self, result):
+
+        """Queues the write-back of the aggregates of a window, starting the writer thread if needed"""
+
+        with self.writeCondition:
+            self.writes.append(result)
+            self.unwritten += 1
+            if self.writer is None:
+                self.writer = Thread(target = self.writeLoop)
+                self.writer.daemon = True
+                self.writer.start()
+            self.writeCondition.notify_all()
+
+    def writeLoop(self):
+        while True:
+            with self.writeCondition:
+                self.writeCondition.wait_for(lambda: self.writes)
+                result = self.writes.popleft()
+            if result is None:
+                return
+            self.writeBack(result)
+            with self.writeCondition:
+                self.unwritten -= 1
+                self.writeCondition.notify_all()
+
+
+    # wait for the write-backs
+    def flush(self, timeout = None):
+
+        """Waits until the aggregates of the closed windows have been written back, returns False on timeout"""
+
+        with self.writeCondition:
+            return self.writeCondition.wait_for(lambda: self.unwritten == 0, timeout)
+
+
+    # write back the aggregates
+    def writeBack(self, result):
+
+        """Sends the aggregates of a window with a single request"""
+
+        names = ["count", "mean", "min", "max"] + ["p%g" % q for q in self.percentiles]
+        columns = [result[name].tolist() for name in names]
+        bindingsList = []
+        for i, key in enumerate(result["keys"]):
+            bindings = {name: repr(column[i]) for name, column in zip(names, columns)}
+            bindings[self.keyBinding] = key
+            bindings["windowStart"] = repr(result["start"])
+            bindings["windowEnd"] = repr(result["end"])
+            bindingsList.append(bindings)
+        try:
+            status, results = self.client.updateMany(self.updateName, bindingsList)
+        except Exception as e:
+            status, results = False, e
+        if not status:
+            self.logger.error("Write back of {} aggregates failed: {}".format(len(bindingsList), results))
+
+
+    # timer
+    def start(self):
+
+        """Starts a thread closing the windows every slide seconds, also when no notifications arrive"""
+
+        def run():
+            while not self.stopEvent.wait(self.slide / 10):
+                self.tick()
+
+        self.stopEvent.clear()
+        self.timer = Thread(target = run)
+        self.timer.daemon = True
+        self.timer.start()
+        return self
+
+    def stop(self):
+
+        """Stops the thread started by start and the writer thread, after the queued write-backs"""
+
+        self.stopEvent.set()
+        if self.timer is not None:
+            self.timer.join()
+            self.timer = None
+        with self.writeCondition:
+            writer = self.writer
+            self.writer = None
+            if writer is not None:
+                self.writes.append(None)
+                self.writeCondition.notify_all()
+        if writer is not None:
+            writer.join()
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import time
+import tempfile
+import unittest
+from threading import Thread, Lock
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.Metrics import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+
+class LoadedBroker(MockBroker):
+
+    """A broker whose latency grows with the requests it is serving, sampling the limit of a limiter under load"""
+
+    def __init__(self, *args, **kwargs):
+        MockBroker.__init__(self, *args, **kwargs)
+        self.serving = 0
+        self.peak = 0
+        self.servingLock = Lock()
+        self.limiter = None
+        self.limits = []
+
+    def beforeRequest(self):
+        with self.servingLock:
+            self.serving += 1
+            self.peak = max(self.peak, self.serving)
+            delay = 0.005 * self.serving
+            if self.limiter is not None:
+                self.limits.append(self.limiter.limit)
+        time.sleep(delay)
+        with self.servingLock:
+            self.serving -= 1
+
+
+def respond(limiter, latency, failed = False):
+    start = limiter.acquire()
+    limiter.release(start - latency, failed)
+
+
+# class
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_00_aimd(self):
+        limiter = AdaptiveLimiter(initialLimit = 4, maxLimit = 10, initialBatch = 100, maxBatch = 150)
+        for i in range(100):
+            respond(limiter, 0.01)
+        self.assertEqual(limiter.limit, 10)
+        self.assertEqual(limiter.batchSize, 150)
+
+        # the responses of the same burst decrease the limit once
+        respond(limiter, 0.5)
+        respond(limiter, 0.5)
+        self.assertAlmostEqual(limiter.limit, 9)
+        self.assertEqual(limiter.overloads, 2)
+        time.sleep(0.02)
+        respond(limiter, 0.01, failed = True)
+        self.assertAlmostEqual(limiter.limit, 8.1)
+        self.assertLess(limiter.batchSize, 150)
+
+    def test_01_gradient(self):
+        limiter = AdaptiveLimiter("gradient", initialLimit = 20, maxLimit = 100)
+        respond(limiter, 0.01)
+        for i in range(50):
+            respond(limiter, 0.1)
+        self.assertLess(limiter.limit, 10)
+        for i in range(50):
+            respond(limiter, 0.01)
+        self.assertGreater(limiter.limit, 30)
+
+    def test_02_backpressure(self):
+        limiter = AdaptiveLimiter(initialLimit = 2)
+        starts = [limiter.acquire(), limiter.acquire()]
+        self.assertIsNone(limiter.acquire(timeout = 0.05))
+        Thread(target = limiter.release, args = (starts[0],)).start()
+        self.assertIsNotNone(limiter.acquire(timeout = 5))
+        self.assertEqual(limiter.inFlight, 2)
+
+    def test_03_client(self):
+        broker = LoadedBroker().start()
+        metrics = MetricsRegistry()
+        # the latency exceeds the target with more than 2 requests in flight
+        limiter = AdaptiveLimiter(initialLimit = 16, maxLimit = 16, targetLatency = 0.012)
+        broker.limiter = limiter
+        kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(tempfile.mkdtemp(), "mqtt.jsap")), metrics = metrics, limiter = limiter)
+        def produce():
+            for i in range(30):
+                kp.update("UPDATE_OBSERVATION_VALUE", {"observation": "arces-monitor:O", "value": "1"})
+        threads = [Thread(target = produce) for i in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        broker.stop()
+        self.assertEqual(broker.updates, 960)
+        self.assertLessEqual(broker.peak, 16)
+        self.assertGreater(limiter.overloads, 0)
+
+        # the limit backs off from the maximum while the broker is loaded
+        self.assertEqual(broker.limits[0], 16)
+        self.assertLessEqual(min(broker.limits), 4)
+        self.assertEqual(limiter.inFlight, 0)
+        self.assertEqual(metrics.snapshot()["sepy_concurrency_limit"], [{"labels": {}, "value": limiter.limit}])
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
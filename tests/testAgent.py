@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+
+# global requirements
+from threading import Event
+import os
+import sys
+import json
+import time
+import tempfile
+import unittest
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.Agent import *
+from sepy.AgentClient import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+
+# handler collecting the notifications
+class Collector:
+
+    def __init__(self):
+        self.notifications = []
+        self.event = Event()
+
+    def handle(self, added, removed):
+        self.notifications.append(added)
+        self.event.set()
+
+    def handleError(self, error):
+        pass
+
+
+# class
+class TestAgent(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.broker = MockBroker(rows = 3).start()
+        self.jsap = self.broker.configuration(TEMPLATE, os.path.join(self.directory, "mqtt.jsap"))
+        self.agent = SEPAAgent(os.path.join(self.directory, "agent.sock")).start()
+        self.client = AgentClient(self.jsap, self.agent.socketPath)
+
+    def tearDown(self):
+        self.client.close()
+        self.agent.stop()
+        self.broker.stop()
+
+    def test_00_update_and_query(self):
+        status, results = self.client.update("UPDATE_OBSERVATION_VALUE", {"observation": "http://example.org/o", "value": "1"})
+        self.assertTrue(status)
+        status, results = self.client.query("MQTT_TOPICS")
+        self.assertTrue(status)
+        self.assertEqual(len(results["results"]["bindings"]), 3)
+        self.assertEqual(self.broker.updates, 1)
+
+        # a single configuration is loaded and reused
+        self.assertEqual(list(self.agent.clients), [(os.path.abspath(self.jsap), None)])
+
+    def test_01_errors(self):
+        with self.assertRaises(AgentException):
+            self.client.query("NOT_A_QUERY")
+
+        # the connection is still usable
+        status, results = self.client.query("MQTT_TOPICS")
+        self.assertTrue(status)
+
+    def test_02_subscription(self):
+        collector = Collector()
+        subid = self.client.subscribe("MQTT_TOPICS", "topics", collector)
+        self.assertTrue(collector.event.wait(5))
+        self.assertEqual(len(collector.notifications[0]["results"]["bindings"]), 3)
+
+        # notifications of the updates
+        collector.event.clear()
+        self.client.update("UPDATE_OBSERVATION_VALUE", {"observation": "http://example.org/o", "value": "1"})
+        self.assertTrue(collector.event.wait(5))
+
+        # the agent closes the server-side subscription when the client leaves
+        client = self.agent.clients[(os.path.abspath(self.jsap), None)]
+        self.assertEqual(len(client.subscriptions), 1)
+        self.client.unsubscribe(subid)
+        for i in range(50):
+            if not client.subscriptions:
+                break
+            time.sleep(0.1)
+        self.assertEqual(len(client.subscriptions), 0)
+
+    def test_03_agent_restart(self):
+        self.assertTrue(self.client.query("MQTT_TOPICS")[0])
+        self.agent.stop()
+        self.agent = SEPAAgent(self.agent.socketPath).start()
+        self.assertTrue(self.client.query("MQTT_TOPICS")[0])
+
+    def test_04_shared_subscription(self):
+        first, second = Collector(), Collector()
+        self.client.subscribe("MQTT_TOPICS", "topics", first)
+        self.assertTrue(first.event.wait(5))
+
+        # the late joiner receives the current results after the response
+        other = AgentClient(self.jsap, self.agent.socketPath)
+        try:
+            other.subscribe("MQTT_TOPICS", "topics", second)
+            self.assertTrue(second.event.wait(5))
+            self.assertEqual(len(second.notifications[0]["results"]["bindings"]), 3)
+
+            # both receive the notifications of the updates
+            first.event.clear()
+            second.event.clear()
+            self.client.update("UPDATE_OBSERVATION_VALUE", {"observation": "http://example.org/o", "value": "1"})
+            self.assertTrue(first.event.wait(5))
+            self.assertTrue(second.event.wait(5))
+            self.assertEqual(len(first.notifications), 2)
+            self.assertEqual(len(second.notifications), 2)
+        finally:
+            other.close()
+
+    def test_05_timeout(self):
+        handleRequest = self.agent.handleRequest
+
+        def slow(message):
+            time.sleep(0.3)
+            return handleRequest(message)
+        self.agent.handleRequest = slow
+
+        # a request that timed out is not sent again
+        client = AgentClient(self.jsap, self.agent.socketPath, timeout = 0.1)
+        try:
+            with self.assertRaises(AgentException):
+                client.update("UPDATE_OBSERVATION_VALUE", {"observation": "http://example.org/o", "value": "1"})
+            time.sleep(0.6)
+            self.assertEqual(self.broker.updates, 1)
+        finally:
+            client.close()
+
+    def test_06_secure(self):
+        with self.assertRaises(AgentException) as context:
+            self.client.query("MQTT_TOPICS", secure = True)
+        self.assertIn("yskFile", str(context.exception))
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
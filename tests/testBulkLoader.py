@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+
+# global requirements
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+import sepy.RDFStream
+from sepy.BulkLoader import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+TURTLE = r'''@prefix ex: <http://example.org/> .
+PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+# a comment
+ex:alice a ex:Person ; rdfs:label "Alice"@en , 'Al' ; ex:height 1.75 ; ex:age 42 ;
+    ex:knows [ rdfs:label """Bob,
+the "builder\"""" ] ;
+    ex:list ( 1 ex:two ) ;
+    ex:typed "5"^^<http://www.w3.org/2001/XMLSchema#int> .
+_:x ex:p ex:o ; .
+'''
+
+
+# a broker failing the first requests
+class FlakyBroker(MockBroker):
+
+    failures = 2
+
+    def beforeRequest(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("injected failure")
+
+
+# class
+class TestBulkLoader(unittest.TestCase):
+
+    def parse(self, text):
+        parser = TurtleParser(io.StringIO(text))
+        return [tuple(term.replace(parser.genid, "_:") for term in triple) for triple in parser]
+
+    def test_00_turtle(self):
+        triples = self.parse(TURTLE)
+        self.assertEqual(len(triples), 14)
+        self.assertIn(("<http://example.org/alice>", "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>", "<http://example.org/Person>"), triples)
+        self.assertIn(("<http://example.org/alice>", "<http://www.w3.org/2000/01/rdf-schema#label>", '"Alice"@en'), triples)
+        self.assertIn(("<http://example.org/alice>", "<http://example.org/height>", "1.75"), triples)
+        self.assertIn(("<_:x>", "<http://example.org/p>", "<http://example.org/o>"), triples)
+        self.assertIn(("<_:anon1>", "<http://www.w3.org/2000/01/rdf-schema#label>", '"""Bob,\nthe "builder\\""""'), triples)
+
+    def test_01_block_boundaries(self):
+        expected = self.parse(TURTLE)
+        size = sepy.RDFStream.BLOCK_SIZE
+        try:
+            for blockSize in (1, 2, 3, 5, 8, 13):
+                sepy.RDFStream.BLOCK_SIZE = blockSize
+                self.assertEqual(self.parse(TURTLE), expected)
+        finally:
+            sepy.RDFStream.BLOCK_SIZE = size
+
+    def test_02_ntriples_and_errors(self):
+        text = '<http://a> <http://b> "c\\n" .\n# comment\n\n_:n <http://b> <http://d> . # trailing\n'
+        triples = list(parseNTriples(io.StringIO(text), genid = "urn:g:"))
+        self.assertEqual(triples, [("<http://a>", "<http://b>", '"c\\n"'), ("<urn:g:n>", "<http://b>", "<http://d>")])
+        with self.assertRaises(RDFParsingException):
+            list(parseNTriples(io.StringIO("<http://a> <http://b>\n")))
+
+        # literals are tokenized, whatever they contain
+        text = '<http://s> <http://p> "a . # b" .\n<http://s> <http://p> "x \\" . y"@en-GB . # c\n<http://s> <http://p> "1"^^<http://t> .\n'
+        triples = list(parseNTriples(io.StringIO(text)))
+        self.assertEqual([triple[2] for triple in triples], ['"a . # b"', '"x \\" . y"@en-GB', '"1"^^<http://t>'])
+        with self.assertRaises(RDFParsingException):
+            list(parseNTriples(io.StringIO('<http://s> <http://p> "a" "b" .\n')))
+        with self.assertRaises(RDFParsingException):
+            self.parse("ex:a ex:b ex:c .")
+
+    def test_03_compaction(self):
+        compactor = NamespaceCompactor({"ex": "http://example.org/", "xsd": "http://www.w3.org/2001/XMLSchema#"})
+        self.assertEqual(compactor.compact("<http://example.org/alice>"), "ex:alice")
+        self.assertEqual(compactor.compact("<http://example.org/a/b>"), "<http://example.org/a/b>")
+        self.assertEqual(compactor.compact("<http://example.org/a(b)>"), "<http://example.org/a(b)>")
+        self.assertEqual(compactor.compact('"5"^^<http://www.w3.org/2001/XMLSchema#int>'), '"5"^^xsd:int')
+
+    def test_04_load(self):
+        broker = FlakyBroker().start()
+        broker.httpServer.handle_error = lambda request, address: None
+        try:
+            directory = tempfile.mkdtemp()
+            kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(directory, "mqtt.jsap")))
+            path = os.path.join(directory, "data.nt")
+            with open(path, "w") as stream:
+                for i in range(1000):
+                    stream.write("<http://wot.arces.unibo.it/monitor#O%s> <http://www.w3.org/2000/01/rdf-schema#label> \"%s\" .\n" % (i, i))
+            loader = BulkLoader(kp, workers = 2, maxBytes = 8192, backoff = 0.01)
+            stats = loader.load(path)
+            self.assertEqual(stats["triples"], 1000)
+            self.assertEqual(stats["sentTriples"], 1000)
+            self.assertEqual(stats["failedChunks"], 0)
+            self.assertEqual(stats["retries"], 2)
+            self.assertEqual(broker.updates, stats["chunks"])
+            self.assertGreater(stats["chunks"], 1)
+        finally:
+            broker.stop()
+
+    def test_05_chunk_size(self):
+        kp = type("FakeClient", (), {"configuration": type("FakeConfiguration", (), {"namespaces": {}, "nsSparql": ""})()})()
+        loader = BulkLoader(kp, maxBytes = 200, maxTriples = 3)
+        triples = [("<http://a/%s>" % i, "<http://b>", '"%s"' % ("x" * (i % 50))) for i in range(100)]
+        chunks = list(loader.chunks(triples))
+        self.assertEqual(sum(count for sparql, count in chunks), 100)
+        for sparql, count in chunks:
+            self.assertLessEqual(count, 3)
+            self.assertTrue(len(sparql.encode("utf-8")) <= 200 or count == 1)
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import unittest
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+from sepy.SEPAClient import *
+
+# configuration file
+jsapFile = os.path.join(os.path.dirname(__file__), "..", "examples", "mqtt.jsap")
+
+# update of the template used by the tests
+UPDATE = "UPDATE_OBSERVATION_VALUE"
+
+# optional dependency
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# fake connection handler, recording the requests
+class FakeConnectionHandler:
+
+    def __init__(self, statuses = ()):
+        self.requests = []
+        self.statuses = list(statuses)
+
+    def unsecureRequest(self, reqURI, sparql, isQuery, name = None, deadline = None):
+        self.requests.append(sparql)
+        status = self.statuses.pop(0) if self.statuses else 200
+        return status, {"request": len(self.requests)}
+
+
+# class
+class TestColumnRendering(unittest.TestCase):
+
+    def setUp(self):
+        self.kp = SEPAClient(jsapFile)
+        self.configuration = self.kp.configuration
+        self.observations = ["arces-monitor:Observation%s" % i for i in range(5)] + ["http://example.org/observation"]
+        self.values = ["1", "2.5", "-3", "text with spaces", "", "4"]
+
+    def test_sameAsGetUpdate(self):
+        columns = {"observation": self.observations, "value": self.values}
+        rendered = self.configuration.renderColumns(False, UPDATE, columns)
+        prefixes = len(self.configuration.nsSparql)
+        expected = [self.configuration.getUpdate(UPDATE, {"observation": o, "value": v})[prefixes:] for o, v in zip(self.observations, self.values)]
+        self.assertEqual(rendered, expected)
+        self.assertIn("<http://example.org/observation>", rendered[-1])
+        self.assertIn("arces-monitor:Observation0 rdf:type", rendered[0])
+        self.assertIn("'text with spaces'", rendered[3])
+
+        # the template is compiled once
+        self.configuration.renderColumns(False, UPDATE, columns)
+        self.assertEqual(len(self.configuration.templates), 1)
+
+    def test_queries(self):
+        rendered = self.configuration.renderColumns(True, "MQTT_TOPICS", {})
+        self.assertEqual(rendered, [self.configuration.getQuery("MQTT_TOPICS", {})[len(self.configuration.nsSparql):]])
+        self.assertRaises(ConfigurationParsingException, self.configuration.renderColumns, True, "MISSING", {})
+
+    def test_scalars(self):
+        rendered = self.configuration.renderColumns(False, UPDATE, {"observation": "arces-monitor:Observation1", "value": [1, 2, 3], "unused": 0})
+        prefixes = len(self.configuration.nsSparql)
+        expected = [self.configuration.getUpdate(UPDATE, {"observation": "arces-monitor:Observation1", "value": v})[prefixes:] for v in (1, 2, 3)]
+        self.assertEqual(rendered, expected)
+
+    def test_scalarTypes(self):
+        prefixes = len(self.configuration.nsSparql)
+        expected = lambda value: [self.configuration.getUpdate(UPDATE, {"observation": "arces-monitor:Observation1", "value": value})[prefixes:]]
+        self.assertEqual(self.configuration.renderColumns(False, UPDATE, {"observation": "arces-monitor:Observation1", "value": None}), expected(None))
+
+        # bytes are decoded, alone or in a column
+        self.assertEqual(self.configuration.renderColumns(False, UPDATE, {"observation": b"arces-monitor:Observation1", "value": b"x"}), expected("x"))
+        rendered = self.configuration.renderColumns(False, UPDATE, {"observation": "arces-monitor:Observation1", "value": [b"x", "y"]})
+        self.assertEqual(rendered, expected("x") + expected("y"))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpyScalars(self):
+        prefixes = len(self.configuration.nsSparql)
+        expected = lambda value: [self.configuration.getUpdate(UPDATE, {"observation": "arces-monitor:Observation1", "value": value})[prefixes:]]
+        for value in (numpy.int64(3), numpy.float32(2.5), numpy.array(7)):
+            rendered = self.configuration.renderColumns(False, UPDATE, {"observation": "arces-monitor:Observation1", "value": value})
+            self.assertEqual(rendered, expected(str(value)))
+        rendered = self.configuration.renderColumns(False, UPDATE, {"observation": "arces-monitor:Observation1", "value": numpy.array([b"x", b"y"])})
+        self.assertEqual(rendered, expected("x") + expected("y"))
+
+    def test_lengths(self):
+        self.assertRaises(ValueError, self.configuration.renderColumns, False, UPDATE, {"observation": self.observations, "value": self.values[:2]})
+        self.assertEqual(self.configuration.getUpdateColumns(UPDATE, {"observation": [], "value": []}), [])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_arrays(self):
+        values = numpy.array([20.5, 21.0, -1.25])
+        observations = numpy.array(self.observations[:3])
+        rendered = self.configuration.renderColumns(False, UPDATE, {"observation": observations, "value": values})
+        prefixes = len(self.configuration.nsSparql)
+        expected = [self.configuration.getUpdate(UPDATE, {"observation": o, "value": str(v)})[prefixes:] for o, v in zip(self.observations, values.tolist())]
+        self.assertEqual(rendered, expected)
+
+    def test_batches(self):
+        columns = {"observation": self.observations, "value": self.values}
+        bodies = self.configuration.getUpdateColumns(UPDATE, columns, batchSize = 4)
+        self.assertEqual(len(bodies), 2)
+        self.assertTrue(all(body.startswith(self.configuration.nsSparql) for body in bodies))
+
+        # the bodies of updateMany, batch by batch
+        bindingsList = [{"observation": o, "value": v} for o, v in zip(self.observations, self.values)]
+        self.kp.connectionManager = FakeConnectionHandler()
+        self.kp.updateMany(UPDATE, bindingsList[:4])
+        self.kp.updateMany(UPDATE, bindingsList[4:])
+        self.assertEqual(bodies, self.kp.connectionManager.requests)
+
+    def test_updateColumns(self):
+        columns = {"observation": self.observations, "value": self.values}
+        self.kp.connectionManager = FakeConnectionHandler()
+        status, results = self.kp.updateColumns(UPDATE, columns, batchSize = 2)
+        self.assertTrue(status)
+        self.assertEqual(results, [{"request": 1}, {"request": 2}, {"request": 3}])
+
+        # the requests stop at the first failure
+        self.kp.connectionManager = FakeConnectionHandler([200, 500])
+        status, results = self.kp.updateColumns(UPDATE, columns, batchSize = 2)
+        self.assertFalse(status)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(len(self.kp.connectionManager.requests), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
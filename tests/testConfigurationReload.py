@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from threading import Event
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.UpdateSuppressor import *
+from sepy.ConfigurationWatcher import *
+
+# configuration file
+jsapFile = os.path.join(os.path.dirname(__file__), "..", "examples", "mqtt.jsap")
+
+# a binding of the results
+BINDING = {"topic": {"type": "literal", "value": "t"}}
+
+
+# fake connection handler, used to avoid a real broker
+class FakeConnectionHandler:
+
+    def __init__(self):
+        self.opened = []
+        self.closed = []
+        self.requests = []
+
+    def unsecureRequest(self, reqURI, sparql, isQuery, name = None, deadline = None):
+        self.requests.append((reqURI, sparql))
+        return 200, '{"head": {"vars": []}, "results": {"bindings": []}}'
+
+    def openWebsockets(self, subscribeURI, sparqlList, registerURI = None, tokenURI = None, aliases = None, handlers = None, yskFile = None):
+        spuids = []
+        for sparql, handler in zip(sparqlList, handlers):
+            self.opened.append((subscribeURI, sparql, handler))
+            spuids.append("spuid-%s" % len(self.opened))
+        return spuids
+
+    def closeWebsocket(self, spuid, secure = False):
+        self.closed.append(spuid)
+
+
+# handler recording the notifications
+class RecordingHandler:
+
+    def __init__(self):
+        self.notifications = []
+        self.errors = []
+
+    def handle(self, added, removed):
+        self.notifications.append((added, removed))
+
+    def handleError(self, error):
+        self.errors.append(error)
+
+
+# class
+class TestConfigurationReload(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "mqtt.jsap")
+        shutil.copy(jsapFile, self.path)
+        self.kp = SEPAClient(self.path)
+        self.kp.connectionManager = FakeConnectionHandler()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def edit(self, function):
+        with open(self.path) as stream:
+            jsap = json.load(stream)
+        function(jsap)
+        with open(self.path, "w") as stream:
+            json.dump(jsap, stream)
+
+    def test_unchanged(self):
+        self.kp.subscribe("MQTT_TOPICS", "a", RecordingHandler())
+        previous = self.kp.configuration
+        changed = self.kp.reloadConfiguration()
+        self.assertIsNot(self.kp.configuration, previous)
+        self.assertEqual(changed, {"queries": [], "updates": [], "uris": False, "resubscribed": 0})
+        self.assertEqual(len(self.kp.connectionManager.opened), 1)
+        self.assertEqual(self.kp.connectionManager.closed, [])
+
+    def test_changedSubscription(self):
+        handler, other = RecordingHandler(), RecordingHandler()
+        moved = self.kp.subscribe("MQTT_TOPICS", "a", handler)
+        kept = self.kp.subscribe("OBSERVATIONS_TOPICS", "b", other)
+        shared = self.kp.subscriptions[moved]
+        shared.handle({"head": {"vars": ["topic"]}, "results": {"bindings": [BINDING]}}, None)
+
+        def change(jsap):
+            jsap["queries"]["MQTT_TOPICS"]["sparql"] = "SELECT ?topic WHERE {?message mqtt:hasTopic ?topic}"
+            jsap["updates"]["UPDATE_OBSERVATION_VALUE"]["sparql"] += " "
+        self.edit(change)
+        changed = self.kp.reloadConfiguration()
+        self.assertEqual(changed["queries"], ["MQTT_TOPICS"])
+        self.assertEqual(changed["updates"], ["UPDATE_OBSERVATION_VALUE"])
+        self.assertEqual(changed["resubscribed"], 1)
+
+        # only the changed subscription is moved, its results are retracted first
+        self.assertEqual(self.kp.connectionManager.closed, ["spuid-1"])
+        self.assertEqual(len(self.kp.connectionManager.opened), 3)
+        self.assertIn("mqtt:hasTopic ?topic}", self.kp.connectionManager.opened[2][1])
+        self.assertEqual(self.kp.subscriptions[moved].spuid, "spuid-3")
+        self.assertEqual(self.kp.subscriptions[kept].spuid, "spuid-2")
+        self.assertEqual(handler.notifications[-1][1]["results"]["bindings"], [BINDING])
+        self.assertEqual(other.notifications, [])
+
+        # the moved subscription is closed by unsubscribe
+        self.kp.unsubscribe(moved)
+        self.assertEqual(self.kp.connectionManager.closed, ["spuid-1", "spuid-3"])
+        self.assertEqual(self.kp.reloadConfiguration()["resubscribed"], 0)
+
+    def test_changedURIs(self):
+        self.kp.subscribe("MQTT_TOPICS", "a", RecordingHandler())
+        self.kp.subscribe("OBSERVATIONS_TOPICS", "b", RecordingHandler())
+        self.edit(lambda jsap: jsap["sparql11seprotocol"]["availableProtocols"]["ws"].update(port = 9999))
+        changed = self.kp.reloadConfiguration()
+        self.assertTrue(changed["uris"])
+        self.assertEqual(changed["resubscribed"], 2)
+        self.assertEqual(sorted(self.kp.connectionManager.closed), ["spuid-1", "spuid-2"])
+        self.assertTrue(all(":9999" in uri for uri, sparql, handler in self.kp.connectionManager.opened[2:]))
+        self.assertIn(":9999", self.kp.configuration.subscribeURI)
+
+    def test_removedSubscription(self):
+        handler, other = RecordingHandler(), RecordingHandler()
+        kept = self.kp.subscribe("MQTT_TOPICS", "a", handler)
+        removed = self.kp.subscribe("OBSERVATIONS_TOPICS", "b", other)
+        listened = []
+        self.kp.reloadListeners.append(lambda previous, configuration, changed: listened.append(changed))
+        previous = self.kp.configuration
+
+        def change(jsap):
+            del jsap["queries"]["OBSERVATIONS_TOPICS"]
+            jsap["sparql11seprotocol"]["availableProtocols"]["ws"]["port"] = 9999
+        self.edit(change)
+
+        # the reload is rejected, nothing changes
+        with self.assertRaises(ConfigurationParsingException) as context:
+            self.kp.reloadConfiguration()
+        self.assertIn("OBSERVATIONS_TOPICS", str(context.exception))
+        self.assertIs(self.kp.configuration, previous)
+        self.assertEqual(len(self.kp.connectionManager.opened), 2)
+        self.assertEqual(self.kp.connectionManager.closed, [])
+        self.assertEqual(self.kp.subscriptions[removed].spuid, "spuid-2")
+        self.assertEqual(listened, [])
+
+        # a subscription started with the previous configuration during a reload is ended
+        configuration = ConfigurationObject(self.path)
+        self.kp.configuration = configuration
+        self.assertEqual(self.kp.resubscribe(configuration), 1)
+        self.assertEqual(sorted(self.kp.connectionManager.closed), ["spuid-1", "spuid-2"])
+        self.assertNotIn(removed, self.kp.subscriptions)
+        self.assertEqual(len(other.errors), 1)
+        self.assertEqual(self.kp.subscriptions[kept].spuid, "spuid-3")
+        self.assertEqual(handler.errors, [])
+
+    def test_inFlightRequests(self):
+
+        # the configuration is reloaded between the rendering and the sending of every request
+        kp = self.kp
+        class ReloadingTracer:
+            def onPhase(self, phase, start, duration, context):
+                if phase == "render" and not context.get("reloaded"):
+                    context["reloaded"] = True
+                    kp.reloadConfiguration()
+        bindings = {"observation": "arces-monitor:Observation1", "value": "1"}
+        requests = [lambda: kp.update("UPDATE_OBSERVATION_VALUE", bindings),
+                    lambda: kp.updateMany("UPDATE_OBSERVATION_VALUE", [bindings]),
+                    lambda: kp.updateColumns("UPDATE_OBSERVATION_VALUE", {"observation": ["arces-monitor:Observation1"], "value": ["1"]}),
+                    lambda: kp.query("MQTT_TOPICS")]
+        for request in requests:
+            previous = kp.configuration
+            previous.tracer = ReloadingTracer()
+            def change(jsap):
+                jsap["sparql11protocol"]["port"] += 1
+                jsap["updates"]["UPDATE_OBSERVATION_VALUE"]["sparql"] += " "
+                jsap["queries"]["MQTT_TOPICS"]["sparql"] += " "
+            self.edit(change)
+            self.assertTrue(request()[0])
+            self.assertIsNot(kp.configuration, previous)
+
+            # the request is sent to the endpoint of the configuration it was rendered with
+            uri, sparql = kp.connectionManager.requests[-1]
+            self.assertIn(uri, (previous.updateURI, previous.queryURI))
+            self.assertNotIn(uri, (kp.configuration.updateURI, kp.configuration.queryURI))
+
+    def test_listeners(self):
+        suppressor = UpdateSuppressor(self.kp)
+        bindings = {"observation": "arces-monitor:Observation1", "value": "1"}
+        self.assertTrue(suppressor.check("UPDATE_OBSERVATION_VALUE", bindings))
+        self.assertFalse(suppressor.check("UPDATE_OBSERVATION_VALUE", bindings))
+        self.kp.reloadConfiguration()
+        self.assertFalse(suppressor.check("UPDATE_OBSERVATION_VALUE", bindings))
+        self.edit(lambda jsap: jsap["updates"]["UPDATE_OBSERVATION_VALUE"].update(sparql = jsap["updates"]["UPDATE_OBSERVATION_VALUE"]["sparql"] + " "))
+        self.kp.reloadConfiguration()
+        self.assertTrue(suppressor.check("UPDATE_OBSERVATION_VALUE", bindings))
+
+    def test_watcher(self):
+        reloaded = Event()
+        watcher = ConfigurationWatcher(self.kp, interval = 0.02, onReload = lambda changed: reloaded.set()).start()
+        try:
+            previous = self.kp.configuration
+
+            # a broken file is not loaded
+            with open(self.path, "a") as stream:
+                stream.write("{")
+            time.sleep(0.2)
+            self.assertIs(self.kp.configuration, previous)
+            self.assertEqual(watcher.failures, 1)
+
+            # a valid one is
+            with open(jsapFile) as stream:
+                jsap = json.load(stream)
+            jsap["namespaces"]["ex"] = "http://example.org/"
+            with open(self.path, "w") as stream:
+                stream.write(json.dumps(jsap))
+            self.assertTrue(reloaded.wait(2.0))
+            self.assertIn("ex", self.kp.configuration.namespaces)
+            self.assertEqual(watcher.reloads, 1)
+        finally:
+            watcher.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import time
+import tempfile
+import unittest
+from threading import Lock
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.QueryHedger import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+
+class StallingBroker(MockBroker):
+
+    """A broker stalling the requests whose number is in stalls"""
+
+    def __init__(self, *args, **kwargs):
+        MockBroker.__init__(self, *args, **kwargs)
+        self.httpServer.handle_error = lambda request, address: None
+        self.stalls = set()
+        self.stall = 1.0
+        self.requests = 0
+        self.requestsLock = Lock()
+
+    def beforeRequest(self):
+        with self.requestsLock:
+            self.requests += 1
+            stalled = self.requests in self.stalls
+        if stalled:
+            time.sleep(self.stall)
+
+
+# class
+class TestDeadline(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.broker = StallingBroker().start()
+        cls.path = cls.broker.configuration(TEMPLATE, os.path.join(cls.directory, "broker.jsap"))
+
+        # the first request imports requests, delaying it
+        SEPAClient(cls.path).query("MQTT_TOPICS")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.broker.stop()
+
+    def setUp(self):
+        self.broker.stalls = set()
+        self.broker.requests = 0
+
+    def test_deadline(self):
+        deadline = Deadline(0.05)
+        self.assertLessEqual(deadline.remaining(), 0.05)
+        deadline.check("rendering")
+        child = Deadline(1.0, parent = deadline)
+        self.assertLessEqual(child.remaining(), 0.05)
+        time.sleep(0.06)
+        self.assertEqual(deadline.remaining(), 0.0)
+        self.assertRaises(DeadlineExceededException, child.check, "send")
+        self.assertIsNone(Deadline().remaining())
+        self.assertIsNone(makeDeadline(None, None))
+        self.assertIs(makeDeadline(deadline, 1.0), deadline)
+        self.assertAlmostEqual(makeDeadline(None, 2.0).remaining(), 2.0, places = 1)
+
+    def test_cancel(self):
+        parent = Deadline()
+        child = Deadline(parent = parent)
+        parent.cancel()
+        self.assertTrue(child.isCancelled())
+        self.assertTrue(child.wait(1.0))
+        self.assertRaises(RequestCancelledException, child.check, "send")
+        client = SEPAClient(self.path)
+        self.assertRaises(RequestCancelledException, client.query, "MQTT_TOPICS", deadline = parent)
+        self.assertEqual(self.broker.requests, 0)
+
+    def test_stalledQuery(self):
+        client = SEPAClient(self.path, timeout = 0.2)
+        self.broker.stalls = {1}
+        start = time.monotonic()
+        self.assertRaises(DeadlineExceededException, client.query, "MQTT_TOPICS")
+        self.assertLess(time.monotonic() - start, 0.8)
+        status, results = client.query("MQTT_TOPICS")
+        self.assertTrue(status)
+
+    def test_stalledInternalRequests(self):
+        client = SEPAClient(self.path, timeout = 0.2)
+        self.broker.stalls = {1, 2}
+        start = time.monotonic()
+        self.assertRaises(DeadlineExceededException, list, client.queryPaged("MQTT_TOPICS", pageSize = 100, serverLimit = 100))
+        self.assertRaises(DeadlineExceededException, client.queryStream, "MQTT_TOPICS")
+        self.assertLess(time.monotonic() - start, 1.6)
+        status, results = client.queryStream("MQTT_TOPICS")
+        self.assertTrue(status)
+        self.assertEqual(len(list(results)), 10)
+        results.close()
+
+    def test_stalledUpdate(self):
+        client = SEPAClient(self.path)
+        self.broker.stalls = {1}
+        self.assertRaises(DeadlineExceededException, client.update, "UPDATE_OBSERVATION_VALUE", {"observation": "arces-monitor:Observation1", "value": "1"}, deadline = 0.2)
+        status, results = client.updateMany("UPDATE_OBSERVATION_VALUE", [{"observation": "arces-monitor:Observation1", "value": "1"}], deadline = 5.0)
+        self.assertTrue(status)
+
+    def test_limiter(self):
+        limiter = AdaptiveLimiter(initialLimit = 1, maxLimit = 1)
+        client = SEPAClient(self.path, limiter = limiter)
+        self.assertIsNotNone(limiter.acquire())
+        self.assertRaises(DeadlineExceededException, client.update, "UPDATE_OBSERVATION_VALUE", {"observation": "arces-monitor:Observation1", "value": "1"}, deadline = 0.1)
+        self.assertEqual(self.broker.requests, 0)
+
+    def test_hedging(self):
+        client = SEPAClient(self.path)
+        hedger = QueryHedger(client, initialDelay = 0.05)
+        self.broker.stalls = {1}
+        start = time.monotonic()
+        status, results = hedger.query("MQTT_TOPICS", deadline = 5.0)
+        self.assertTrue(status)
+        self.assertEqual(len(results["results"]["bindings"]), 10)
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(hedger.hedged, 1)
+        self.assertEqual(hedger.wins, 1)
+
+        # fast responses are not hedged
+        for i in range(5):
+            status, results = hedger.query("MQTT_TOPICS")
+            self.assertTrue(status)
+        self.assertEqual(hedger.hedged, 1)
+
+    def test_hedgingDeadline(self):
+        client = SEPAClient(self.path)
+        hedger = QueryHedger(client, initialDelay = 0.05)
+        self.broker.stalls = {1, 2}
+        start = time.monotonic()
+        self.assertRaises(DeadlineExceededException, hedger.query, "MQTT_TOPICS", deadline = 0.3)
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(hedger.hedged, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.FederatedClient import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+
+class SlowBroker(MockBroker):
+
+    """A broker answering after delay seconds (to clients that may have given up)"""
+
+    delay = 1.0
+
+    def __init__(self, *args, **kwargs):
+        MockBroker.__init__(self, *args, **kwargs)
+        self.httpServer.handle_error = lambda request, address: None
+
+    def beforeRequest(self):
+        time.sleep(self.delay)
+
+
+class FakeClient:
+
+    """A client recording the updates"""
+
+    def __init__(self):
+        self.updates = []
+
+    def update(self, updateName, forcedBindings = {}, secure = False):
+        self.updates.append(forcedBindings)
+        return True, "{}"
+
+    def updateMany(self, updateName, bindingsList, secure = False):
+        self.updates.extend(bindingsList)
+        return True, "{}"
+
+
+# class
+class TestFederatedClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.brokers = [MockBroker(rows = 30).start(), MockBroker(rows = 50).start(), SlowBroker(rows = 100).start()]
+
+    @classmethod
+    def tearDownClass(cls):
+        for broker in cls.brokers:
+            broker.stop()
+
+    def federation(self, count, **options):
+        files = [broker.configuration(TEMPLATE, os.path.join(self.directory, "b%s.jsap" % i)) for i, broker in enumerate(self.brokers[:count])]
+        return FederatedClient(files, names = ["a", "b", "slow"][:count], **options)
+
+    def test_00_merge(self):
+        federation = self.federation(2)
+        results = federation.query("OBSERVATIONS_TOPICS")
+        bindings = list(results)
+        self.assertEqual(len(bindings), 50)
+        self.assertEqual((results.rows, results.duplicates), (50, 30))
+        self.assertEqual(sorted(results.completed), ["a", "b"])
+        self.assertEqual(results.variables, ["s", "p", "o"])
+
+        results = federation.query("OBSERVATIONS_TOPICS", distinct = False)
+        self.assertEqual(len(list(results)), 80)
+
+    def test_01_deadline(self):
+        federation = self.federation(3, deadlines = {"slow": 0.3})
+        start = time.perf_counter()
+        results = federation.query("OBSERVATIONS_TOPICS")
+        self.assertEqual(len(list(results)), 50)
+        self.assertLess(time.perf_counter() - start, 0.9)
+        self.assertEqual(results.timedOut, ["slow"])
+        self.assertEqual(sorted(results.completed), ["a", "b"])
+
+        # failures are reported, the other brokers still answer
+        self.brokers[1].queryPath = "/missing"
+        try:
+            results = federation.query("OBSERVATIONS_TOPICS", deadline = 5)
+            self.assertEqual(len(list(results)), 100)
+            self.assertEqual(list(results.failed), ["b"])
+        finally:
+            self.brokers[1].queryPath = "/query"
+
+    def test_02_partitions(self):
+        clients = [FakeClient() for i in range(4)]
+        federation = FederatedClient(clients, names = "abcd", keys = {"UPDATE_OBSERVATION_VALUE": ["observation"]})
+        bindingsList = [{"observation": "ex:o%s" % (i % 20), "value": str(i)} for i in range(200)]
+        for bindings in bindingsList[:100]:
+            self.assertTrue(federation.update("UPDATE_OBSERVATION_VALUE", bindings)[0])
+        status, results = federation.updateMany("UPDATE_OBSERVATION_VALUE", bindingsList[100:])
+        self.assertTrue(status)
+        self.assertEqual(sum(len(client.updates) for client in clients), 200)
+        for client in clients:
+            observations = set(bindings["observation"] for bindings in client.updates)
+            for other in clients:
+                if other is not client:
+                    self.assertFalse(observations & set(bindings["observation"] for bindings in other.updates))
+
+        # updates without keys go to all the brokers
+        status, results = federation.update("OTHER_UPDATE", {})
+        self.assertEqual(sorted(results), ["a", "b", "c", "d"])
+        with self.assertRaises(ValueError):
+            federation.update("UPDATE_OBSERVATION_VALUE", {"value": "1"})
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+# path modification
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+# the heavy dependencies that must be loaded on demand
+HEAVY = ("requests", "websocket", "yaml", "asyncio", "ssl")
+
+
+def loadedAfter(statements):
+
+    """Runs the statements in a fresh interpreter, returns the heavy modules loaded"""
+
+    script = "import sys, json\nsys.path.insert(0, %r)\n%s\nprint(json.dumps([m for m in %r if m in sys.modules]))" % (ROOT, statements, HEAVY)
+    return json.loads(subprocess.check_output([sys.executable, "-c", script]))
+
+
+# class
+class TestImportTime(unittest.TestCase):
+
+    def test_00_import_loads_nothing_heavy(self):
+        self.assertEqual(loadedAfter("import sepy.SEPAClient"), [])
+
+    def test_01_jsap_configuration_does_not_load_yaml(self):
+        jsap = os.path.join(ROOT, "examples", "mqtt.jsap")
+        statements = "from sepy.SEPAClient import *\nc = SEPAClient(%r)\nc.configuration.getSparql(True, 'MQTT_TOPICS', {})" % jsap
+        self.assertEqual(loadedAfter(statements), [])
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import socket
+import tempfile
+import unittest
+import urllib.request
+from threading import Event
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.Metrics import *
+from sepy.SEPAClient import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+
+class NotifiedHandler:
+
+    def __init__(self):
+        self.event = Event()
+
+    def handle(self, added, removed):
+        self.event.set()
+
+
+# class
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_00_counters_and_histograms(self):
+        self.registry.inc("requests_total", kind = "query", name = "Q")
+        self.registry.inc("requests_total", 2, kind = "query", name = "Q")
+        self.registry.inc("requests_total", kind = "update", name = "U")
+        for value in (0.0001, 0.002, 0.002, 0.3):
+            self.registry.observe("request_seconds", value, name = "Q")
+        snapshot = self.registry.snapshot()
+        values = {tuple(sorted(m["labels"].items())): m["value"] for m in snapshot["requests_total"]}
+        self.assertEqual(values[(("kind", "query"), ("name", "Q"))], 3)
+        self.assertEqual(snapshot["request_seconds"][0]["value"]["count"], 4)
+        histogram = self.registry.get(Histogram, "request_seconds", (("name", "Q"),))
+        self.assertEqual(histogram.quantile(0.5), 0.0025)
+        self.assertEqual(histogram.quantile(1.0), 0.5)
+
+    def test_01_prometheus(self):
+        self.registry.inc("requests_total", name = 'a"b')
+        self.registry.observe("request_seconds", 0.2, name = "Q")
+        self.registry.set("queue_depth", 5, alias = "x")
+        text = self.registry.prometheusText()
+        self.assertIn('requests_total{name="a\\"b"} 1', text)
+        self.assertIn('request_seconds_bucket{name="Q",le="0.25"} 1', text)
+        self.assertIn('request_seconds_bucket{name="Q",le="+Inf"} 1', text)
+        self.assertIn('request_seconds_count{name="Q"} 1', text)
+        self.assertIn("# TYPE queue_depth gauge", text)
+
+        # HTTP endpoint
+        port = self.registry.startHttpServer(0)
+        try:
+            body = urllib.request.urlopen("http://127.0.0.1:%s/metrics" % port).read().decode()
+            self.assertIn('queue_depth{alias="x"} 5', body)
+        finally:
+            self.registry.stopHttpServer()
+
+    def test_02_client(self):
+        broker = MockBroker().start()
+        try:
+            kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(tempfile.mkdtemp(), "mqtt.jsap")), metrics = self.registry)
+            self.assertTrue(kp.query("MQTT_TOPICS")[0])
+            self.assertTrue(kp.update("UPDATE_OBSERVATION_VALUE", {"observation": "arces-monitor:Observation1", "value": "1"})[0])
+            handler = NotifiedHandler()
+            subid = kp.subscribe("MQTT_TOPICS", "topics", handler)
+            self.assertTrue(handler.event.wait(5))
+            kp.unsubscribe(subid)
+
+            # a request that cannot reach the broker
+            with socket.socket() as closed:
+                closed.bind(("localhost", 0))
+                kp.configuration.queryURI = "http://localhost:%d/query" % closed.getsockname()[1]
+            self.assertRaises(Exception, kp.query, "MQTT_TOPICS")
+        finally:
+            broker.stop()
+
+        snapshot = self.registry.snapshot()
+        values = lambda name: {tuple(sorted(m["labels"].items())): m["value"] for m in snapshot.get(name, [])}
+        query = (("kind", "query"), ("name", "MQTT_TOPICS"))
+        update = (("kind", "update"), ("name", "UPDATE_OBSERVATION_VALUE"))
+        self.assertEqual(values("sepy_requests_total"), {query: 1, update: 1})
+        self.assertEqual(values("sepy_errors_total"), {query: 1})
+        self.assertGreater(values("sepy_bytes_sent_total")[query], 0)
+        self.assertGreater(values("sepy_bytes_received_total")[query], values("sepy_bytes_received_total")[update])
+        self.assertEqual(values("sepy_notifications_total"), {(("alias", "topics"),): 1})
+        self.assertGreater(values("sepy_notification_bytes_total")[(("alias", "topics"),)], 0)
+        self.assertIn('sepy_requests_total{kind="update",name="UPDATE_OBSERVATION_VALUE"} 1', self.registry.prometheusText())
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import json
+import re
+import tempfile
+import unittest
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.MqttIngestion import *
+from sepy.UpdateSuppressor import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+
+# class
+class TestMqttIngestion(unittest.TestCase):
+
+    def setUp(self):
+        with open(TEMPLATE) as stream:
+            self.mapper = MqttMapper(json.load(stream)["extended"])
+
+    def test_00_regex_topics(self):
+        bindings = self.mapper.bindings("pepoli:6lowpan:network", b" | ID: NODO2 | Temperature: 21.50 | Humidity: 45.20 | Pressure: 1013.25\n")
+        self.assertEqual([(b["observation"], b["value"]) for b in bindings],
+                         [("arces-monitor:Pepoli-6lowpan-Nodo2-Temperature", "21.50"),
+                          ("arces-monitor:Pepoli-6lowpan-Nodo2-Humidity", "45.20"),
+                          ("arces-monitor:Pepoli-6lowpan-Nodo2-Pressure", "1013.25")])
+
+    def test_01_json_and_plain_topics(self):
+        bindings = self.mapper.bindings("ground/lora/moisture", b'{"nodeId": "device2", "moistureValue": 31}')
+        self.assertEqual([(b["observation"], b["value"]) for b in bindings], [("arces-monitor:ground-lora-moisture-device2", "31")])
+        bindings = self.mapper.bindings("arces/servers/ares/ercole/cpu/core-3/temperature", b"52.0")
+        self.assertEqual([(b["observation"], b["value"]) for b in bindings], [("arces-monitor:ServerErcoleCore3", "52.0")])
+
+    def test_02_unmapped_and_malformed(self):
+        self.assertEqual(self.mapper.bindings("somewhere/else", b"1"), [])
+        self.assertEqual(self.mapper.bindings("ground/lora/moisture", b"not json"), [])
+        self.assertEqual(self.mapper.unmapped, 1)
+
+    def test_03_batched_updates(self):
+        broker = MockBroker().start()
+        try:
+            kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(tempfile.mkdtemp(), "mqtt.jsap")))
+            ingestion = MqttIngestion(kp, batchSize = 10)
+            for i in range(35):
+                ingestion.submit("arces/servers/ares/ercole/cpu/core-1/temperature", str(i).encode())
+            ingestion.start()
+            self.assertTrue(ingestion.flush(10))
+            ingestion.stop()
+            self.assertEqual(ingestion.sent, 35)
+            self.assertEqual(ingestion.batches, 4)
+            self.assertEqual(broker.updates, 4)
+        finally:
+            broker.stop()
+
+    def test_04_bounded_queue(self):
+        kp = type("FakeClient", (), {"configuration": type("FakeConfiguration", (), {"configurationDict": {}})()})()
+        ingestion = MqttIngestion(kp, mapper = self.mapper, maxQueue = 5, overflow = "drop")
+        for i in range(8):
+            ingestion.submit("arces/servers/ares/ercole/cpu/core-1/temperature", b"1")
+        self.assertEqual(len(ingestion.queue), 5)
+        self.assertEqual(ingestion.dropped, 3)
+
+        # the dropped values are not suppressed when they come again
+        suppressor = UpdateSuppressor(kp)
+        ingestion = MqttIngestion(kp, mapper = self.mapper, maxQueue = 1, overflow = "drop", suppressor = suppressor)
+        ingestion.submit("arces/servers/ares/ercole/cpu/core-1/temperature", b"1")
+        ingestion.submit("arces/servers/ares/ercole/cpu/core-1/temperature", b"2")
+        self.assertEqual(ingestion.dropped, 1)
+        ingestion.queue.clear()
+        ingestion.submit("arces/servers/ares/ercole/cpu/core-1/temperature", b"2")
+        self.assertEqual([bindings["value"] for bindings in ingestion.queue], ["2"])
+
+        # as the ones discarded by stop
+        ingestion.stop(flush = False)
+        ingestion.submit("arces/servers/ares/ercole/cpu/core-1/temperature", b"2")
+        self.assertEqual([bindings["value"] for bindings in ingestion.queue], ["2"])
+        self.assertEqual(suppressor.suppressed, 0)
+
+
+    def test_05_possessive(self):
+        self.assertEqual(removePossessive(r"\d++.(?>a|b)[++]x*+y{2}+z+?w??\++"), r"\d+.(?:a|b)[++]x*y{2}z+?w??\++")
+        self.assertEqual(removePossessive(r"[]+]*+[^]a]?+"), r"[]+]*[^]a]?")
+
+        # the regexes of the template match the same values without the possessive quantifiers
+        with open(TEMPLATE) as stream:
+            extended = json.load(stream)["extended"]
+        payload = " | ID: NODO2 | Temperature: 21.50 | Humidity: 45.20 | Pressure: 1013.25\n"
+        for patterns in extended["regexTopics"].values():
+            for pattern in patterns:
+                if "++" in pattern:
+                    rewritten = re.compile(removePossessive(JAVA_NAMED_GROUP.sub(r'(?P<\1>', pattern)))
+                    self.assertNotIn("++", rewritten.pattern)
+                    self.assertEqual(rewritten.search(payload).groupdict(), compileRegex(pattern).search(payload).groupdict())
+
+# main
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import json
+import time
+import tempfile
+import unittest
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+from sepy.NotificationRecorder import *
+
+
+# handler recording the notifications
+class RecordingHandler:
+
+    def __init__(self):
+        self.notifications = []
+
+    def handle(self, added, removed):
+        self.notifications.append((added, removed))
+
+
+# class
+class TestNotificationRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def notification(self, spuid, sequence):
+        return json.dumps({"notification": {"spuid": spuid, "sequence": sequence, "addedResults": {"results": {"bindings": [sequence]}}, "removedResults": None}})
+
+    def test_00_segments(self):
+        recorder = NotificationRecorder(self.directory.name, segmentSize = 256)
+        for i in range(20):
+            recorder.record(self.notification("a", i), timestamp = 1000.0 + i)
+        recorder.close()
+        self.assertGreater(len(segmentFiles(self.directory.name)), 1)
+
+        # records are read back in order
+        records = list(NotificationReplayer(self.directory.name).records())
+        self.assertEqual(len(records), 20)
+        self.assertEqual([t for t, m in records], [1000.0 + i for i in range(20)])
+
+        # a new recorder appends new segments
+        recorder = NotificationRecorder(self.directory.name, segmentSize = 256)
+        recorder.record(self.notification("a", 20))
+        recorder.close()
+        self.assertEqual(len(list(NotificationReplayer(self.directory.name).records())), 21)
+
+    def test_01_replay(self):
+        recorder = NotificationRecorder(self.directory.name)
+        for i in range(10):
+            recorder.record(self.notification("a" if i % 2 else "b", i), timestamp = 1000.0 + i * 0.01)
+        recorder.record('{"unsubscribed":{"spuid":"a"}}', timestamp = 1000.1)
+        recorder.close()
+
+        default, handler = RecordingHandler(), RecordingHandler()
+        replayer = NotificationReplayer(self.directory.name, default)
+        replayer.register("a", handler)
+        stats = replayer.replay(speed = 10)
+        self.assertEqual(stats["messages"], 11)
+        self.assertEqual(stats["notifications"], 10)
+        self.assertEqual([n[0]["results"]["bindings"][0] for n in handler.notifications], [1, 3, 5, 7, 9])
+        self.assertEqual(len(default.notifications), 5)
+        self.assertGreaterEqual(stats["seconds"], 0.009)
+
+
+    def test_02_flush(self):
+        recorder = NotificationRecorder(self.directory.name)
+        recorder.record(self.notification("a", 0))
+        self.assertEqual(len(list(NotificationReplayer(self.directory.name).records())), 1)
+        recorder.close()
+
+        # the buffered records are written within flushInterval
+        recorder = NotificationRecorder(self.directory.name, flushInterval = 0.05)
+        for i in range(3):
+            recorder.record(self.notification("a", i + 1))
+        time.sleep(0.3)
+        self.assertEqual(len(list(NotificationReplayer(self.directory.name).records())), 4)
+        recorder.close()
+
+    def test_03_segment_names(self):
+        for name in ("notifications-00000009.seg", "notifications-old.seg", "notifications-123456789.seg.bak"):
+            with open(os.path.join(self.directory.name, name), "wb") as stream:
+                stream.write(SEGMENT_MAGIC)
+        self.assertEqual([os.path.basename(path) for path in segmentFiles(self.directory.name)], ["notifications-00000009.seg"])
+        recorder = NotificationRecorder(self.directory.name)
+        recorder.record(self.notification("a", 0))
+        recorder.close()
+        self.assertEqual(recorder.segmentNumber, 10)
+        self.assertEqual(segmentNumber(segmentFiles(self.directory.name)[-1]), 10)
+
+# main
+if __name__ == "__main__":
+    unittest.main()
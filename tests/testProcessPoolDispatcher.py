@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import unittest
+from threading import Lock
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+from sepy.ProcessPoolDispatcher import *
+
+
+# handler run by the workers
+class SquareHandler:
+
+    def __init__(self, offset):
+        self.offset = offset
+
+    def handle(self, added, removed):
+        if added == "crash":
+            os._exit(1)
+        if added == "fail":
+            raise ValueError("failed")
+        return added * added + self.offset
+
+
+# parent collecting results and errors
+class Parent:
+
+    def __init__(self):
+        self.lock = Lock()
+        self.results = []
+        self.errors = []
+
+    def handleResult(self, result):
+        with self.lock:
+            self.results.append(result)
+
+    def handleError(self, error):
+        with self.lock:
+            self.errors.append(error)
+
+
+# class
+class TestProcessPoolDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = ProcessPoolDispatcher(workers = 2, batchSize = 4)
+        self.parent = Parent()
+
+    def tearDown(self):
+        self.dispatcher.close()
+
+    def test_dispatch(self):
+        handler = self.dispatcher.handler(SquareHandler, (1,), self.parent)
+        for i in range(20):
+            handler.handle(i, None)
+        handler.handle("fail", None)
+        self.assertTrue(handler.join(10))
+
+        # the order of the notifications is preserved
+        self.assertEqual(self.parent.results, [i * i + 1 for i in range(20)])
+        self.assertEqual(len(self.parent.errors), 1)
+        self.assertIsInstance(self.parent.errors[0], ValueError)
+        self.assertEqual(handler.processed, 21)
+        self.assertEqual(handler.pending, 0)
+
+    def test_crash(self):
+        handler = self.dispatcher.handler(SquareHandler, (0,), self.parent)
+        handler.handle(1, None)
+        self.assertTrue(handler.join(10))
+
+        # the batch of the dead worker fails, the pool is replaced for the next ones
+        for notification in ("crash", 2, 3, 4, 5, 6):
+            handler.handle(notification, None)
+        self.assertTrue(handler.join(10))
+        self.assertEqual(handler.inFlight, 0)
+        self.assertEqual(handler.pending, 0)
+        self.assertEqual(self.dispatcher.restarts, 1)
+        self.assertEqual(self.parent.results[0], 1)
+        self.assertEqual(self.parent.results[-2:], [25, 36])
+        self.assertEqual(len(self.parent.results) + len(self.parent.errors), 7)
+        self.assertTrue(all(isinstance(error, BrokenProcessPool) for error in self.parent.errors))
+
+        # the new pool keeps working
+        handler.handle(7, None)
+        self.assertTrue(handler.join(10))
+        self.assertEqual(self.parent.results[-1], 49)
+
+    def test_close(self):
+        handler = self.dispatcher.handler(SquareHandler, (0,), self.parent)
+        handler.handle(2, None)
+        self.assertTrue(handler.join(10))
+        self.dispatcher.close()
+
+        # the notifications received after close are reported, not lost silently
+        handler.handle(3, None)
+        self.assertTrue(handler.join(1))
+        self.assertEqual(self.parent.results, [4])
+        self.assertEqual(len(self.parent.errors), 1)
+        self.assertEqual(handler.dropped, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
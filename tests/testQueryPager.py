@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import re
+import sys
+import time
+import tempfile
+import unittest
+from threading import Lock
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.SEPAClient import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+XSD_INTEGER = "http://www.w3.org/2001/XMLSchema#integer"
+QUERY = "PREFIX ex: <http://example.org/>\nSELECT ?n WHERE { ?s ex:n ?n }"
+
+
+class PagedStore:
+
+    """A fake client answering the page queries from a list of results, with a delay per row"""
+
+    def __init__(self, rows, delay = 0.0, cap = None):
+        self.cap = cap
+        self.timeout = None
+        self.results = [{"n": {"type": "literal", "datatype": XSD_INTEGER, "value": str(i)}} for i in range(rows)]
+        self.delay = delay
+        self.queries = []
+        self.lock = Lock()
+        self.configuration = type("FakeConfiguration", (), {"getQuery": lambda configuration, name, bindings: QUERY})()
+
+    def sendQuery(self, queryName, sparql, secure, sent, deadline = None):
+        with self.lock:
+            self.queries.append(sparql)
+        limit = int(re.search(r'LIMIT (\d+)', sparql).group(1))
+        offset = re.search(r'OFFSET (\d+)', sparql)
+        after = re.search(r'FILTER\(\?n > "(\d+)"', sparql)
+        results = self.results
+        if after is not None:
+            results = [r for r in results if int(r["n"]["value"]) > int(after.group(1))]
+        start = int(offset.group(1)) if offset is not None else 0
+        page = results[start:start + min(limit, self.cap or limit)]
+        time.sleep(self.delay * len(page))
+        return True, {"head": {"vars": ["n"]}, "results": {"bindings": page}}
+
+
+# class
+class TestQueryPager(unittest.TestCase):
+
+    def values(self, pager):
+        return [int(binding["n"]["value"]) for binding in pager]
+
+    def test_00_page_queries(self):
+        self.assertEqual(pageQuery(QUERY, 10, 20), QUERY + " LIMIT 10 OFFSET 20")
+        self.assertEqual(pageQuery(QUERY + " LIMIT 5", 10, 0),
+                         "PREFIX ex: <http://example.org/>\nSELECT * WHERE { { SELECT ?n WHERE { ?s ex:n ?n } LIMIT 5 } } LIMIT 10 OFFSET 0")
+        after = {"type": "literal", "datatype": XSD_INTEGER, "value": "7"}
+        self.assertEqual(pageQuery(QUERY, 10, 0, "n", True, after),
+                         "PREFIX ex: <http://example.org/>\nSELECT * WHERE { { SELECT ?n WHERE { ?s ex:n ?n } } "
+                         "FILTER(?n > \"7\"^^<%s>) } ORDER BY ?n LIMIT 10" % XSD_INTEGER)
+        self.assertIn('FILTER(STR(?s) > "http://a/b")', pageQuery(QUERY, 10, 0, "s", True, {"type": "uri", "value": "http://a/b"}))
+
+    def test_01_offset_pages(self):
+        store = PagedStore(1050)
+        pager = QueryPager(store, "Q", pageSize = 100, prefetch = 3, targetSeconds = None)
+        self.assertEqual(self.values(pager), list(range(1050)))
+        self.assertEqual((pager.pages, pager.rows), (12, 1050))
+        self.assertEqual(store.queries[-1], QUERY + " LIMIT 50 OFFSET 1050")
+
+        # the last page is known with the limit of the broker
+        store = PagedStore(1050)
+        pager = QueryPager(store, "Q", pageSize = 100, prefetch = 3, targetSeconds = None, serverLimit = 100)
+        self.assertEqual(self.values(pager), list(range(1050)))
+        self.assertEqual(pager.pages, 11)
+        self.assertEqual(pager.variables, ["n"])
+
+    def test_02_keyset_pages(self):
+        store = PagedStore(250)
+        pager = QueryPager(store, "Q", pageSize = 100, orderBy = "n", keyset = True, targetSeconds = None)
+        self.assertEqual(self.values(pager), list(range(250)))
+        self.assertEqual(len(store.queries), 4)
+        self.assertNotIn("OFFSET", store.queries[-1])
+
+    def test_03_adaptive_page_size(self):
+        store = PagedStore(3000, delay = 0.00005)
+        pager = QueryPager(store, "Q", pageSize = 100, targetSeconds = 0.02, minPageSize = 10)
+        self.assertEqual(self.values(pager), list(range(3000)))
+        self.assertGreater(pager.pageSize, 200)
+        store = PagedStore(3000, delay = 0.0002)
+        pager = QueryPager(store, "Q", pageSize = 1000, targetSeconds = 0.02, minPageSize = 10)
+        self.assertEqual(self.values(pager), list(range(3000)))
+        self.assertLess(pager.pageSize, 250)
+
+    def test_04_server_limit(self):
+        for keyset in (False, True):
+            store = PagedStore(5000, cap = 500)
+            pager = QueryPager(store, "Q", pageSize = 1000, prefetch = 3, orderBy = "n" if keyset else None, keyset = keyset,
+                               targetSeconds = 0.01, maxPageSize = 4000)
+            self.assertEqual(self.values(pager), list(range(5000)))
+            self.assertEqual(pager.serverLimit, 500)
+            self.assertLessEqual(pager.pageSize, 500)
+
+    def test_05_broker(self):
+        broker = MockBroker(rows = 10).start()
+        try:
+            kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(tempfile.mkdtemp(), "mqtt.jsap")))
+            # the mock broker ignores LIMIT and OFFSET
+            pager = kp.queryPaged("OBSERVATIONS_TOPICS", pageSize = 100, serverLimit = 100)
+            self.assertEqual(len(list(pager)), 10)
+            self.assertEqual(pager.pages, 1)
+        finally:
+            broker.stop()
+
+    def test_06_last_short_page(self):
+
+        # the short last page is not taken for a limit of the broker
+        store = PagedStore(1050)
+        pager = QueryPager(store, "Q", pageSize = 100, targetSeconds = None)
+        self.assertEqual(self.values(pager), list(range(1050)))
+        self.assertEqual((pager.serverLimit, pager.pageSize), (None, 100))
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
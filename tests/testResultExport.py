@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import csv
+import sys
+import json
+import tempfile
+import unittest
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.ResultExport import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+# optional dependency
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def makeTypedResults(rows):
+
+    """Returns a result set with typed literals, IRIs, blank nodes and unbound variables"""
+
+    bindings = []
+    for i in range(rows):
+        binding = {"s": {"type": "uri", "value": "http://example.org/s%s" % i},
+                   "n": {"type": "literal", "datatype": XSD + "integer", "value": str(i)},
+                   "x": {"type": "literal", "datatype": XSD + "double", "value": "%s.5" % i},
+                   "t": {"type": "literal", "datatype": XSD + "dateTime", "value": "2020-01-01T00:00:%02dZ" % (i % 60)},
+                   "l": {"type": "literal", "xml:lang": "it", "value": "città, \"%s\"" % i}}
+        if i % 3 == 0:
+            binding["b"] = {"type": "bnode", "value": "b%s" % i}
+        bindings.append(binding)
+    bindings[-1]["n"]["value"] = "not a number"
+    return {"head": {"vars": ["s", "n", "x", "t", "l", "b"]}, "results": {"bindings": bindings}}
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+# class
+class TestResultExport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.broker = MockBroker().start()
+        cls.broker.queryResponse = json.dumps(makeTypedResults(250)).encode("utf-8")
+        cls.directory = tempfile.mkdtemp()
+        cls.kp = SEPAClient(cls.broker.configuration(TEMPLATE, os.path.join(cls.directory, "mqtt.jsap")))
+        cls.queryName = list(cls.kp.configuration.configurationDict["queries"])[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.broker.stop()
+
+    def test_00_result_stream(self):
+        data = json.dumps(makeTypedResults(20)).encode("utf-8")
+        expected = makeTypedResults(20)["results"]["bindings"]
+        for size in (1, 3, 64, len(data)):
+            stream = ResultStream(split(data, size))
+            self.assertEqual(stream.variables, ["s", "n", "x", "t", "l", "b"])
+            self.assertEqual(list(stream), expected)
+        stream = ResultStream(split(data, 7))
+        self.assertEqual([len(batch) for batch in stream.batches(8)], [8, 8, 4])
+
+    def test_01_ask_errors_and_truncation(self):
+        self.assertEqual(ResultStream([b'{"head": {}, "boolean": true}']).boolean, True)
+        self.assertEqual(ResultStream([b'{"error": {"message": "bad query"}}']).error, "bad query")
+        with self.assertRaises(ResultParsingException):
+            list(ResultStream(split(b'{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri"', 5)))
+
+    def test_02_csv(self):
+        path = os.path.join(self.directory, "results.csv")
+        status, stats = ResultExporter(self.kp, batchSize = 100, chunkSize = 1000).toCSV(self.queryName, path)
+        self.assertTrue(status)
+        self.assertEqual((stats["rows"], stats["batches"]), (250, 3))
+        with open(path, newline = "", encoding = "utf-8") as stream:
+            rows = list(csv.reader(stream))
+        self.assertEqual(rows[0], ["s", "n", "x", "t", "l", "b"])
+        self.assertEqual(rows[1], ["http://example.org/s0", "0", "0.5", "2020-01-01T00:00:00Z", "città, \"0\"", "_:b0"])
+        self.assertEqual(rows[2][5], "")
+        self.assertEqual(len(rows), 251)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_03_arrow_and_parquet(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+        exporter = ResultExporter(self.kp, batchSize = 100, chunkSize = 1000)
+        path = os.path.join(self.directory, "results.arrow")
+        status, stats = exporter.toArrow(self.queryName, path)
+        self.assertTrue(status)
+        self.assertEqual(stats["invalid"], 1)
+        reader = pyarrow.ipc.open_file(path)
+        self.assertEqual(reader.num_record_batches, 3)
+        table = reader.read_all()
+        self.assertEqual(str(table.schema.field("n").type), "int64")
+        self.assertEqual(str(table.schema.field("x").type), "double")
+        self.assertEqual(str(table.schema.field("t").type), "timestamp[us, tz=UTC]")
+        self.assertEqual(str(table.schema.field("s").type), "string")
+        self.assertEqual(table.column("n").to_pylist()[:3], [0, 1, 2])
+        self.assertIsNone(table.column("n").to_pylist()[-1])
+        path = os.path.join(self.directory, "results.parquet")
+        status, stats = exporter.toParquet(self.queryName, path)
+        self.assertTrue(status)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.num_rows, 250)
+        self.assertEqual(table.column("x").to_pylist()[1], 1.5)
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import ssl
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.Metrics import MetricsRegistry
+from sepy.Tracing import RecordingTracer
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+
+class TlsBroker(MockBroker):
+
+    """A broker serving the secure endpoints over TLS with a self-signed certificate"""
+
+    def __init__(self, certfile, keyfile):
+        MockBroker.__init__(self)
+        self.queryPath = "/secure/query"
+        self.updatePath = "/secure/update"
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self.httpServer.socket = context.wrap_socket(self.httpServer.socket, server_side = True)
+        self.httpServer.handle_error = lambda request, address: None
+
+    def configuration(self, template, path):
+        MockBroker.configuration(self, template, path)
+        with open(path) as stream:
+            jsap = json.load(stream)
+        jsap["sparql11protocol"]["query"]["path"] = "/query"
+        jsap["sparql11protocol"]["update"]["path"] = "/update"
+        jsap["sparql11seprotocol"]["security"]["port"] = self.httpPort
+        with open(path, "w") as stream:
+            json.dump(jsap, stream)
+        return path
+
+
+# class
+@unittest.skipIf(shutil.which("openssl") is None, "openssl is needed to create a certificate")
+class TestSecureTransport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.certfile = os.path.join(cls.directory, "cert.pem")
+        cls.keyfile = os.path.join(cls.directory, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-subj", "/CN=localhost",
+                        "-addext", "subjectAltName=DNS:localhost", "-days", "1",
+                        "-keyout", cls.keyfile, "-out", cls.certfile],
+                       check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+        cls.broker = TlsBroker(cls.certfile, cls.keyfile).start()
+        cls.queryURI = "https://localhost:%s/secure/query" % cls.broker.httpPort
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.broker.stop()
+        shutil.rmtree(cls.directory)
+
+    def post(self, transport):
+        return transport.post(self.queryURI, "SELECT * WHERE { ?s ?p ?o }", {"Content-Type": "application/sparql-query"})
+
+    def test_verification(self):
+        transport = SecureTransport()
+        with self.assertRaises(ssl.SSLError):
+            self.post(transport)
+        transport.close()
+
+    def test_keepAlive(self):
+        transport = SecureTransport(cafile = self.certfile)
+        for i in range(5):
+            status, text = self.post(transport)
+            self.assertEqual(status, 200)
+            self.assertEqual(len(json.loads(text)["results"]["bindings"]), 10)
+        self.assertEqual(transport.requests, 5)
+        self.assertEqual(transport.reused, 4)
+        self.assertEqual(transport.handshakes, 1)
+        transport.close()
+
+    def test_resumption(self):
+        metrics = MetricsRegistry()
+        transport = SecureTransport(cafile = self.certfile, keepAlive = False, metrics = metrics)
+        for i in range(4):
+            status, text = self.post(transport)
+            self.assertEqual(status, 200)
+        self.assertEqual(transport.reused, 0)
+        self.assertEqual(transport.handshakes, 4)
+        self.assertEqual(transport.resumed, 3)
+        self.assertIn('sepy_tls_handshakes_total{resumed="true"} 3', metrics.prometheusText())
+
+    def test_client(self):
+        jsap = self.broker.configuration(TEMPLATE, os.path.join(self.directory, "broker.jsap"))
+        ysk = os.path.join(self.directory, "client.ysk")
+        with open(ysk, "w") as stream:
+            stream.write("security:\n  client_id: test\n  client_secret: Basic dGVzdA==\n  jwt: token\n")
+        transport = SecureTransport(cafile = self.certfile)
+        client = SEPAClient(jsap, yskFile = ysk, transport = transport)
+        updates = self.broker.updates
+        status, results = client.query("MQTT_TOPICS", secure = True)
+        self.assertTrue(status)
+        self.assertEqual(len(results["results"]["bindings"]), 10)
+        status, results = client.update("UPDATE_OBSERVATION_VALUE", {"observation": "http://example.org/o", "value": "1"}, secure = True)
+        self.assertTrue(status)
+        self.assertEqual(self.broker.updates, updates + 1)
+        self.assertEqual(transport.handshakes, 1)
+        transport.close()
+
+
+    def test_tracer(self):
+        jsap = self.broker.configuration(TEMPLATE, os.path.join(self.directory, "traced.jsap"))
+        ysk = os.path.join(self.directory, "traced.ysk")
+        with open(ysk, "w") as stream:
+            stream.write("security:\n  client_id: test\n  client_secret: Basic dGVzdA==\n  jwt: token\n")
+        tracer = RecordingTracer()
+        transport = SecureTransport(cafile = self.certfile)
+        client = SEPAClient(jsap, yskFile = ysk, transport = transport, tracer = tracer)
+        status, results = client.query("MQTT_TOPICS", secure = True)
+        self.assertTrue(status)
+
+        # the secure requests report the same phases as the unsecure ones
+        self.assertEqual([span[0] for span in tracer.spans], ["render", "firstByte", "send", "decode"])
+        phases = {span[0]: span for span in tracer.spans}
+        self.assertEqual(phases["firstByte"][3]["status"], 200)
+        self.assertEqual(phases["firstByte"][1], phases["send"][1])
+        self.assertLessEqual(phases["firstByte"][2], phases["send"][2])
+        transport.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import time
+import unittest
+import threading
+import multiprocessing
+from multiprocessing import resource_tracker
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+from sepy.SharedMemoryFanout import *
+import sepy.SharedMemoryFanout as fanout
+
+
+class SlowSlot:
+
+    """The layout of the reader slots, slow to read to widen the races between the readers"""
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.size = layout.size
+
+    def unpack_from(self, buffer, offset = 0):
+        values = self.layout.unpack_from(buffer, offset)
+        time.sleep(0.01)
+        return values
+
+    def pack_into(self, buffer, offset, *values):
+        self.layout.pack_into(buffer, offset, *values)
+
+
+# reader attached in another process
+def attach(name, barrier, published, queue):
+    fanout.SLOT = SlowSlot(fanout.SLOT)
+    unregistered = []
+    unregister = resource_tracker.unregister
+    resource_tracker.unregister = lambda name, rtype: (unregistered.append((name, rtype)), unregister(name, rtype))
+    barrier.wait()
+    reader = NotificationReader(name)
+    queue.put(("slot", reader.slot, unregistered, reader.shm._name))
+    published.wait(10)
+    queue.put(("read", reader.slot, reader.read(5)))
+    reader.close()
+
+
+# reader exiting without releasing its slot
+def vanish(name):
+    NotificationReader(name)
+    os._exit(0)
+
+
+# class
+class TestSharedMemoryFanout(unittest.TestCase):
+
+    def setUp(self):
+        self.publisher = NotificationPublisher(capacity = 256, maxReaders = 2)
+
+    def tearDown(self):
+        self.publisher.close()
+
+    def test_00_publish_and_read(self):
+        reader = NotificationReader(self.publisher.name)
+        self.assertIsNone(reader.read())
+        for i in range(20):
+            self.publisher.handle({"results": {"bindings": [i]}}, None)
+            notification = reader.read()
+            self.assertEqual(notification["addedResults"]["results"]["bindings"], [i])
+        self.assertEqual(reader.lost, 0)
+        reader.close()
+
+    def test_01_independent_cursors(self):
+        r1 = NotificationReader(self.publisher.name)
+        r2 = NotificationReader(self.publisher.name)
+        self.assertNotEqual(r1.slot, r2.slot)
+        self.publisher.publish(b'{"error":"a"}')
+        self.publisher.publish(b'{"error":"b"}')
+        self.assertEqual(r1.read()["error"], "a")
+        self.assertEqual(r1.read()["error"], "b")
+        self.assertEqual(r2.read()["error"], "a")
+        r1.close()
+        r2.close()
+
+    def test_02_slow_reader(self):
+        reader = NotificationReader(self.publisher.name)
+        for i in range(10):
+            self.publisher.publish(b'{"error":"' + b"x" * 30 + b'"}')
+            if i == 4:
+                self.assertEqual(self.publisher.slowReaders(0.5)[0][0], reader.slot)
+        self.assertIsNone(reader.read())
+        self.assertEqual(reader.lost, 1)
+        self.publisher.publish(b'{"error":"y"}')
+        self.assertEqual(reader.read()["error"], "y")
+        reader.close()
+
+    def test_03_processes(self):
+        publisher = NotificationPublisher(capacity = 4096, maxReaders = 4)
+        barrier = multiprocessing.Barrier(4)
+        published = multiprocessing.Event()
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target = attach, args = (publisher.name, barrier, published, queue)) for i in range(4)]
+        try:
+            for process in processes:
+                process.start()
+
+            # the readers attaching at the same time take different slots
+            attached = [queue.get(timeout = 10) for process in processes]
+            self.assertEqual(sorted(message[1] for message in attached), [0, 1, 2, 3])
+            self.assertRaises(SlowReaderException, NotificationReader, publisher.name)
+
+            # the readers of the other processes do not own the segment
+            for message in attached:
+                self.assertEqual(message[2], [(message[3], "shared_memory")])
+            publisher.handle({"results": {"bindings": [1]}}, None)
+            published.set()
+            for process in processes:
+                message = queue.get(timeout = 10)
+                self.assertEqual(message[2]["addedResults"]["results"]["bindings"], [1])
+            for process in processes:
+                process.join(10)
+                self.assertEqual(process.exitcode, 0)
+
+            # the segment survives the readers, whose slots are free again
+            reader = NotificationReader(publisher.name)
+            self.assertEqual(reader.slot, 0)
+            publisher.publish(b'{"error":"z"}')
+            self.assertEqual(reader.read()["error"], "z")
+            reader.close()
+        finally:
+            publisher.close()
+
+    def test_04_exited_readers(self):
+        process = multiprocessing.Process(target = vanish, args = (self.publisher.name,))
+        process.start()
+        process.join(10)
+        for i in range(5):
+            self.publisher.publish(b'{"error":"' + b"x" * 30 + b'"}')
+
+        # the slot of the exited reader is not slow, and it is taken again
+        self.assertEqual(self.publisher.slowReaders(0.5), [])
+        readers = [NotificationReader(self.publisher.name) for i in range(2)]
+        self.assertEqual(sorted(reader.slot for reader in readers), [0, 1])
+        for reader in readers:
+            reader.close()
+
+    def test_05_publishing_threads(self):
+        publisher = NotificationPublisher(capacity = 1024 * 1024)
+        reader = NotificationReader(publisher.name)
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            def publish(thread):
+                for i in range(500):
+                    publisher.handleError("%d-%d" % (thread, i))
+            threads = [threading.Thread(target = publish, args = (thread,)) for thread in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            # every record is read once and whole
+            errors = []
+            while True:
+                notification = reader.read()
+                if notification is None:
+                    break
+                errors.append(notification["error"])
+            self.assertEqual(sorted(errors), sorted("%d-%d" % (thread, i) for thread in range(4) for i in range(500)))
+            self.assertEqual(publisher.published, 2000)
+        finally:
+            sys.setswitchinterval(interval)
+            reader.close()
+            publisher.close()
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
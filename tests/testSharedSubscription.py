@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import socket
+import tempfile
+import unittest
+from threading import Thread, Event
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.SEPAClient import *
+from mockBroker import MockBroker
+
+# configuration file
+jsapFile = os.path.join(os.path.dirname(__file__), "..", "examples", "mqtt.jsap")
+
+
+# fake connection handler, used to avoid a real broker
+class FakeConnectionHandler:
+
+    def __init__(self):
+        self.opened = []
+        self.closed = []
+
+    def openWebsockets(self, subscribeURI, sparqlList, registerURI = None, tokenURI = None, aliases = None, handlers = None, yskFile = None):
+        self.connections = getattr(self, "connections", 0) + 1
+        spuids = []
+        for sparql, handler in zip(sparqlList, handlers):
+            self.opened.append((sparql, handler))
+            spuids.append("spuid-%s" % len(self.opened))
+        return spuids
+
+    def closeWebsocket(self, spuid, secure = False):
+        self.closed.append(spuid)
+
+
+# handler recording the notifications
+class RecordingHandler:
+
+    def __init__(self):
+        self.notifications = []
+
+    def handle(self, added, removed):
+        self.notifications.append((added, removed))
+
+
+# handler subscribing from its first notification
+class SubscribingHandler(RecordingHandler):
+
+    def __init__(self, kp):
+        RecordingHandler.__init__(self)
+        self.kp = kp
+        self.subids = []
+        self.event = Event()
+
+    def handle(self, added, removed):
+        RecordingHandler.handle(self, added, removed)
+        if not self.subids:
+            self.subids.append(self.kp.subscribe("MQTT_TOPICS", "topics", RecordingHandler()))
+            self.kp.unsubscribe(self.subids[0])
+        self.event.set()
+
+
+# class
+class TestSharedSubscription(unittest.TestCase):
+
+    def setUp(self):
+        self.kp = SEPAClient(jsapFile)
+        self.kp.connectionManager = FakeConnectionHandler()
+
+    def test_00_normalization(self):
+        a = normalizeSparql("PREFIX b: <http://b#> PREFIX a: <http://a#>  SELECT ?s\n WHERE { ?s a:p 'x  y' }")
+        b = normalizeSparql("PREFIX a: <http://a#> PREFIX b: <http://b#> SELECT ?s WHERE { ?s a:p 'x  y' }")
+        c = normalizeSparql("PREFIX a: <http://a#> PREFIX b: <http://b#> SELECT ?s WHERE { ?s a:p 'x y' }")
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_01_deduplication(self):
+        h1, h2 = RecordingHandler(), RecordingHandler()
+        s1 = self.kp.subscribe("OBSERVATIONS", "a", h1)
+        s2 = self.kp.subscribe("OBSERVATIONS", "b", h2)
+        self.assertNotEqual(s1, s2)
+        self.assertEqual(len(self.kp.connectionManager.opened), 1)
+
+        # notifications are fanned out
+        shared = self.kp.connectionManager.opened[0][1]
+        added = {"head": {"vars": ["value"]}, "results": {"bindings": [{"value": {"type": "literal", "value": "1"}}]}}
+        removed = {"head": {"vars": ["value"]}, "results": {"bindings": []}}
+        shared.handle(added, removed)
+        self.assertEqual(len(h1.notifications), 1)
+        self.assertEqual(len(h2.notifications), 1)
+
+        # the unsubscribe is sent only by the last subscriber
+        self.kp.unsubscribe(s1)
+        self.assertEqual(self.kp.connectionManager.closed, [])
+        self.kp.unsubscribe(s2)
+        self.assertEqual(self.kp.connectionManager.closed, ["spuid-1"])
+
+    def test_02_late_joiner(self):
+        h1, h2 = RecordingHandler(), RecordingHandler()
+        self.kp.subscribe("OBSERVATIONS", "a", h1)
+        shared = self.kp.connectionManager.opened[0][1]
+        b1 = {"value": {"type": "literal", "value": "1"}}
+        b2 = {"value": {"type": "literal", "value": "2"}}
+        shared.handle({"head": {"vars": ["value"]}, "results": {"bindings": [b1, b2]}}, None)
+        shared.handle(None, {"head": {"vars": ["value"]}, "results": {"bindings": [b1]}})
+
+        # the current result set is replayed
+        self.kp.subscribe("OBSERVATIONS", "b", h2)
+        self.assertEqual(len(h2.notifications), 1)
+        self.assertEqual(h2.notifications[0][0]["results"]["bindings"], [b2])
+
+    def test_03_forced_bindings(self):
+        locations = ["arces-monitor:Star", "arces-monitor:Ares", "arces-monitor:Star"]
+        subids = self.kp.subscribeMany("OBSERVATIONS_BY_LOCATION", [{"location": l} for l in locations], "loc", RecordingHandler())
+        self.assertEqual(len(subids), 3)
+
+        # two distinct subscriptions opened through one connection
+        self.assertEqual(self.kp.connectionManager.connections, 1)
+        self.assertEqual(len(self.kp.connectionManager.opened), 2)
+        self.assertIn("arces-monitor:Ares", self.kp.connectionManager.opened[1][0])
+        self.assertNotIn("?location", self.kp.connectionManager.opened[0][0])
+
+        # single parameterized subscription
+        self.kp.subscribe("OBSERVATIONS_BY_LOCATION", "loc", None, forcedBindings = {"location": "arces-monitor:Ares"})
+        self.assertEqual(len(self.kp.connectionManager.opened), 2)
+
+    def call(self, function, *args):
+        thread = Thread(target = function, args = args)
+        thread.daemon = True
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "deadlock")
+
+    def test_04_reentrant_handlers(self):
+        self.kp.subscribe("OBSERVATIONS", "a", RecordingHandler())
+        shared = self.kp.connectionManager.opened[0][1]
+        shared.handle({"head": {"vars": ["value"]}, "results": {"bindings": [{"value": {"type": "literal", "value": "1"}}]}}, None)
+
+        # the replay to a late joiner is delivered without the locks held
+        handler = SubscribingHandler(self.kp)
+        self.call(self.kp.subscribe, "OBSERVATIONS", "b", handler)
+        self.assertEqual(len(handler.notifications), 1)
+        self.assertEqual(self.kp.connectionManager.closed, ["spuid-2"])
+
+        # as well as the notifications
+        handler = SubscribingHandler(self.kp)
+        self.kp.subscribe("OBSERVATIONS_TOPICS", "c", handler)
+        self.call(self.kp.connectionManager.opened[-1][1].handle, {"head": {"vars": ["value"]}, "results": {"bindings": []}}, None)
+        self.assertEqual(len(handler.notifications), 1)
+
+    def test_05_deferred_replay(self):
+        shared = SharedSubscription(("ws://b", "q"))
+        b1 = {"value": {"type": "literal", "value": "1"}}
+        b2 = {"value": {"type": "literal", "value": "2"}}
+        shared.handle({"head": {"vars": ["value"]}, "results": {"bindings": [b1]}}, None)
+        handler = RecordingHandler()
+        shared.addHandler("late", handler, deferred = True)
+
+        # the notifications before the replay are held back, the replay includes them
+        shared.handle({"head": {"vars": ["value"]}, "results": {"bindings": [b2]}}, None)
+        self.assertEqual(handler.notifications, [])
+        shared.replay("late")
+        self.assertEqual(len(handler.notifications), 1)
+        self.assertEqual(handler.notifications[0][0]["results"]["bindings"], [b1, b2])
+        shared.handle(None, {"head": {"vars": ["value"]}, "results": {"bindings": [b1]}})
+        self.assertEqual(len(handler.notifications), 2)
+
+    def test_06_broker(self):
+        broker = MockBroker(rows = 2).start()
+        try:
+            kp = SEPAClient(broker.configuration(jsapFile, os.path.join(tempfile.mkdtemp(), "mqtt.jsap")))
+
+            # the first notification arrives while the second subscription is being confirmed
+            handler = SubscribingHandler(kp)
+            self.call(kp.subscribeMany, "OBSERVATIONS_BY_LOCATION", [{"location": "arces-monitor:Star"}, {"location": "arces-monitor:Ares"}], "loc", handler)
+            self.assertTrue(handler.event.wait(5))
+            self.assertEqual(len(kp.subscriptions), 2)
+
+            # a subscription that is not confirmed in time fails (the server never answers)
+            silent = socket.socket()
+            silent.bind(("localhost", 0))
+            silent.listen(1)
+            kp.configuration.subscribeURI = "ws://localhost:%d/subscribe" % silent.getsockname()[1]
+            kp.connectionManager.subscribeTimeout = 0.2
+            try:
+                with self.assertRaises(SubscriptionFailedException):
+                    kp.subscribe("MQTT_TOPICS", "t", RecordingHandler())
+            finally:
+                silent.close()
+            self.assertEqual(len(kp.subscriptions), 2)
+            self.assertEqual(len(kp.sharedSubscriptions), 2)
+        finally:
+            broker.stop()
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import unittest
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+from sepy.ConfigurationObject import *
+from sepy.StatePlanner import *
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+SOSA = "http://www.w3.org/ns/sosa/"
+
+
+class FakeClient:
+
+    """A client returning the bindings of results and recording the updates"""
+
+    def __init__(self, results = []):
+        self.configuration = ConfigurationObject(TEMPLATE)
+        self.results = results
+        self.requests = []
+        self.fail = False
+        self.timeout = None
+
+    def query(self, queryName, forcedBindings = {}, secure = False):
+        return True, {"head": {"vars": ["observation", "topic"]}, "results": {"bindings": self.results}}
+
+    def sendUpdate(self, updateName, sparqlUpdate, secure, sent, deadline = None):
+        self.requests.append(sparqlUpdate)
+        return not self.fail, "{}"
+
+
+def topic(i, value = None):
+    return {"observation": {"type": "uri", "value": "http://example.org/o%s" % i},
+            "topic": {"type": "literal", "value": value or "topic/%s" % i, "datatype": "http://www.w3.org/2001/XMLSchema#string"}}
+
+
+# class
+class TestStatePlanner(unittest.TestCase):
+
+    def test_00_template(self):
+        self.assertEqual(parsePattern('?s a ex:T ; ex:p "x"@en, 3.5 ; . ?q ex:v ?v.'),
+                         [("?s", RDF_TYPE, "ex:T"), ("?s", "ex:p", '"x"@en'), ("?s", "ex:p", "3.5"), ("?q", "ex:v", "?v")])
+        for pattern in ("?s ?p", "?s ?p ?o ?x", "?s . ?p ?o", "?s ?p ?o OPTIONAL { ?s ?q ?r }"):
+            with self.assertRaises(PlanningException):
+                parsePattern(pattern)
+        planner = StatePlanner(FakeClient(), "OBSERVATIONS_TOPICS")
+        self.assertEqual(planner.template, [("?observation", "rdf:type", "sosa:Observation"), ("?observation", "arces-monitor:hasMqttTopic", "?topic")])
+        planner = StatePlanner(FakeClient(), "OBSERVATIONS_TOPICS", "UPDATE_OBSERVATION_VALUE")
+        self.assertEqual(planner.template, [("?quantity", "qudt-1-1:numericValue", "?value")])
+
+    def test_01_minimal_plan(self):
+        client = FakeClient([topic(i) for i in range(100)])
+        planner = StatePlanner(client, "OBSERVATIONS_TOPICS", batchSize = 3)
+        desired = [topic(i) for i in range(1, 100)] + [topic(100)]
+        desired[50] = topic(51, "moved")
+        deletes, inserts = planner.plan(desired)
+        self.assertEqual(deletes, {("<http://example.org/o0>", "rdf:type", "sosa:Observation"),
+                                   ("<http://example.org/o0>", "arces-monitor:hasMqttTopic", '"topic/0"'),
+                                   ("<http://example.org/o51>", "arces-monitor:hasMqttTopic", '"topic/51"')})
+        self.assertEqual(len(inserts), 3)
+
+        status, results = planner.apply(desired)
+        self.assertTrue(status)
+        self.assertEqual(results, {"deleted": 3, "inserted": 3, "unchanged": 197, "requests": 2})
+        self.assertTrue(client.requests[0].startswith(client.configuration.nsSparql + "DELETE DATA { <http://example.org/o0> "))
+        self.assertTrue(client.requests[1].startswith(client.configuration.nsSparql + "INSERT DATA { <http://example.org/o100> "))
+
+        # the state after apply is used next
+        client.results = []
+        self.assertEqual(planner.apply(desired), (True, {"deleted": 0, "inserted": 0, "unchanged": 200, "requests": 0}))
+
+        # after a failure the state is read again
+        client.fail = True
+        self.assertFalse(planner.apply(desired[:10])[0])
+        self.assertIsNone(planner.state)
+        client.fail = False
+        self.assertEqual(planner.apply(desired[:10])[1]["inserted"], 20)
+
+    def test_02_errors(self):
+        planner = StatePlanner(FakeClient(), "OBSERVATIONS_TOPICS")
+        with self.assertRaises(PlanningException):
+            planner.plan([{"observation": {"type": "uri", "value": "http://example.org/o"}}], [])
+        with self.assertRaises(PlanningException):
+            planner.plan([{"observation": {"type": "bnode", "value": "b0"}, "topic": {"type": "literal", "value": "t"}}], [])
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
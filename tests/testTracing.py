@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import tempfile
+import unittest
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.Tracing import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+
+# class
+class TestTracing(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.broker = MockBroker().start()
+        cls.path = cls.broker.configuration(TEMPLATE, os.path.join(cls.directory, "broker.jsap"))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.broker.stop()
+
+    def test_00_phases(self):
+        tracer = RecordingTracer()
+        client = SEPAClient(self.path, tracer = tracer)
+        status, results = client.query("MQTT_TOPICS")
+        self.assertTrue(status)
+        self.assertEqual([span[0] for span in tracer.spans], ["render", "firstByte", "send", "decode"])
+        phases = {span[0]: span for span in tracer.spans}
+        self.assertEqual(phases["render"][3]["name"], "MQTT_TOPICS")
+        self.assertEqual(phases["firstByte"][3]["status"], 200)
+        self.assertGreater(phases["send"][3]["bytes"], 0)
+        self.assertLessEqual(phases["firstByte"][2], phases["send"][2])
+        self.assertGreaterEqual(phases["send"][1], phases["render"][1])
+
+        # the slowest phases, of every kind or of one
+        client.update("UPDATE_OBSERVATION_VALUE", {"observation": "http://example.org/o", "value": "1"})
+        self.assertEqual(len(tracer.spans), 7)
+        slowest = tracer.slowest(2)
+        self.assertEqual(len(slowest), 2)
+        self.assertGreaterEqual(slowest[0][2], slowest[1][2])
+        self.assertEqual([span[0] for span in tracer.slowest(phase = "send")], ["send", "send"])
+
+    def test_01_bounded(self):
+        tracer = RecordingTracer(maxSpans = 3)
+        client = SEPAClient(self.path, tracer = tracer)
+        client.query("MQTT_TOPICS")
+        client.query("MQTT_TOPICS")
+        self.assertEqual([span[0] for span in tracer.spans], ["firstByte", "send", "decode"])
+
+    def test_02_logging(self):
+        client = SEPAClient(self.path, tracer = LoggingTracer(threshold = 0.0))
+        with self.assertLogs("sepaLogger", "WARNING") as logs:
+            client.query("MQTT_TOPICS")
+        self.assertEqual(len(logs.output), 4)
+        self.assertIn("Slow send phase", logs.output[2])
+        client = SEPAClient(self.path, tracer = LoggingTracer(threshold = 60.0))
+        with self.assertRaises(AssertionError):
+            with self.assertLogs("sepaLogger", "WARNING"):
+                client.query("MQTT_TOPICS")
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import socket
+import time
+import tempfile
+import unittest
+from threading import Event
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'benchmarks')))
+
+# local import
+from sepy.SEPAClient import *
+from sepy.UpdateSpool import *
+from mockBroker import MockBroker
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+
+def freePort():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+class FakeClient:
+
+    """A client rejecting the requests containing "bad", unavailable for the first unavailable requests and waiting for gate if set"""
+
+    def __init__(self):
+        self.configuration = type("FakeConfiguration", (), {"nsSparql": "PREFIX ex: <http://example.org/> ",
+                                                            "getUpdate": lambda configuration, name, bindings: configuration.nsSparql + "INSERT DATA { ex:%s ex:p 1 }" % bindings["s"]})()
+        self.requests = []
+        self.timeout = None
+        self.unavailable = 0
+        self.gate = None
+
+    def sendUpdate(self, updateName, sparqlUpdate, secure, sent, deadline = None, raiseUnavailable = False):
+        if self.gate is not None:
+            self.gate.wait()
+        self.requests.append(sparqlUpdate)
+        if self.unavailable:
+            self.unavailable -= 1
+            if raiseUnavailable:
+                raise BrokerUnavailableException("status 503")
+            return False, "status 503"
+        if "bad" in sparqlUpdate:
+            return False, "rejected"
+        return True, "{}"
+
+
+# class
+class TestUpdateSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def test_00_recovery(self):
+        spool = UpdateSpool(FakeClient(), self.directory, segmentBytes = 1024, maxBytes = 4096)
+        for i in range(30):
+            self.assertEqual(spool.update("U", {"s": "s%s" % i}), (True, "spooled"))
+        spool.stop()
+        self.assertGreater(len(spool.segments), 1)
+
+        # a partially written entry at the end of the log is discarded
+        with open(spool.segmentPath(spool.active), "ab") as stream:
+            stream.write(b"\x00\x00\x01\x00garbage")
+        client = FakeClient()
+        spool = UpdateSpool(client, self.directory, segmentBytes = 1024, maxBytes = 4096, batchEntries = 7)
+        self.assertEqual(spool.pending, 30)
+        spool.start()
+        self.assertTrue(spool.flush(10))
+        spool.stop()
+        self.assertEqual(spool.sent, 30)
+        self.assertLess(len(client.requests), 10)
+        self.assertEqual(sum(request.count(" ; ") + 1 for request in client.requests), 30)
+        self.assertTrue(client.requests[0].startswith("PREFIX ex: <http://example.org/> INSERT DATA { ex:s0 ex:p 1 } ; INSERT DATA { ex:s1"))
+        self.assertEqual(UpdateSpool(FakeClient(), self.directory).pending, 0)
+
+    def test_01_outage(self):
+        port = freePort()
+        broker = MockBroker(httpPort = port)
+        broker.httpServer.server_close()
+        broker.wsServer.server_close()
+        kp = SEPAClient(broker.configuration(TEMPLATE, os.path.join(self.directory, "mqtt.jsap")))
+        spool = UpdateSpool(kp, os.path.join(self.directory, "spool"), syncInterval = 0.001, retryInterval = 0.05, maxRetryInterval = 0.1).start()
+        try:
+            for i in range(100):
+                spool.update("UPDATE_OBSERVATION_VALUE", {"observation": "arces-monitor:O%s" % i, "value": str(i)})
+            self.assertFalse(spool.flush(0.3))
+            self.assertGreater(spool.retried, 0)
+            broker = MockBroker(httpPort = port).start()
+            self.assertTrue(spool.flush(10))
+            self.assertEqual(spool.sent, 100)
+            self.assertEqual(broker.updates, spool.batches)
+            self.assertLess(broker.updates, 10)
+        finally:
+            spool.stop(flush = False)
+            broker.stop()
+
+    def test_02_rejected_entries(self):
+        client = FakeClient()
+        spool = UpdateSpool(client, self.directory, retryInterval = 0.01, retries = 1).start()
+        for s in ("a", "bad", "c"):
+            spool.update("U", {"s": s})
+        self.assertTrue(spool.flush(10))
+        spool.stop()
+        self.assertEqual((spool.sent, spool.rejected), (2, 1))
+
+    def test_03_overflow(self):
+        spool = UpdateSpool(FakeClient(), os.path.join(self.directory, "newest"), segmentBytes = 512, maxBytes = 1024, overflow = "drop-newest")
+        results = [spool.update("U", {"s": "s%s" % i})[0] for i in range(40)]
+        self.assertIn(False, results)
+        self.assertLessEqual(spool.usage, 1024)
+        self.assertEqual(spool.pending + spool.dropped, 40)
+        self.assertEqual(results[:spool.pending], [True] * spool.pending)
+        spool.stop()
+
+        client = FakeClient()
+        spool = UpdateSpool(client, os.path.join(self.directory, "oldest"), segmentBytes = 512, maxBytes = 1024, overflow = "drop-oldest")
+        for i in range(40):
+            self.assertTrue(spool.update("U", {"s": "s%s" % i})[0])
+        self.assertLessEqual(spool.usage, 1024)
+        self.assertEqual(spool.pending + spool.dropped, 40)
+        spool.start()
+        self.assertTrue(spool.flush(10))
+        spool.stop()
+        self.assertIn("ex:s39 ", client.requests[-1])
+        self.assertNotIn("ex:s0 ", client.requests[0])
+
+    def test_04_unavailable(self):
+        client = FakeClient()
+        client.unavailable = 3
+        spool = UpdateSpool(client, self.directory, retryInterval = 0.01, retries = 1).start()
+        for s in ("a", "b"):
+            spool.update("U", {"s": s})
+        self.assertTrue(spool.flush(10))
+        spool.stop()
+
+        # the broker answering 503 is retried as unreachable, no entry is skipped
+        self.assertEqual((spool.sent, spool.rejected), (2, 0))
+        self.assertEqual(spool.retried, 3)
+
+    def test_05_entry_backoff(self):
+        spool = UpdateSpool(FakeClient(), self.directory, retryInterval = 0.05, retries = 2).start()
+        start = time.monotonic()
+        spool.update("U", {"s": "bad"})
+        self.assertTrue(spool.flush(10))
+        spool.stop()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertEqual((spool.rejected, spool.retried), (1, 2))
+
+    def test_06_drop_in_flight(self):
+        client = FakeClient()
+        client.gate = Event()
+        spool = UpdateSpool(client, self.directory, segmentBytes = 512, maxBytes = 1024, overflow = "drop-oldest", syncInterval = 0.001)
+
+        # entries without the prefixes are sent one per request
+        while spool.active == 0:
+            spool.append("U", "INSERT DATA { ex:a%s ex:p 1 }" % spool.appended)
+        first = spool.appended
+        spool.start()
+        for i in range(100):
+            if spool.inFlight is not None:
+                break
+            time.sleep(0.01)
+
+        # the segment of the batch being sent is discarded
+        while 0 in spool.segments:
+            spool.append("U", "INSERT DATA { ex:b%s ex:p 1 }" % spool.appended)
+        client.gate.set()
+        self.assertTrue(spool.flush(10))
+        spool.stop()
+        self.assertEqual(spool.pending, 0)
+        self.assertEqual(spool.sent + spool.dropped, spool.appended)
+        self.assertEqual(spool.dropped, first - 1)
+        self.assertFalse(any("ex:a1 " in request for request in client.requests))
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import json
+import unittest
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+from sepy.Metrics import *
+from sepy.MqttIngestion import *
+from sepy.UpdateSuppressor import *
+
+# configuration template
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "mqtt.jsap")
+
+UPDATE = "UPDATE_OBSERVATION_VALUE"
+
+
+class FakeClient:
+
+    """A client recording the updates, failing when fail is True"""
+
+    def __init__(self):
+        with open(TEMPLATE) as stream:
+            self.configuration = type("FakeConfiguration", (), {"configurationDict": json.load(stream)})()
+        self.metrics = MetricsRegistry()
+        self.updates = []
+        self.fail = False
+
+    def update(self, updateName, forcedBindings = {}, secure = False):
+        self.updates.append(forcedBindings)
+        return not self.fail, "{}"
+
+
+def reading(observation, value):
+    return {"observation": observation, "value": value}
+
+
+# class
+class TestUpdateSuppressor(unittest.TestCase):
+
+    def test_00_unchanged_and_deadband(self):
+        client = FakeClient()
+        suppressor = UpdateSuppressor(client, deadband = {UPDATE: 0.5})
+        values = ["21.0", "21.00", "21.4", "21.6", "21.6", "22.2", "off", "off", "on"]
+        sent = [suppressor.update(UPDATE, reading("ex:a", v)) != (True, "suppressed") for v in values]
+        self.assertEqual(sent, [True, False, False, True, False, True, True, False, True])
+        self.assertTrue(suppressor.update(UPDATE, reading("ex:b", "21.0"))[1] != "suppressed")
+        self.assertEqual((suppressor.suppressed, suppressor.passed), (4, 6))
+        self.assertEqual(client.metrics.snapshot()["sepy_suppressed_total"], [{"labels": {"kind": "update", "name": UPDATE}, "value": 4}])
+
+        # updates without keys are never suppressed
+        for i in range(3):
+            self.assertTrue(suppressor.check("OTHER_UPDATE", reading("ex:a", "1")))
+
+    def test_01_heartbeat_and_failures(self):
+        client = FakeClient()
+        suppressor = UpdateSuppressor(client, maxSilence = 10)
+        self.assertTrue(suppressor.check(UPDATE, reading("ex:a", "1"), now = 0))
+        self.assertFalse(suppressor.check(UPDATE, reading("ex:a", "1"), now = 9))
+        self.assertTrue(suppressor.check(UPDATE, reading("ex:a", "1"), now = 10))
+        client.fail = True
+        self.assertEqual(suppressor.update(UPDATE, reading("ex:a", "2")), (False, "{}"))
+        client.fail = False
+        self.assertEqual(suppressor.update(UPDATE, reading("ex:a", "2")), (True, "{}"))
+
+    def test_02_bounded_memory(self):
+        suppressor = UpdateSuppressor(FakeClient(), maxEntries = 100)
+        for i in range(1000):
+            suppressor.check(UPDATE, reading("ex:o%s" % i, "1"))
+        self.assertEqual(len(suppressor.last), 100)
+        self.assertEqual(suppressor.evicted, 900)
+        self.assertFalse(suppressor.check(UPDATE, reading("ex:o999", "1")))
+        self.assertTrue(suppressor.check(UPDATE, reading("ex:o0", "1")))
+
+    def test_03_mqtt_ingestion(self):
+        client = FakeClient()
+        suppressor = UpdateSuppressor(client)
+        ingestion = MqttIngestion(client, suppressor = suppressor)
+        for value in (b"52.0", b"52.0", b"52", b"53.5"):
+            ingestion.submit("arces/servers/ares/ercole/cpu/core-1/temperature", value)
+        self.assertEqual([bindings["value"] for bindings in ingestion.queue], ["52.0", "53.5"])
+        self.assertEqual(suppressor.suppressed, 2)
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()
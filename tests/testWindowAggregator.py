@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+
+# global requirements
+import os
+import sys
+import time
+import unittest
+from threading import Event
+
+# path modification
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# local import
+import numpy
+from sepy.WindowAggregator import *
+
+
+class FakeClient:
+
+    """A client recording the bindings of updateMany, waiting for gate if set"""
+
+    def __init__(self):
+        self.requests = []
+        self.gate = None
+
+    def updateMany(self, updateName, bindingsList, secure = False):
+        if self.gate is not None:
+            self.gate.wait()
+        self.requests.append((updateName, bindingsList))
+        return True, "{}"
+
+
+def notification(*readings):
+    return {"head": {"vars": ["observation", "value", "time"]},
+            "results": {"bindings": [{"observation": {"type": "uri", "value": o},
+                                      "value": {"type": "literal", "value": str(v)},
+                                      "time": {"type": "literal", "value": str(t)}} for o, v, t in readings]}}
+
+
+# class
+class TestWindowAggregator(unittest.TestCase):
+
+    def test_00_tumbling(self):
+        windows = []
+        aggregator = WindowAggregator(window = 10, timeBinding = "time", percentiles = (50, 90), onWindow = windows.append)
+        aggregator.handle(notification(*[("ex:a", v, 100 + v) for v in range(1, 10)]), None)
+        aggregator.handle(notification(("ex:b", 5, 105), ("ex:a", "NaN?", 106), ("ex:b", 7, 109)), None)
+        self.assertEqual(windows, [])
+        aggregator.handle(notification(("ex:a", 100, 111)), None)
+        self.assertEqual(len(windows), 1)
+        window = windows[0]
+        self.assertEqual((window["start"], window["end"], window["keys"]), (100, 110, ["ex:a", "ex:b"]))
+        self.assertEqual(window["count"].tolist(), [9, 2])
+        self.assertEqual(window["mean"].tolist(), [5.0, 6.0])
+        self.assertEqual(window["min"].tolist(), [1.0, 5.0])
+        self.assertEqual(window["max"].tolist(), [9.0, 7.0])
+        expected = [numpy.percentile(numpy.arange(1, 10), [50, 90]), numpy.percentile([5, 7], [50, 90])]
+        self.assertTrue(numpy.allclose(numpy.array([window["p50"], window["p90"]]).T, expected))
+        self.assertEqual(aggregator.invalid, 1)
+
+        # a window without values of ex:b
+        window = aggregator.tick(120)[0]
+        self.assertEqual((window["keys"], window["count"].tolist(), window["max"].tolist()), (["ex:a"], [1], [100.0]))
+        self.assertEqual(aggregator.tick(130)[0]["keys"], [])
+
+    def test_01_sliding(self):
+        windows = []
+        aggregator = WindowAggregator(window = 10, slide = 5, timeBinding = "time", onWindow = windows.append)
+        aggregator.handle(notification(*[("ex:a", t, t) for t in range(1, 21)]), None)
+        self.assertEqual(aggregator.nextEnd, 25)
+        self.assertEqual([(w["start"], w["end"]) for w in windows], [(-5, 5), (0, 10), (5, 15), (10, 20)])
+        self.assertEqual([w["count"].tolist() for w in windows], [[5], [10], [10], [10]])
+        self.assertEqual(windows[-1]["mean"].tolist(), [15.5])
+
+    def test_02_fixed_memory(self):
+        aggregator = WindowAggregator(window = 100, timeBinding = "time", capacity = 8, maxKeys = 2)
+        aggregator.handle(notification(*[("ex:a", t, t) for t in range(1, 21)] + [("ex:b", 1, 1), ("ex:c", 1, 1)]), None)
+        self.assertEqual(aggregator.values.shape, (2, 8))
+        self.assertEqual((aggregator.discarded, aggregator.overwritten), (1, 12))
+        window = aggregator.tick(100)[0]
+        self.assertEqual(window["count"].tolist(), [8, 1])
+        self.assertEqual(window["min"].tolist(), [13.0, 1.0])
+
+    def test_03_write_back(self):
+        client = FakeClient()
+        aggregator = WindowAggregator(client, window = 60, timeBinding = "time", updateName = "UPDATE_AGGREGATE")
+        aggregator.handle(notification(("ex:a", 1.5, "2020-01-01T00:00:10Z"), ("ex:b", 2, "2020-01-01T00:00:20Z")), None)
+        aggregator.handle(notification(("ex:a", 2.5, "2020-01-01T00:01:10Z")), None)
+        self.assertTrue(aggregator.flush(5))
+        self.assertEqual(len(client.requests), 1)
+        updateName, bindingsList = client.requests[0]
+        self.assertEqual(updateName, "UPDATE_AGGREGATE")
+        self.assertEqual(bindingsList[0], {"observation": "ex:a", "count": "1", "mean": "1.5", "min": "1.5", "max": "1.5", "p50": "1.5", "p95": "1.5",
+                                           "windowStart": "1577836800.0", "windowEnd": "1577836860.0"})
+        self.assertEqual(bindingsList[1]["observation"], "ex:b")
+        aggregator.stop()
+
+    def test_04_slow_write_back(self):
+        client = FakeClient()
+        client.gate = Event()
+        aggregator = WindowAggregator(client, window = 60, timeBinding = "time", updateName = "UPDATE_AGGREGATE")
+
+        # the notifications are stored while the write-backs wait for the broker
+        start = time.monotonic()
+        for minute in range(4):
+            aggregator.handle(notification(("ex:a", minute, "2020-01-01T00:%02d:10Z" % minute)), None)
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual((aggregator.windows, aggregator.received), (3, 4))
+        self.assertFalse(aggregator.flush(0.1))
+        client.gate.set()
+        aggregator.stop()
+        self.assertEqual(aggregator.unwritten, 0)
+        self.assertEqual([bindingsList[0]["mean"] for updateName, bindingsList in client.requests], ["0.0", "1.0", "2.0"])
+
+
+# main
+if __name__ == "__main__":
+    unittest.main()